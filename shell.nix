@@ -19,7 +19,7 @@ in
     shellHook = ''
 			python3 -m venv .cocotbvenv
 			source .cocotbvenv/bin/activate
-      pip3 install cocotb cocotb-bus pytest
+      pip3 install cocotb cocotb-bus pytest numpy
 			cocotb-config --version
     '';
   }
@@ -171,20 +171,17 @@ module cpu_axi_wrapper #(
     assign instruction_count_low = instruction_count[31:0];
     assign instruction_count_high = instruction_count[63:32];
     
-    // AXI4-Lite Control Interface State Machine
-    typedef enum logic [1:0] {
-        AXI_IDLE,
-        AXI_WRITE,
-        AXI_READ
-    } axi_state_t;
-    
-    axi_state_t axi_state;
-    logic [C_S_AXI_ADDR_WIDTH-1:0] axi_awaddr_reg;
-    logic [C_S_AXI_ADDR_WIDTH-1:0] axi_araddr_reg;
-    logic axi_write_ready;
+    // AXI4-Lite Control Interface
+    // A write is accepted when AW and W are both valid and the previous
+    // response has been (or is being) taken, so the address decoded is
+    // always the one paired with the data. Reads are accepted whenever the
+    // read data register is free. Both sustain one transaction per cycle.
+    logic axi_write_fire;
     logic axi_read_valid;
     logic [C_S_AXI_DATA_WIDTH-1:0] axi_read_data;
     
+    assign axi_write_fire = s_axi_awvalid && s_axi_wvalid && (!s_axi_bvalid || s_axi_bready);
+    
     // AXI Write Logic
     always_ff @(posedge s_axi_aclk or negedge s_axi_aresetn) begin
         if (!s_axi_aresetn) begin
@@ -193,18 +190,12 @@ module cpu_axi_wrapper #(
             single_step_mode <= 1'b0;
             interrupt_enable <= 1'b0;
             breakpoint_addr <= '0;
-            axi_awaddr_reg <= '0;
-            axi_write_ready <= 1'b0;
             s_axi_bvalid <= 1'b0;
         end else begin
             cpu_reset_req <= 1'b0;
             
-            if (s_axi_awvalid && s_axi_awready) begin
-                axi_awaddr_reg <= s_axi_awaddr;
-            end
-            
-            if (s_axi_wvalid && s_axi_wready) begin
-                case (axi_awaddr_reg[7:0])
+            if (axi_write_fire) begin
+                case (s_axi_awaddr[7:0])
                     8'h00: begin
                         cpu_enable <= s_axi_wdata[0];
                         cpu_reset_req <= s_axi_wdata[1];
@@ -215,9 +206,7 @@ module cpu_axi_wrapper #(
                     default: ;
                 endcase
                 s_axi_bvalid <= 1'b1;
-            end
-            
-            if (s_axi_bvalid && s_axi_bready) begin
+            end else if (s_axi_bready) begin
                 s_axi_bvalid <= 1'b0;
             end
         end
@@ -226,12 +215,10 @@ module cpu_axi_wrapper #(
     // AXI Read Logic
     always_ff @(posedge s_axi_aclk or negedge s_axi_aresetn) begin
         if (!s_axi_aresetn) begin
-            axi_araddr_reg <= '0;
             axi_read_valid <= 1'b0;
             axi_read_data <= '0;
         end else begin
             if (s_axi_arvalid && s_axi_arready) begin
-                axi_araddr_reg <= s_axi_araddr;
                 axi_read_valid <= 1'b1;
                 
                 case (s_axi_araddr[7:0])
@@ -252,20 +239,18 @@ module cpu_axi_wrapper #(
                         end
                     end
                 endcase
-            end
-            
-            if (s_axi_rvalid && s_axi_rready) begin
+            end else if (s_axi_rready) begin
                 axi_read_valid <= 1'b0;
             end
         end
     end
     
     // AXI4-Lite Interface Assignments
-    assign s_axi_awready = (axi_state == AXI_IDLE);
-    assign s_axi_wready = (axi_state == AXI_IDLE) || (s_axi_awvalid && s_axi_awready);
+    assign s_axi_awready = axi_write_fire;
+    assign s_axi_wready = axi_write_fire;
     assign s_axi_bresp = 2'b00;
     
-    assign s_axi_arready = (axi_state == AXI_IDLE) && !s_axi_awvalid;
+    assign s_axi_arready = !axi_read_valid || s_axi_rready;
     assign s_axi_rdata = axi_read_data;
     assign s_axi_rresp = 2'b00;
     assign s_axi_rvalid = axi_read_valid;
@@ -153,6 +153,12 @@ module cpu_top #(
   // Hazard detection
   logic                  load_use_hazard;
   logic                  data_hazard;
+  logic                  mem_stall;
+  logic                  backend_stall;
+
+  // ID operands with EX/MEM/WB forwarding applied
+  logic [DATA_WIDTH-1:0] forwarded_rs1_data;
+  logic [DATA_WIDTH-1:0] forwarded_rs2_data;
 
   // Pipeline flush signal for atomics
   logic                  pipeline_flush;
@@ -167,15 +173,17 @@ module cpu_top #(
   ) u_muldiv (
       .clk       (clk),
       .rst_n     (rst_n),
-      .valid_i   (is_m_op && id_valid && !load_use_hazard && !cp_stall_external),
+      // Start as the op moves into EX, with the operands forwarded in ID
+      .valid_i   (is_m_op && id_valid && !pipeline_stall),
       .funct3_i  (funct3),
-      .rs1_data_i(id_rs1_data),
-      .rs2_data_i(id_rs2_data),
+      .rs1_data_i(forwarded_rs1_data),
+      .rs2_data_i(forwarded_rs2_data),
       .ready_o   (m_ready),
       .valid_o   (m_result_valid),
       .result_o  (m_result),
-      .flush_i   (pipeline_flush),
-      .stall_i   (load_use_hazard || cp_stall_external)
+      // A redirect from ID never squashes the older op already in EX
+      .flush_i   (1'b0),
+      .stall_i   (cp_stall_external || a_stall_req || mem_stall)
   );
 
   assign m_stall = ex_is_m_op && ex_m_valid && !m_result_valid;
@@ -189,13 +197,13 @@ module cpu_top #(
   ) u_atomic (
       .clk(clk),
       .rst_n(rst_n),
-      .valid_i(is_a_op && id_valid && !load_use_hazard && !cp_stall_external),
+      .valid_i(is_a_op && id_valid && !pipeline_stall),
       .funct5_i(id_inst[31:27]),
       .aq_i(id_inst[26]),
       .rl_i(id_inst[25]),
-      .addr_i(id_rs1_data),
-      .rs1_data_i(id_rs1_data),
-      .rs2_data_i(id_rs2_data),
+      .addr_i(forwarded_rs1_data),
+      .rs1_data_i(forwarded_rs1_data),
+      .rs2_data_i(forwarded_rs2_data),
       .ready_o(a_ready),
       .valid_o(a_result_valid),
       .result_o(a_result),
@@ -206,7 +214,8 @@ module cpu_top #(
       .mem_lock_o(a_mem_lock),
       .mem_rdata_i(dmem_read_data),
       .mem_ready_i(dmem_ready),
-      .flush_i(pipeline_flush),
+      // Taken branches must not drop an LR reservation
+      .flush_i(1'b0),
       .exception_i(1'b0),  // Connect to exception logic if available
       .stall_req_o(a_stall_req),
       .snoop_valid_i(1'b0),
@@ -235,17 +244,19 @@ module cpu_top #(
         pc <= jal_addr;
       end else if (jalr) begin
         pc <= jalr_addr;
-      end else begin
+      end else if (imem_ready) begin
         pc <= pc + 4;
       end
       if_pc <= pc;
-      if_valid <= 1'b1;
+      // Fetch wait state: hold the PC and pass a bubble to ID. On a
+      // redirect the word fetched this cycle is from the wrong path.
+      if_valid <= imem_ready && !pipeline_flush;
     end
   end
 
   // Instruction memory interface
   assign imem_addr = pc;
-  assign imem_read = 1'b1;  // Always reading since BRAM is always ready
+  assign imem_read = 1'b1;  // Always fetching; imem_ready marks the data valid
   always_ff @(posedge clk or negedge rst_n) begin
     if (!rst_n) begin
         if_inst <= 32'h00000013; // NOP Signal
@@ -313,8 +324,6 @@ module cpu_top #(
 
   // something
   // Add forwarding logic for ALU inputs (NEW CODE - insert at line ~280)
-  logic [DATA_WIDTH-1:0] forwarded_rs1_data;
-  logic [DATA_WIDTH-1:0] forwarded_rs2_data;
 
 always_comb begin
 // Forward from EX stage
@@ -371,7 +380,7 @@ end
   ) branch_calc_inst (
       .pc(id_pc),
       .inst(id_inst),
-      .data_a(reg_rs1_data),
+      .data_a(forwarded_rs1_data),
       .bra_addr(bra_addr),
       .jal_addr(jal_addr),
       .jalr_addr(jalr_addr)
@@ -380,8 +389,8 @@ end
   equ #(
       .DATA_WIDTH(DATA_WIDTH)
   ) comparator (
-      .data_a  (reg_rs1_data),
-      .data_b  (reg_rs2_data),
+      .data_a  (forwarded_rs1_data),
+      .data_b  (forwarded_rs2_data),
       .is_equal(is_equal)
   );
 
@@ -418,6 +427,10 @@ always_comb begin
   else if (is_m_op || is_a_op) begin
     alu_result = 32'h0;
   end
+  else if (jump || jalr) begin
+    // Link address
+    alu_result = id_pc + 4;
+  end
   else begin
     case (alu_op)
       5'b00000: alu_result = alu_input_a + alu_input_b;  // ADD
@@ -492,7 +505,8 @@ end
   end else if (!pipeline_stall) begin
     id_pc <= if_pc;
     id_inst <= if_inst;
-    id_valid <= if_valid && imem_ready;
+    // The instruction behind a taken branch or jump is squashed
+    id_valid <= if_valid && !pipeline_flush;
     // Use forwarded data instead of raw register file output
     id_rs1_data <= forwarded_rs1_data;  // Changed from reg_rs1_data
     id_rs2_data <= forwarded_rs2_data;  // Changed from reg_rs2_data
@@ -525,8 +539,11 @@ end
     ex_is_a_op <= 1'b0;
     ex_a_rd <= 5'h0;
     ex_a_valid <= 1'b0;
-  end else if (load_use_hazard) begin
-    // Insert bubble (NOP) in EX stage when load-use hazard detected
+  end else if (backend_stall) begin
+    // Hold EX with the rest of the back end
+  end else if (load_use_hazard || data_hazard) begin
+    // Insert bubble (NOP) in EX stage while ID waits on a load or an M/A
+    // result; the producer moves on to MEM this cycle
     ex_reg_write <= 1'b0;
     ex_mem_read <= 1'b0;
     ex_mem_write <= 1'b0;
@@ -535,7 +552,7 @@ end
     ex_m_valid <= 1'b0;
     ex_is_a_op <= 1'b0;
     ex_a_valid <= 1'b0;
-    end else if (!pipeline_stall) begin
+    end else begin
       ex_pc <= id_pc;
       ex_result <= alu_result;
       ex_rd <= rd;
@@ -565,7 +582,7 @@ end
       mem_rd <= 5'h0;
       mem_reg_write <= 1'b0;
       mem_valid <= 1'b0;
-    end else if (!pipeline_stall) begin
+    end else if (!backend_stall) begin
       mem_pc <= ex_pc;
 
       // Select result based on operation type
@@ -598,7 +615,7 @@ end
       wb_rd <= 5'h0;
       wb_reg_write <= 1'b0;
       wb_valid <= 1'b0;
-    end else if (!pipeline_stall) begin
+    end else if (!backend_stall) begin
       wb_result <= mem_result;
       wb_rd <= mem_rd;
       wb_reg_write <= mem_reg_write;
@@ -608,12 +625,12 @@ end
 
   // Debug: Check if write-back is working
 always_ff @(posedge clk) begin
-  if (wb_reg_write && wb_valid && !pipeline_stall) begin
+  if (wb_reg_write && wb_valid && !backend_stall) begin
     $display("Time %t: RegWrite - rd=%d, value=%h", $time, wb_rd, wb_result);
   end
   
   // Also check what's preventing writes
-  if (mem_valid && !pipeline_stall) begin
+  if (mem_valid && !backend_stall) begin
     $display("Time %t: MEM stage - rd=%d, reg_write=%b, result=%h", 
              $time, mem_rd, mem_reg_write, mem_result);
   end
@@ -651,10 +668,10 @@ end
       case (funct3)
         3'b000:  branch_taken = is_equal;  // BEQ
         3'b001:  branch_taken = !is_equal;  // BNE
-        3'b100:  branch_taken = reg_rs1_data < reg_rs2_data;  // BLT
-        3'b101:  branch_taken = reg_rs1_data >= reg_rs2_data;  // BGE
-        3'b110:  branch_taken = $unsigned(reg_rs1_data) < $unsigned(reg_rs2_data);  // BLTU
-        3'b111:  branch_taken = $unsigned(reg_rs1_data) >= $unsigned(reg_rs2_data);  // BGEU
+        3'b100:  branch_taken = $signed(forwarded_rs1_data) < $signed(forwarded_rs2_data);  // BLT
+        3'b101:  branch_taken = $signed(forwarded_rs1_data) >= $signed(forwarded_rs2_data);  // BGE
+        3'b110:  branch_taken = forwarded_rs1_data < forwarded_rs2_data;  // BLTU
+        3'b111:  branch_taken = forwarded_rs1_data >= forwarded_rs2_data;  // BGEU
         default: branch_taken = 1'b0;
       endcase
       branch_target = bra_addr;
@@ -676,41 +693,48 @@ always_comb begin
     end
   end
 
-  // Simplified RAW hazard for M/A extensions - avoid circular dependency
+  // RAW hazard for M/A extensions. Their results are only forwarded from
+  // MEM onwards, so ID waits while the producer is still in EX; the M/A
+  // stall itself holds EX until the result is valid.
   if (id_valid) begin
-    // M operations - check if M operation is in execute stage and not ready
+    // M operations
     if (ex_is_m_op && ex_m_valid) begin
       if ((ex_m_rd != 0) && ((ex_m_rd == rs1) || (ex_m_rd == rs2))) begin
-        // Only create hazard if M result is not yet available
-        if (!m_result_valid) begin
-          data_hazard = 1'b1;
-        end
+        data_hazard = 1'b1;
       end
     end
     
-    // A operations - check if A operation is active and not ready
+    // A operations
     if (ex_is_a_op) begin
       if ((ex_a_rd != 0) && ((ex_a_rd == rs1) || (ex_a_rd == rs2))) begin
-        // Only create hazard if A result is not yet available
-        if (!a_result_valid) begin
-          data_hazard = 1'b1;
-        end
+        data_hazard = 1'b1;
       end
     end
+
+    // Structural hazard: the unit only accepts a new op when idle
+    if ((is_m_op && !m_ready) || (is_a_op && !a_ready)) begin
+      data_hazard = 1'b1;
+    end
   end
 end
 
 // Simplified stall logic for Red Pitaya - broken into stages to avoid circular logic
-logic execution_stall;
 
-// Since BRAM is always ready, remove memory ready checks
+// Data port wait state: hold the load or store in EX until dmem_ready.
+// Atomics drive the port themselves and wait inside rv32a_atomic.
+assign mem_stall = (dmem_read || dmem_write) && !dmem_ready && !a_mem_req;
+
+// Back-end stalls freeze every stage: an M op in EX waiting for its
+// result, an atomic in progress or a data wait state. Load-use and M/A
+// hazards only hold IF/ID: EX takes a bubble while the producer carries on.
 // Break circular dependency by not using pipeline_stall in M/A unit inputs
-assign execution_stall = load_use_hazard    ||
-                        data_hazard         ||
-                        cp_stall_external   ||
-                        a_stall_req;
+assign backend_stall = m_stall             ||
+                       cp_stall_external   ||
+                       a_stall_req         ||
+                       mem_stall;
 
-assign pipeline_stall = execution_stall;  // Removed fetch_stall since BRAM is always ready
+// Fetch wait states do not stall the pipeline; IF sends bubbles instead
+assign pipeline_stall = load_use_hazard || data_hazard || backend_stall;
 
   // ========================================
   // Debug Outputs
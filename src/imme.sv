@@ -9,8 +9,8 @@ module imme #(
 );
     localparam IMM_I_TYPE = 2'b00;
     localparam IMM_S_TYPE = 2'b01;
-    localparam IMM_U_TYPE = 2'b10;
-    localparam IMM_B_TYPE = 2'b11;
+    localparam IMM_B_TYPE = 2'b10;
+    localparam IMM_U_TYPE = 2'b11;
     
     always_comb begin
         case(imm_type)
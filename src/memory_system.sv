@@ -4,7 +4,9 @@ module memory_system #(
     parameter INST_WIDTH = 32,
     parameter IMEM_SIZE  = 32768,  // 32KB instruction memory (8 BRAM blocks)
     parameter DMEM_SIZE  = 32768,  // 32KB data memory (8 BRAM blocks)
-    parameter BURST_SIZE = 4
+    parameter BURST_SIZE = 4,
+    parameter IMEM_INIT_FILE = "",  // Optional $readmemh image for inst_mem
+    parameter DMEM_INIT_FILE = ""   // Optional $readmemh image for data_mem
 ) (
     input logic clk,
     input logic rst_n,
@@ -60,40 +62,87 @@ module memory_system #(
 
     // Initialize first data location for testing
     data_mem[0] = 32'h89ABCDEF;
+
+    // Preload images; these override the defaults above
+    if (IMEM_INIT_FILE != "") $readmemh(IMEM_INIT_FILE, inst_mem);
+    if (DMEM_INIT_FILE != "") $readmemh(DMEM_INIT_FILE, data_mem);
+
+`ifndef SYNTHESIS
+    // Simulation-only preload chosen at run time: +IMEM_INIT=<file> +DMEM_INIT=<file>
+    begin
+      string init_file;
+      if ($value$plusargs("IMEM_INIT=%s", init_file)) $readmemh(init_file, inst_mem);
+      if ($value$plusargs("DMEM_INIT=%s", init_file)) $readmemh(init_file, data_mem);
+    end
+`endif
   end
 
+  // BRAM reads are registered, so a word arrives the cycle after its address
+  // is presented. To still fetch one word per cycle, the BRAM reads ahead:
+  // while the word on the port is being served it reads the next sequential
+  // one. The last word served is kept as well, so a CPU holding its PC
+  // through a stall stays ready. Any other fetch, e.g. a branch target,
+  // costs one wait state.
+  logic [ADDR_WIDTH-1:0] imem_fetch_addr;  // Address read at the next edge
+  logic [INST_WIDTH-1:0] imem_bram_data;   // BRAM output register
+  logic [ADDR_WIDTH-1:0] imem_bram_addr;
+  logic                  imem_bram_valid;
+  logic [INST_WIDTH-1:0] imem_hold_data;   // Last word served
+  logic [ADDR_WIDTH-1:0] imem_hold_addr;
+  logic                  imem_hold_valid;
+  logic                  imem_bram_hit;
+  logic                  imem_hold_hit;
+
+  assign imem_bram_hit   = imem_bram_valid && (imem_bram_addr == imem_addr);
+  assign imem_hold_hit   = imem_hold_valid && (imem_hold_addr == imem_addr);
+  assign imem_ready      = imem_bram_hit || imem_hold_hit;
+  assign imem_read_data  = imem_bram_hit ? imem_bram_data : imem_hold_data;
+  assign imem_fetch_addr = imem_ready ? imem_addr + 4 : imem_addr;
+
   // Instruction fetch logic - simplified for direct BRAM access
   always_ff @(posedge clk or negedge rst_n) begin
     if (!rst_n) begin
-      imem_read_data <= 32'h00000013;  // NOP
+      imem_bram_data <= 32'h00000013;  // NOP
+      imem_bram_addr <= '0;
+      imem_bram_valid <= 1'b0;
+      imem_hold_data <= 32'h00000013;  // NOP
+      imem_hold_addr <= '0;
+      imem_hold_valid <= 1'b0;
       imem_access_count <= '0;
     end else begin
-      // Handle read request - BRAM is always ready in 1 cycle
+      if (imem_bram_hit) begin
+        imem_hold_data <= imem_bram_data;
+        imem_hold_addr <= imem_bram_addr;
+        imem_hold_valid <= 1'b1;
+      end
+
+      imem_bram_valid <= imem_read;
       if (imem_read) begin
         imem_access_count <= imem_access_count + 1;
+        imem_bram_addr <= imem_fetch_addr;
 
         // Check if address is in range (word-aligned addresses only)
-        if (imem_addr[31:15] == 17'h0 && imem_addr[1:0] == 2'b00) begin
-          logic [IMEM_ADDR_WIDTH-1:0] word_addr = imem_addr[IMEM_ADDR_WIDTH+1:2];
+        if (imem_fetch_addr[31:15] == 17'h0 && imem_fetch_addr[1:0] == 2'b00) begin
+          // Declared and assigned separately: an initializer on a
+          // block-local variable runs only once, at time zero
+          logic [IMEM_ADDR_WIDTH-1:0] word_addr;
+          word_addr = imem_fetch_addr[IMEM_ADDR_WIDTH+1:2];
 
           if (32'(word_addr) < (IMEM_SIZE / 4)) begin
             // Direct BRAM access - single cycle
-            imem_read_data <= inst_mem[word_addr];
+            imem_bram_data <= inst_mem[word_addr];
           end else begin
             // Out of range
-            imem_read_data <= 32'h00000013;  // NOP for out of range
+            imem_bram_data <= 32'h00000013;  // NOP for out of range
           end
         end else begin
           // Out of range or misaligned
-          imem_read_data <= 32'h00000013;  // NOP for out of range
+          imem_bram_data <= 32'h00000013;  // NOP for out of range
         end
       end
     end
   end
 
-  // BRAM is always ready for instruction access
-  assign imem_ready = 1'b1;
-
   // Data memory access logic - simplified for direct BRAM access
   always_ff @(posedge clk or negedge rst_n) begin
     if (!rst_n) begin
@@ -106,13 +155,14 @@ module memory_system #(
 
         // Check if address is in data memory range (word-aligned addresses only)
         if (dmem_addr[31:15] == 17'h0 && dmem_addr[1:0] == 2'b00) begin
-          logic [DMEM_ADDR_WIDTH-1:0] word_addr = dmem_addr[DMEM_ADDR_WIDTH+1:2];
+          logic [DMEM_ADDR_WIDTH-1:0] word_addr;
+          word_addr = dmem_addr[DMEM_ADDR_WIDTH+1:2];
 
           if (32'(word_addr) < (DMEM_SIZE / 4)) begin
             if (dmem_write) begin
               // Handle byte enables for write
-              logic [31:0] current_data = data_mem[word_addr];
-              logic [31:0] new_data = current_data;
+              logic [31:0] new_data;
+              new_data = data_mem[word_addr];
 
               if (dmem_byte_enable[0]) new_data[7:0] = dmem_write_data[7:0];
               if (dmem_byte_enable[1]) new_data[15:8] = dmem_write_data[15:8];
@@ -137,7 +187,21 @@ module memory_system #(
     end
   end
 
-  // BRAM is always ready for data access
-  assign dmem_ready = 1'b1;
+  // Writes complete at the clock edge; reads wait one cycle for the
+  // registered data
+  logic [ADDR_WIDTH-1:0] dmem_addr_q;
+  logic                  dmem_read_q;
+
+  always_ff @(posedge clk or negedge rst_n) begin
+    if (!rst_n) begin
+      dmem_addr_q <= '0;
+      dmem_read_q <= 1'b0;
+    end else begin
+      dmem_addr_q <= dmem_addr;
+      dmem_read_q <= dmem_read && !dmem_write;
+    end
+  end
+
+  assign dmem_ready = dmem_write || (dmem_read_q && (dmem_addr_q == dmem_addr));
 
 endmodule
\ No newline at end of file
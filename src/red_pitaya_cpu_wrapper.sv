@@ -4,7 +4,9 @@ module red_pitaya_cpu_wrapper #(
     parameter ADDR_WIDTH = 32,
     parameter DATA_WIDTH = 32,
     parameter INST_WIDTH = 32,
-    parameter REG_NUM = 32
+    parameter REG_NUM = 32,
+    parameter IMEM_INIT_FILE = "",  // Optional $readmemh images for the BRAMs
+    parameter DMEM_INIT_FILE = ""
 ) (
     // AXI4-Lite Clock and Reset
     input logic s_axi_aclk,
@@ -268,7 +270,9 @@ module red_pitaya_cpu_wrapper #(
       .DATA_WIDTH(DATA_WIDTH),
       .INST_WIDTH(INST_WIDTH),
       .IMEM_SIZE(8192),  // 8KB instruction memory
-      .DMEM_SIZE(8192)  // 8KB data memory
+      .DMEM_SIZE(8192),  // 8KB data memory
+      .IMEM_INIT_FILE(IMEM_INIT_FILE),
+      .DMEM_INIT_FILE(DMEM_INIT_FILE)
   ) mem_sys (
       .clk  (cpu_clk),
       .rst_n(cpu_rst_n),
@@ -0,0 +1,191 @@
+"""
+asyncio host controller for many boards and simulations
+
+cpu_wait_for_state() in cpu_driver.c (and CPUController.wait_for_state)
+blocks its caller while it polls. AsyncCPUController wraps a CPUController
+so waits are coroutines: one orchestration process can wait on dozens of
+boards at once, and cancelling or timing out a wait is ordinary asyncio.
+
+Waits poll CPU_STATUS_STATE and CPU_STATUS_PC following a PollPolicy:
+back to back for a short hot window (most single steps and short runs
+finish there), then with exponentially growing sleeps up to a ceiling.
+Register and memory accesses on the mmap backends are single loads and
+stores and run inline; backends marked blocking run in an executor.
+
+    boards = [AsyncCPUController(CPUController(DevMemBackend(base))) for base in bases]
+    await asyncio.gather(*(b.start() for b in boards))
+    results = await wait_many(boards, CPU_STATE_HALTED, timeout=5.0)
+"""
+
+import asyncio
+import functools
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Sequence, Union
+
+from controller import CPU_STATE_HALTED, CPU_STATE_RUNNING, CPUController, ControllerError
+
+
+class WaitTimeout(ControllerError, asyncio.TimeoutError):
+    """A wait did not see its condition before the timeout"""
+
+
+@dataclass
+class PollPolicy:
+    """How often a wait samples the status registers"""
+    hot_window: float = 0.002  # Seconds of back-to-back polling
+    initial: float = 0.0001  # First sleep after the hot window
+    factor: float = 2.0
+    ceiling: float = 0.05
+
+
+@dataclass
+class PollResult:
+    """Status seen when a wait finished"""
+    state: int
+    pc: int
+    polls: int
+    elapsed: float
+
+
+class AsyncCPUController:
+    """Coroutine interface to a CPUController"""
+
+    def __init__(self, controller: CPUController, policy: Optional[PollPolicy] = None,
+                 name: Optional[str] = None):
+        self.controller = controller
+        self.policy = policy or PollPolicy()
+        self.name = name or getattr(controller.backend, "key", None) or f"cpu@{id(controller):x}"
+        self._lock = asyncio.Lock()
+
+    def __repr__(self):
+        return f"AsyncCPUController({self.name})"
+
+    async def _call(self, fn: Callable, *args, **kwargs):
+        """Run a controller method, off the event loop if the backend blocks"""
+        if not getattr(self.controller.backend, "blocking", False):
+            return fn(*args, **kwargs)
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def close(self):
+        await self._call(self.controller.close)
+
+    # Control; start/stop return without blocking and can be awaited on
+
+    async def start(self, wait: bool = True, timeout: Optional[float] = 0.1) -> Optional[PollResult]:
+        await self._call(self.controller.start, timeout=None)
+        if wait:
+            return await self.wait_for_state(CPU_STATE_RUNNING, timeout)
+        return None
+
+    async def stop(self, wait: bool = True, timeout: Optional[float] = 1.0) -> Optional[PollResult]:
+        await self._call(self.controller.stop, timeout=None)
+        if wait:
+            return await self.wait_for_state(CPU_STATE_HALTED, timeout)
+        return None
+
+    async def step(self):
+        await self._call(self.controller.step)
+
+    async def reset(self, hard: bool = False):
+        await self._call(self.controller.reset, hard)
+
+    async def load(self, image, **kwargs):
+        return await self._call(self.controller.load, image, **kwargs)
+
+    async def status(self):
+        """(CPU_STATUS_STATE, CPU_STATUS_PC)"""
+        return await self._call(lambda: (self.controller.state(), self.controller.pc))
+
+    async def read_register(self, index: int) -> int:
+        return await self._call(self.controller.read_register, index)
+
+    async def write_register(self, index: int, value: int):
+        await self._call(self.controller.write_register, index, value)
+
+    async def read_registers(self):
+        return await self._call(self.controller.read_registers)
+
+    async def read_block(self, offset: int, size: int) -> bytes:
+        """Raw slice of the CPU window, e.g. the whole status block"""
+        return await self._call(self.controller.backend.read, offset, size)
+
+    async def read_memory(self, addr: int, size: int) -> bytes:
+        return await self._call(self.controller.read_memory, addr, size)
+
+    async def write_memory(self, addr: int, data):
+        await self._call(self.controller.write_memory, addr, data)
+
+    async def snapshot(self, memory=(), halt: bool = False):
+        return await self._call(self.controller.snapshot, memory, halt)
+
+    # Waits
+
+    async def wait_until(self, condition: Callable[[int, int], bool], timeout: Optional[float] = None,
+                         what: str = "condition") -> PollResult:
+        """Poll until condition(state, pc) holds
+
+        Raises WaitTimeout after timeout seconds; cancelling the task stops
+        the polling at its next await.
+        """
+        policy = self.policy
+        start = time.monotonic()
+        hot_until = start + policy.hot_window
+        deadline = None if timeout is None else start + timeout
+        interval = policy.initial
+        polls = 0
+        while True:
+            state, pc = await self.status()
+            polls += 1
+            now = time.monotonic()
+            if condition(state, pc):
+                return PollResult(state, pc, polls, now - start)
+            if deadline is not None and now >= deadline:
+                raise WaitTimeout(f"{self.name}: timeout after {timeout}s waiting for {what} "
+                                  f"(state 0x{state:08x}, pc 0x{pc:08x}, {polls} polls)")
+            if now < hot_until:
+                # Yield so other boards' waits still run
+                await asyncio.sleep(0)
+                continue
+            sleep = interval if deadline is None else min(interval, deadline - now)
+            await asyncio.sleep(sleep)
+            interval = min(interval * policy.factor, policy.ceiling)
+
+    async def wait_for_state(self, mask: int, timeout: Optional[float] = 1.0) -> PollResult:
+        """Wait until any bit of mask is set in CPU_STATUS_STATE"""
+        return await self.wait_until(lambda state, pc: bool(state & mask), timeout, f"state 0x{mask:x}")
+
+    async def wait_halted(self, timeout: Optional[float] = None) -> PollResult:
+        return await self.wait_for_state(CPU_STATE_HALTED, timeout)
+
+    async def wait_for_pc(self, pcs: Union[int, Iterable[int]], timeout: Optional[float] = None) -> PollResult:
+        """Wait until the PC reaches one of pcs, e.g. a halt loop"""
+        targets = {pcs} if isinstance(pcs, int) else set(pcs)
+        what = "pc " + ", ".join(f"0x{pc:x}" for pc in sorted(targets))
+        return await self.wait_until(lambda state, pc: pc in targets, timeout, what)
+
+
+async def wait_many(boards: Sequence[AsyncCPUController], mask: int = CPU_STATE_HALTED,
+                    timeout: Optional[float] = None) -> Dict[AsyncCPUController, Union[PollResult, Exception]]:
+    """Wait on many boards concurrently; failures are returned, not raised"""
+    results = await asyncio.gather(*(board.wait_for_state(mask, timeout) for board in boards),
+                                   return_exceptions=True)
+    return dict(zip(boards, results))
+
+
+async def first_of(boards: Sequence[AsyncCPUController], mask: int = CPU_STATE_HALTED,
+                   timeout: Optional[float] = None):
+    """(board, result) for the first board to reach mask; the other waits are cancelled"""
+    tasks = {asyncio.ensure_future(board.wait_for_state(mask, None)): board for board in boards}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            raise WaitTimeout(f"No board reached state 0x{mask:x} within {timeout}s")
+        task = done.pop()
+        return tasks[task], task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
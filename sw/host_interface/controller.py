@@ -0,0 +1,687 @@
+"""
+Host controller for the Red Pitaya RISC-V CPU
+
+Python counterpart of sw/drivers/cpu_driver.c. The CPU window of
+cpu_regs.h (IMEM, DMEM, CTRL, STATUS and DEBUG blocks) is mapped once when
+the backend is opened; register and memory accesses afterwards are loads
+and stores on that mapping, with no system call per access.
+
+Backends:
+  DevMemBackend  /dev/mem on the board
+  FileBackend    a file-backed (or anonymous) mmap standing in for the board
+                 in scripts and tests; it behaves as plain memory
+  SimBackend     a cocotb red_pitaya_cpu_wrapper (tb/sim_backend.py)
+
+    with CPUController(DevMemBackend()) as cpu:
+        cpu.load(load_program("prog.elf"))
+        cpu.start()
+        print(hex(cpu.pc), cpu.read_register(10))
+
+load() keeps a hash per 1 KB block of what it last wrote to each board
+(persisted under $RP_CPU_CACHE, default ~/.cache/rp_cpu, for /dev/mem and
+file backends), so reloading after an edit writes and verifies only the
+blocks that changed. Starting the CPU invalidates data memory.
+
+The same script runs in simulation from a cocotb test with
+`await cocotb.external(script)(CPUController(SimBackend(dut)))`, and an
+AsyncCPUController on a plain thread drives SimBackend while
+`cocotb.start_soon(backend.serve())` runs.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from loader import DMEM_OFFSET, DMEM_SIZE, IMEM_OFFSET, IMEM_SIZE, PAGE_SIZE, ProgramImage
+
+logger = logging.getLogger(__name__)
+
+# Addresses and offsets from sw/drivers/cpu_regs.h
+RP_BASE_ADDR = 0x40000000
+CPU_BASE_ADDR = RP_BASE_ADDR + 0x100000
+CTRL_OFFSET = 0x20000
+STATUS_OFFSET = 0x21000
+DEBUG_OFFSET = 0x22000
+WINDOW_SIZE = 0x30000  # As mapped by cpu_init()
+
+CPU_REG_COUNT = 32
+
+CPU_CTRL_ENABLE = 0x00
+CPU_CTRL_RESET = 0x04
+CPU_CTRL_CLOCK = 0x08
+CPU_CTRL_PC = 0x0C
+CPU_CTRL_IRQ = 0x10
+CPU_CTRL_MODE = 0x14
+CPU_CTRL_STEP = 0x18
+CPU_CTRL_BREAK = 0x1C
+
+CPU_STATUS_STATE = 0x00
+CPU_STATUS_PC = 0x04
+CPU_STATUS_CYCLES = 0x08
+CPU_STATUS_INSTRET = 0x0C
+CPU_STATUS_STALL = 0x10
+CPU_STATUS_EXCEPT = 0x14
+CPU_STATUS_IRQ_PEND = 0x18
+CPU_STATUS_PIPELINE = 0x1C
+
+CPU_DEBUG_REG_SEL = 0x00
+CPU_DEBUG_REG_VAL = 0x04
+CPU_DEBUG_MEM_ADDR = 0x08
+CPU_DEBUG_MEM_DATA = 0x0C
+CPU_DEBUG_TRACE = 0x10
+CPU_DEBUG_BP_ADDR = 0x14
+CPU_DEBUG_BP_CTRL = 0x18
+CPU_DEBUG_WATCH = 0x1C
+
+CPU_ENABLE_BIT = 1 << 0
+CPU_CLOCK_EN_BIT = 1 << 1
+CPU_DEBUG_EN_BIT = 1 << 2
+CPU_COPROC_EN_BIT = 1 << 3
+
+CPU_RESET_BIT = 1 << 0
+CPU_RESET_PIPE_BIT = 1 << 1
+CPU_RESET_CACHE_BIT = 1 << 2
+CPU_RESET_COPROC_BIT = 1 << 3
+
+CPU_MODE_RUN = 0x0
+CPU_MODE_STEP = 0x1
+CPU_MODE_DEBUG = 0x2
+CPU_MODE_HALT = 0x3
+
+CPU_STATE_RUNNING = 1 << 0
+CPU_STATE_HALTED = 1 << 1
+CPU_STATE_EXCEPTION = 1 << 2
+CPU_STATE_INTERRUPT = 1 << 3
+CPU_STATE_DEBUG = 1 << 4
+CPU_STATE_RESET = 1 << 5
+
+MAX_BREAKPOINTS = 16  # Size of the cpu_driver breakpoint table
+EBREAK = 0x00100073
+
+REGISTER_NAMES = [
+    "zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2",
+    "s0", "s1", "a0", "a1", "a2", "a3", "a4", "a5",
+    "a6", "a7", "s2", "s3", "s4", "s5", "s6", "s7",
+    "s8", "s9", "s10", "s11", "t3", "t4", "t5", "t6",
+]
+
+# Granularity of incremental reloads
+BLOCK_SIZE = 1024
+CACHE_DIR = os.environ.get("RP_CPU_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "rp_cpu"))
+
+
+class ControllerError(Exception):
+    """Raised for invalid requests and hardware timeouts, like CPU_ERROR_*"""
+
+
+# Backends ----------------------------------------------------------------
+
+
+class Backend:
+    """Word and block access to the CPU window, by offset from CPU_BASE_ADDR"""
+
+    # Seconds between status polls while waiting for the CPU
+    poll_interval = 0.001
+    # Identifies the board for the reload cache; None keeps it in memory
+    key: Optional[str] = None
+    # Accesses may block (e.g. over a network); async callers use an executor
+    blocking = False
+
+    def read32(self, offset: int) -> int:
+        raise NotImplementedError
+
+    def write32(self, offset: int, value: int):
+        raise NotImplementedError
+
+    def read(self, offset: int, size: int) -> bytes:
+        raise NotImplementedError
+
+    def write(self, offset: int, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MmapBackend(Backend):
+    """Backend over a mapping of the whole window
+
+    Word accesses go through a 32-bit memoryview, so each is a single load
+    or store; block accesses are slice copies.
+    """
+
+    def __init__(self, mm: mmap.mmap):
+        self._mmap = mm
+        self._bytes = memoryview(mm)
+        self._words = self._bytes.cast("I")
+
+    def read32(self, offset: int) -> int:
+        return self._words[offset >> 2]
+
+    def write32(self, offset: int, value: int):
+        self._words[offset >> 2] = value & 0xFFFFFFFF
+
+    def read(self, offset: int, size: int) -> bytes:
+        return bytes(self._bytes[offset:offset + size])
+
+    def write(self, offset: int, data):
+        data = memoryview(data).cast("B")
+        self._bytes[offset:offset + len(data)] = data
+
+    def view(self, offset: int, size: int) -> memoryview:
+        """Zero-copy view of part of the window"""
+        return self._bytes[offset:offset + size]
+
+    def close(self):
+        if self._mmap is None:
+            return
+        self._words.release()
+        self._bytes.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Views from view() still held elsewhere; the mapping goes with them
+            pass
+        self._mmap = None
+
+
+class DevMemBackend(MmapBackend):
+    """The CPU window of the FPGA, mapped from /dev/mem like cpu_init()"""
+
+    poll_interval = 0.001
+
+    def __init__(self, base: int = CPU_BASE_ADDR, size: int = WINDOW_SIZE, path: str = "/dev/mem"):
+        try:
+            fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        except OSError as e:
+            raise ControllerError(f"Failed to open {path}: {e.strerror}")
+        try:
+            mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE, offset=base)
+        except OSError as e:
+            raise ControllerError(f"Failed to map CPU memory: {e.strerror}")
+        finally:
+            os.close(fd)
+        super().__init__(mm)
+        self.key = f"devmem-{base:08x}"
+
+
+class FileBackend(MmapBackend):
+    """File-backed stand-in for the board; anonymous memory without a path
+
+    Apart from CPU_CTRL_ENABLE updating CPU_STATUS_STATE it is plain memory.
+    """
+
+    poll_interval = 0
+
+    def __init__(self, path: Optional[str] = None, size: int = WINDOW_SIZE):
+        if path is None:
+            super().__init__(mmap.mmap(-1, size))
+            return
+        with open(path, "a+b") as f:
+            if os.fstat(f.fileno()).st_size < size:
+                f.truncate(size)
+            super().__init__(mmap.mmap(f.fileno(), size))
+        self.key = f"file-{os.path.abspath(path)}"
+
+    def write32(self, offset: int, value: int):
+        super().write32(offset, value)
+        if offset == CTRL_OFFSET + CPU_CTRL_ENABLE:
+            # Reflect enable in the state register so start()/stop() complete
+            state = CPU_STATE_RUNNING if value & CPU_ENABLE_BIT else CPU_STATE_HALTED
+            super().write32(STATUS_OFFSET + CPU_STATUS_STATE, state)
+
+
+# Incremental reload ------------------------------------------------------
+
+
+class BlockCache:
+    """Content hashes of the BLOCK_SIZE blocks last written to one board
+
+    With a path the hashes persist between runs, so a later reload from
+    another process still only writes what changed. Blocks the CPU or
+    another writer may have modified since must be invalidated.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.hashes: Dict[int, str] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.hashes = {int(addr, 16): digest for addr, digest in json.load(f).items()}
+            except (OSError, ValueError):
+                logger.warning(f"Ignoring unreadable reload cache {path}")
+
+    @classmethod
+    def for_backend(cls, backend: Backend, cache_dir: str = CACHE_DIR) -> "BlockCache":
+        if backend.key is None:
+            return cls()
+        name = hashlib.sha1(backend.key.encode()).hexdigest()[:16]
+        return cls(os.path.join(cache_dir, f"{name}.json"))
+
+    @staticmethod
+    def digest(block) -> str:
+        return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+    def invalidate(self, addr: int = 0, size: Optional[int] = None):
+        """Forget blocks overlapping [addr, addr + size), or everything"""
+        if size is None:
+            self.hashes.clear()
+            return
+        first = addr - addr % BLOCK_SIZE
+        for block in range(first, addr + size, BLOCK_SIZE):
+            self.hashes.pop(block, None)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({f"{addr:05x}": digest for addr, digest in sorted(self.hashes.items())}, f)
+        os.replace(tmp, self.path)
+
+
+@dataclass
+class LoadStats:
+    """What an incremental load wrote"""
+    blocks: int = 0
+    written: int = 0
+    bytes_written: int = 0
+    runs: int = 0
+    stale: int = 0
+
+
+Run = Tuple[int, List[memoryview], List[str]]
+
+
+def _add_to_runs(runs: List[Run], addr: int, block: memoryview, digest: str):
+    """Extend the last (address, blocks, digests) run or start a new one"""
+    if runs and runs[-1][0] + BLOCK_SIZE * len(runs[-1][1]) == addr != DMEM_OFFSET:
+        runs[-1][1].append(block)
+        runs[-1][2].append(digest)
+    else:
+        runs.append((addr, [block], [digest]))
+
+
+def _blocks(image: ProgramImage) -> Iterator[Tuple[int, memoryview]]:
+    """(address, block) for every BLOCK_SIZE block of the image in CPU memory"""
+    limit = DMEM_OFFSET + DMEM_SIZE
+    for page_addr, page in image.items():
+        view = memoryview(page)
+        for offset in range(0, PAGE_SIZE, BLOCK_SIZE):
+            if page_addr + offset < limit:
+                yield page_addr + offset, view[offset:offset + BLOCK_SIZE]
+
+
+# Controller --------------------------------------------------------------
+
+
+@dataclass
+class Breakpoint:
+    """Mirrors cpu_breakpoint_t"""
+    id: int
+    address: int
+    enabled: bool = True
+    hardware: bool = False
+    hit_count: int = 0
+    original: Optional[int] = None  # Instruction replaced by EBREAK
+
+
+class CPUController:
+    """Start/stop/step, register, memory and breakpoint access over a Backend"""
+
+    def __init__(self, backend: Backend, reset_vector: int = 0, cache: Optional[BlockCache] = None):
+        self.backend = backend
+        self.reset_vector = reset_vector
+        self.breakpoints: Dict[int, Breakpoint] = {}
+        self.cache = cache if cache is not None else BlockCache.for_backend(backend)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.backend.close()
+
+    # Register blocks
+
+    def ctrl(self, offset: int) -> int:
+        return self.backend.read32(CTRL_OFFSET + offset)
+
+    def set_ctrl(self, offset: int, value: int):
+        self.backend.write32(CTRL_OFFSET + offset, value)
+
+    def status(self, offset: int) -> int:
+        return self.backend.read32(STATUS_OFFSET + offset)
+
+    def debug(self, offset: int) -> int:
+        return self.backend.read32(DEBUG_OFFSET + offset)
+
+    def set_debug(self, offset: int, value: int):
+        self.backend.write32(DEBUG_OFFSET + offset, value)
+
+    # Execution control
+
+    def reset(self, hard: bool = False):
+        """Pulse reset, restore the reset vector and clear breakpoints"""
+        bits = CPU_RESET_BIT
+        if hard:
+            bits |= CPU_RESET_PIPE_BIT | CPU_RESET_CACHE_BIT | CPU_RESET_COPROC_BIT
+        self.set_ctrl(CPU_CTRL_RESET, bits)
+        self.set_ctrl(CPU_CTRL_RESET, 0)
+        if hard:
+            # Memory contents after a hard reset are not the ones last loaded
+            self.cache.invalidate()
+            self.cache.save()
+        self.set_pc(self.reset_vector)
+        for bp_id in list(self.breakpoints):
+            self.clear_breakpoint(bp_id)
+
+    def _will_run(self):
+        # A running program may store anywhere in data memory
+        self.cache.invalidate(DMEM_OFFSET, DMEM_SIZE)
+        self.cache.save()
+
+    def start(self, timeout: Optional[float] = 0.1):
+        self._will_run()
+        self.set_ctrl(CPU_CTRL_ENABLE, self.ctrl(CPU_CTRL_ENABLE) | CPU_ENABLE_BIT)
+        if timeout is not None:
+            self.wait_for_state(CPU_STATE_RUNNING, timeout)
+
+    def stop(self, timeout: Optional[float] = 1.0):
+        self.set_ctrl(CPU_CTRL_ENABLE, self.ctrl(CPU_CTRL_ENABLE) & ~CPU_ENABLE_BIT)
+        if timeout is not None:
+            self.wait_for_state(CPU_STATE_HALTED, timeout)
+
+    def step(self):
+        """Execute one instruction in single-step mode"""
+        if self.is_running():
+            raise ControllerError("CPU must be stopped for single step")
+        self._will_run()
+        self.set_ctrl(CPU_CTRL_MODE, CPU_MODE_STEP)
+        self.set_ctrl(CPU_CTRL_STEP, 1)
+        self.set_ctrl(CPU_CTRL_ENABLE, self.ctrl(CPU_CTRL_ENABLE) | CPU_ENABLE_BIT)
+        self.set_ctrl(CPU_CTRL_ENABLE, self.ctrl(CPU_CTRL_ENABLE) & ~CPU_ENABLE_BIT)
+        self.set_ctrl(CPU_CTRL_STEP, 0)
+        self.set_ctrl(CPU_CTRL_MODE, CPU_MODE_RUN)
+
+    def state(self) -> int:
+        return self.status(CPU_STATUS_STATE)
+
+    def is_running(self) -> bool:
+        return bool(self.state() & CPU_STATE_RUNNING)
+
+    def wait_for_state(self, mask: int, timeout: float = 1.0) -> int:
+        """Poll CPU_STATUS_STATE until any bit of mask is set"""
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self.state()
+            if state & mask:
+                return state
+            if time.monotonic() > deadline:
+                raise ControllerError(f"Timeout waiting for CPU state 0x{mask:08x} (state 0x{state:08x})")
+            if self.backend.poll_interval:
+                time.sleep(self.backend.poll_interval)
+
+    @property
+    def pc(self) -> int:
+        return self.status(CPU_STATUS_PC)
+
+    def set_pc(self, pc: int):
+        self.set_ctrl(CPU_CTRL_PC, pc)
+
+    # The counters are single 32-bit registers: cpu_get_state() reads
+    # CPU_STATUS_CYCLES + 4 as a high word, but that is CPU_STATUS_INSTRET
+
+    @property
+    def cycles(self) -> int:
+        return self.status(CPU_STATUS_CYCLES)
+
+    @property
+    def instret(self) -> int:
+        return self.status(CPU_STATUS_INSTRET)
+
+    # Registers
+
+    def read_register(self, index: int) -> int:
+        if not 0 <= index < CPU_REG_COUNT:
+            raise ControllerError(f"Invalid register x{index}")
+        self.set_debug(CPU_DEBUG_REG_SEL, index)
+        return self.debug(CPU_DEBUG_REG_VAL)
+
+    def write_register(self, index: int, value: int):
+        if not 0 <= index < CPU_REG_COUNT:
+            raise ControllerError(f"Invalid register x{index}")
+        if index == 0:
+            return  # x0 is hardwired to zero
+        self.set_debug(CPU_DEBUG_REG_SEL, index)
+        self.set_debug(CPU_DEBUG_REG_VAL, value)
+
+    def read_registers(self) -> List[int]:
+        return [self.read_register(i) for i in range(CPU_REG_COUNT)]
+
+    def snapshot(self, memory=(), halt: bool = False):
+        """Status, registers and memory ranges in one pass; see snapshot.py"""
+        from snapshot import snapshot
+
+        return snapshot(self, memory, halt)
+
+    # Memory, addressed like cpu_read_memory(): IMEM at 0, DMEM at 0x10000
+
+    @staticmethod
+    def check_range(addr: int, size: int):
+        """Same bounds as is_valid_address() in cpu_driver.c"""
+        if size <= 0 or addr < 0:
+            raise ControllerError(f"Invalid memory access 0x{addr:x}+{size}")
+        if addr + size <= IMEM_OFFSET + IMEM_SIZE:
+            return
+        if addr >= DMEM_OFFSET and addr + size <= DMEM_OFFSET + DMEM_SIZE:
+            return
+        raise ControllerError(f"Invalid memory address range 0x{addr:x}+{size}")
+
+    def read_memory(self, addr: int, size: int) -> bytes:
+        self.check_range(addr, size)
+        return self.backend.read(addr, size)
+
+    def write_memory(self, addr: int, data):
+        data = memoryview(data).cast("B")
+        self.check_range(addr, len(data))
+        self.cache.invalidate(addr, len(data))
+        self.backend.write(addr, data)
+
+    def read_word(self, addr: int) -> int:
+        self.check_range(addr, 4)
+        return self.backend.read32(addr)
+
+    def write_word(self, addr: int, value: int):
+        self.check_range(addr, 4)
+        self.cache.invalidate(addr, 4)
+        self.backend.write32(addr, value)
+
+    def verify_memory(self, addr: int, expected) -> bool:
+        expected = memoryview(expected).cast("B")
+        return self.read_memory(addr, len(expected)) == expected
+
+    def load(self, image: ProgramImage, verify: bool = True, incremental: bool = True) -> LoadStats:
+        """Write a ProgramImage, like cpu_load_program()
+
+        Only BLOCK_SIZE blocks whose content differs from what the cache
+        says was last written are written, as runs of adjacent blocks, and
+        only those runs are read back and compared. The skipped blocks are
+        compared too, since the board may have been reloaded or written
+        elsewhere; if any differ the cache is dropped and every block is
+        rewritten. incremental=False rewrites every block of the image.
+        """
+        was_running = self.is_running()
+        if was_running:
+            self.stop()
+
+        stats = LoadStats()
+        runs: List[Run] = []
+        skipped: List[Run] = []
+        every: List[Run] = []
+        for addr, block in _blocks(image):
+            stats.blocks += 1
+            digest = BlockCache.digest(block)
+            cached = incremental and self.cache.hashes.get(addr) == digest
+            _add_to_runs(skipped if cached else runs, addr, block, digest)
+            _add_to_runs(every, addr, block, digest)
+
+        for addr, blocks, _ in skipped:
+            data = b"".join(blocks)
+            current = self.backend.read(addr, len(data))
+            if current != data:
+                stats.stale += sum(current[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE] != block
+                                   for i, block in enumerate(blocks))
+        if stats.stale:
+            logger.warning(f"{stats.stale} cached blocks changed on the board, rewriting all")
+            self.cache.invalidate()
+            runs = every
+
+        for addr, blocks, digests in runs:
+            data = b"".join(blocks)
+            self.check_range(addr, len(data))
+            self.backend.write(addr, data)
+            if verify and self.backend.read(addr, len(data)) != data:
+                self.cache.invalidate(addr, len(data))
+                self.cache.save()
+                raise ControllerError(f"Memory verification failed in 0x{addr:05x}+0x{len(data):x}")
+            for i, digest in enumerate(digests):
+                self.cache.hashes[addr + i * BLOCK_SIZE] = digest
+            stats.written += len(blocks)
+            stats.bytes_written += len(data)
+            stats.runs += 1
+        self.cache.save()
+        logger.info(f"Loaded {stats.written}/{stats.blocks} blocks in {stats.runs} runs")
+
+        if image.entry_point is not None:
+            self.set_pc(image.entry_point)
+        if was_running:
+            self.start()
+        return stats
+
+    # Breakpoints
+
+    def set_breakpoint(self, address: int) -> int:
+        """Add a breakpoint and return its id
+
+        The first one uses the hardware comparator (CPU_DEBUG_BP_ADDR);
+        further ones patch an EBREAK into instruction memory.
+        """
+        if len(self.breakpoints) >= MAX_BREAKPOINTS:
+            raise ControllerError(f"All {MAX_BREAKPOINTS} breakpoints in use")
+        self.check_range(address, 4)
+        bp_id = next(i for i in range(MAX_BREAKPOINTS) if i not in self.breakpoints)
+        bp = Breakpoint(bp_id, address)
+        if not any(b.hardware for b in self.breakpoints.values()):
+            bp.hardware = True
+            self.set_debug(CPU_DEBUG_BP_ADDR, address)
+            self.set_debug(CPU_DEBUG_BP_CTRL, 1)
+        else:
+            bp.original = self.read_word(address)
+            self.write_word(address, EBREAK)
+        self.breakpoints[bp_id] = bp
+        return bp_id
+
+    def clear_breakpoint(self, bp_id: int):
+        bp = self.breakpoints.pop(bp_id, None)
+        if bp is None:
+            raise ControllerError(f"No breakpoint {bp_id}")
+        if bp.hardware:
+            self.set_debug(CPU_DEBUG_BP_CTRL, 0)
+        elif bp.original is not None:
+            self.write_word(bp.address, bp.original)
+
+    def breakpoint_hit(self) -> Optional[Breakpoint]:
+        """The breakpoint at the current PC of a halted CPU, counting the hit"""
+        pc = self.pc
+        for bp in self.breakpoints.values():
+            if bp.enabled and bp.address == pc:
+                bp.hit_count += 1
+                return bp
+        return None
+
+    def dump_state(self) -> str:
+        """Text dump in the format of cpu_dump_state()"""
+        regs = self.read_registers()
+        lines = [
+            "CPU State Dump:",
+            f"PC: 0x{self.pc:08x}",
+            f"Cycles: {self.cycles}",
+            f"Instructions: {self.instret}",
+            f"State: 0x{self.state():08x}",
+            "",
+            "Registers:",
+        ]
+        for i in range(0, CPU_REG_COUNT, 4):
+            lines.append(f"x{i:2d}-x{i + 3:2d}: " + " ".join(f"{r:08x}" for r in regs[i:i + 4]))
+        return "\n".join(lines)
+
+
+def open_backend(spec: str) -> Backend:
+    """'devmem', 'devmem:<base>' or 'file:<path>'"""
+    kind, _, arg = spec.partition(":")
+    if kind == "devmem":
+        return DevMemBackend(int(arg, 0)) if arg else DevMemBackend()
+    if kind == "file":
+        return FileBackend(arg or None)
+    raise ControllerError(f"Unknown backend '{spec}'")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Control the Red Pitaya RISC-V CPU")
+    parser.add_argument("--backend", default="devmem", help="devmem[:base] or file:<path>")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="dump PC, counters and registers")
+    sub.add_parser("start")
+    sub.add_parser("stop")
+    sub.add_parser("step")
+    reset = sub.add_parser("reset")
+    reset.add_argument("--hard", action="store_true")
+    load = sub.add_parser("load", help="load an ELF, HEX or binary program")
+    load.add_argument("file")
+    load.add_argument("--load-addr", type=lambda v: int(v, 0), default=0)
+    load.add_argument("--start", action="store_true", help="start the CPU after loading")
+    load.add_argument("--full", action="store_true", help="rewrite every block, ignoring the reload cache")
+    args = parser.parse_args(argv)
+
+    from loader import LoaderError, load_program
+
+    try:
+        with CPUController(open_backend(args.backend)) as cpu:
+            if args.command == "status":
+                print(cpu.dump_state())
+            elif args.command == "start":
+                cpu.start()
+            elif args.command == "stop":
+                cpu.stop()
+            elif args.command == "step":
+                cpu.step()
+                print(f"PC: 0x{cpu.pc:08x}")
+            elif args.command == "reset":
+                cpu.reset(args.hard)
+            elif args.command == "load":
+                with load_program(args.file, args.load_addr) as image:
+                    stats = cpu.load(image, incremental=not args.full)
+                    print(image.summary())
+                print(f"Wrote {stats.written} of {stats.blocks} {BLOCK_SIZE}-byte blocks ({stats.bytes_written} bytes)")
+                if args.start:
+                    cpu.start()
+    except (ControllerError, LoaderError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+RV32IMA disassembler for traces, listings and the dashboard
+
+cpu_disassemble() in cpu_driver.c only knows add, sll and addi. This
+decodes all of RV32I, M and A plus the Zicsr and privileged instructions
+the CPU implements, with the ABI register names of cpu_register_name(),
+and folds the usual pseudo-instructions (li, mv, j, ret, beqz, csrr ...).
+Branch and jump targets are printed as absolute addresses, with
+<symbol+offset> when a symbol table is given.
+
+Decoding is memoized per instruction word, independent of the PC, so a
+trace that runs the same loop a million times decodes each word once.
+Listing pre-renders a whole IMEM image once per distinct image, so a
+viewer turns a PC into a line with a dictionary lookup:
+
+    listing = Listing.for_image(image, load_elf_symbols("prog.elf"))
+    for pc, insn in entries:
+        print(listing.line(pc, insn))
+
+    python disassembler.py prog.elf
+    python disassembler.py --word 0x00500293
+"""
+
+import argparse
+import bisect
+import hashlib
+import sys
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from controller import REGISTER_NAMES
+from loader import IMEM_OFFSET, IMEM_SIZE, PAGE_SIZE, LoaderError, ProgramImage, load_elf_symbols, load_program
+
+MASK32 = 0xFFFFFFFF
+
+CSR_NAMES = {
+    0x300: "mstatus", 0x301: "misa", 0x304: "mie", 0x305: "mtvec", 0x340: "mscratch",
+    0x341: "mepc", 0x342: "mcause", 0x343: "mtval", 0x344: "mip",
+    0xC00: "cycle", 0xC01: "time", 0xC02: "instret", 0xC80: "cycleh", 0xC81: "timeh",
+    0xC82: "instreth", 0xB00: "mcycle", 0xB02: "minstret", 0xF14: "mhartid",
+}
+# Counters with rdcycle-style read pseudo-instructions
+_COUNTER_READS = {0xC00: "rdcycle", 0xC01: "rdtime", 0xC02: "rdinstret",
+                  0xC80: "rdcycleh", 0xC81: "rdtimeh", 0xC82: "rdinstreth"}
+
+_OP = {
+    (0, 0x00): "add", (0, 0x20): "sub", (1, 0x00): "sll", (2, 0x00): "slt",
+    (3, 0x00): "sltu", (4, 0x00): "xor", (5, 0x00): "srl", (5, 0x20): "sra",
+    (6, 0x00): "or", (7, 0x00): "and",
+    (0, 0x01): "mul", (1, 0x01): "mulh", (2, 0x01): "mulhsu", (3, 0x01): "mulhu",
+    (4, 0x01): "div", (5, 0x01): "divu", (6, 0x01): "rem", (7, 0x01): "remu",
+}
+_OP_IMM = {0: "addi", 2: "slti", 3: "sltiu", 4: "xori", 6: "ori", 7: "andi"}
+_LOAD = {0: "lb", 1: "lh", 2: "lw", 4: "lbu", 5: "lhu"}
+_STORE = {0: "sb", 1: "sh", 2: "sw"}
+_BRANCH = {0: "beq", 1: "bne", 4: "blt", 5: "bge", 6: "bltu", 7: "bgeu"}
+_CSR = {1: "csrrw", 2: "csrrs", 3: "csrrc", 5: "csrrwi", 6: "csrrsi", 7: "csrrci"}
+_AMO = {
+    0x02: "lr.w", 0x03: "sc.w", 0x01: "amoswap.w", 0x00: "amoadd.w", 0x04: "amoxor.w",
+    0x0C: "amoand.w", 0x08: "amoor.w", 0x10: "amomin.w", 0x14: "amomax.w",
+    0x18: "amominu.w", 0x1C: "amomaxu.w",
+}
+_SYSTEM = {0x00000073: "ecall", 0x00100073: "ebreak", 0x30200073: "mret", 0x10500073: "wfi"}
+
+# (mnemonic, operands, pc-relative target offset or None)
+Decoded = Tuple[str, str, Optional[int]]
+
+
+def register_name(index: int) -> str:
+    """Same as cpu_register_name()"""
+    return REGISTER_NAMES[index] if 0 <= index < len(REGISTER_NAMES) else "invalid"
+
+
+def _sext(value: int, bits: int) -> int:
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+
+def _csr(number: int) -> str:
+    return CSR_NAMES.get(number, f"0x{number:03x}")
+
+
+@lru_cache(maxsize=1 << 16)
+def decode(insn: int, pseudo: bool = True) -> Decoded:
+    """Mnemonic and operands of one instruction word, without its PC"""
+    r = REGISTER_NAMES
+    opcode = insn & 0x7F
+    rd = (insn >> 7) & 0x1F
+    funct3 = (insn >> 12) & 0x7
+    rs1 = (insn >> 15) & 0x1F
+    rs2 = (insn >> 20) & 0x1F
+    funct7 = insn >> 25
+    imm_i = _sext(insn >> 20, 12)
+
+    if opcode == 0x37:
+        return "lui", f"{r[rd]}, 0x{insn >> 12:x}", None
+    if opcode == 0x17:
+        return "auipc", f"{r[rd]}, 0x{insn >> 12:x}", None
+    if opcode == 0x6F:
+        offset = _sext((((insn >> 31) & 1) << 20) | (((insn >> 12) & 0xFF) << 12)
+                       | (((insn >> 20) & 1) << 11) | (((insn >> 21) & 0x3FF) << 1), 21)
+        if pseudo and rd == 0:
+            return "j", "", offset
+        if pseudo and rd == 1:
+            return "jal", "", offset
+        return "jal", f"{r[rd]}, ", offset
+    if opcode == 0x67 and funct3 == 0:
+        if pseudo and imm_i == 0:
+            if rd == 0:
+                return ("ret", "", None) if rs1 == 1 else ("jr", r[rs1], None)
+            if rd == 1:
+                return "jalr", r[rs1], None
+        return "jalr", f"{r[rd]}, {imm_i}({r[rs1]})", None
+    if opcode == 0x63 and funct3 in _BRANCH:
+        offset = _sext((((insn >> 31) & 1) << 12) | (((insn >> 7) & 1) << 11)
+                       | (((insn >> 25) & 0x3F) << 5) | (((insn >> 8) & 0xF) << 1), 13)
+        name = _BRANCH[funct3]
+        if pseudo and rs2 == 0 and name in ("beq", "bne", "blt", "bge"):
+            return {"beq": "beqz", "bne": "bnez", "blt": "bltz", "bge": "bgez"}[name], f"{r[rs1]}, ", offset
+        if pseudo and rs1 == 0 and name in ("blt", "bge"):
+            return {"blt": "bgtz", "bge": "blez"}[name], f"{r[rs2]}, ", offset
+        return name, f"{r[rs1]}, {r[rs2]}, ", offset
+    if opcode == 0x03 and funct3 in _LOAD:
+        return _LOAD[funct3], f"{r[rd]}, {imm_i}({r[rs1]})", None
+    if opcode == 0x23 and funct3 in _STORE:
+        imm = _sext(((insn >> 25) << 5) | ((insn >> 7) & 0x1F), 12)
+        return _STORE[funct3], f"{r[rs2]}, {imm}({r[rs1]})", None
+    if opcode == 0x13:
+        if funct3 == 1 and funct7 == 0:
+            return "slli", f"{r[rd]}, {r[rs1]}, {rs2}", None
+        if funct3 == 5 and funct7 in (0x00, 0x20):
+            return "srai" if funct7 else "srli", f"{r[rd]}, {r[rs1]}, {rs2}", None
+        if funct3 in _OP_IMM:
+            name = _OP_IMM[funct3]
+            if pseudo:
+                if name == "addi":
+                    if insn == 0x00000013:
+                        return "nop", "", None
+                    if rs1 == 0:
+                        return "li", f"{r[rd]}, {imm_i}", None
+                    if imm_i == 0:
+                        return "mv", f"{r[rd]}, {r[rs1]}", None
+                if name == "xori" and imm_i == -1:
+                    return "not", f"{r[rd]}, {r[rs1]}", None
+                if name == "sltiu" and imm_i == 1:
+                    return "seqz", f"{r[rd]}, {r[rs1]}", None
+            return name, f"{r[rd]}, {r[rs1]}, {imm_i}", None
+    if opcode == 0x33 and (funct3, funct7) in _OP:
+        name = _OP[(funct3, funct7)]
+        if pseudo and rs1 == 0:
+            if name == "sub":
+                return "neg", f"{r[rd]}, {r[rs2]}", None
+            if name == "sltu":
+                return "snez", f"{r[rd]}, {r[rs2]}", None
+        if pseudo and name == "slt":
+            if rs2 == 0:
+                return "sltz", f"{r[rd]}, {r[rs1]}", None
+            if rs1 == 0:
+                return "sgtz", f"{r[rd]}, {r[rs2]}", None
+        return name, f"{r[rd]}, {r[rs1]}, {r[rs2]}", None
+    if opcode == 0x0F:
+        if funct3 == 1:
+            return "fence.i", "", None
+        if funct3 == 0:
+            pred, succ = (insn >> 24) & 0xF, (insn >> 20) & 0xF
+            if pseudo and pred == succ == 0xF:
+                return "fence", "", None
+            bits = lambda v: "".join(c for c, b in zip("iorw", (8, 4, 2, 1)) if v & b) or "0"
+            return "fence", f"{bits(pred)}, {bits(succ)}", None
+    if opcode == 0x73:
+        if insn in _SYSTEM:
+            return _SYSTEM[insn], "", None
+        if funct3 in _CSR:
+            name = _CSR[funct3]
+            csr = insn >> 20
+            source = str(rs1) if funct3 & 4 else r[rs1]
+            if pseudo:
+                if name == "csrrs" and rs1 == 0:
+                    if csr in _COUNTER_READS:
+                        return _COUNTER_READS[csr], r[rd], None
+                    return "csrr", f"{r[rd]}, {_csr(csr)}", None
+                if rd == 0:
+                    return "csr" + name[4:], f"{_csr(csr)}, {source}", None
+            return name, f"{r[rd]}, {_csr(csr)}, {source}", None
+    if opcode == 0x2F and funct3 == 2 and (funct7 >> 2) in _AMO:
+        name = _AMO[funct7 >> 2]
+        suffix = ("", ".rl", ".aq", ".aqrl")[funct7 & 3]  # Spelled as objdump does
+        if name == "lr.w":
+            return name + suffix, f"{r[rd]}, ({r[rs1]})", None
+        return name + suffix, f"{r[rd]}, {r[rs2]}, ({r[rs1]})", None
+    return "unknown", f"(0x{insn:08x})", None
+
+
+class Symbols:
+    """Address to <name+offset> lookup over a {name: address} table"""
+
+    def __init__(self, table: Optional[Dict[str, int]] = None):
+        pairs = sorted((addr, name) for name, addr in (table or {}).items())
+        self.addrs = [addr for addr, _ in pairs]
+        self.names = [name for _, name in pairs]
+
+    def __bool__(self) -> bool:
+        return bool(self.addrs)
+
+    def lookup(self, addr: int) -> Optional[str]:
+        i = bisect.bisect_right(self.addrs, addr) - 1
+        if i < 0:
+            return None
+        offset = addr - self.addrs[i]
+        return self.names[i] if offset == 0 else f"{self.names[i]}+0x{offset:x}"
+
+    def label(self, addr: int) -> Optional[str]:
+        """Name of a symbol exactly at addr"""
+        i = bisect.bisect_left(self.addrs, addr)
+        return self.names[i] if i < len(self.addrs) and self.addrs[i] == addr else None
+
+
+def disassemble(insn: int, pc: Optional[int] = None, symbols: Optional[Symbols] = None,
+                pseudo: bool = True) -> str:
+    """Assembly text of insn; branch targets are absolute when pc is given"""
+    name, operands, offset = decode(insn & MASK32, pseudo)
+    if offset is not None:
+        if pc is None:
+            operands += f"{offset:+d}"
+        else:
+            target = (pc + offset) & MASK32
+            where = symbols.lookup(target) if symbols else None
+            operands += f"0x{target:x}" + (f" <{where}>" if where else "")
+    return f"{name} {operands}" if operands else name
+
+
+def format_line(pc: int, insn: int, symbols: Optional[Symbols] = None) -> str:
+    return f"{pc:08x}:  {insn:08x}  {disassemble(insn, pc, symbols)}"
+
+
+class Listing:
+    """Pre-rendered disassembly of an instruction memory image"""
+
+    _cache: "OrderedDict[Tuple[bytes, int], Listing]" = OrderedDict()
+    CACHE_SIZE = 8
+
+    def __init__(self, words: Iterable[int], base: int = 0, symbols: Optional[Symbols] = None):
+        self.base = base
+        self.symbols = symbols or Symbols()
+        self.words = list(words)
+        self.lines = [format_line(base + 4 * i, insn, self.symbols) for i, insn in enumerate(self.words)]
+
+    @classmethod
+    def for_image(cls, image: ProgramImage, symbols: Optional[Dict[str, int]] = None) -> "Listing":
+        """Listing of the code of image in instruction memory, reused while it is unchanged"""
+        spans = [(seg.addr, min(seg.addr + seg.filesz, IMEM_OFFSET + IMEM_SIZE))
+                 for seg in image.segments if seg.filesz and seg.addr < IMEM_OFFSET + IMEM_SIZE]
+        if not spans:
+            spans = [(addr, addr + PAGE_SIZE) for addr, _ in image.region(IMEM_OFFSET, IMEM_SIZE).items()]
+        base = min((start for start, _ in spans), default=IMEM_OFFSET) & ~3
+        end = max((end for _, end in spans), default=base)
+        data = image.read(base, (end - base + 3) & ~3)
+        words = [int.from_bytes(data[i:i + 4], "little") for i in range(0, len(data), 4)]
+        key = (hashlib.blake2b(data + repr(sorted((symbols or {}).items())).encode(),
+                               digest_size=16).digest(), base)
+        listing = cls._cache.get(key)
+        if listing is None:
+            listing = cls(words, base, Symbols(symbols))
+            cls._cache[key] = listing
+            while len(cls._cache) > cls.CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        else:
+            cls._cache.move_to_end(key)
+        return listing
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def line(self, pc: int, insn: Optional[int] = None) -> str:
+        """Rendered line for pc; insn overrides a word that differs from the image"""
+        index = (pc - self.base) >> 2
+        if 0 <= index < len(self.lines) and not pc & 3 and (insn is None or insn == self.words[index]):
+            return self.lines[index]
+        return format_line(pc, insn if insn is not None else 0, self.symbols)
+
+    def render(self, start: int, count: int) -> List[str]:
+        """count lines starting at start, with symbol labels, for a scrolling view"""
+        first = max((start - self.base) >> 2, 0)
+        out = []
+        for index in range(first, min(first + count, len(self.lines))):
+            label = self.symbols.label(self.base + 4 * index)
+            if label:
+                out.append(f"{label}:")
+            out.append(self.lines[index])
+        return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Disassemble RV32IMA code")
+    parser.add_argument("file", nargs="?", help="ELF, HEX or binary program")
+    parser.add_argument("--word", action="append", type=lambda v: int(v, 0), default=[],
+                        help="disassemble an instruction word; may be repeated")
+    parser.add_argument("--pc", type=lambda v: int(v, 0), default=0, help="address of the first --word")
+    parser.add_argument("--no-pseudo", action="store_true", help="print base instructions for --word")
+    args = parser.parse_args(argv)
+
+    pc = args.pc
+    for word in args.word:
+        print(f"{pc:08x}:  {word:08x}  {disassemble(word, pc, pseudo=not args.no_pseudo)}")
+        pc += 4
+    if not args.file:
+        return 0
+    try:
+        with load_program(args.file) as image:
+            symbols = load_elf_symbols(args.file) if image.file_type == "elf" else {}
+            listing = Listing.for_image(image, symbols)
+    except LoaderError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    for line in listing.render(listing.base, len(listing)):
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
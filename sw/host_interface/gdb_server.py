@@ -0,0 +1,416 @@
+"""
+GDB remote serial protocol server for the host controller
+
+Fronts a CPUController so gdb can debug programs on the board (or in
+simulation) instead of scripts around cpu_set_breakpoint(), cpu_step()
+and cpu_read_all_registers():
+
+    python gdb_server.py --port 3333
+    (gdb) set architecture riscv:rv32
+    (gdb) target remote localhost:3333
+
+Memory is addressed like the controller: instruction memory at 0, data
+memory at DMEM_OFFSET. Registers and memory are cached while the CPU is
+stopped and dropped when it resumes. A register packet reads all GPRs in
+one pass, and memory packets fill missing CACHE_PAGE pages with one bulk
+read per contiguous run, so single stepping and x/100x cost a handful of
+window accesses rather than one per word.
+
+On a board, breakpoints use CPU_DEBUG_BP_ADDR (or EBREAK patches) and
+single step uses CPU_CTRL_STEP. red_pitaya_cpu_wrapper implements neither,
+so in a cocotb test, where the server runs on SimBackend from
+cocotb.external with the client on the other end of a socket pair (see
+serve()), both are SimBackend's IMEM trap emulation instead. That test
+covers the emulation, not the board's debug path; tests/test_gdb_server.py
+covers the packet handling and caching against a FileBackend.
+"""
+
+import argparse
+import logging
+import select
+import socket
+import sys
+from typing import Dict, List, Optional
+
+from controller import (
+    CPU_REG_COUNT,
+    CPU_STATE_EXCEPTION,
+    CPU_STATE_HALTED,
+    CPU_STATE_RUNNING,
+    DMEM_OFFSET,
+    CPUController,
+    ControllerError,
+    open_backend,
+)
+
+logger = logging.getLogger(__name__)
+
+CACHE_PAGE = 1024
+PACKET_SIZE = 0x4000
+INTERRUPT = b"\x03"
+
+SIGINT = 2
+SIGILL = 4
+SIGTRAP = 5
+
+# x0-x31 then pc, in gdb's riscv register numbering
+PC_REGNUM = CPU_REG_COUNT
+
+
+def checksum(data: bytes) -> int:
+    return sum(data) & 0xFF
+
+
+def _hex_word(value: int) -> str:
+    return (value & 0xFFFFFFFF).to_bytes(4, "little").hex()
+
+
+def _unescape(data: bytes) -> bytes:
+    """Undo the } escaping of binary (X) packet payloads"""
+    out = bytearray()
+    it = iter(data)
+    for byte in it:
+        out.append(next(it) ^ 0x20 if byte == 0x7D else byte)
+    return bytes(out)
+
+
+class TargetCache:
+    """Registers and memory pages of a stopped CPU"""
+
+    def __init__(self, cpu: CPUController):
+        self.cpu = cpu
+        self.regs: Optional[List[int]] = None
+        self.pages: Dict[int, bytes] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self.regs = None
+        self.pages.clear()
+
+    def registers(self) -> List[int]:
+        if self.regs is None:
+            self.regs = self.cpu.read_registers() + [self.cpu.pc]
+        return self.regs
+
+    def set_register(self, index: int, value: int):
+        if index == PC_REGNUM:
+            self.cpu.set_pc(value)
+        else:
+            self.cpu.write_register(index, value)
+        if self.regs is not None:
+            self.regs[index] = value if index else 0
+
+    def _fill(self, pages: List[int]):
+        """Read missing pages, one backend read per contiguous run"""
+        start = 0
+        while start < len(pages):
+            end = start + 1
+            while (end < len(pages) and pages[end] == pages[end - 1] + CACHE_PAGE
+                   and pages[end] != DMEM_OFFSET):
+                end += 1
+            data = self.cpu.read_memory(pages[start], CACHE_PAGE * (end - start))
+            for i, page in enumerate(pages[start:end]):
+                self.pages[page] = data[i * CACHE_PAGE:(i + 1) * CACHE_PAGE]
+            start = end
+
+    def read(self, addr: int, size: int) -> bytes:
+        self.cpu.check_range(addr, size)
+        first = addr - addr % CACHE_PAGE
+        pages = range(first, addr + size, CACHE_PAGE)
+        missing = [page for page in pages if page not in self.pages]
+        self.misses += len(missing)
+        self.hits += len(pages) - len(missing)
+        if missing:
+            self._fill(missing)
+        data = bytearray(b"".join(self.pages[page] for page in pages)[addr - first:addr - first + size])
+        # Show gdb the instructions that breakpoints patched with EBREAK
+        for bp in self.cpu.breakpoints.values():
+            if bp.original is None:
+                continue
+            for i, byte in enumerate(bp.original.to_bytes(4, "little")):
+                if addr <= bp.address + i < addr + size:
+                    data[bp.address + i - addr] = byte
+        return bytes(data)
+
+    def write(self, addr: int, data: bytes):
+        self.cpu.write_memory(addr, data)
+        for page in range(addr - addr % CACHE_PAGE, addr + len(data), CACHE_PAGE):
+            self.pages.pop(page, None)
+
+
+class GdbServer:
+    """Serves one gdb connection at a time for a CPUController"""
+
+    def __init__(self, cpu: CPUController):
+        self.cpu = cpu
+        self.cache = TargetCache(cpu)
+        self.conn: Optional[socket.socket] = None
+        self.ack = True
+        self._buffer = b""
+        self._breakpoints: Dict[int, int] = {}  # address -> controller breakpoint id
+        self._last_signal = SIGTRAP
+
+    # Transport
+
+    def _recv(self) -> bytes:
+        data = self.conn.recv(4096)
+        if not data:
+            raise ConnectionResetError("gdb disconnected")
+        return data
+
+    def read_packet(self) -> Optional[bytes]:
+        """Next packet payload, or INTERRUPT for a bare Ctrl-C"""
+        while True:
+            self._buffer = self._buffer.lstrip(b"+-")
+            if self._buffer.startswith(INTERRUPT):
+                self._buffer = self._buffer[1:]
+                return INTERRUPT
+            start = self._buffer.find(b"$")
+            end = self._buffer.find(b"#", start)
+            if start >= 0 and end >= 0 and len(self._buffer) >= end + 3:
+                payload = self._buffer[start + 1:end]
+                expected = self._buffer[end + 1:end + 3]
+                self._buffer = self._buffer[end + 3:]
+                if not self.ack:
+                    return payload
+                if int(expected, 16) == checksum(payload):
+                    self.conn.sendall(b"+")
+                    return payload
+                self.conn.sendall(b"-")
+                continue
+            self._buffer += self._recv()
+
+    def send_packet(self, payload: str):
+        data = payload.encode()
+        self.conn.sendall(b"$" + data + b"#" + f"{checksum(data):02x}".encode())
+
+    # Serving
+
+    def serve(self, conn: socket.socket):
+        """Handle packets on conn until gdb detaches or disconnects"""
+        self.conn = conn
+        self.ack = True
+        self._buffer = b""
+        self.cache.invalidate()
+        try:
+            while True:
+                packet = self.read_packet()
+                if packet == INTERRUPT:
+                    # Already stopped; report where
+                    self.send_packet(self.stop_reply())
+                    continue
+                reply = self.handle(packet)
+                if reply is None:
+                    return
+                self.send_packet(reply)
+                if packet == b"QStartNoAckMode":
+                    self.ack = False
+        except ConnectionResetError:
+            logger.info("gdb disconnected")
+        finally:
+            logger.info(f"Cache hits {self.cache.hits}, misses {self.cache.misses}")
+            self.conn = None
+
+    def listen(self, host: str = "127.0.0.1", port: int = 3333, once: bool = False):
+        with socket.create_server((host, port)) as server:
+            logger.info(f"Waiting for gdb on {host}:{port}")
+            while True:
+                conn, peer = server.accept()
+                logger.info(f"gdb connected from {peer[0]}:{peer[1]}")
+                with conn:
+                    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                    self.serve(conn)
+                if once:
+                    return
+
+    def handle(self, packet: bytes) -> Optional[str]:
+        """Reply to one packet; None ends the session"""
+        cmd, args = chr(packet[0]), packet[1:]
+        try:
+            if cmd in "gGpPmMX":
+                self._require_stopped()
+            if cmd == "g":
+                return "".join(_hex_word(value) for value in self.cache.registers())
+            if cmd == "G":
+                data = bytes.fromhex(args.decode())
+                for i in range(min(len(data) // 4, PC_REGNUM + 1)):
+                    self.cache.set_register(i, int.from_bytes(data[4 * i:4 * i + 4], "little"))
+                return "OK"
+            if cmd == "p":
+                index = int(args, 16)
+                if index > PC_REGNUM:
+                    return "E01"
+                return _hex_word(self.cache.registers()[index])
+            if cmd == "P":
+                index, value = args.split(b"=")
+                self.cache.set_register(int(index, 16), int.from_bytes(bytes.fromhex(value.decode()), "little"))
+                return "OK"
+            if cmd == "m":
+                addr, size = (int(x, 16) for x in args.split(b","))
+                return self.cache.read(addr, min(size, PACKET_SIZE // 2)).hex()
+            if cmd == "M":
+                where, data = args.split(b":")
+                addr, _ = (int(x, 16) for x in where.split(b","))
+                self.cache.write(addr, bytes.fromhex(data.decode()))
+                return "OK"
+            if cmd == "X":
+                where, _, data = args.partition(b":")
+                addr, size = (int(x, 16) for x in where.split(b","))
+                if size:
+                    self.cache.write(addr, _unescape(data))
+                return "OK"
+            if cmd == "c":
+                if args:
+                    self.cache.set_register(PC_REGNUM, int(args, 16))
+                return self.resume()
+            if cmd == "s":
+                if args:
+                    self.cache.set_register(PC_REGNUM, int(args, 16))
+                return self.single_step()
+            if cmd in "Zz":
+                return self.breakpoint(cmd == "Z", args)
+            if cmd == "?":
+                return self.stop_reply()
+            if cmd == "H":
+                return "OK"
+            if cmd == "D":
+                self._detach()
+                self.send_packet("OK")
+                return None
+            if cmd == "k":
+                self._detach()
+                return None
+            if cmd == "q":
+                return self.query(packet)
+            if packet == b"QStartNoAckMode":
+                return "OK"
+        except ControllerError as e:
+            logger.warning(f"{packet[:32]!r}: {e}")
+            return "E01"
+        except ValueError:
+            return "E02"
+        return ""
+
+    def query(self, packet: bytes) -> str:
+        if packet.startswith(b"qSupported"):
+            return f"PacketSize={PACKET_SIZE:x};QStartNoAckMode+;swbreak+;hwbreak+"
+        if packet == b"qAttached":
+            return "1"
+        if packet == b"qC":
+            return "QC1"
+        if packet == b"qfThreadInfo":
+            return "m1"
+        if packet == b"qsThreadInfo":
+            return "l"
+        if packet == b"qOffsets":
+            return "Text=0;Data=0;Bss=0"
+        if packet.startswith(b"qSymbol"):
+            return "OK"
+        return ""
+
+    # Execution
+
+    def _require_stopped(self):
+        if self.cpu.is_running():
+            raise ControllerError("CPU is running")
+
+    def stop_reply(self) -> str:
+        return f"S{self._last_signal:02x}"
+
+    def _stopped(self, signal: int) -> str:
+        self._last_signal = signal
+        bp = self.cpu.breakpoint_hit()
+        if bp is not None and signal == SIGTRAP:
+            kind = "hwbreak" if bp.hardware else "swbreak"
+            return f"T{signal:02x}{kind}:;"
+        return self.stop_reply()
+
+    def _step_off_breakpoint(self):
+        """Step over a breakpoint at the current PC so resuming doesn't re-hit it"""
+        pc = self.cpu.pc
+        bp_id = self._breakpoints.get(pc)
+        if bp_id is None:
+            return
+        self.cpu.clear_breakpoint(bp_id)
+        try:
+            self.cpu.step()
+        finally:
+            self._breakpoints[pc] = self.cpu.set_breakpoint(pc)
+
+    def single_step(self) -> str:
+        self.cache.invalidate()
+        if self.cpu.pc in self._breakpoints:
+            self._step_off_breakpoint()
+        else:
+            self.cpu.step()
+        return self._stopped(SIGTRAP)
+
+    def resume(self) -> str:
+        """Run until the CPU halts or gdb sends Ctrl-C"""
+        self.cache.invalidate()
+        self._step_off_breakpoint()
+        self.cpu.start(timeout=None)
+        interval = self.cpu.backend.poll_interval or 0.001
+        while True:
+            state = self.cpu.state()
+            if not state & CPU_STATE_RUNNING and state & (CPU_STATE_HALTED | CPU_STATE_EXCEPTION):
+                self.cache.invalidate()
+                return self._stopped(SIGILL if state & CPU_STATE_EXCEPTION else SIGTRAP)
+            if self._interrupted(interval):
+                self.cpu.stop()
+                self.cache.invalidate()
+                return self._stopped(SIGINT)
+
+    def _interrupted(self, timeout: float) -> bool:
+        if INTERRUPT in self._buffer:
+            self._buffer = self._buffer.replace(INTERRUPT, b"", 1)
+            return True
+        readable, _, _ = select.select([self.conn], [], [], timeout)
+        if readable:
+            self._buffer += self._recv()
+        return False
+
+    def breakpoint(self, insert: bool, args: bytes) -> str:
+        kind, addr, _ = args.split(b",")
+        if kind not in (b"0", b"1"):
+            return ""  # Watchpoints are not supported
+        addr = int(addr, 16)
+        if insert:
+            if addr not in self._breakpoints:
+                self._breakpoints[addr] = self.cpu.set_breakpoint(addr)
+        elif addr in self._breakpoints:
+            self.cpu.clear_breakpoint(self._breakpoints.pop(addr))
+        # The cached page may still hold the EBREAK of a cleared breakpoint
+        self.cache.pages.pop(addr - addr % CACHE_PAGE, None)
+        return "OK"
+
+    def _detach(self):
+        for bp_id in self._breakpoints.values():
+            self.cpu.clear_breakpoint(bp_id)
+        self._breakpoints.clear()
+        self.cache.invalidate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GDB remote serial protocol server for the CPU")
+    parser.add_argument("--backend", default="devmem", help="devmem[:base] or file:<path>")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3333)
+    parser.add_argument("--once", action="store_true", help="exit after the first session")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    try:
+        with CPUController(open_backend(args.backend)) as cpu:
+            GdbServer(cpu).listen(args.host, args.port, args.once)
+    except ControllerError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""
+Program loader for the Red Pitaya RISC-V CPU
+
+Python counterpart of sw/drivers/cpu_loader.c. Parses ELF, Intel HEX and
+raw binary files into a ProgramImage: a sparse set of 4 KB pages keyed by
+address in the CPU window of cpu_regs.h (instruction memory at 0x00000,
+data memory at 0x10000).
+
+ELF and binary files are mmap'ed, and pages that lie entirely inside a
+PT_LOAD segment (or the binary) are memoryviews into the mapping, so large
+programs load without copying. Only partial pages at segment edges, BSS and
+HEX records are materialised as bytearrays.
+
+The same image feeds the testbench memory models (word_dict()) and the
+board, where each page is a single slice assignment into /dev/mem.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+PAGE_SIZE = 4096
+
+# CPU window layout from sw/drivers/cpu_regs.h
+IMEM_OFFSET = 0x00000
+IMEM_SIZE = 0x10000
+DMEM_OFFSET = 0x10000
+DMEM_SIZE = 0x10000
+
+MAX_FILE_SIZE = 1024 * 1024  # Same limit as cpu_load_program_file()
+
+EM_RISCV = 243
+PT_LOAD = 1
+SHT_SYMTAB = 2
+STT_SECTION = 3
+STT_FILE = 4
+
+FILE_TYPES = ("elf", "hex", "bin")
+
+Page = Union[memoryview, bytearray]
+
+
+class LoaderError(Exception):
+    """Raised for unreadable or unsupported program files"""
+
+
+@dataclass
+class Segment:
+    """One loaded region, as reported by the loader"""
+    addr: int
+    filesz: int
+    memsz: int
+
+
+class ProgramImage:
+    """Sparse page image of a program, addressed in the CPU window"""
+
+    def __init__(self, file_type: str = "bin", entry_point: Optional[int] = None,
+                 source: Optional[str] = None):
+        self.file_type = file_type
+        self.entry_point = entry_point
+        self.source = source
+        self.pages: Dict[int, Page] = {}
+        self.segments: List[Segment] = []
+        self._mmap: Optional[mmap.mmap] = None
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Release views into the mapped file, then the mapping itself
+
+        Pages handed out through region() or items() are invalid afterwards.
+        """
+        for page in self.pages.values():
+            if isinstance(page, memoryview):
+                page.release()
+        self.pages.clear()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views still held elsewhere; the mapping goes with them
+                pass
+            self._file.close()
+            self._mmap = None
+            self._file = None
+
+    # Building
+
+    def _writable(self, page_addr: int) -> bytearray:
+        page = self.pages.get(page_addr)
+        if page is None:
+            page = self.pages[page_addr] = bytearray(PAGE_SIZE)
+        elif isinstance(page, memoryview):
+            # Copy on write for pages still backed by the file
+            page = self.pages[page_addr] = bytearray(page)
+        return page
+
+    def add(self, addr: int, data, memsz: Optional[int] = None):
+        """Place data at addr, zero-filling up to memsz bytes
+
+        Whole pages of a memoryview are stored as views, not copied.
+        """
+        view = memoryview(data).cast("B")
+        filesz = len(view)
+        memsz = filesz if memsz is None else memsz
+        self.segments.append(Segment(addr, filesz, memsz))
+
+        pos = 0
+        while pos < filesz:
+            page_addr = (addr + pos) & ~(PAGE_SIZE - 1)
+            offset = addr + pos - page_addr
+            chunk = min(PAGE_SIZE - offset, filesz - pos)
+            if chunk == PAGE_SIZE and isinstance(data, (mmap.mmap, memoryview)):
+                self.pages[page_addr] = view[pos:pos + PAGE_SIZE]
+            else:
+                self._writable(page_addr)[offset:offset + chunk] = view[pos:pos + chunk]
+            pos += chunk
+
+        # BSS: zero the tail, which may overlap earlier contents
+        end = addr + memsz
+        pos = addr + filesz
+        while pos < end:
+            page_addr = pos & ~(PAGE_SIZE - 1)
+            offset = pos - page_addr
+            chunk = min(PAGE_SIZE - offset, end - pos)
+            self._writable(page_addr)[offset:offset + chunk] = bytes(chunk)
+            pos += chunk
+
+    # Access
+
+    def __len__(self) -> int:
+        return len(self.pages) * PAGE_SIZE
+
+    def items(self) -> Iterator[Tuple[int, Page]]:
+        """(page address, page) in address order"""
+        for addr in sorted(self.pages):
+            yield addr, self.pages[addr]
+
+    def read(self, addr: int, size: int) -> bytes:
+        out = bytearray(size)
+        pos = 0
+        while pos < size:
+            page_addr = (addr + pos) & ~(PAGE_SIZE - 1)
+            offset = addr + pos - page_addr
+            chunk = min(PAGE_SIZE - offset, size - pos)
+            page = self.pages.get(page_addr)
+            if page is not None:
+                out[pos:pos + chunk] = page[offset:offset + chunk]
+            pos += chunk
+        return bytes(out)
+
+    def word(self, addr: int) -> int:
+        return int.from_bytes(self.read(addr, 4), "little")
+
+    def page_words(self, page: Page) -> array:
+        """Little-endian 32-bit words of one page"""
+        words = array("I")
+        words.frombytes(page)
+        if sys.byteorder != "little":
+            words.byteswap()
+        return words
+
+    def word_dict(self, base: int = 0) -> Dict[int, int]:
+        """{address - base: word} for every word, as used by the testbench memory models"""
+        out: Dict[int, int] = {}
+        for addr, page in self.items():
+            out.update(zip(range(addr - base, addr - base + PAGE_SIZE, 4), self.page_words(page)))
+        return out
+
+    def region(self, offset: int, size: int) -> "ProgramImage":
+        """Pages in [offset, offset + size), rebased to start at 0; pages are shared"""
+        if offset % PAGE_SIZE:
+            raise ValueError("region offset must be page aligned")
+        sub = ProgramImage(self.file_type, None, self.source)
+        for addr, page in self.items():
+            if offset <= addr < offset + size:
+                sub.pages[addr - offset] = page
+        if self.entry_point is not None and offset <= self.entry_point < offset + size:
+            sub.entry_point = self.entry_point - offset
+        return sub
+
+    def split(self) -> Tuple["ProgramImage", "ProgramImage"]:
+        """Instruction and data memory images, each starting at address 0"""
+        return self.region(IMEM_OFFSET, IMEM_SIZE), self.region(DMEM_OFFSET, DMEM_SIZE)
+
+    def check_range(self, limit: int = DMEM_OFFSET + DMEM_SIZE):
+        for seg in self.segments:
+            if seg.addr + seg.memsz > limit:
+                raise LoaderError(f"Segment 0x{seg.addr:08x}+0x{seg.memsz:x} is outside CPU memory (0x{limit:x})")
+
+    def summary(self) -> str:
+        lines = [f"{self.source or 'image'}: {self.file_type}, {len(self.pages)} pages"]
+        if self.entry_point is not None:
+            lines.append(f"  entry point 0x{self.entry_point:08x}")
+        for seg in self.segments:
+            bss = f" (+{seg.memsz - seg.filesz} BSS)" if seg.memsz > seg.filesz else ""
+            lines.append(f"  0x{seg.addr:08x}: {seg.filesz} bytes{bss}")
+        return "\n".join(lines)
+
+
+def _map(path: str) -> Tuple[object, mmap.mmap]:
+    f = open(path, "rb")
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0 or size > MAX_FILE_SIZE:
+            raise LoaderError(f"Invalid file size: {size} bytes")
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+
+
+def load_elf(path: str) -> ProgramImage:
+    """Load the PT_LOAD segments of a little-endian RISC-V ELF file"""
+    f, mm = _map(path)
+    image = ProgramImage("elf", source=path)
+    image._file, image._mmap = f, mm
+    try:
+        if mm[:4] != b"\x7fELF":
+            raise LoaderError("Not an ELF file")
+        ei_class, ei_data = mm[4], mm[5]
+        if ei_data != 1:
+            raise LoaderError("Only little-endian ELF files are supported")
+        if ei_class == 1:
+            ehdr, phdr = struct.Struct("<HHIIIIIHHHHHH"), struct.Struct("<IIIIIIII")
+        elif ei_class == 2:
+            ehdr, phdr = struct.Struct("<HHIQQQIHHHHHH"), struct.Struct("<IIQQQQQQ")
+        else:
+            raise LoaderError(f"Unknown ELF class {ei_class}")
+        (e_type, e_machine, _, e_entry, e_phoff, _, _, _,
+         e_phentsize, e_phnum, _, _, _) = ehdr.unpack_from(mm, 16)
+        if e_machine != EM_RISCV:
+            raise LoaderError(f"ELF machine {e_machine} is not RISC-V")
+        if e_phnum == 0:
+            raise LoaderError("No program headers found")
+        image.entry_point = e_entry
+
+        view = memoryview(mm)
+        for i in range(e_phnum):
+            fields = phdr.unpack_from(mm, e_phoff + i * e_phentsize)
+            if ei_class == 1:
+                p_type, p_offset, p_vaddr, _, p_filesz, p_memsz, _, _ = fields
+            else:
+                p_type, _, p_offset, p_vaddr, _, p_filesz, p_memsz, _ = fields
+            if p_type != PT_LOAD or p_memsz == 0:
+                continue
+            if p_offset + p_filesz > len(mm):
+                raise LoaderError(f"Segment {i} extends past the end of the file")
+            image.add(p_vaddr, view[p_offset:p_offset + p_filesz], p_memsz)
+        image.check_range()
+    except Exception:
+        image.close()
+        raise
+    return image
+
+
+def load_elf_symbols(path: str) -> Dict[str, int]:
+    """{name: address} of the named symbols in the .symtab of an ELF file"""
+    f, mm = _map(path)
+    try:
+        if mm[:4] != b"\x7fELF" or mm[5] != 1:
+            raise LoaderError("Not a little-endian ELF file")
+        if mm[4] == 1:
+            e_shoff, e_shentsize, e_shnum = struct.unpack_from("<I10xHH", mm, 32)
+            shdr, sym = struct.Struct("<IIIIIIIIII"), struct.Struct("<IIIBBH")
+        else:
+            e_shoff, e_shentsize, e_shnum = struct.unpack_from("<Q10xHH", mm, 40)
+            shdr, sym = struct.Struct("<IIQQQQIIQQ"), struct.Struct("<IBBHQQ")
+        sections = [shdr.unpack_from(mm, e_shoff + i * e_shentsize) for i in range(e_shnum)]
+        symbols = {}
+        for _, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, _ in sections:
+            if sh_type != SHT_SYMTAB:
+                continue
+            strtab = sections[sh_link][4]
+            for offset in range(sh_offset, sh_offset + sh_size, sym.size):
+                fields = sym.unpack_from(mm, offset)
+                if mm[4] == 1:
+                    st_name, st_value, _, st_info, _, st_shndx = fields
+                else:
+                    st_name, st_info, _, st_shndx, st_value, _ = fields
+                if not st_name or not st_shndx or st_info & 0xF in (STT_SECTION, STT_FILE):
+                    continue
+                end = mm.find(b"\0", strtab + st_name)
+                symbols[mm[strtab + st_name:end].decode(errors="replace")] = st_value
+        return symbols
+    finally:
+        mm.close()
+        f.close()
+
+
+def load_binary(path: str, load_addr: int = 0) -> ProgramImage:
+    """Map a raw binary at load_addr; the entry point is the load address"""
+    f, mm = _map(path)
+    image = ProgramImage("bin", entry_point=load_addr, source=path)
+    image._file, image._mmap = f, mm
+    try:
+        image.add(load_addr, memoryview(mm))
+        image.check_range()
+    except Exception:
+        image.close()
+        raise
+    return image
+
+
+def load_hex(path: str) -> ProgramImage:
+    """Load an Intel HEX file (record types 00-05)"""
+    image = ProgramImage("hex", source=path)
+    base = 0
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line.startswith(":"):
+                continue
+            try:
+                record = bytes.fromhex(line[1:])
+            except ValueError:
+                raise LoaderError(f"{path}:{lineno}: invalid hex digits")
+            if len(record) < 5 or len(record) != record[0] + 5:
+                raise LoaderError(f"{path}:{lineno}: bad record length")
+            if sum(record) & 0xFF:
+                raise LoaderError(f"{path}:{lineno}: checksum mismatch")
+            count, offset, rtype = record[0], (record[1] << 8) | record[2], record[3]
+            data = record[4:4 + count]
+            if rtype == 0x00:
+                image.add(base + offset, data)
+            elif rtype == 0x01:
+                break
+            elif rtype == 0x02:
+                base = int.from_bytes(data, "big") << 4
+            elif rtype == 0x04:
+                base = int.from_bytes(data, "big") << 16
+            elif rtype in (0x03, 0x05):
+                image.entry_point = int.from_bytes(data, "big")
+                if rtype == 0x03:
+                    image.entry_point = ((image.entry_point >> 16) << 4) + (image.entry_point & 0xFFFF)
+            else:
+                raise LoaderError(f"{path}:{lineno}: unknown record type {rtype:02x}")
+    image.check_range()
+    return image
+
+
+def detect_file_type(path: str) -> str:
+    with open(path, "rb") as f:
+        header = f.read(16)
+    if len(header) < 4:
+        raise LoaderError("File too small to determine type")
+    if header.startswith(b"\x7fELF"):
+        return "elf"
+    if header.lstrip()[:1] == b":" or path.lower().endswith((".hex", ".ihex", ".ihx")):
+        return "hex"
+    return "bin"
+
+
+def load_program(path: str, load_addr: int = 0, file_type: Optional[str] = None) -> ProgramImage:
+    """Load a program file, detecting its type like cpu_load_program_file()"""
+    if not os.access(path, os.R_OK):
+        raise LoaderError(f"Cannot access file {path}")
+    file_type = file_type or detect_file_type(path)
+    if file_type == "elf":
+        return load_elf(path)
+    if file_type == "hex":
+        return load_hex(path)
+    if file_type == "bin":
+        return load_binary(path, load_addr)
+    raise LoaderError(f"Unsupported file type '{file_type}'")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect a program image for the Red Pitaya CPU")
+    parser.add_argument("file")
+    parser.add_argument("--load-addr", type=lambda v: int(v, 0), default=0,
+                        help="load address for raw binaries")
+    parser.add_argument("--type", choices=FILE_TYPES, help="override file type detection")
+    args = parser.parse_args(argv)
+
+    try:
+        with load_program(args.file, args.load_addr, args.type) as image:
+            print(image.summary())
+    except LoaderError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
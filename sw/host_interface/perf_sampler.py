@@ -0,0 +1,346 @@
+"""
+High-rate performance counter sampler
+
+CPU_STATUS_CYCLES and CPU_STATUS_INSTRET are 32-bit and wrap about every
+34 s at 125 MHz, and cpu_get_performance_stats() reads them once.
+PerfSampler reads the counter registers from a background thread at a
+fixed rate, extends them to 64 bits (a counter that went backwards has
+wrapped, unless it could not have got that far since the last read and
+was reset), and records CPU_STATUS_STALL with every sample. The series are
+NumPy arrays; IPC and stall ratio are computed over a rolling window of
+samples. CPU_STATUS_STALL is a stall reason, not a counter, so the stall
+ratio is the fraction of samples that saw the pipeline stalled.
+
+For soak tests, csv_path streams rows to disk as they are taken and
+max_samples bounds what is kept in memory:
+
+    with PerfSampler(cpu, rate=1000, csv_path="soak.csv", max_samples=1 << 20) as sampler:
+        run_soak()
+    series = sampler.series(window=100)
+
+    python perf_sampler.py --rate 1000 --duration 3600 --csv soak.csv
+"""
+
+import argparse
+import logging
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, TextIO
+
+import numpy as np
+
+from controller import (
+    CPU_STATUS_CYCLES,
+    CPU_STATUS_STALL,
+    CPU_STATUS_STATE,
+    STATUS_OFFSET,
+    CPUController,
+    ControllerError,
+    open_backend,
+)
+
+logger = logging.getLogger(__name__)
+
+CLOCK_HZ = 125_000_000
+COUNTER_WRAP = 1 << 32
+# Seconds of timing error allowed when deciding whether a drop is a wrap
+WRAP_SLACK = 0.01
+
+SAMPLE_DTYPE = np.dtype([
+    ("time", "<f8"),  # Seconds since the sampler started
+    ("cycles", "<u8"),
+    ("instret", "<u8"),
+    ("stall", "<u4"),
+    ("state", "<u4"),
+])
+
+# CPU_STATUS_CYCLES, CPU_STATUS_INSTRET and CPU_STATUS_STALL are adjacent,
+# so one slice of the status block reads all three
+_COUNTER_BLOCK = CPU_STATUS_STALL + 4 - CPU_STATUS_CYCLES
+
+
+class WrapCounter:
+    """Extends a wrapping 32-bit counter to 64 bits
+
+    Wraps are only seen if the counter is read at least once per wrap
+    period; read it from a sampler well inside that. Given the read time,
+    a drop the counter cannot have covered since the last read at one
+    count per clock is a reset (the wrapper clears its counters when the
+    CPU is stopped), and the extended value carries on from where it was.
+    """
+
+    def __init__(self, raw: int = 0, clock_hz: float = CLOCK_HZ):
+        self.last = raw
+        self.clock_hz = clock_hz
+        self.high = 0
+        self.wraps = 0
+        self.resets = 0
+        self._last_time: Optional[float] = None
+
+    def update(self, raw: int, now: Optional[float] = None) -> int:
+        """Extended value of raw, read at monotonic time now if known"""
+        if raw < self.last:
+            advance = COUNTER_WRAP - self.last + raw
+            if (now is not None and self._last_time is not None
+                    and advance > (now - self._last_time + WRAP_SLACK) * self.clock_hz):
+                self.high += self.last
+                self.resets += 1
+            else:
+                self.high += COUNTER_WRAP
+                self.wraps += 1
+        self.last = raw
+        if now is not None:
+            self._last_time = now
+        return self.high + raw
+
+
+class PerfSampler:
+    """Background sampler of the cycle, instret and stall registers"""
+
+    def __init__(self, controller: CPUController, rate: float = 1000.0,
+                 max_samples: Optional[int] = None, csv_path: Optional[str] = None,
+                 clock_hz: float = CLOCK_HZ):
+        self.controller = controller
+        self.period = 1.0 / rate
+        self.max_samples = max_samples
+        self.csv_path = csv_path
+        self.clock_hz = clock_hz
+        self.overruns = 0  # Samples taken late because a read took too long
+        self._samples = np.zeros(min(1024, max_samples or 1024), dtype=SAMPLE_DTYPE)
+        self._count = 0
+        self._written = 0
+        self._csv: Optional[TextIO] = None
+        self._cycles = WrapCounter(clock_hz=clock_hz)
+        self._instret = WrapCounter(clock_hz=clock_hz)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start = 0.0
+        self._epoch = time.time()
+        self.listeners: List[Callable[[float, Dict[str, int]], None]] = []
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def wraps(self) -> Dict[str, int]:
+        return {"cycles": self._cycles.wraps, "instret": self._instret.wraps}
+
+    def add_listener(self, listener: Callable[[float, Dict[str, int]], None]):
+        """Call listener(wall-clock time, values) from the sampler thread for every sample"""
+        self.listeners.append(listener)
+
+    def start(self):
+        wrap_period = COUNTER_WRAP / self.clock_hz
+        if self.period > wrap_period / 2:
+            raise ControllerError(f"Sample period {self.period}s cannot track counters "
+                                  f"that wrap every {wrap_period:.1f}s")
+        if self.csv_path:
+            self._csv = open(self.csv_path, "w")
+            self._csv.write(",".join(SAMPLE_DTYPE.names) + "\n")
+        self._start = time.monotonic()
+        self._epoch = time.time()
+        cycles, instret, _ = self._read()
+        self._cycles = WrapCounter(cycles, self.clock_hz)
+        self._instret = WrapCounter(instret, self.clock_hz)
+        self._cycles.update(cycles, 0.0)
+        self._instret.update(instret, 0.0)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="perf-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self._csv:
+            self._flush_csv()
+            self._csv.close()
+            self._csv = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _read(self):
+        words = np.frombuffer(self.controller.backend.read(STATUS_OFFSET + CPU_STATUS_CYCLES, _COUNTER_BLOCK),
+                              dtype="<u4")
+        return int(words[0]), int(words[1]), int(words[2])
+
+    def sample(self):
+        """Take one sample now"""
+        cycles, instret, stall = self._read()
+        state = self.controller.status(CPU_STATUS_STATE)
+        now = time.monotonic() - self._start
+        with self._lock:
+            if self._count == len(self._samples):
+                self._grow()
+            row = self._samples[self._count]
+            row["time"] = now
+            row["cycles"] = self._cycles.update(cycles, now)
+            row["instret"] = self._instret.update(instret, now)
+            row["stall"] = stall
+            row["state"] = state
+            self._count += 1
+            if not self.listeners:
+                return
+            values = {name: int(row[name]) for name in ("cycles", "instret", "stall", "state")}
+        for listener in self.listeners:
+            listener(self._epoch + now, values)
+
+    def _grow(self):
+        if self.max_samples and self._count >= self.max_samples:
+            # Keep the newer half, streaming rows not yet in the CSV first
+            if self._csv and self._written < self._count:
+                _write_rows(self._csv, self._samples[self._written:self._count])
+                self._csv.flush()
+                self._written = self._count
+            drop = self._count // 2
+            self._samples[:self._count - drop] = self._samples[drop:self._count]
+            self._count -= drop
+            self._written = max(self._written - drop, 0)
+            if self._count < len(self._samples):
+                return
+        size = len(self._samples) * 2
+        if self.max_samples:
+            size = max(min(size, self.max_samples), self._count + 1)
+        samples = np.zeros(size, dtype=SAMPLE_DTYPE)
+        samples[:self._count] = self._samples[:self._count]
+        self._samples = samples
+
+    def _run(self):
+        next_sample = time.monotonic()
+        last_flush = next_sample
+        while not self._stop.is_set():
+            try:
+                self.sample()
+            except Exception:
+                logger.exception("Counter sample failed")
+                return
+            next_sample += self.period
+            now = time.monotonic()
+            if self._csv and now - last_flush >= 1.0:
+                self._flush_csv()
+                last_flush = now
+            if next_sample < now:
+                # Fell behind; skip the missed slots instead of bursting
+                self.overruns += 1
+                next_sample = now
+            else:
+                self._stop.wait(next_sample - now)
+
+    def _flush_csv(self):
+        with self._lock:
+            rows = self._samples[self._written:self._count].copy()
+            self._written = self._count
+        _write_rows(self._csv, rows)
+        self._csv.flush()
+
+    # Series
+
+    @property
+    def samples(self) -> np.ndarray:
+        """Copy of the samples taken so far (SAMPLE_DTYPE)"""
+        with self._lock:
+            return self._samples[:self._count].copy()
+
+    def series(self, window: int = 10) -> Dict[str, np.ndarray]:
+        """Columns of the samples plus rolling ipc and stall_ratio
+
+        Both are computed over the last window samples and are NaN until
+        that many have been taken.
+        """
+        samples = self.samples
+        out = {name: samples[name] for name in SAMPLE_DTYPE.names}
+        out["ipc"] = rolling_ipc(samples, window)
+        out["stall_ratio"] = rolling_stall_ratio(samples, window)
+        return out
+
+    def summary(self) -> Dict[str, float]:
+        samples = self.samples
+        if len(samples) < 2:
+            return {"samples": len(samples)}
+        cycles = int(samples["cycles"][-1] - samples["cycles"][0])
+        instret = int(samples["instret"][-1] - samples["instret"][0])
+        elapsed = float(samples["time"][-1] - samples["time"][0])
+        return {
+            "samples": len(samples),
+            "elapsed": elapsed,
+            "rate": (len(samples) - 1) / elapsed if elapsed else 0.0,
+            "cycles": cycles,
+            "instret": instret,
+            "ipc": instret / cycles if cycles else 0.0,
+            "stall_ratio": float(np.mean(samples["stall"] != 0)),
+            "wraps": self._cycles.wraps,
+            "resets": self._cycles.resets,
+            "overruns": self.overruns,
+        }
+
+    def to_csv(self, path: str):
+        with open(path, "w") as f:
+            f.write(",".join(SAMPLE_DTYPE.names) + "\n")
+            _write_rows(f, self.samples)
+
+    def to_npz(self, path: str, window: int = 10):
+        """Columnar export of the series, one array per column"""
+        np.savez_compressed(path, **self.series(window))
+
+
+def _write_rows(f: TextIO, rows: np.ndarray):
+    for row in rows:
+        f.write(f"{row['time']:.6f},{row['cycles']},{row['instret']},{row['stall']},{row['state']}\n")
+
+
+def rolling_ipc(samples: np.ndarray, window: int) -> np.ndarray:
+    """Instructions per cycle over the last window samples"""
+    ipc = np.full(len(samples), np.nan)
+    if len(samples) > window:
+        cycles = samples["cycles"][window:].astype(np.int64) - samples["cycles"][:-window].astype(np.int64)
+        instret = samples["instret"][window:].astype(np.int64) - samples["instret"][:-window].astype(np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ipc[window:] = np.where(cycles > 0, instret / cycles, np.nan)
+    return ipc
+
+
+def rolling_stall_ratio(samples: np.ndarray, window: int) -> np.ndarray:
+    """Fraction of the last window samples that saw a stall"""
+    ratio = np.full(len(samples), np.nan)
+    if len(samples) >= window:
+        stalled = np.concatenate(([0], np.cumsum(samples["stall"] != 0)))
+        ratio[window - 1:] = (stalled[window:] - stalled[:-window]) / window
+    return ratio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sample the CPU performance counters")
+    parser.add_argument("--backend", default="devmem", help="devmem[:base] or file:<path>")
+    parser.add_argument("--rate", type=float, default=1000.0, help="samples per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to sample")
+    parser.add_argument("--window", type=int, default=100, help="samples per rolling IPC/stall value")
+    parser.add_argument("--csv", help="stream samples to this CSV file")
+    parser.add_argument("--npz", help="save the series to this .npz file at the end")
+    parser.add_argument("--max-samples", type=int, help="samples kept in memory")
+    args = parser.parse_args(argv)
+
+    try:
+        with CPUController(open_backend(args.backend)) as cpu:
+            sampler = PerfSampler(cpu, args.rate, args.max_samples, args.csv)
+            with sampler:
+                time.sleep(args.duration)
+    except ControllerError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.npz:
+        sampler.to_npz(args.npz, args.window)
+    for key, value in sampler.summary().items():
+        print(f"{key:<12} {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
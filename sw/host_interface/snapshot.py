@@ -0,0 +1,217 @@
+"""
+Bulk CPU state snapshots for the host controller
+
+cpu_get_state() in cpu_driver.c reads the status block one register at a
+time and every GPR through a select/read pair, and memory dumps go through
+cpu_read_memory() byte by byte. snapshot() instead reads the whole status
+block as one slice of the mapped window, walks the 32 GPRs in a single
+pass, and copies memory ranges straight out of the CPU_IMEM/CPU_DMEM
+windows into NumPy arrays. The scalar state lands in one SNAPSHOT_DTYPE
+record; snapshots can be saved, loaded and diffed:
+
+    before = cpu.snapshot(memory=["dmem"])
+    cpu.step()
+    print(diff(before, cpu.snapshot(memory=["dmem"])).format())
+
+    python snapshot.py save state.npz --mem dmem
+    python snapshot.py diff before.npz after.npz
+"""
+
+import argparse
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from controller import (
+    CPU_REG_COUNT,
+    CPU_STATUS_CYCLES,
+    CPU_STATUS_EXCEPT,
+    CPU_STATUS_INSTRET,
+    CPU_STATUS_IRQ_PEND,
+    CPU_STATUS_PC,
+    CPU_STATUS_PIPELINE,
+    CPU_STATUS_STALL,
+    CPU_STATUS_STATE,
+    REGISTER_NAMES,
+    STATUS_OFFSET,
+    CPUController,
+    ControllerError,
+    open_backend,
+)
+from loader import DMEM_OFFSET, DMEM_SIZE, IMEM_OFFSET, IMEM_SIZE
+
+# Status block fields in register order (CPU_STATUS_STATE .. CPU_STATUS_PIPELINE)
+STATUS_FIELDS = [
+    ("state", CPU_STATUS_STATE),
+    ("pc", CPU_STATUS_PC),
+    ("cycles", CPU_STATUS_CYCLES),
+    ("instret", CPU_STATUS_INSTRET),
+    ("stall", CPU_STATUS_STALL),
+    ("exception", CPU_STATUS_EXCEPT),
+    ("irq_pending", CPU_STATUS_IRQ_PEND),
+    ("pipeline", CPU_STATUS_PIPELINE),
+]
+STATUS_BLOCK_SIZE = CPU_STATUS_PIPELINE + 4
+
+SNAPSHOT_DTYPE = np.dtype(
+    [("timestamp", "<f8")]
+    + [(name, "<u4") for name, _ in STATUS_FIELDS]
+    + [("regs", "<u4", (CPU_REG_COUNT,))]
+)
+
+NAMED_RANGES = {
+    "imem": (IMEM_OFFSET, IMEM_SIZE),
+    "dmem": (DMEM_OFFSET, DMEM_SIZE),
+}
+
+MemoryRange = Union[str, Tuple[int, int]]
+
+
+@dataclass
+class Snapshot:
+    """One SNAPSHOT_DTYPE record plus {start address: uint32 words}"""
+    record: np.ndarray
+    memory: Dict[int, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def regs(self) -> np.ndarray:
+        return self.record["regs"]
+
+    def __getitem__(self, name: str) -> int:
+        return int(self.record[name])
+
+    def save(self, path: str):
+        arrays = {f"mem_{addr:05x}": words for addr, words in self.memory.items()}
+        np.savez_compressed(path, record=self.record, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "Snapshot":
+        with np.load(path) as f:
+            memory = {int(name[4:], 16): f[name] for name in f.files if name.startswith("mem_")}
+            return cls(f["record"], memory)
+
+
+def _ranges(memory: Sequence[MemoryRange]) -> List[Tuple[int, int]]:
+    out = []
+    for entry in memory:
+        if isinstance(entry, str):
+            if entry not in NAMED_RANGES:
+                raise ControllerError(f"Unknown memory range '{entry}'")
+            entry = NAMED_RANGES[entry]
+        addr, size = entry
+        if addr % 4 or size % 4:
+            raise ControllerError(f"Memory range 0x{addr:x}+{size} is not word aligned")
+        CPUController.check_range(addr, size)
+        out.append((addr, size))
+    return out
+
+
+def snapshot(cpu: CPUController, memory: Sequence[MemoryRange] = (), halt: bool = False) -> Snapshot:
+    """Capture status, registers and memory ranges of cpu
+
+    With halt=True a running CPU is stopped for the capture and restarted
+    afterwards, so the parts are consistent with each other.
+    """
+    ranges = _ranges(memory)
+    was_running = halt and cpu.is_running()
+    if was_running:
+        cpu.stop()
+
+    record = np.zeros((), dtype=SNAPSHOT_DTYPE)
+    record["timestamp"] = time.time()
+    status = np.frombuffer(cpu.backend.read(STATUS_OFFSET, STATUS_BLOCK_SIZE), dtype="<u4")
+    for name, offset in STATUS_FIELDS:
+        record[name] = status[offset // 4]
+    record["regs"] = cpu.read_registers()
+    words = {addr: np.frombuffer(cpu.backend.read(addr, size), dtype="<u4").copy()
+             for addr, size in ranges}
+
+    if was_running:
+        cpu.start()
+    return Snapshot(record, words)
+
+
+@dataclass
+class SnapshotDiff:
+    """Differences between two snapshots, as (name, old, new) tuples"""
+    status: List[Tuple[str, int, int]] = field(default_factory=list)
+    regs: List[Tuple[int, int, int]] = field(default_factory=list)
+    memory: List[Tuple[int, int, int]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.status or self.regs or self.memory)
+
+    def format(self, limit: int = 64) -> str:
+        lines = [f"{name:<12} 0x{old:08x} -> 0x{new:08x}" for name, old, new in self.status]
+        lines += [f"x{i:<2} ({REGISTER_NAMES[i]:<4})  0x{old:08x} -> 0x{new:08x}" for i, old, new in self.regs]
+        lines += [f"[0x{addr:05x}]    0x{old:08x} -> 0x{new:08x}" for addr, old, new in self.memory[:limit]]
+        if len(self.memory) > limit:
+            lines.append(f"... {len(self.memory) - limit} more memory words")
+        return "\n".join(lines) if lines else "no differences"
+
+
+def diff(a: Snapshot, b: Snapshot) -> SnapshotDiff:
+    """Status fields, registers and memory words that differ from a to b
+
+    Memory is compared over the ranges present in both snapshots.
+    """
+    result = SnapshotDiff()
+    for name, _ in STATUS_FIELDS:
+        if a[name] != b[name]:
+            result.status.append((name, a[name], b[name]))
+    for i in np.flatnonzero(a.regs != b.regs):
+        result.regs.append((int(i), int(a.regs[i]), int(b.regs[i])))
+
+    for addr_a, words_a in a.memory.items():
+        for addr_b, words_b in b.memory.items():
+            start, end = max(addr_a, addr_b), min(addr_a + 4 * len(words_a), addr_b + 4 * len(words_b))
+            if start >= end:
+                continue
+            old = words_a[(start - addr_a) // 4:(end - addr_a) // 4]
+            new = words_b[(start - addr_b) // 4:(end - addr_b) // 4]
+            for i in np.flatnonzero(old != new):
+                result.memory.append((start + 4 * int(i), int(old[i]), int(new[i])))
+    result.memory.sort()
+    return result
+
+
+def _parse_range(text: str) -> MemoryRange:
+    if text in NAMED_RANGES:
+        return text
+    addr, _, size = text.partition("+")
+    return int(addr, 0), int(size, 0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Save and compare CPU state snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    save = sub.add_parser("save", help="capture a snapshot to an .npz file")
+    save.add_argument("output")
+    save.add_argument("--backend", default="devmem", help="devmem[:base] or file:<path>")
+    save.add_argument("--mem", action="append", type=_parse_range, default=[],
+                      help="imem, dmem or <addr>+<size>; may be repeated")
+    save.add_argument("--halt", action="store_true", help="stop the CPU during the capture")
+    cmp = sub.add_parser("diff", help="compare two saved snapshots")
+    cmp.add_argument("before")
+    cmp.add_argument("after")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "save":
+            with CPUController(open_backend(args.backend)) as cpu:
+                snapshot(cpu, args.mem, args.halt).save(args.output)
+        else:
+            changes = diff(Snapshot.load(args.before), Snapshot.load(args.after))
+            print(changes.format())
+            return 1 if changes else 0
+    except ControllerError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Incremental loads through the BlockCache against a FileBackend board"""
+
+from controller import BLOCK_SIZE, DMEM_OFFSET, BlockCache, CPUController, FileBackend
+from loader import ProgramImage
+
+
+def image() -> ProgramImage:
+    program = ProgramImage()
+    program.add(0, bytes(range(256)) * 16)  # 4 KiB of code
+    program.add(DMEM_OFFSET, b"\x5a" * 2 * BLOCK_SIZE)
+    return program
+
+
+def controller(tmp_path) -> CPUController:
+    backend = FileBackend(str(tmp_path / "board.bin"))
+    return CPUController(backend, cache=BlockCache.for_backend(backend, str(tmp_path / "cache")))
+
+
+def test_unchanged_load_writes_nothing(tmp_path):
+    """A second load of the same image, even from a new controller, skips every block"""
+    program = image()
+    first = controller(tmp_path).load(program)
+    assert first.written == first.blocks
+
+    stats = controller(tmp_path).load(program)
+    assert (stats.written, stats.runs, stats.stale) == (0, 0, 0)
+
+
+def test_changed_board_rewritten(tmp_path):
+    """Blocks changed behind the cache are noticed and the whole image rewritten"""
+    program = image()
+    controller(tmp_path).load(program)
+
+    # E.g. a bitstream reload or a load through the C driver
+    other = FileBackend(str(tmp_path / "board.bin"))
+    other.write(BLOCK_SIZE, b"\xff" * 8)
+
+    cpu = controller(tmp_path)
+    stats = cpu.load(program)
+    assert stats.stale == 1
+    assert stats.written == stats.blocks
+    assert cpu.read_memory(0, 4096) == program.read(0, 4096)
+    assert controller(tmp_path).load(program).written == 0
+
+
+def test_hard_reset_clears_cache(tmp_path):
+    """reset(hard=True) forgets the hashes, here and in the saved cache"""
+    program = image()
+    cpu = controller(tmp_path)
+    cpu.load(program)
+    cpu.reset()
+    assert cpu.cache.hashes
+
+    cpu.reset(hard=True)
+    assert not cpu.cache.hashes
+    stats = controller(tmp_path).load(program)
+    assert stats.written == stats.blocks
+    assert stats.stale == 0
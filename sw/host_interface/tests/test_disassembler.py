@@ -0,0 +1,16 @@
+"""Disassembly of A-extension ordering suffixes"""
+
+from disassembler import disassemble
+
+
+def amo(funct5: int, aqrl: int, rd: int = 10, rs1: int = 12, rs2: int = 11) -> int:
+    return (funct5 << 27 | aqrl << 25 | rs2 << 20 | rs1 << 15 | 0b010 << 12 | rd << 7 | 0x2F)
+
+
+def test_amo_suffixes():
+    """Both bits set is .aqrl, as objdump and riscv_asm spell it"""
+    assert disassemble(amo(0x01, 0)) == "amoswap.w a0, a1, (a2)"
+    assert disassemble(amo(0x01, 1)) == "amoswap.w.rl a0, a1, (a2)"
+    assert disassemble(amo(0x01, 2)) == "amoswap.w.aq a0, a1, (a2)"
+    assert disassemble(amo(0x01, 3)) == "amoswap.w.aqrl a0, a1, (a2)"
+    assert disassemble(amo(0x02, 3, rs2=0)) == "lr.w.aqrl a0, (a2)"
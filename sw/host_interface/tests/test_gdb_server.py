@@ -0,0 +1,189 @@
+"""GdbServer packet handling against a FileBackend board model"""
+
+import socket
+import threading
+from typing import Optional
+
+import pytest
+
+from controller import (
+    CPU_CTRL_ENABLE,
+    CPU_DEBUG_REG_SEL,
+    CPU_DEBUG_REG_VAL,
+    CPU_ENABLE_BIT,
+    CPU_STATE_HALTED,
+    CPU_STATUS_PC,
+    CPU_STATUS_STATE,
+    CTRL_OFFSET,
+    DEBUG_OFFSET,
+    DMEM_OFFSET,
+    STATUS_OFFSET,
+    CPUController,
+    FileBackend,
+)
+from gdb_server import GdbServer, checksum
+
+STOP_PC = 0x80
+
+
+class Board(FileBackend):
+    """FileBackend with a register bank and a program that runs when enabled
+
+    Each run counts up t0 and stores it to the first DMEM word, then stops
+    at STOP_PC unless halt is cleared.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.regs = [0] * 32
+        self.runs = 0
+        self.halt = True
+
+    def read32(self, offset: int) -> int:
+        if offset == DEBUG_OFFSET + CPU_DEBUG_REG_VAL:
+            return self.regs[super().read32(DEBUG_OFFSET + CPU_DEBUG_REG_SEL) % 32]
+        return super().read32(offset)
+
+    def write32(self, offset: int, value: int):
+        if offset == DEBUG_OFFSET + CPU_DEBUG_REG_VAL:
+            index = super().read32(DEBUG_OFFSET + CPU_DEBUG_REG_SEL) % 32
+            if index:
+                self.regs[index] = value
+            return
+        super().write32(offset, value)
+        if offset == CTRL_OFFSET + CPU_CTRL_ENABLE and value & CPU_ENABLE_BIT:
+            self.runs += 1
+            self.regs[5] += 1
+            super().write32(DMEM_OFFSET, self.regs[5])
+            if self.halt:
+                super().write32(STATUS_OFFSET + CPU_STATUS_PC, STOP_PC)
+                super().write32(STATUS_OFFSET + CPU_STATUS_STATE, CPU_STATE_HALTED)
+
+
+class Client:
+    """The gdb end of a socket pair"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.ack = True
+        self.buffer = b""
+
+    def send(self, payload: bytes, check: Optional[int] = None):
+        check = checksum(payload) if check is None else check
+        self.sock.sendall(b"$" + payload + b"#" + f"{check:02x}".encode())
+
+    def recv_ack(self) -> bytes:
+        while not self.buffer:
+            self.buffer += self.sock.recv(4096)
+        ack, self.buffer = self.buffer[:1], self.buffer[1:]
+        return ack
+
+    def recv_packet(self) -> str:
+        while b"#" not in self.buffer or len(self.buffer) < self.buffer.index(b"#") + 3:
+            self.buffer += self.sock.recv(4096)
+        end = self.buffer.index(b"#")
+        start = self.buffer.index(b"$")
+        payload, check = self.buffer[start + 1:end], self.buffer[end + 1:end + 3]
+        self.buffer = self.buffer[end + 3:]
+        assert int(check, 16) == checksum(payload)
+        if self.ack:
+            self.sock.sendall(b"+")
+        return payload.decode()
+
+    def transact(self, payload: str) -> str:
+        self.send(payload.encode())
+        if self.ack:
+            assert self.recv_ack() == b"+"
+        return self.recv_packet()
+
+
+@pytest.fixture
+def session():
+    board = Board()
+    cpu = CPUController(board)
+    server = GdbServer(cpu)
+    server_end, client_end = socket.socketpair()
+    client_end.settimeout(5)
+    thread = threading.Thread(target=server.serve, args=(server_end,), daemon=True)
+    thread.start()
+    yield board, server, Client(client_end)
+    client_end.close()
+    thread.join(5)
+    server_end.close()
+
+
+def test_packet_framing(session):
+    """Acks, checksum retransmits, no-ack mode and the detach reply"""
+    board, server, client = session
+    assert "QStartNoAckMode+" in client.transact("qSupported:swbreak+")
+
+    client.send(b"?", check=0)  # Corrupted
+    assert client.recv_ack() == b"-"
+    assert client.transact("?") == "S05"
+
+    assert client.transact("QStartNoAckMode") == "OK"
+    client.ack = False
+    assert client.transact("qAttached") == "1"
+    assert client.transact("vMustReplyEmpty") == ""
+    assert client.transact("D") == "OK"
+
+
+def test_registers_and_memory(session):
+    """g/p/P, m/M and escaped X packets, and error replies"""
+    board, server, client = session
+    board.regs[5] = 0x12345678
+    regs = client.transact("g")
+    assert len(regs) == 33 * 8
+    assert regs[5 * 8:6 * 8] == "78563412"
+
+    assert client.transact("P6=efbeadde") == "OK"
+    assert board.regs[6] == 0xDEADBEEF
+    assert client.transact("p6") == "efbeadde"
+    assert client.transact("p21") == "E01"
+
+    assert client.transact(f"M{DMEM_OFFSET:x},4:01020304") == "OK"
+    assert client.transact(f"m{DMEM_OFFSET:x},4") == "01020304"
+    # 0x23 (#), 0x24 ($) and 0x7d (}) travel escaped as } followed by byte ^ 0x20
+    assert client.transact(f"X{DMEM_OFFSET + 4:x},3:}}\x03}}\x04}}]") == "OK"
+    assert board.read(DMEM_OFFSET + 4, 3) == b"#$}"
+
+    assert client.transact("m40000,4") == "E01"  # Outside both memories
+    assert client.transact("mzz,4") == "E02"
+
+
+def test_cache_invalidated_on_resume(session):
+    """Memory and registers are cached while stopped and re-read after c and s"""
+    board, server, client = session
+    assert client.transact(f"m{DMEM_OFFSET:x},4") == "00000000"
+    regs = client.transact("g")
+
+    # Changes behind the server's back stay hidden while the CPU is stopped
+    board.write32(DMEM_OFFSET, 0x55)
+    board.regs[5] = 0x55
+    misses = server.cache.misses
+    assert client.transact(f"m{DMEM_OFFSET:x},4") == "00000000"
+    assert client.transact("g") == regs
+    assert server.cache.misses == misses
+
+    assert client.transact(f"Z0,{STOP_PC:x},4") == "OK"
+    assert client.transact("c") == "T05hwbreak:;"
+    assert board.runs == 1
+    assert client.transact(f"m{DMEM_OFFSET:x},4") == "56000000"
+    assert client.transact("p5") == "56000000"
+    assert client.transact("p20") == f"{STOP_PC:02x}000000"
+    assert server.cache.misses == misses + 1
+
+    # Stepping off the breakpoint at the PC runs the program once more
+    assert client.transact("s") == "T05hwbreak:;"
+    assert client.transact(f"m{DMEM_OFFSET:x},4") == "57000000"
+
+
+def test_interrupt(session):
+    """Ctrl-C while running stops the CPU and reports SIGINT"""
+    board, server, client = session
+    board.halt = False
+    client.send(b"c")
+    assert client.recv_ack() == b"+"
+    client.sock.sendall(b"\x03")
+    assert client.recv_packet() == "S02"
+    assert not server.cpu.is_running()
@@ -0,0 +1,80 @@
+"""WrapCounter's wrap/reset decision and PerfSampler's CSV spill"""
+
+import time
+
+import numpy as np
+
+from controller import CPU_STATUS_CYCLES, CPU_STATUS_INSTRET, STATUS_OFFSET, CPUController, FileBackend
+from perf_sampler import CLOCK_HZ, COUNTER_WRAP, WRAP_SLACK, PerfSampler, WrapCounter
+
+
+def test_wrap():
+    """A drop the counter can have covered since the last read is a wrap"""
+    counter = WrapCounter(COUNTER_WRAP - 0x100)
+    assert counter.update(COUNTER_WRAP - 0x100, 0.0) == COUNTER_WRAP - 0x100
+    assert counter.update(0x100, 0.001) == COUNTER_WRAP + 0x100
+    assert counter.update(COUNTER_WRAP - 1, 20.0) == 2 * COUNTER_WRAP - 1
+    assert counter.update(5, 20.001) == 2 * COUNTER_WRAP + 5
+    assert (counter.wraps, counter.resets) == (2, 0)
+
+
+def test_wrap_without_times():
+    """With no read times every drop counts as a wrap"""
+    counter = WrapCounter(1000)
+    assert counter.update(10) == COUNTER_WRAP + 10
+    assert counter.wraps == 1
+
+
+def test_reset():
+    """A stop clears the counters; the extended value carries on from before"""
+    counter = WrapCounter(0)
+    counter.update(0, 0.0)
+    assert counter.update(CLOCK_HZ // 2, 0.5) == CLOCK_HZ // 2
+    # Stopped and restarted within the next second: 0 then a few counts
+    assert counter.update(0, 1.5) == CLOCK_HZ // 2
+    assert counter.update(1000, 1.6) == CLOCK_HZ // 2 + 1000
+    assert (counter.wraps, counter.resets) == (0, 1)
+
+
+def test_ambiguous_reset_near_wrap():
+    """A reset just before the counter would wrap anyway is taken as a wrap
+
+    Both explain the drop in the time since the last read, so the value
+    jumps by the rest of the wrap period but stays monotonic.
+    """
+    counter = WrapCounter(COUNTER_WRAP - 1000)
+    counter.update(COUNTER_WRAP - 1000, 0.0)
+    assert counter.update(100, 0.001) == COUNTER_WRAP + 100
+    assert (counter.wraps, counter.resets) == (1, 0)
+    # Further below the wrap point than WRAP_SLACK allows, the drop is a reset
+    below = COUNTER_WRAP - int(2 * WRAP_SLACK * CLOCK_HZ)
+    counter = WrapCounter(below)
+    counter.update(below, 0.0)
+    assert counter.update(100, 0.001) == below + 100
+    assert (counter.wraps, counter.resets) == (0, 1)
+
+
+def test_csv_spill(tmp_path):
+    """Rows dropped from memory past max_samples are in the CSV, each once"""
+    cpu = CPUController(FileBackend())
+    path = tmp_path / "soak.csv"
+    sampler = PerfSampler(cpu, rate=0.1, max_samples=8, csv_path=str(path))
+    with sampler:
+        deadline = time.monotonic() + 5
+        while not len(sampler) and time.monotonic() < deadline:
+            time.sleep(0.001)
+        assert len(sampler) == 1  # The thread's first sample; the next is 10 s away
+        for i in range(1, 21):
+            cpu.backend.write32(STATUS_OFFSET + CPU_STATUS_CYCLES, i * 100)
+            cpu.backend.write32(STATUS_OFFSET + CPU_STATUS_INSTRET, i * 50)
+            sampler.sample()
+
+    assert len(sampler) <= 8
+    kept = sampler.samples["cycles"]
+    assert list(kept) == [i * 100 for i in range(21 - len(kept), 21)]
+
+    rows = np.loadtxt(path, delimiter=",", skiprows=1)
+    assert path.read_text().splitlines()[0] == "time,cycles,instret,stall,state"
+    assert list(rows[:, 1]) == [i * 100 for i in range(21)]
+    assert list(rows[:, 2]) == [i * 50 for i in range(21)]
+    assert np.all(np.diff(rows[:, 0]) >= 0)
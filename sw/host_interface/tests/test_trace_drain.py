@@ -0,0 +1,152 @@
+"""TraceDrainer against a FileBackend standing in for the proposed trace ring"""
+
+import numpy as np
+
+from controller import DEBUG_OFFSET, CPUController, FileBackend
+from trace_drain import (
+    CPU_DEBUG_TRACE_BUF,
+    CPU_DEBUG_TRACE_DROP,
+    CPU_DEBUG_TRACE_HEAD,
+    CPU_DEBUG_TRACE_TAIL,
+    CPU_TRACE_DEPTH,
+    ENTRY_DTYPE,
+    ENTRY_SIZE,
+    TraceDrainer,
+    read_trace,
+)
+
+MASK = 0xFFFFFFFF
+
+
+class TraceHardware:
+    """Plays the CPU side of the ring: writes entries and moves HEAD and DROP"""
+
+    def __init__(self, cpu: CPUController, head: int = 0):
+        self.cpu = cpu
+        self.head = head
+        self.pc = 0x4C
+        cpu.set_debug(CPU_DEBUG_TRACE_HEAD, head)
+        cpu.set_debug(CPU_DEBUG_TRACE_TAIL, head)
+
+    def emit(self, count: int) -> np.ndarray:
+        """Record count entries, overwriting the oldest once the ring is full"""
+        entries = np.zeros(count, dtype=ENTRY_DTYPE)
+        for i in range(count):
+            entries[i] = (self.pc, 0x00000013 | (self.head & 0xFFF) << 20)  # addi x0, x0, n
+            slot = self.head % CPU_TRACE_DEPTH
+            self.cpu.backend.write(DEBUG_OFFSET + CPU_DEBUG_TRACE_BUF + slot * ENTRY_SIZE, entries[i:i + 1].tobytes())
+            self.head = (self.head + 1) & MASK
+            self.pc += 4 if self.head % 16 else -60  # A 16-instruction loop
+        self.cpu.set_debug(CPU_DEBUG_TRACE_HEAD, self.head)
+        return entries
+
+    def overflow(self, count: int):
+        """Entries the hardware discarded because the ring was full"""
+        dropped = self.cpu.debug(CPU_DEBUG_TRACE_DROP)
+        self.cpu.set_debug(CPU_DEBUG_TRACE_DROP, (dropped + count) & MASK)
+
+
+def setup(tmp_path, **kwargs):
+    cpu = CPUController(FileBackend())
+    path = str(tmp_path / "run.rvtr")
+    return cpu, TraceHardware(cpu), TraceDrainer(cpu, path, **kwargs), path
+
+
+def contents(path):
+    """Trace file as a list of entry arrays and drop counts"""
+    return [item if isinstance(item, int) else item.entries for item in read_trace(path)]
+
+
+def entries_of(items):
+    chunks = [item for item in items if not isinstance(item, int)]
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=ENTRY_DTYPE)
+
+
+def test_ring_wrap(tmp_path):
+    """Pending entries that wrap round the end of the ring come out in order"""
+    cpu, hw, drainer, path = setup(tmp_path)
+    expected = [hw.emit(200)]
+    assert drainer.drain_once() == 200
+    expected.append(hw.emit(200))  # Slots 200..255, then 0..143
+    assert drainer.drain_once() == 200
+    drainer.stop()
+
+    assert cpu.debug(CPU_DEBUG_TRACE_TAIL) == 400
+    items = contents(path)
+    assert all(not isinstance(item, int) for item in items)
+    assert np.array_equal(entries_of(items), np.concatenate(expected))
+    assert drainer.stats.as_dict(drainer.ring)["dropped"] == 0
+
+
+def test_counter_wrap(tmp_path):
+    """HEAD and TAIL are free-running and wrap at 2^32"""
+    cpu = CPUController(FileBackend())
+    hw = TraceHardware(cpu, head=MASK - 99)
+    path = str(tmp_path / "run.rvtr")
+    expected = hw.emit(200)
+    with TraceDrainer(cpu, path) as drainer:
+        pass
+
+    assert cpu.debug(CPU_DEBUG_TRACE_TAIL) == 100
+    assert np.array_equal(entries_of(contents(path)), expected)
+    assert drainer.dropped == 0
+
+
+def test_lag_drops(tmp_path):
+    """Entries overwritten before the drainer got to them become a drop record"""
+    cpu, hw, drainer, path = setup(tmp_path)
+    expected = hw.emit(300)
+    assert drainer.drain_once() == CPU_TRACE_DEPTH
+    drainer.stop()
+
+    lag = 300 - CPU_TRACE_DEPTH
+    assert drainer.stats.lag_dropped == lag
+    items = contents(path)
+    assert items[0] == lag
+    assert np.array_equal(entries_of(items[1:]), expected[lag:])
+
+
+def test_hardware_drops(tmp_path):
+    """CPU_DEBUG_TRACE_DROP increments are recorded after the entries before them"""
+    cpu, hw, drainer, path = setup(tmp_path)
+    first = hw.emit(100)
+    hw.overflow(7)
+    drainer.drain_once()
+    second = hw.emit(10)
+    drainer.drain_once()
+    drainer.stop()
+
+    assert drainer.stats.hw_dropped == 7
+    items = contents(path)
+    assert [len(item) if not isinstance(item, int) else ("drop", item) for item in items] == [100, ("drop", 7), 10]
+    assert np.array_equal(items[0], first)
+    assert np.array_equal(items[2], second)
+
+
+def test_host_ring_drops(tmp_path):
+    """A full host ring keeps the oldest entries and records the rest as dropped"""
+    cpu, hw, drainer, path = setup(tmp_path, capacity=64)
+    expected = hw.emit(100)
+    assert drainer.drain_once() == 64
+    drainer.stop()
+
+    assert drainer.ring.dropped == 36
+    items = contents(path)
+    assert items[-1] == 36
+    assert np.array_equal(entries_of(items), expected[:64])
+
+
+def test_file_round_trip(tmp_path):
+    """Chunks decode lazily and each one's PCs continue from the previous chunk"""
+    cpu, hw, drainer, path = setup(tmp_path, chunk=50)
+    expected = hw.emit(230)
+    drainer.drain_once()
+    drainer.stop()
+
+    chunks = list(read_trace(path))
+    assert [len(chunk) for chunk in chunks] == [50, 50, 50, 50, 30]
+    assert all(chunk._entries is None for chunk in chunks)
+    # Decoding only the last chunk still gives absolute PCs
+    assert np.array_equal(chunks[-1].entries, expected[200:])
+    assert np.array_equal(np.concatenate([chunk.entries for chunk in chunks]), expected)
+    assert drainer.stats.written == 230
@@ -0,0 +1,414 @@
+"""
+Streaming drain of the hardware trace buffer
+
+cpu_get_trace() pops one word at a time through CPU_DEBUG_TRACE, which
+cannot keep up with a running CPU. The drainer instead works against a
+proposed trace ring in the debug block, defined below: the CPU records
+{pc, instruction} entries in a CPU_TRACE_DEPTH ring at
+CPU_DEBUG_TRACE_BUF, advancing CPU_DEBUG_TRACE_HEAD, and the host consumes
+them by advancing CPU_DEBUG_TRACE_TAIL. Neither CPU wrapper implements
+the ring yet, so the layout is not in cpu_regs.h; until it is, the drainer
+only runs against a FileBackend that something else fills in.
+
+TraceDrainer copies everything between tail and head out of the ring as
+one or two slices on a background thread and pushes the entries into a
+single-producer/single-consumer TraceRing, which needs no lock. A writer
+thread (or the caller, via read()) consumes the ring; with a path the
+entries go to a compressed trace file whose PCs are delta-encoded, so
+straight-line code costs almost nothing.
+
+Entries are lost in three places, all counted and recorded in the file as
+drop records: the hardware ring overflowing (CPU_DEBUG_TRACE_DROP), the
+drainer falling more than a ring behind, and the host ring filling up.
+
+    python trace_drain.py record run.rvtr --duration 10
+    python trace_drain.py dump run.rvtr --limit 20 --program prog.elf
+"""
+
+import argparse
+import logging
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from typing import BinaryIO, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from controller import (
+    DEBUG_OFFSET,
+    CPUController,
+    ControllerError,
+    open_backend,
+)
+from disassembler import Listing
+from loader import LoaderError, load_elf_symbols, load_program
+
+logger = logging.getLogger(__name__)
+
+# Proposed trace ring registers, debug block offsets. Not implemented by
+# any RTL yet; move them to cpu_regs.h once a wrapper has the ring.
+CPU_DEBUG_TRACE_HEAD = 0x20  # Entries written by the hardware (free-running)
+CPU_DEBUG_TRACE_TAIL = 0x24  # Entries consumed by the host (host writes)
+CPU_DEBUG_TRACE_DROP = 0x28  # Entries lost to overflow (free-running)
+CPU_DEBUG_TRACE_BUF = 0x800  # Entry i at + (i % CPU_TRACE_DEPTH) * ENTRY_SIZE
+CPU_TRACE_DEPTH = 256
+CPU_TRACE_ENTRY_WORDS = 2
+
+ENTRY_DTYPE = np.dtype([("pc", "<u4"), ("insn", "<u4")])
+ENTRY_SIZE = CPU_TRACE_ENTRY_WORDS * 4
+
+TRACE_MAGIC = b"RVTR"
+TRACE_VERSION = 1
+_HEADER = struct.Struct("<4sHH")
+# Record type, entry count, payload bytes, last PC of an entries record
+_RECORD = struct.Struct("<BIII")
+RECORD_ENTRIES = 0
+RECORD_DROP = 1
+
+_MASK = 0xFFFFFFFF
+
+
+class TraceRing:
+    """Single-producer single-consumer ring of trace entries
+
+    The producer only moves head and the consumer only moves tail, each
+    after its copy is complete, so the two threads need no lock.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        self.capacity = capacity
+        self.buffer = np.zeros(capacity, dtype=ENTRY_DTYPE)
+        self.head = 0  # Total entries pushed
+        self.tail = 0  # Total entries popped
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self.head - self.tail
+
+    def push(self, entries: np.ndarray) -> int:
+        """Copy in as many entries as fit; the rest are counted as dropped"""
+        count = min(len(entries), self.capacity - (self.head - self.tail))
+        start = self.head & (self.capacity - 1)
+        first = min(count, self.capacity - start)
+        self.buffer[start:start + first] = entries[:first]
+        self.buffer[:count - first] = entries[first:count]
+        self.dropped += len(entries) - count
+        self.head += count
+        return count
+
+    def pop(self, limit: Optional[int] = None) -> np.ndarray:
+        count = self.head - self.tail
+        if limit is not None:
+            count = min(count, limit)
+        start = self.tail & (self.capacity - 1)
+        first = min(count, self.capacity - start)
+        out = np.concatenate((self.buffer[start:start + first], self.buffer[:count - first]))
+        self.tail += count
+        return out
+
+
+class TraceWriter:
+    """Writes entry chunks and drop records to a compressed trace file"""
+
+    def __init__(self, path: str, level: int = 6):
+        self.path = path
+        self.level = level
+        self._file: BinaryIO = open(path, "wb")
+        self._file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, CPU_TRACE_ENTRY_WORDS))
+        self._last_pc = 0
+        self.entries = 0
+        self.bytes = _HEADER.size
+
+    def write(self, entries: np.ndarray):
+        if not len(entries):
+            return
+        pcs = entries["pc"].astype(np.int64)
+        deltas = np.diff(pcs, prepend=self._last_pc).astype("<i4")
+        self._last_pc = int(pcs[-1])
+        payload = zlib.compress(deltas.tobytes() + entries["insn"].astype("<u4").tobytes(), self.level)
+        self._record(RECORD_ENTRIES, len(entries), payload, self._last_pc)
+        self.entries += len(entries)
+
+    def drop(self, count: int):
+        self._record(RECORD_DROP, count, b"")
+
+    def _record(self, kind: int, count: int, payload: bytes, last_pc: int = 0):
+        self._file.write(_RECORD.pack(kind, count, len(payload), last_pc))
+        self._file.write(payload)
+        self.bytes += _RECORD.size + len(payload)
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class TraceChunk:
+    """A block of entries from a trace file, decompressed on first access"""
+
+    def __init__(self, count: int, payload: bytes, base_pc: int):
+        self.count = count
+        self._payload = payload
+        self._base_pc = base_pc
+        self._entries: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def entries(self) -> np.ndarray:
+        if self._entries is None:
+            raw = zlib.decompress(self._payload)
+            deltas = np.frombuffer(raw, dtype="<i4", count=self.count)
+            entries = np.empty(self.count, dtype=ENTRY_DTYPE)
+            entries["pc"] = (self._base_pc + np.cumsum(deltas, dtype=np.int64)) & _MASK
+            entries["insn"] = np.frombuffer(raw, dtype="<u4", offset=4 * self.count)
+            self._entries = entries
+            self._payload = b""
+        return self._entries
+
+
+def read_trace(path: str) -> Iterator[Union[TraceChunk, int]]:
+    """Yield TraceChunks, and the entry count of each drop record, in order"""
+    with open(path, "rb") as f:
+        magic, version, _ = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} trace file")
+        last_pc = 0
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            kind, count, size, end_pc = _RECORD.unpack(header)
+            payload = f.read(size)
+            if kind == RECORD_DROP:
+                yield count
+                continue
+            yield TraceChunk(count, payload, last_pc)
+            # The next chunk's deltas start from this chunk's last PC, which
+            # the header carries so skipped chunks stay compressed
+            last_pc = end_pc
+
+
+@dataclass
+class DrainStats:
+    drained: int = 0
+    hw_dropped: int = 0  # Overflow reported by CPU_DEBUG_TRACE_DROP
+    lag_dropped: int = 0  # Overwritten before the drainer copied them
+    written: int = 0
+
+    def as_dict(self, ring: TraceRing) -> Dict[str, int]:
+        return {
+            "drained": self.drained,
+            "written": self.written,
+            "hw_dropped": self.hw_dropped,
+            "lag_dropped": self.lag_dropped,
+            "ring_dropped": ring.dropped,
+            "dropped": self.hw_dropped + self.lag_dropped + ring.dropped,
+        }
+
+
+class TraceDrainer:
+    """Background drain of the hardware trace ring into a TraceRing"""
+
+    def __init__(self, controller: CPUController, path: Optional[str] = None,
+                 capacity: int = 1 << 16, interval: float = 0.0005, chunk: int = 8192):
+        self.controller = controller
+        self.ring = TraceRing(capacity)
+        self.interval = interval
+        self.chunk = chunk
+        self.stats = DrainStats()
+        self.writer = TraceWriter(path) if path else None
+        # (ring position, entries lost just before it); deque appends are atomic
+        self._drops: Deque[Tuple[int, int]] = deque()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._tail = 0
+        self._drop_count = 0
+        self._reported = 0
+
+    def _debug(self, offset: int) -> int:
+        return self.controller.debug(offset)
+
+    @property
+    def dropped(self) -> int:
+        return self.stats.hw_dropped + self.stats.lag_dropped + self.ring.dropped
+
+    def start(self):
+        self._tail = self._debug(CPU_DEBUG_TRACE_TAIL)
+        self._drop_count = self._debug(CPU_DEBUG_TRACE_DROP)
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._drain_loop, name="trace-drain", daemon=True)]
+        if self.writer:
+            self._threads.append(threading.Thread(target=self._write_loop, name="trace-write", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Drain what is left, flush the file and join the threads"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.writer:
+            self._flush()
+            self.writer.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # Producer
+
+    def _lost(self, count: int):
+        if count:
+            self._drops.append((self.ring.head, count))
+
+    def drain_once(self) -> int:
+        """Copy all pending hardware entries into the ring; returns the count kept"""
+        head = self._debug(CPU_DEBUG_TRACE_HEAD)
+        drop_count = self._debug(CPU_DEBUG_TRACE_DROP)
+        hw_dropped = (drop_count - self._drop_count) & _MASK
+        self._drop_count = drop_count
+        self.stats.hw_dropped += hw_dropped
+
+        tail = self._tail
+        pending = (head - tail) & _MASK
+        if pending > CPU_TRACE_DEPTH:
+            lag = pending - CPU_TRACE_DEPTH
+            self.stats.lag_dropped += lag
+            self._lost(lag)
+            tail, pending = (tail + lag) & _MASK, CPU_TRACE_DEPTH
+        if not pending:
+            self._lost(hw_dropped)
+            return 0
+
+        start = tail % CPU_TRACE_DEPTH
+        first = min(pending, CPU_TRACE_DEPTH - start)
+        base = DEBUG_OFFSET + CPU_DEBUG_TRACE_BUF
+        raw = self.controller.backend.read(base + start * ENTRY_SIZE, first * ENTRY_SIZE)
+        if pending > first:
+            raw += self.controller.backend.read(base, (pending - first) * ENTRY_SIZE)
+        entries = np.frombuffer(raw, dtype=ENTRY_DTYPE)
+
+        # Entries the hardware overwrote while we were copying are garbage
+        overrun = ((self._debug(CPU_DEBUG_TRACE_HEAD) - tail) & _MASK) - CPU_TRACE_DEPTH
+        if overrun > 0:
+            overrun = min(overrun, len(entries))
+            entries = entries[overrun:]
+            self.stats.lag_dropped += overrun
+            self._lost(overrun)
+
+        self._tail = head
+        self.controller.set_debug(CPU_DEBUG_TRACE_TAIL, head)
+        pushed = self.ring.push(entries)
+        # A full host ring keeps the oldest entries and loses the rest
+        self._lost(len(entries) - pushed)
+        self.stats.drained += pushed
+        # The hardware only drops once its ring is full, i.e. after these entries
+        self._lost(hw_dropped)
+        return pushed
+
+    def _drain_loop(self):
+        while not self._stop.is_set():
+            try:
+                count = self.drain_once()
+            except Exception:
+                logger.exception("Trace drain failed")
+                return
+            if self.dropped != self._reported:
+                logger.warning(f"Trace entries dropped: {self.stats.as_dict(self.ring)}")
+                self._reported = self.dropped
+            if not count:
+                time.sleep(self.interval)
+        self.drain_once()
+
+    # Consumer
+
+    def read(self, limit: Optional[int] = None) -> np.ndarray:
+        """Pop entries from the ring (when not writing to a file)"""
+        return self.ring.pop(limit)
+
+    def _flush(self) -> int:
+        """Write out ring contents, with drop records where entries were lost"""
+        written = 0
+        while len(self.ring):
+            limit = self.chunk
+            if self._drops:
+                position, count = self._drops[0]
+                if position <= self.ring.tail:
+                    self._drops.popleft()
+                    self.writer.drop(count)
+                    continue
+                limit = min(limit, position - self.ring.tail)
+            entries = self.ring.pop(limit)
+            self.writer.write(entries)
+            written += len(entries)
+        while self._drops and self._drops[0][0] <= self.ring.tail:
+            self.writer.drop(self._drops.popleft()[1])
+        self.stats.written += written
+        return written
+
+    def _write_loop(self):
+        while not self._stop.is_set():
+            if not self._flush():
+                time.sleep(self.interval * 4)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drain the CPU trace buffer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="drain the trace of a running CPU to a file")
+    record.add_argument("output")
+    record.add_argument("--backend", default="devmem", help="devmem[:base] or file:<path>")
+    record.add_argument("--duration", type=float, default=10.0, help="seconds to record")
+    dump = sub.add_parser("dump", help="print entries of a trace file")
+    dump.add_argument("trace")
+    dump.add_argument("--limit", type=int, help="stop after this many entries")
+    dump.add_argument("--program", help="program that produced the trace, for symbols")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        try:
+            with CPUController(open_backend(args.backend)) as cpu:
+                drainer = TraceDrainer(cpu, args.output)
+                with drainer:
+                    time.sleep(args.duration)
+                print(drainer.stats.as_dict(drainer.ring))
+        except ControllerError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    listing = Listing([])
+    if args.program:
+        try:
+            with load_program(args.program) as image:
+                symbols = load_elf_symbols(args.program) if image.file_type == "elf" else {}
+                listing = Listing.for_image(image, symbols)
+        except LoaderError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    shown = 0
+    for item in read_trace(args.trace):
+        if isinstance(item, int):
+            print(f"<{item} entries dropped>")
+            continue
+        for pc, insn in item.entries:
+            print(listing.line(int(pc), int(insn)))
+            shown += 1
+            if args.limit and shown >= args.limit:
+                return 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
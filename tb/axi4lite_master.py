@@ -0,0 +1,308 @@
+"""
+Pipelined AXI4-Lite master BFM
+
+Each of the five channels (AW, W, B, AR, R) runs in its own coroutine, so a
+new address can be presented on the same edge the previous one is accepted
+and several transactions can be in flight at once. max_outstanding bounds
+the writes and the reads in flight (each direction separately). Keep it at
+1 for slaves such as red_pitaya_cpu_wrapper, whose state machine handles one
+transaction at a time; cpu_axi_wrapper takes deeper pipelines.
+
+    axi = AXI4LiteMaster(dut, dut.s_axi_aclk, max_outstanding=4)
+    await axi.write(0x00C, 0x1000)
+    data, resp = await axi.read(0x00C)
+    await axi.write_many([(addr, value), ...])
+    values = await axi.read_many(addrs)
+    axi.stats()  # latency in cycles and throughput per direction
+
+throttle() inserts idle cycles on the master-driven VALID/READY signals,
+e.g. with random_pause(), to check the slave under back-pressure.
+"""
+
+import logging
+import random
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import cocotb
+from cocotb.queue import Queue
+from cocotb.triggers import Event, ReadOnly, RisingEdge
+from cocotb.utils import get_sim_time
+
+logger = logging.getLogger(__name__)
+
+RESP_OKAY = 0
+RESP_EXOKAY = 1
+RESP_SLVERR = 2
+RESP_DECERR = 3
+
+
+class AXI4LiteError(Exception):
+    """A transaction got a SLVERR/DECERR response or timed out"""
+
+
+@dataclass
+class Transaction:
+    """One AXI4-Lite read or write, with sim-time stamps in ps"""
+    write: bool
+    addr: int
+    data: int = 0
+    strb: int = 0xF
+    resp: Optional[int] = None
+    error: Optional[str] = None
+    queued: int = 0
+    issued: Optional[int] = None  # First edge VALID was sampled on AW/AR
+    completed: Optional[int] = None  # B/R handshake edge
+    done: Event = field(default_factory=Event)
+
+
+def random_pause(probability: float, seed: Optional[int] = None) -> Iterator[bool]:
+    """Endless stream of pauses, each True with the given probability"""
+    rng = random.Random(seed)
+    while True:
+        yield rng.random() < probability
+
+
+def _high(signal) -> bool:
+    try:
+        return bool(int(signal.value))
+    except ValueError:  # X/Z
+        return False
+
+
+class AXI4LiteMaster:
+    """AXI4-Lite master with independent channels and outstanding transactions"""
+
+    def __init__(self, dut, clock, prefix: str = "s_axi", max_outstanding: int = 1,
+                 timeout: int = 1000):
+        self.dut = dut
+        self.clock = clock
+        self.max_outstanding = max_outstanding
+        # Cycles a transaction may wait for its response
+        self.timeout = timeout
+        self.period: Optional[int] = None
+
+        for name in ("awaddr", "awprot", "awvalid", "awready", "wdata", "wstrb", "wvalid",
+                     "wready", "bresp", "bvalid", "bready", "araddr", "arprot", "arvalid",
+                     "arready", "rdata", "rresp", "rvalid", "rready"):
+            setattr(self, name, getattr(dut, f"{prefix}_{name}"))
+
+        # Initialize AXI signals
+        self.awaddr.value = 0
+        self.awprot.value = 0
+        self.awvalid.value = 0
+        self.wdata.value = 0
+        self.wstrb.value = 0xF
+        self.wvalid.value = 0
+        self.bready.value = 0
+        self.araddr.value = 0
+        self.arprot.value = 0
+        self.arvalid.value = 0
+        self.rready.value = 0
+
+        self._aw_queue: Queue = Queue()
+        self._w_queue: Queue = Queue()
+        self._ar_queue: Queue = Queue()
+        self._pending = {True: deque(), False: deque()}  # Awaiting B / R
+        self._in_flight = {True: 0, False: 0}
+        self._credit = {True: Event(), False: Event()}
+        self._response_wake = {True: Event(), False: Event()}
+        self._pauses: Dict[str, Optional[Iterator[bool]]] = dict.fromkeys(("aw", "w", "b", "ar", "r"))
+        self.reset_stats()
+
+        cocotb.start_soon(self._measure_period())
+        cocotb.start_soon(self._drive(self._aw_queue, "aw", self.awvalid, self.awready,
+                                      ((self.awaddr, "addr"),), first=True))
+        cocotb.start_soon(self._drive(self._w_queue, "w", self.wvalid, self.wready,
+                                      ((self.wdata, "data"), (self.wstrb, "strb"))))
+        cocotb.start_soon(self._drive(self._ar_queue, "ar", self.arvalid, self.arready,
+                                      ((self.araddr, "addr"),), first=True))
+        cocotb.start_soon(self._respond(True, "b", self.bvalid, self.bready, self.bresp))
+        cocotb.start_soon(self._respond(False, "r", self.rvalid, self.rready, self.rresp, self.rdata))
+
+    def throttle(self, **pauses: Optional[Iterable[bool]]):
+        """Set pause streams per channel (aw, w, b, ar, r); None removes one
+
+        The master idles VALID (AW/W/AR) or deasserts READY (B/R) for each
+        cycle its stream yields True.
+        """
+        for channel, pause in pauses.items():
+            if channel not in self._pauses:
+                raise ValueError(f"Unknown AXI channel {channel!r}")
+            self._pauses[channel] = iter(pause) if pause is not None else None
+
+    def _paused(self, channel: str) -> bool:
+        pause = self._pauses[channel]
+        return pause is not None and next(pause)
+
+    async def _measure_period(self):
+        await RisingEdge(self.clock)
+        start = get_sim_time("ps")
+        await RisingEdge(self.clock)
+        self.period = get_sim_time("ps") - start
+
+    # Channel coroutines --------------------------------------------------
+
+    async def _drive(self, queue: Queue, channel: str, valid, ready, fields, first: bool = False):
+        """Present queued transactions on a VALID/READY channel back to back"""
+        txn = await queue.get()
+        while True:
+            while self._paused(channel):
+                valid.value = 0
+                await RisingEdge(self.clock)
+            for signal, attr in fields:
+                signal.value = getattr(txn, attr)
+            valid.value = 1
+            while True:
+                # READY as the edge will see it; after the edge it may
+                # already have moved on to the next transfer
+                await ReadOnly()
+                accepted = _high(ready)
+                await RisingEdge(self.clock)
+                if first and txn.issued is None:
+                    txn.issued = get_sim_time("ps")
+                if accepted:
+                    break
+            if queue.empty():
+                valid.value = 0
+                txn = await queue.get()
+            else:
+                txn = queue.get_nowait()
+
+    async def _respond(self, write: bool, channel: str, valid, ready, resp, data=None):
+        """Accept B or R beats and complete the oldest pending transaction"""
+        pending = self._pending[write]
+        wake = self._response_wake[write]
+        while True:
+            if not pending:
+                ready.value = 0
+                wake.clear()
+                await wake.wait()
+            accepting = not self._paused(channel)
+            ready.value = int(accepting)
+            # Sample the beat before the edge it is transferred on; after
+            # it the slave may already present the next response
+            await ReadOnly()
+            beat = accepting and _high(valid)
+            if beat:
+                beat_resp = int(resp.value)
+                beat_data = data.value if data is not None else None
+            await RisingEdge(self.clock)
+            now = get_sim_time("ps")
+            if beat:
+                if not pending:
+                    logger.warning(f"Unexpected {channel.upper()} beat at {now} ps")
+                    continue
+                txn = pending.popleft()
+                txn.resp = beat_resp
+                if beat_data is not None:
+                    try:
+                        txn.data = int(beat_data)
+                    except ValueError:  # X/Z read data
+                        txn.error = f"unresolved RDATA {beat_data}"
+                self._complete(txn, now)
+            elif pending and self.period and pending[0].issued is not None:
+                if now - pending[0].issued > self.timeout * self.period:
+                    txn = pending.popleft()
+                    txn.error = f"no {channel.upper()} response within {self.timeout} cycles"
+                    self._complete(txn, now)
+
+    def _complete(self, txn: Transaction, now: int):
+        txn.completed = now
+        self._in_flight[txn.write] -= 1
+        self._credit[txn.write].set()
+        if txn.error is None:
+            self._records[txn.write].append(txn)
+        txn.done.set()
+
+    # Transactions --------------------------------------------------------
+
+    async def _submit(self, txn: Transaction) -> Transaction:
+        """Queue a transaction once the outstanding limit allows"""
+        credit = self._credit[txn.write]
+        while self._in_flight[txn.write] >= self.max_outstanding:
+            credit.clear()
+            await credit.wait()
+        self._in_flight[txn.write] += 1
+        txn.queued = get_sim_time("ps")
+        self._pending[txn.write].append(txn)
+        self._response_wake[txn.write].set()
+        if txn.write:
+            self._aw_queue.put_nowait(txn)
+            self._w_queue.put_nowait(txn)
+        else:
+            self._ar_queue.put_nowait(txn)
+        return txn
+
+    @staticmethod
+    async def _finish(txns: List[Transaction], check: bool):
+        for txn in txns:
+            await txn.done.wait()
+            if txn.error is not None:
+                raise AXI4LiteError(f"{'Write' if txn.write else 'Read'} 0x{txn.addr:x}: {txn.error}")
+            if check and txn.resp not in (RESP_OKAY, RESP_EXOKAY):
+                raise AXI4LiteError(f"{'Write' if txn.write else 'Read'} 0x{txn.addr:x}: resp {txn.resp}")
+
+    async def write(self, addr: int, data: int, strb: int = 0xF) -> int:
+        """Perform AXI4-Lite write transaction, returning BRESP"""
+        txn = await self._submit(Transaction(True, addr, data & 0xFFFFFFFF, strb))
+        await self._finish([txn], check=False)
+        return txn.resp
+
+    async def read(self, addr: int) -> Tuple[int, int]:
+        """Perform AXI4-Lite read transaction, returning (RDATA, RRESP)"""
+        txn = await self._submit(Transaction(False, addr))
+        await self._finish([txn], check=False)
+        return txn.data, txn.resp
+
+    async def write_many(self, writes: Iterable[Tuple[int, int]], strb: int = 0xF,
+                         check: bool = True) -> List[int]:
+        """Issue (addr, data) writes as fast as the outstanding limit allows"""
+        txns = [await self._submit(Transaction(True, addr, data & 0xFFFFFFFF, strb))
+                for addr, data in writes]
+        await self._finish(txns, check)
+        return [txn.resp for txn in txns]
+
+    async def read_many(self, addrs: Iterable[int], check: bool = True) -> List[int]:
+        """Issue reads as fast as the outstanding limit allows, returning RDATA"""
+        txns = [await self._submit(Transaction(False, addr)) for addr in addrs]
+        await self._finish(txns, check)
+        return [txn.data for txn in txns]
+
+    # Statistics ----------------------------------------------------------
+
+    def reset_stats(self):
+        self._records: Dict[bool, List[Transaction]] = {True: [], False: []}
+
+    def latencies(self, write: bool) -> List[float]:
+        """Cycles from the first AW/AR edge to the B/R handshake"""
+        period = self.period or 1
+        return [(txn.completed - txn.issued) / period for txn in self._records[write]]
+
+    def stats(self) -> Dict:
+        """Per-direction transaction counts, latency summary and throughput"""
+        result = {"period_ps": self.period, "max_outstanding": self.max_outstanding}
+        for write, name in ((True, "write"), (False, "read")):
+            records = self._records[write]
+            latencies = sorted(self.latencies(write))
+            entry: Dict = {"count": len(records)}
+            if records:
+                span = max(t.completed for t in records) - min(t.issued for t in records)
+                cycles = span / (self.period or 1) + 1
+                entry.update({
+                    "latency_min": latencies[0],
+                    "latency_mean": sum(latencies) / len(latencies),
+                    "latency_p50": _percentile(latencies, 50),
+                    "latency_p99": _percentile(latencies, 99),
+                    "latency_max": latencies[-1],
+                    "cycles": cycles,
+                    "per_cycle": len(records) / cycles,
+                })
+            result[name] = entry
+        return result
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
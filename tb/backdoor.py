@@ -0,0 +1,167 @@
+"""
+Backdoor preload of memory_system BRAM in simulation
+
+Front-door loading through the AXI wrappers costs several clock cycles per
+word. Instead, BackdoorLoader writes the inst_mem/data_mem arrays of
+memory_system.sv directly through the simulator hierarchy, taking zero
+simulated time, so a full 32 KB image is in place before reset is released.
+
+The other route is $readmemh before time zero: memory_system reads
++IMEM_INIT=<file> and +DMEM_INIT=<file> plusargs (or the IMEM_INIT_FILE /
+DMEM_INIT_FILE parameters). The Makefile passes IMEM_INIT/DMEM_INIT through,
+and this module's CLI produces the files from an ELF, HEX, BIN or assembly
+source:
+
+    PYTHONPATH=../sw/host_interface python backdoor.py program.elf --imem imem.hex --dmem dmem.hex
+    make red_pitaya_cpu_wrapper IMEM_INIT=imem.hex DMEM_INIT=dmem.hex
+"""
+
+import argparse
+import logging
+import sys
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NOP = 0x00000013
+PORTS = {"imem": "inst_mem", "dmem": "data_mem"}
+# Fill values of memory_system's init block
+FILL = {"imem": NOP, "dmem": 0}
+
+
+def find_memory_system(dut):
+    """Return the memory_system instance in dut (itself, or mem_sys in the wrappers)"""
+    for path in ("", "mem_sys"):
+        handle = dut
+        try:
+            for name in filter(None, path.split(".")):
+                handle = getattr(handle, name)
+            handle.inst_mem
+            return handle
+        except AttributeError:
+            continue
+    raise AttributeError(f"No memory_system with inst_mem/data_mem found under {dut._name}")
+
+
+class BackdoorLoader:
+    """Writes and reads memory_system BRAM arrays without using the clock"""
+
+    def __init__(self, dut, mem_sys=None):
+        self.mem_sys = mem_sys if mem_sys is not None else find_memory_system(dut)
+        self.arrays = {port: getattr(self.mem_sys, name) for port, name in PORTS.items()}
+        self.sizes = {port: len(array) for port, array in self.arrays.items()}
+        self.words_written = 0
+
+    def _index(self, port: str, addr: int) -> int:
+        if addr % 4:
+            raise ValueError(f"{port} address 0x{addr:x} is not word aligned")
+        index = addr // 4
+        if not 0 <= index < self.sizes[port]:
+            raise ValueError(f"{port} address 0x{addr:x} is outside the {self.sizes[port] * 4} byte BRAM")
+        return index
+
+    def write_words(self, port: str, addr: int, words: Iterable[int]):
+        """Write consecutive words starting at byte address addr"""
+        array = self.arrays[port]
+        index = self._index(port, addr)
+        count = 0
+        for count, word in enumerate(words, 1):
+            if index + count > self.sizes[port]:
+                raise ValueError(f"{port} image runs past the end of the BRAM")
+            array[index + count - 1].value = word & 0xFFFFFFFF
+        self.words_written += count
+
+    def write_dict(self, port: str, words: Mapping[int, int]):
+        """Write {byte address: word}, e.g. a MemoryModel or Program.data"""
+        array = self.arrays[port]
+        for addr, word in words.items():
+            array[self._index(port, addr)].value = word & 0xFFFFFFFF
+        self.words_written += len(words)
+
+    def clear(self, port: str, value: Optional[int] = None):
+        """Refill a whole array, by default with its reset-time contents"""
+        self.write_words(port, 0, [FILL[port] if value is None else value] * self.sizes[port])
+
+    def load_image(self, image):
+        """Load a ProgramImage from sw/host_interface/loader.py
+
+        The image's instruction half goes to inst_mem and its data half to
+        data_mem, one page at a time.
+        """
+        imem, dmem = image.split()
+        for port, sub in (("imem", imem), ("dmem", dmem)):
+            limit = self.sizes[port] * 4
+            for page_addr, page in sub.items():
+                if page_addr >= limit:
+                    raise ValueError(f"{port} page 0x{page_addr:x} is outside the {limit} byte BRAM")
+                words = sub.page_words(page)
+                self.write_words(port, page_addr, words[:(limit - page_addr) // 4])
+        logger.info(f"Backdoor loaded {len(imem.pages)} imem and {len(dmem.pages)} dmem pages")
+
+    def load_program(self, program):
+        """Load a riscv_asm Program: text into inst_mem, data into data_mem"""
+        self.write_words("imem", program.text_base, program.text)
+        self.write_dict("dmem", program.data)
+
+    def read_words(self, port: str, addr: int, count: int):
+        array = self.arrays[port]
+        index = self._index(port, addr)
+        return [int(array[index + i].value) for i in range(count)]
+
+
+def readmemh_lines(words: Mapping[int, int], base: int = 0) -> Iterable[str]:
+    """$readmemh lines for {byte address: word}, with @ markers at each gap"""
+    expected = None
+    for addr in sorted(words):
+        index = (addr - base) // 4
+        if index != expected:
+            yield f"@{index:x}"
+        yield f"{words[addr] & 0xFFFFFFFF:08x}"
+        expected = index + 1
+
+
+def write_readmemh(path: str, words: Mapping[int, int], base: int = 0):
+    with open(path, "w") as f:
+        for line in readmemh_lines(words, base):
+            f.write(line)
+            f.write("\n")
+
+
+def _load_source(path: str, load_addr: int) -> Tuple[Dict[int, int], Dict[int, int]]:
+    """{addr: word} for instruction and data memory from a program file"""
+    if path.endswith((".s", ".S", ".asm")):
+        from riscv_asm import assemble
+
+        with open(path) as f:
+            program = assemble(f.read())
+        text = {program.text_base + 4 * i: w for i, w in enumerate(program.text)}
+        return text, dict(program.data)
+
+    from loader import load_program
+
+    with load_program(path, load_addr) as image:
+        imem, dmem = image.split()
+        return imem.word_dict(), dmem.word_dict()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate $readmemh images for memory_system")
+    parser.add_argument("program", help="ELF, Intel HEX, raw binary or assembly source")
+    parser.add_argument("--imem", help="instruction memory image to write")
+    parser.add_argument("--dmem", help="data memory image to write")
+    parser.add_argument("--load-addr", type=lambda v: int(v, 0), default=0,
+                        help="load address for raw binaries")
+    args = parser.parse_args(argv)
+
+    imem, dmem = _load_source(args.program, args.load_addr)
+    for path, words, port in ((args.imem, imem, "imem"), (args.dmem, dmem, "dmem")):
+        if path:
+            write_readmemh(path, words)
+            print(f"{path}: {len(words)} {port} words")
+        elif words:
+            print(f"{port}: {len(words)} words (use --{port} to write them)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+Commit log writer, reader and differ for cpu_top
+
+Logs are written either in the text format produced by Spike's
+``--log-commits`` option, so they can be compared directly with a reference
+simulator run, or in a compact fixed-size binary format for long runs:
+
+    core   0: 3 0x0000004c (0x00a00093) x1  0x0000000a
+    core   0: 3 0x00000054 (0x0020a023) mem 0x00000064 0x00000014
+
+The differ streams both logs in lockstep and keeps only a small window of
+context, so multi-million instruction runs are checked in O(n) time with
+bounded memory.
+"""
+
+import argparse
+import io
+import itertools
+import struct
+import sys
+from collections import deque
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Binary log layout: 8-byte header followed by fixed-size records
+BINARY_MAGIC = b"RVCL"
+BINARY_VERSION = 1
+_HEADER = struct.Struct("<4sHH")
+# pc, insn, rd_value, mem_addr, mem_value, rd, flags, mem_size, priv
+_RECORD = struct.Struct("<IIIIIBBBB")
+RECORD_SIZE = _RECORD.size
+
+# Record flag bits
+FLAG_RD_WRITE = 1 << 0
+FLAG_MEM_READ = 1 << 1
+FLAG_MEM_WRITE = 1 << 2
+
+PRIV_MACHINE = 3
+
+
+@dataclass
+class CommitRecord:
+    """One retired instruction"""
+    pc: int
+    insn: int
+    rd: Optional[int] = None  # Destination register, None if nothing written
+    rd_value: int = 0
+    mem_addr: Optional[int] = None
+    mem_value: Optional[int] = None  # Only set for stores
+    mem_size: int = 4
+    priv: int = PRIV_MACHINE
+
+    @property
+    def mem_write(self) -> bool:
+        return self.mem_addr is not None and self.mem_value is not None
+
+    @property
+    def mem_read(self) -> bool:
+        return self.mem_addr is not None and self.mem_value is None
+
+    def normalized(self) -> "CommitRecord":
+        """Drop writes to x0 so logs from different sources compare equal"""
+        if self.rd == 0:
+            return CommitRecord(self.pc, self.insn, None, 0, self.mem_addr,
+                                self.mem_value, self.mem_size, self.priv)
+        return self
+
+    def to_spike(self) -> str:
+        """Format as a Spike --log-commits line"""
+        line = f"core   0: {self.priv} 0x{self.pc:08x} (0x{self.insn:08x})"
+        if self.rd is not None:
+            line += f" x{self.rd:<2d} 0x{self.rd_value & 0xFFFFFFFF:08x}"
+        if self.mem_addr is not None:
+            line += f" mem 0x{self.mem_addr:08x}"
+            if self.mem_value is not None:
+                digits = 2 * self.mem_size
+                line += f" 0x{self.mem_value & ((1 << (8 * self.mem_size)) - 1):0{digits}x}"
+        return line
+
+    def pack(self) -> bytes:
+        return _RECORD.pack(*self._fields())
+
+    def pack_into(self, buffer: bytearray, offset: int):
+        _RECORD.pack_into(buffer, offset, *self._fields())
+
+    def _fields(self) -> Tuple[int, ...]:
+        flags = 0
+        if self.rd is not None:
+            flags |= FLAG_RD_WRITE
+        if self.mem_addr is not None:
+            flags |= FLAG_MEM_WRITE if self.mem_value is not None else FLAG_MEM_READ
+        return (self.pc & 0xFFFFFFFF, self.insn & 0xFFFFFFFF, self.rd_value & 0xFFFFFFFF,
+                (self.mem_addr or 0) & 0xFFFFFFFF, (self.mem_value or 0) & 0xFFFFFFFF,
+                self.rd or 0, flags, self.mem_size, self.priv)
+
+    @classmethod
+    def unpack(cls, data: bytes, offset: int = 0) -> "CommitRecord":
+        pc, insn, rd_value, mem_addr, mem_value, rd, flags, mem_size, priv = _RECORD.unpack_from(data, offset)
+        has_mem = flags & (FLAG_MEM_READ | FLAG_MEM_WRITE)
+        return cls(
+            pc=pc,
+            insn=insn,
+            rd=rd if flags & FLAG_RD_WRITE else None,
+            rd_value=rd_value,
+            mem_addr=mem_addr if has_mem else None,
+            mem_value=mem_value if flags & FLAG_MEM_WRITE else None,
+            mem_size=mem_size,
+            priv=priv,
+        )
+
+
+def parse_spike_line(line: str) -> Optional[CommitRecord]:
+    """Parse one Spike commit line; returns None for unrelated output"""
+    tokens = line.split()
+    # core <hart>: <priv> <pc> (<insn>) ...
+    if len(tokens) < 5 or tokens[0] != "core" or not tokens[3].startswith("0x"):
+        return None
+    try:
+        record = CommitRecord(pc=int(tokens[3], 16), insn=int(tokens[4].strip("()"), 16),
+                              priv=int(tokens[2]))
+    except ValueError:
+        return None
+
+    i = 5
+    while i < len(tokens):
+        tok = tokens[i]
+        if tok == "mem":
+            record.mem_addr = int(tokens[i + 1], 16)
+            i += 2
+            if i < len(tokens) and tokens[i].startswith("0x"):
+                record.mem_value = int(tokens[i], 16)
+                record.mem_size = max(1, (len(tokens[i]) - 2) // 2)
+                i += 1
+        elif tok[0] == "x" and tok[1:].isdigit() and i + 1 < len(tokens):
+            record.rd = int(tok[1:])
+            record.rd_value = int(tokens[i + 1], 16)
+            i += 2
+        else:
+            # CSR and FP register writes are not tracked
+            i += 2 if i + 1 < len(tokens) and tokens[i + 1].startswith("0x") else 1
+    return record
+
+
+class CommitLogWriter:
+    """Buffered, streaming commit log writer
+
+    Records are packed into an in-memory buffer and written out in blocks of
+    buffer_records entries, so the per-retirement cost inside the simulator
+    is a single append.
+    """
+
+    def __init__(self, path: str, fmt: str = "text", buffer_records: int = 4096):
+        if fmt not in ("text", "binary"):
+            raise ValueError("fmt must be 'text' or 'binary'")
+        self.path = path
+        self.fmt = fmt
+        self.buffer_records = buffer_records
+        self.count = 0
+        self._pending = 0
+        if fmt == "binary":
+            self._file = open(path, "wb")
+            self._file.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, RECORD_SIZE))
+            self._buffer = bytearray(RECORD_SIZE * buffer_records)
+        else:
+            self._file = open(path, "w")
+            self._lines: List[str] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, record: CommitRecord):
+        """Append one record, flushing when the buffer is full"""
+        if self.fmt == "binary":
+            record.pack_into(self._buffer, self._pending * RECORD_SIZE)
+        else:
+            self._lines.append(record.to_spike())
+        self._pending += 1
+        self.count += 1
+        if self._pending >= self.buffer_records:
+            self.flush()
+
+    def write_many(self, records: Iterable[CommitRecord]):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        """Write buffered records to disk"""
+        if self._file is None or self._pending == 0:
+            return
+        if self.fmt == "binary":
+            self._file.write(memoryview(self._buffer)[:self._pending * RECORD_SIZE])
+        else:
+            self._file.write("\n".join(self._lines))
+            self._file.write("\n")
+            self._lines.clear()
+        self._pending = 0
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+def _iter_binary(f: BinaryIO, chunk_records: int = 8192) -> Iterator[CommitRecord]:
+    header = f.read(_HEADER.size)
+    magic, version, record_size = _HEADER.unpack(header)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION or record_size != RECORD_SIZE:
+        raise ValueError(f"Unsupported binary commit log (version {version}, record size {record_size})")
+    while True:
+        chunk = f.read(RECORD_SIZE * chunk_records)
+        if not chunk:
+            return
+        for offset in range(0, len(chunk) - RECORD_SIZE + 1, RECORD_SIZE):
+            yield CommitRecord.unpack(chunk, offset)
+
+
+def read_commit_log(source: Union[str, BinaryIO]) -> Iterator[CommitRecord]:
+    """Stream records from a text (Spike) or binary commit log
+
+    The format is detected from the file header.
+    """
+    f = open(source, "rb") if isinstance(source, str) else source
+    try:
+        magic = f.peek(len(BINARY_MAGIC))[:len(BINARY_MAGIC)] if hasattr(f, "peek") else b""
+        if magic == BINARY_MAGIC:
+            yield from _iter_binary(f)
+        else:
+            for line in io.TextIOWrapper(f, encoding="ascii", errors="replace"):
+                record = parse_spike_line(line)
+                if record is not None:
+                    yield record
+    finally:
+        if isinstance(source, str):
+            f.close()
+
+
+@dataclass
+class Divergence:
+    """First point where two commit logs disagree"""
+    index: int  # Position in the aligned streams
+    field: str
+    expected: Optional[CommitRecord]
+    actual: Optional[CommitRecord]
+    context: List[Tuple[CommitRecord, CommitRecord]]
+
+    def report(self) -> str:
+        lines = [f"Divergence at commit #{self.index}: {self.field}"]
+        for exp, act in self.context:
+            lines.append(f"    {exp.to_spike()}")
+        lines.append(f"  - {self.expected.to_spike() if self.expected else '<end of log>'}")
+        lines.append(f"  + {self.actual.to_spike() if self.actual else '<end of log>'}")
+        return "\n".join(lines)
+
+
+def _compare(exp: CommitRecord, act: CommitRecord, check_memory: bool) -> Optional[str]:
+    if exp.pc != act.pc:
+        return "pc"
+    if exp.insn != act.insn:
+        return "instruction"
+    if exp.rd != act.rd:
+        return "rd"
+    if exp.rd is not None and (exp.rd_value & 0xFFFFFFFF) != (act.rd_value & 0xFFFFFFFF):
+        return "rd value"
+    if check_memory and exp.mem_write != act.mem_write:
+        return "memory write"
+    if check_memory and exp.mem_write:
+        if exp.mem_addr != act.mem_addr:
+            return "memory address"
+        mask = (1 << (8 * min(exp.mem_size, act.mem_size))) - 1
+        if (exp.mem_value & mask) != (act.mem_value & mask):
+            return "memory value"
+    return None
+
+
+def _skip_to(stream: Iterator[CommitRecord], pc: int,
+             window: int) -> Tuple[bool, Iterator[CommitRecord]]:
+    """Drop records before the first one at pc, looking at most window records ahead"""
+    skipped = list(itertools.islice(stream, window))
+    for i, rec in enumerate(skipped):
+        if rec.pc == pc:
+            return True, itertools.chain(skipped[i:], stream)
+    return False, itertools.chain(skipped, stream)
+
+
+def _align(expected: Iterator[CommitRecord], actual: Iterator[CommitRecord],
+           start_pc: Optional[int], window: int) -> Tuple[Iterator[CommitRecord], Iterator[CommitRecord]]:
+    """Skip leading records so both streams start at the same PC
+
+    Reference simulators usually run a boot ROM before reaching the program,
+    so with no explicit start_pc either log may be advanced to the other's
+    first PC.
+    """
+    if start_pc is not None:
+        return (itertools.dropwhile(lambda r: r.pc != start_pc, expected),
+                itertools.dropwhile(lambda r: r.pc != start_pc, actual))
+
+    first_exp = next(expected, None)
+    first_act = next(actual, None)
+    expected = itertools.chain([first_exp] if first_exp else [], expected)
+    actual = itertools.chain([first_act] if first_act else [], actual)
+    if first_exp is None or first_act is None or first_exp.pc == first_act.pc:
+        return expected, actual
+
+    found, expected = _skip_to(expected, first_act.pc, window)
+    if not found:
+        _, actual = _skip_to(actual, first_exp.pc, window)
+    return expected, actual
+
+
+def diff_commit_logs(expected: Iterable[CommitRecord], actual: Iterable[CommitRecord],
+                     start_pc: Optional[int] = None, align: bool = True,
+                     check_memory: bool = True, context: int = 5,
+                     align_window: int = 100000) -> Optional[Divergence]:
+    """Return the first divergence between two commit streams, or None
+
+    Runs in a single pass; memory use is bounded by the context window.
+    """
+    exp_it, act_it = iter(expected), iter(actual)
+    if align:
+        exp_it, act_it = _align(exp_it, act_it, start_pc, align_window)
+
+    history: deque = deque(maxlen=context)
+    for index, (exp, act) in enumerate(itertools.zip_longest(exp_it, act_it)):
+        if exp is None or act is None:
+            return Divergence(index, "log length", exp, act, list(history))
+        exp, act = exp.normalized(), act.normalized()
+        field = _compare(exp, act, check_memory)
+        if field is not None:
+            return Divergence(index, field, exp, act, list(history))
+        history.append((exp, act))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cpu_top commit log tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    diff = sub.add_parser("diff", help="Report the first divergence between two logs")
+    diff.add_argument("expected", help="Reference log (e.g. spike --log-commits output)")
+    diff.add_argument("actual", help="Log from the cpu_top retirement monitor")
+    diff.add_argument("--start-pc", type=lambda x: int(x, 0), help="Align both logs at this PC")
+    diff.add_argument("--no-align", action="store_true", help="Compare from the first record")
+    diff.add_argument("--no-memory", action="store_true", help="Ignore memory writes")
+
+    convert = sub.add_parser("convert", help="Convert between text and binary logs")
+    convert.add_argument("input")
+    convert.add_argument("output")
+    convert.add_argument("--format", choices=["text", "binary"], default="binary")
+
+    args = parser.parse_args()
+    if args.command == "diff":
+        result = diff_commit_logs(read_commit_log(args.expected), read_commit_log(args.actual),
+                                  start_pc=args.start_pc, align=not args.no_align,
+                                  check_memory=not args.no_memory)
+        if result is None:
+            print("Logs match")
+            return 0
+        print(result.report())
+        return 1
+
+    with CommitLogWriter(args.output, fmt=args.format) as writer:
+        writer.write_many(read_commit_log(args.input))
+    print(f"Wrote {writer.count} records to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+"""
+cpu_axi_wrapper AXI4-Lite register interface testbench and benchmark
+
+test_axi_benchmark drives the control registers with the pipelined
+AXI4LiteMaster, back to back and with random VALID/READY pauses, checks
+every transaction against a register model and records throughput and
+latency per scenario in a JSON report:
+
+    make cpu_axi_wrapper TESTCASE=test_axi_benchmark AXI_BENCH_REPORT=bench.json
+"""
+
+import json
+import os
+import random
+import subprocess
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles
+
+from axi4lite_master import AXI4LiteMaster, random_pause
+
+# AXI4-Lite Register Map
+REG_CONTROL = 0x00
+REG_STATUS = 0x04
+REG_PC = 0x08
+REG_INST_COUNT_LO = 0x0C
+REG_INST_COUNT_HI = 0x10
+REG_CYCLE_COUNT_LO = 0x14
+REG_CYCLE_COUNT_HI = 0x18
+REG_BREAKPOINT = 0x1C
+REG_UNMAPPED = 0xFC
+
+# CONTROL bits that leave the CPU in reset: single_step, interrupt_enable
+CONTROL_SAFE_MASK = 0xC
+
+CLOCK_NS = 8
+NOP = 0x00000013
+
+
+async def reset_dut(dut):
+    """Reset the DUT with the CPU memory ports idle"""
+    dut.s_axi_aresetn.value = 0
+    dut.external_interrupt.value = 0
+    dut.imem_read_data.value = NOP
+    dut.imem_ready.value = 1
+    dut.dmem_read_data.value = 0
+    dut.dmem_ready.value = 1
+    await ClockCycles(dut.s_axi_aclk, 10)
+    dut.s_axi_aresetn.value = 1
+    await ClockCycles(dut.s_axi_aclk, 5)
+
+
+async def start(dut, max_outstanding=1):
+    clock = Clock(dut.s_axi_aclk, CLOCK_NS, units="ns")
+    cocotb.start_soon(clock.start())
+    await reset_dut(dut)
+    return AXI4LiteMaster(dut, dut.s_axi_aclk, max_outstanding=max_outstanding)
+
+
+@cocotb.test()
+async def test_axi_register_access(dut):
+    """Test reset values and write/read of the control registers"""
+    axi = await start(dut)
+
+    data, resp = await axi.read(REG_CONTROL)
+    assert resp == 0 and data == 0, f"CONTROL after reset: 0x{data:08x} resp {resp}"
+    data, _ = await axi.read(REG_BREAKPOINT)
+    assert data == 0, f"BREAKPOINT after reset: 0x{data:08x}"
+
+    for value in [0x00000000, 0xFFFFFFFF, 0xAAAAAAAA, 0x55555555, 0x12345678]:
+        resp = await axi.write(REG_BREAKPOINT, value)
+        assert resp == 0, f"Write response error: {resp}"
+        data, _ = await axi.read(REG_BREAKPOINT)
+        assert data == value, f"BREAKPOINT: wrote 0x{value:08x}, read 0x{data:08x}"
+
+    await axi.write(REG_CONTROL, 0xC)
+    data, _ = await axi.read(REG_CONTROL)
+    assert data == 0xC, f"CONTROL: wrote 0xc, read 0x{data:08x}"
+
+    data, _ = await axi.read(REG_UNMAPPED)
+    assert data == 0xDEADBEEF, f"Unmapped register read 0x{data:08x}"
+
+    dut._log.info("Register access test PASSED!")
+
+
+async def run_scenario(axi, model, rng, count, throttle):
+    """Interleave batched writes and reads, checking them against model"""
+    if throttle:
+        seed = rng.getrandbits(32)
+        axi.throttle(**{ch: random_pause(throttle, seed + i) for i, ch in enumerate(("aw", "w", "b", "ar", "r"))})
+    else:
+        axi.throttle(aw=None, w=None, b=None, ar=None, r=None)
+    axi.reset_stats()
+
+    # Alternate the two writable registers so a write decoded against the
+    # wrong address shows up in the read-back
+    remaining = count
+    while remaining:
+        batch = min(remaining, rng.randint(1, 16))
+        writes = []
+        for _ in range(batch):
+            if rng.random() < 0.5:
+                writes.append((REG_BREAKPOINT, rng.getrandbits(32)))
+            else:
+                writes.append((REG_CONTROL, rng.getrandbits(32) & CONTROL_SAFE_MASK))
+        await axi.write_many(writes)
+        for addr, value in writes:
+            model[addr] = value
+
+        addrs = [rng.choice((REG_CONTROL, REG_BREAKPOINT, REG_UNMAPPED)) for _ in range(batch)]
+        for addr, data in zip(addrs, await axi.read_many(addrs)):
+            assert data == model[addr], (
+                f"Read 0x{addr:02x}: expected 0x{model[addr]:08x}, got 0x{data:08x}"
+            )
+        remaining -= batch
+
+    # Sustained streams of each kind
+    values = [rng.getrandbits(32) for _ in range(count)]
+    await axi.write_many([(REG_BREAKPOINT, v) for v in values])
+    model[REG_BREAKPOINT] = values[-1]
+    data = await axi.read_many([REG_BREAKPOINT] * count)
+    assert data == [values[-1]] * count, "Back-to-back BREAKPOINT reads mismatched"
+
+    # Reads overlapping writes to another register are unaffected by them
+    writer = cocotb.start_soon(axi.write_many([(REG_BREAKPOINT, v) for v in values]))
+    data = await axi.read_many([REG_CONTROL] * count)
+    await writer
+    model[REG_BREAKPOINT] = values[-1]
+    assert data == [model[REG_CONTROL]] * count, "CONTROL reads disturbed by concurrent writes"
+
+    return axi.stats()
+
+
+@cocotb.test()
+async def test_axi_benchmark(dut):
+    """Measure AXI throughput and latency, back to back and throttled"""
+    count = int(os.environ.get("AXI_BENCH_COUNT", "256"))
+    depth = int(os.environ.get("AXI_BENCH_OUTSTANDING", "4"))
+    rng = random.Random(int(os.environ.get("AXI_BENCH_SEED", "39")))
+    axi = await start(dut, max_outstanding=depth)
+    model = {REG_CONTROL: 0, REG_BREAKPOINT: 0, REG_UNMAPPED: 0xDEADBEEF}
+
+    scenarios = {}
+    for name, outstanding, throttle in [
+        ("serial", 1, 0.0),
+        ("back_to_back", depth, 0.0),
+        ("throttled_25", depth, 0.25),
+        ("throttled_50", depth, 0.5),
+    ]:
+        axi.max_outstanding = outstanding
+        stats = await run_scenario(axi, model, rng, count, throttle)
+        stats["throttle"] = throttle
+        scenarios[name] = stats
+        dut._log.info(
+            f"{name:<14} writes {stats['write']['per_cycle']:.2f}/cycle "
+            f"(p50 {stats['write']['latency_p50']:.0f}, max {stats['write']['latency_max']:.0f}), "
+            f"reads {stats['read']['per_cycle']:.2f}/cycle "
+            f"(p50 {stats['read']['latency_p50']:.0f}, max {stats['read']['latency_max']:.0f})"
+        )
+
+    # The slave accepts one write and one read per cycle, so an unthrottled
+    # pipelined master should get well above the serialized rate. At depth 1
+    # both scenarios are serialized and there is nothing to compare.
+    b2b = scenarios["back_to_back"]
+    serial = scenarios["serial"]
+    for kind in ("write", "read") if depth > 1 else ():
+        assert b2b[kind]["per_cycle"] > serial[kind]["per_cycle"], (
+            f"Pipelined {kind}s no faster than serialized: "
+            f"{b2b[kind]['per_cycle']:.2f} vs {serial[kind]['per_cycle']:.2f}/cycle"
+        )
+
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    report = {
+        "design": "cpu_axi_wrapper",
+        "revision": revision,
+        "clock_ns": CLOCK_NS,
+        "transactions": count,
+        "max_outstanding": depth,
+        "scenarios": scenarios,
+    }
+    report_path = os.environ.get("AXI_BENCH_REPORT",
+                                 os.path.join(os.environ.get("SIM_BUILD", "."), "axi_bench_report.json"))
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    dut._log.info(f"AXI benchmark report written to {report_path}")
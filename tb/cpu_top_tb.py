@@ -1,7 +1,19 @@
+import json
+import os
+
 import cocotb
-from cocotb.triggers import RisingEdge, ClockCycles
+from cocotb.triggers import RisingEdge, FallingEdge, ClockCycles
 from cocotb.clock import Clock
 
+from memory_responder import MemoryResponder, parse_latency_profile
+from perf_collector import PerfCollector
+from riscv_asm import assemble
+
+
+def sim_build_path(name):
+    """Default location for generated reports, next to the simulator build"""
+    return os.path.join(os.environ.get("SIM_BUILD", "."), name)
+
 
 # RISC-V Instruction encodings
 def encode_r_type(opcode, rd, funct3, rs1, rs2, funct7):
@@ -110,6 +122,10 @@ class MemoryModel:
         for i, inst in enumerate(program):
             self.write(start_addr + i * 4, inst)
 
+    def load_image(self, image, base=0):
+        """Load a ProgramImage from sw/host_interface/loader.py, starting at base"""
+        self.memory.update(image.region(base, self.size).word_dict())
+
 
 async def reset_dut(dut):
     """Reset the DUT"""
@@ -175,6 +191,8 @@ async def test_basic_alu_operations(dut):
     dut.dmem_ready.value = 0
     dut.cp_stall_external.value = 0
 
+    memory = MemoryResponder.from_env(dut, imem, dmem, name="test_basic_alu_operations")
+
     # Run the program
     for cycle in range(50):
         # Log PC and state for debugging
@@ -183,29 +201,13 @@ async def test_basic_alu_operations(dut):
             state = int(dut.debug_state.value)
             dut._log.info(f"Cycle {cycle}: PC=0x{pc:08x}, State={state}")
 
-        # Handle instruction memory requests
-        if dut.imem_read.value:
-            addr = int(dut.imem_addr.value)
-            dut.imem_read_data.value = imem.read(addr)
-            dut.imem_ready.value = 1
-        else:
-            dut.imem_ready.value = 0
-
-        # Handle data memory requests
-        if dut.dmem_read.value:
-            addr = int(dut.dmem_addr.value)
-            dut.dmem_read_data.value = dmem.read(addr)
-            dut.dmem_ready.value = 1
-        elif dut.dmem_write.value:
-            addr = int(dut.dmem_addr.value)
-            data = int(dut.dmem_write_data.value)
-            dmem.write(addr, data)
-            dut.dmem_ready.value = 1
-        else:
-            dut.dmem_ready.value = 0
+        # Serve (or record/replay) memory requests once the outputs settle
+        await FallingEdge(dut.clk)
+        memory.respond()
 
         await RisingEdge(dut.clk)
 
+    memory.close()
     dut._log.info("ALU operations test completed!")
 
 
@@ -380,28 +382,13 @@ async def test_branch_operations(dut):
     # Track PC values to verify branches
     pc_history = []
 
+    memory = MemoryResponder.from_env(dut, imem, dmem, name="test_branch_operations")
+
     # Run the program
     for cycle in range(50):
-        # Handle instruction memory
-        if dut.imem_read.value:
-            addr = int(dut.imem_addr.value)
-            dut.imem_read_data.value = imem.read(addr)
-            dut.imem_ready.value = 1
-        else:
-            dut.imem_ready.value = 0
-
-        # Handle data memory
-        if dut.dmem_read.value:
-            addr = int(dut.dmem_addr.value)
-            dut.dmem_read_data.value = dmem.read(addr)
-            dut.dmem_ready.value = 1
-        elif dut.dmem_write.value:
-            addr = int(dut.dmem_addr.value)
-            data = int(dut.dmem_write_data.value)
-            dmem.write(addr, data)
-            dut.dmem_ready.value = 1
-        else:
-            dut.dmem_ready.value = 0
+        # Serve (or record/replay) memory requests once the outputs settle
+        await FallingEdge(dut.clk)
+        memory.respond()
 
         # Track PC
         pc = int(dut.debug_pc.value)
@@ -414,6 +401,7 @@ async def test_branch_operations(dut):
             state = int(dut.debug_state.value)
             dut._log.info(f"Cycle {cycle}: PC=0x{pc:08x}, State={state}")
 
+    memory.close()
     dut._log.info(f"PC history: {[hex(pc) for pc in pc_history]}")
     dut._log.info("Branch operations test completed!")
 
@@ -811,9 +799,6 @@ async def test_debug_signals(dut):
 
 # Run all tests
 if __name__ == "__main__":
-    import sys
-    import os
-
     # Set default test runner behavior
     os.environ["COCOTB_REDUCED_LOG_FMT"] = "1"
 
@@ -938,4 +923,505 @@ async def test_debug_load_store_fixed(dut):
     
     assert dmem_writes > 0, f"Expected memory writes, got {dmem_writes}"
     
-    dut._log.info("🎉 Load/store test PASSED!")
\ No newline at end of file
+    dut._log.info("🎉 Load/store test PASSED!")
+
+
+async def run_to_halt(dut, source, latency=None, max_cycles=1000):
+    """Run an assembled program from the reset vector until it fetches its
+    halt label, let the pipeline drain and return the data memory"""
+    await reset_dut(dut)
+    dut.cp_stall_external.value = 0
+
+    program = assemble(source)
+    imem = MemoryModel()
+    dmem = MemoryModel(size=0x10000)
+    imem.load_program(program.text, 0x4c)
+    dmem.memory.update(program.data)
+    halt_pc = program.symbols["halt"]
+
+    responder = MemoryResponder(dut, imem, dmem, latency=parse_latency_profile(latency)).start()
+    for _ in range(max_cycles):
+        await RisingEdge(dut.clk)
+        if int(dut.debug_pc.value) == halt_pc:
+            break
+    else:
+        assert False, f"Did not reach halt (0x{halt_pc:x}) within {max_cycles} cycles"
+    # Stores ahead of the halt loop are still in the pipeline
+    await ClockCycles(dut.clk, 20)
+    responder.kill()
+    return dmem
+
+
+def check_memory(dmem, expected, label=""):
+    for addr, value in expected.items():
+        actual = dmem.read(addr)
+        assert actual == value, f"{label}mem[0x{addr:x}] = 0x{actual:08x}, expected 0x{value:08x}"
+
+
+# Straight-line code whose results change if a fetch is dropped or repeated
+FETCH_PROGRAM = """
+    addi x1, x0, 0
+    addi x1, x1, 1
+    addi x1, x1, 2
+    addi x1, x1, 3
+    slli x2, x1, 4
+    xori x3, x2, 0x55
+    addi x1, x1, 4
+    lui  x5, 0x1
+    sw   x1, 0(x5)
+    sw   x2, 4(x5)
+    sw   x3, 8(x5)
+halt:
+    j halt
+"""
+
+
+@cocotb.test()
+async def test_fetch_wait_states(dut):
+    """Instruction fetch wait states stall fetch without changing results"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    expected = {0x1000: 10, 0x1004: 0x60, 0x1008: 0x35}
+    for spec in ["zero", "fixed:1@imem", "fixed:3@imem", "random:0-3@imem"]:
+        dmem = await run_to_halt(dut, FETCH_PROGRAM, latency=spec)
+        check_memory(dmem, expected, f"{spec}: ")
+
+
+# Loads, stores and a load-use pair, with the data in its own region
+DATA_PROGRAM = """
+    lui  x5, 0x1
+    addi x1, x0, 0x11
+    sw   x1, 0(x5)
+    addi x2, x0, 0x22
+    sw   x2, 4(x5)
+    lw   x3, 0(x5)
+    lw   x4, 4(x5)
+    add  x6, x3, x4     # load-use
+    sw   x6, 8(x5)
+    lw   x7, 8(x5)
+    slli x7, x7, 1      # load-use
+    sw   x7, 12(x5)
+halt:
+    j halt
+"""
+
+
+@cocotb.test()
+async def test_data_wait_states(dut):
+    """Data port wait states stall loads and stores without changing results"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    expected = {0x1000: 0x11, 0x1004: 0x22, 0x1008: 0x33, 0x100C: 0x66}
+    for spec in ["zero", "fixed:1@dmem", "fixed:3@dmem", "random:0-3@dmem", "bursty:8/3@dmem"]:
+        dmem = await run_to_halt(dut, DATA_PROGRAM, latency=spec)
+        check_memory(dmem, expected, f"{spec}: ")
+
+
+# Taken branch and jump, with the instructions behind them on the wrong path.
+# The NOPs let the operands reach the register file before the compare.
+SQUASH_PROGRAM = """
+    lui  x5, 0x1
+    addi x1, x0, 1
+    addi x2, x0, 1
+    nop
+    nop
+    nop
+    nop
+    beq  x1, x2, taken
+    addi x3, x0, 0x7ff
+    addi x4, x0, 0x7ff
+taken:
+    j    over
+    addi x3, x3, 1
+    addi x4, x4, 1
+over:
+    sw   x3, 0(x5)
+    sw   x4, 4(x5)
+halt:
+    j halt
+"""
+
+
+@cocotb.test()
+async def test_redirect_squash(dut):
+    """Instructions fetched behind a taken branch or jump do not execute"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dmem = await run_to_halt(dut, SQUASH_PROGRAM)
+    check_memory(dmem, {0x1000: 0, 0x1004: 0})
+
+
+# Branch and JALR operands produced by the instruction just before them
+BRANCH_FORWARD_PROGRAM = """
+    lui  x5, 0x1
+    addi x1, x0, 5
+    addi x2, x0, 5
+    beq  x1, x2, equal
+    addi x3, x0, 1
+equal:
+    addi x1, x1, 1
+    bne  x1, x2, differ
+    addi x3, x3, 2
+differ:
+    la   x6, target
+    jalr x0, 0(x6)
+    addi x3, x3, 4
+target:
+    sw   x3, 0(x5)
+halt:
+    j halt
+"""
+
+
+@cocotb.test()
+async def test_branch_operand_forwarding(dut):
+    """Branch compares and the JALR base see results still in the pipeline"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dmem = await run_to_halt(dut, BRANCH_FORWARD_PROGRAM)
+    check_memory(dmem, {0x1000: 0})
+
+
+# Each not-taken branch sets its bit in x3
+SIGNED_BRANCH_PROGRAM = """
+    lui  x5, 0x1
+    addi x1, x0, -1
+    addi x2, x0, 1
+    addi x3, x0, 0
+    blt  x1, x2, b1
+    ori  x3, x3, 1
+b1: bge  x2, x1, b2
+    ori  x3, x3, 2
+b2: bltu x1, x2, b3
+    ori  x3, x3, 4
+b3: bgeu x1, x2, b4
+    ori  x3, x3, 8
+b4: bge  x1, x2, b5
+    ori  x3, x3, 16
+b5: sw   x3, 0(x5)
+halt:
+    j halt
+"""
+
+
+@cocotb.test()
+async def test_signed_branches(dut):
+    """BLT and BGE compare signed, BLTU and BGEU unsigned"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dmem = await run_to_halt(dut, SIGNED_BRANCH_PROGRAM)
+    check_memory(dmem, {0x1000: 4 | 16})
+
+
+LINK_PROGRAM = """
+    lui  x5, 0x1
+    jal  x1, after_jal
+after_jal:
+    sw   x1, 0(x5)
+    la   x6, after_jalr
+    jalr x2, 0(x6)
+after_jalr:
+    sw   x2, 4(x5)
+halt:
+    j halt
+"""
+
+
+@cocotb.test()
+async def test_link_address(dut):
+    """JAL and JALR write the address of the next instruction to rd"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    symbols = assemble(LINK_PROGRAM).symbols
+    dmem = await run_to_halt(dut, LINK_PROGRAM)
+    check_memory(dmem, {0x1000: symbols["after_jal"], 0x1004: symbols["after_jalr"]})
+
+
+# Dependent and back-to-back M ops, then an AMO and an LR/SC pair with a
+# taken branch between them
+MULDIV_ATOMIC_PROGRAM = """
+    lui  x5, 0x1
+    addi x1, x0, 6
+    addi x2, x0, 7
+    mul  x3, x1, x2
+    mul  x4, x3, x2
+    mul  x6, x1, x1
+    div  x7, x4, x2
+    add  x8, x7, x6
+    sw   x3, 0(x5)
+    sw   x4, 4(x5)
+    sw   x6, 8(x5)
+    sw   x7, 12(x5)
+    sw   x8, 16(x5)
+    addi x9, x5, 0x100
+    addi x10, x0, 5
+    sw   x10, 0(x9)
+    amoadd.w x11, x2, (x9)
+    lr.w x12, (x9)
+    beq  x0, x0, reserved
+    nop
+reserved:
+    sc.w x13, x1, (x9)
+    sw   x11, 20(x5)
+    sw   x12, 24(x5)
+    sw   x13, 28(x5)
+halt:
+    j halt
+"""
+
+
+@cocotb.test()
+async def test_muldiv_atomic_hazards(dut):
+    """M and A ops get forwarded operands, feed dependents and keep LR reservations"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    expected = {
+        0x1000: 42, 0x1004: 294, 0x1008: 36, 0x100C: 42, 0x1010: 78,
+        0x1014: 5, 0x1018: 12, 0x101C: 0, 0x1100: 6,
+    }
+    for spec in ["zero", "fixed:1@dmem"]:
+        dmem = await run_to_halt(dut, MULDIV_ATOMIC_PROGRAM, latency=spec)
+        check_memory(dmem, expected, f"{spec}: ")
+
+
+# Latency profiles swept by test_memory_latency_sensitivity
+LATENCY_PROFILES = ["zero", "fixed:1", "fixed:2", "random:0-3", "region", "bursty:16/4"]
+
+# Mix of ALU, load-use and store traffic. The data lives at 0x8000, outside
+# the BRAM windows, so the "region" profile gives it AXI-like latency.
+LATENCY_BODY = """
+    lui  x1, 0x8
+    addi x2, x0, 0x42
+    sw   x2, 0(x1)
+    lw   x3, 0(x1)
+    add  x4, x3, x2     # load-use
+    addi x5, x4, 1
+    sw   x5, 4(x1)
+    xor  x6, x5, x1
+    sw   x6, 8(x1)
+"""
+
+
+@cocotb.test()
+async def test_memory_latency_sensitivity(dut):
+    """Measure CPI and stall breakdown under different memory latency profiles"""
+
+    # Start clock
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    program = assemble(LATENCY_BODY * 4 + "halt:\n    j halt\n")
+    halt_pc = program.symbols["halt"]
+    expected = {0x8000: 0x42, 0x8004: 0x85, 0x8008: 0x8085}
+    max_cycles = 2000
+
+    report = {}
+    for spec in LATENCY_PROFILES:
+        await reset_dut(dut)
+        dut.cp_stall_external.value = 0
+
+        imem = MemoryModel()
+        dmem = MemoryModel(size=0x10000)
+        imem.load_program(program.text, 0x4c)
+        memory = MemoryResponder(dut, imem, dmem, latency=parse_latency_profile(spec))
+        perf = PerfCollector(dut, stop_pc=halt_pc).start()
+
+        responder = memory.start()
+        for _ in range(max_cycles):
+            await RisingEdge(dut.clk)
+            if perf.done:
+                break
+        perf.stop()
+        responder.kill()
+
+        report[spec] = perf.report()
+        report[spec]["memory_wait_cycles"] = dict(memory.wait_cycles)
+        dut._log.info(f"{spec:>12}: {perf.summary()}")
+
+        # Wait states may only cost time, never change the result
+        assert perf.done, f"{spec}: did not reach the halt loop within {max_cycles} cycles"
+        for addr, value in expected.items():
+            actual = dmem.read(addr)
+            assert actual == value, f"{spec}: mem[0x{addr:x}] = 0x{actual:08x}, expected 0x{value:08x}"
+
+    report_path = os.environ.get("LATENCY_REPORT", sim_build_path("memory_latency_report.json"))
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    dut._log.info(f"Latency report written to {report_path}")
+
+    retired = {spec: r["retired"] for spec, r in report.items()}
+    assert len(set(retired.values())) == 1, f"Retired counts differ between profiles: {retired}"
+    span = {spec: r["span_cycles"] for spec, r in report.items()}
+    assert span["zero"] < span["fixed:1"] < span["fixed:2"], f"Wait states did not add cycles: {span}"
+    waits = report["region"]["memory_wait_cycles"]
+    assert waits["dmem"] > 0 and waits["imem"] == 0, f"Region profile should only slow data accesses: {waits}"
+
+
+# Largest model error on span cycles that test_pipeline_model_calibration accepts
+CALIBRATION_MAX_ERROR_PCT = 5.0
+
+
+def calibration_programs():
+    """Programs used to calibrate the Python pipeline model, each ending in `j .`"""
+    alu_mix = """
+        addi x1, x0, 10
+        addi x2, x0, 20
+        add  x3, x1, x2
+        sub  x4, x2, x1
+        xor  x5, x3, x4
+        or   x6, x5, x2
+        and  x7, x6, x1
+        j    .
+    """
+    load_use = """
+        addi x1, x0, 100
+        addi x2, x0, 0x42
+        sw   x2, 0(x1)
+        lw   x3, 0(x1)
+        add  x4, x3, x2     # load-use
+        addi x5, x4, 1
+        sw   x5, 4(x1)
+        j    .
+    """
+    mul_loop = """
+        addi x1, x0, 8
+    loop:
+        addi x2, x0, 3
+        mul  x3, x2, x1
+        add  x4, x3, x3
+        addi x1, x1, -1
+        bnez x1, loop
+        j    .
+    """
+    return {name: assemble(source).text for name, source in
+            (("alu_mix", alu_mix), ("load_use", load_use), ("mul_loop", mul_loop))}
+
+
+@cocotb.test()
+async def test_pipeline_model_calibration(dut):
+    """Record RTL timing of small programs and compare with the pipeline model"""
+    from pipeline_model import calibrate, format_calibration
+
+    # Start clock
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    runs = {}
+    for name, program in calibration_programs().items():
+        await reset_dut(dut)
+        dut.cp_stall_external.value = 0
+
+        imem = MemoryModel()
+        dmem = MemoryModel()
+        imem.load_program(program, 0x4c)
+        memory = MemoryResponder(dut, imem, dmem)
+        perf = PerfCollector(dut, stop_pc=0x4c + 4 * (len(program) - 1)).start()
+
+        responder = memory.start()
+        for _ in range(500):
+            await RisingEdge(dut.clk)
+            if perf.done:
+                break
+        perf.stop()
+        responder.kill()
+
+        runs[name] = {"program": program, "base": 0x4c, "rtl": perf.report()}
+        dut._log.info(f"{name}: {perf.summary()}")
+
+    runs_path = os.environ.get("CALIBRATION_RUNS", sim_build_path("pipeline_calibration.json"))
+    with open(runs_path, "w") as f:
+        json.dump(runs, f, indent=2)
+    dut._log.info(f"RTL runs written to {runs_path}")
+    results = calibrate(runs)
+    dut._log.info("Pipeline model calibration:\n" + format_calibration(results))
+
+    for name, run in runs.items():
+        assert run["rtl"]["retired"] > 0, f"{name}: no instructions retired"
+        result = results[name]
+        assert result["model_retired"] == result["rtl_retired"], (
+            f"{name}: model retired {result['model_retired']}, RTL {result['rtl_retired']}")
+        assert abs(result["error_pct"]) <= CALIBRATION_MAX_ERROR_PCT, (
+            f"{name}: model {result['model_cycles']} vs RTL {result['rtl_cycles']} cycles, "
+            f"{result['error_pct']:+.1f}% exceeds {CALIBRATION_MAX_ERROR_PCT}%")
+
+
+@cocotb.test()
+async def test_kernel_suite(dut):
+    """Run the benchmark kernels, check their results and gate on CPI baselines"""
+    from kernels import DEFAULT_LATENCY, build_kernels, compare, load_baselines, save_baselines
+
+    # Start clock
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    selected = os.environ.get("KERNELS")
+    kernels = build_kernels(selected.split(",") if selected else None)
+    baselines = load_baselines()
+    latency = baselines.get("latency", DEFAULT_LATENCY)
+    tolerance = os.environ.get("KERNEL_TOLERANCE")
+    tolerance = float(tolerance) if tolerance else None
+    update = bool(os.environ.get("KERNEL_BASELINE_UPDATE"))
+
+    report = {}
+    failures = []
+    for kernel in kernels:
+        await reset_dut(dut)
+        dut.cp_stall_external.value = 0
+
+        imem = MemoryModel()
+        dmem = MemoryModel()
+        imem.load_program(kernel.program, kernel.base)
+        for addr, value in kernel.data.items():
+            dmem.write(addr, value)
+        memory = MemoryResponder(dut, imem, dmem, latency=parse_latency_profile(latency))
+        perf = PerfCollector(dut, stop_pc=kernel.halt_pc).start()
+
+        responder = memory.start()
+        for _ in range(kernel.max_cycles):
+            await RisingEdge(dut.clk)
+            if perf.done:
+                break
+        perf.stop()
+        responder.kill()
+
+        rtl = perf.report()
+        measured = {
+            "cycles": rtl["span_cycles"],
+            "retired": rtl["retired"],
+            "cpi": rtl["span_cycles"] / rtl["retired"] if rtl["retired"] else float("inf"),
+        }
+        report[kernel.name] = dict(measured, lost_cycles=rtl["lost_cycles"])
+        dut._log.info(f"{kernel.name}: {measured['cycles']} cycles, CPI {measured['cpi']:.3f} ({perf.summary()})")
+
+        if not perf.done:
+            failures.append(f"{kernel.name}: did not reach the halt loop within {kernel.max_cycles} cycles")
+            continue
+        errors = kernel.check(dmem.read)
+        if errors:
+            failures.extend(errors)
+            continue
+
+        if update:
+            baselines["kernels"][kernel.name] = dict(measured, cpi=round(measured["cpi"], 4), source="rtl")
+            continue
+        regression = compare(kernel.name, measured, baselines, tolerance)
+        if regression:
+            failures.append(regression)
+
+    if update:
+        baselines["latency"] = latency
+        save_baselines(baselines)
+        dut._log.info("Kernel baselines updated from this run")
+    report_path = os.environ.get("KERNEL_REPORT", sim_build_path("kernel_report.json"))
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    dut._log.info(f"Kernel report written to {report_path}")
+
+    assert not failures, "Kernel suite failed:\n" + "\n".join(failures)
@@ -0,0 +1,74 @@
+import cocotb
+import random
+from cocotb.triggers import Timer
+
+# Immediate generator test. imm_type codes are the ones control_unit drives,
+# so a mismatch between the two modules shows up here.
+
+IMM_I = 0b00
+IMM_S = 0b01
+IMM_B = 0b10
+IMM_U = 0b11
+
+
+def sign_extend(value, bits):
+    """Sign extend a bits-wide value to 32 bits"""
+    if value & (1 << (bits - 1)):
+        value -= 1 << bits
+    return value & 0xFFFFFFFF
+
+
+def expected_immediate(inst, imm_type):
+    """Immediate per the RISC-V ISA for each instruction format"""
+    if imm_type == IMM_I:
+        return sign_extend(inst >> 20, 12)
+    if imm_type == IMM_S:
+        return sign_extend(((inst >> 25) << 5) | ((inst >> 7) & 0x1F), 12)
+    if imm_type == IMM_B:
+        imm = (
+            (((inst >> 31) & 1) << 12)
+            | (((inst >> 7) & 1) << 11)
+            | (((inst >> 25) & 0x3F) << 5)
+            | (((inst >> 8) & 0xF) << 1)
+        )
+        return sign_extend(imm, 13)
+    return inst & 0xFFFFF000
+
+
+async def check(dut, inst, imm_type, name):
+    dut.inst.value = inst
+    dut.imm_type.value = imm_type
+    await Timer(1, units="ns")
+    expected = expected_immediate(inst, imm_type)
+    actual = int(dut.imm.value)
+    assert actual == expected, (
+        f"{name} 0x{inst:08x}: imm 0x{actual:08x}, expected 0x{expected:08x}"
+    )
+
+
+@cocotb.test()
+async def test_known_encodings(dut):
+    """Immediates of hand-encoded instructions, one per format"""
+    cases = [
+        (0xFFF00093, IMM_I, "addi x1, x0, -1", 0xFFFFFFFF),
+        (0x7FF00093, IMM_I, "addi x1, x0, 2047", 0x000007FF),
+        (0xFE112E23, IMM_S, "sw x1, -4(x2)", 0xFFFFFFFC),
+        (0x00208463, IMM_B, "beq x1, x2, +8", 0x00000008),
+        (0xFE208EE3, IMM_B, "beq x1, x2, -4", 0xFFFFFFFC),
+        (0x123450B7, IMM_U, "lui x1, 0x12345", 0x12345000),
+        (0x00001117, IMM_U, "auipc x2, 0x1", 0x00001000),
+    ]
+    for inst, imm_type, name, value in cases:
+        await check(dut, inst, imm_type, name)
+        assert int(dut.imm.value) == value, f"{name}: imm 0x{int(dut.imm.value):08x}"
+
+
+@cocotb.test()
+async def test_random_instructions(dut):
+    """Random instruction words decoded in every format"""
+    rng = random.Random(30)
+    names = {IMM_I: "I-type", IMM_S: "S-type", IMM_B: "B-type", IMM_U: "U-type"}
+    for _ in range(500):
+        inst = rng.getrandbits(32)
+        for imm_type, name in names.items():
+            await check(dut, inst, imm_type, name)
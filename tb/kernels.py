@@ -0,0 +1,490 @@
+"""
+Benchmark kernels for cpu_top
+
+Small, self-checking workloads generated on the Python side: memcpy,
+checksum, integer matrix multiply, insertion sort, linked-list walk, a
+Dhrystone-like mix and an AMO counter loop. Each kernel is assembly text
+built by a generator function and assembled with riscv_asm. It starts at
+the reset PC, only uses word loads and stores, stops in a `j .` loop at
+the `halt` label and lists the data words it must leave behind so a run
+can be checked.
+
+Cycle and CPI baselines live in kernel_baselines.json. Each entry records
+where it came from: "rtl" baselines are measured by test_kernel_suite,
+"model" baselines are pipeline model predictions used until an RTL run
+replaces them. Both gate regressions, model baselines with the wider
+model_tolerance since they are only as good as the model's calibration.
+RTL runs serve memory with the wait states named by the baselines'
+"latency" profile, by default those of memory_system's BRAMs.
+
+    python kernels.py list
+    python kernels.py seed          # fill missing baselines from the model
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from riscv_asm import DEFAULT_DATA_BASE, DEFAULT_TEXT_BASE, assemble
+
+RESET_PC = DEFAULT_TEXT_BASE
+DATA_BASE = DEFAULT_DATA_BASE
+MASK32 = 0xFFFFFFFF
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernel_baselines.json")
+DEFAULT_TOLERANCE = 0.05
+DEFAULT_MODEL_TOLERANCE = 0.25
+DEFAULT_LATENCY = "bram"
+
+
+@dataclass
+class Kernel:
+    """Program image, initial data memory and expected final data words"""
+    name: str
+    description: str
+    program: List[int]
+    halt_pc: int
+    data: Dict[int, int] = field(default_factory=dict)
+    expected: Dict[int, int] = field(default_factory=dict)
+    base: int = RESET_PC
+    max_cycles: int = 20000
+    source: str = ""
+
+    def check(self, read_word: Callable[[int], int]) -> List[str]:
+        """Compare expected data words; returns one message per mismatch"""
+        errors = []
+        for addr, value in sorted(self.expected.items()):
+            actual = read_word(addr) & MASK32
+            if actual != value & MASK32:
+                errors.append(f"{self.name}: mem[0x{addr:x}] = 0x{actual:08x}, expected 0x{value & MASK32:08x}")
+        return errors
+
+
+def _kernel(name: str, description: str, source: str,
+            expected: Callable[[Dict[str, int]], Dict[int, int]], **kwargs) -> Kernel:
+    """Assemble source and resolve the expected words against its symbols"""
+    program = assemble(source)
+    return Kernel(name, description, program.text, program.symbols["halt"], dict(program.data),
+                  expected(program.symbols), source=source, **kwargs)
+
+
+def _words(base: int, values: List[int]) -> Dict[int, int]:
+    return {base + 4 * i: v & MASK32 for i, v in enumerate(values)}
+
+
+def _word_lines(values: List[int], per_line: int = 8) -> str:
+    return "\n".join("    .word " + ", ".join(f"0x{v & MASK32:x}" for v in values[i:i + per_line])
+                     for i in range(0, len(values), per_line))
+
+
+def _values(seed: int, count: int, low: int = 0, high: int = 0xFFFF) -> List[int]:
+    rng = random.Random(seed)
+    return [rng.randint(low, high) for _ in range(count)]
+
+
+def memcpy_kernel(words: int = 64) -> Kernel:
+    values = _values(1, words, 0, MASK32)
+    source = f"""
+    la   a0, src
+    la   a1, dst
+    li   a2, {words}
+loop:                       # unrolled by two
+    lw   t0, 0(a0)
+    lw   t1, 4(a0)
+    sw   t0, 0(a1)
+    sw   t1, 4(a1)
+    addi a0, a0, 8
+    addi a1, a1, 8
+    addi a2, a2, -2
+    bnez a2, loop
+halt:
+    j    .
+
+    .data
+src:
+{_word_lines(values)}
+dst:
+    .space {4 * words}
+"""
+    return _kernel("memcpy", f"Copy {words} words, unrolled by two", source,
+                   lambda sym: _words(sym["dst"], values))
+
+
+def checksum_kernel(words: int = 64) -> Kernel:
+    values = _values(2, words)
+    source = f"""
+    la   a0, buf
+    li   a2, {words}
+    li   s0, 0              # Fletcher-style running sums
+    li   s1, 0
+loop:
+    lw   t0, 0(a0)
+    add  s0, s0, t0         # load-use on purpose
+    add  s1, s1, s0
+    addi a0, a0, 4
+    addi a2, a2, -1
+    bnez a2, loop
+    sw   s0, 0(a0)          # a0 now points at result
+    sw   s1, 4(a0)
+halt:
+    j    .
+
+    .data
+buf:
+{_word_lines(values)}
+result:
+    .word 0, 0
+"""
+    s0 = s1 = 0
+    for v in values:
+        s0 = (s0 + v) & MASK32
+        s1 = (s1 + s0) & MASK32
+    return _kernel("checksum", f"Fletcher-style checksum over {words} words", source,
+                   lambda sym: _words(sym["result"], [s0, s1]))
+
+
+def matmul_kernel(n: int = 6) -> Kernel:
+    a = _values(3, n * n, 0, 255)
+    b = _values(4, n * n, 0, 255)
+    source = f"""
+    .equ N, {n}
+    la   a0, mat_a
+    la   a1, mat_b
+    la   a2, mat_c
+    li   a3, N
+    li   t3, 0              # i
+row:
+    li   t4, 0              # j
+col:
+    li   s0, 0              # acc
+    mul  t0, t3, a3         # &A[i][0]
+    slli t0, t0, 2
+    add  t0, t0, a0
+    slli t1, t4, 2          # &B[0][j]
+    add  t1, t1, a1
+    li   t5, 0              # k
+dot:
+    lw   t2, 0(t0)
+    lw   t6, 0(t1)
+    mul  t2, t2, t6
+    add  s0, s0, t2
+    addi t0, t0, 4
+    addi t1, t1, 4 * N
+    addi t5, t5, 1
+    bne  t5, a3, dot
+    sw   s0, 0(a2)
+    addi a2, a2, 4
+    addi t4, t4, 1
+    bne  t4, a3, col
+    addi t3, t3, 1
+    bne  t3, a3, row
+halt:
+    j    .
+
+    .data
+mat_a:
+{_word_lines(a, n)}
+mat_b:
+{_word_lines(b, n)}
+mat_c:
+    .space 4 * N * N
+"""
+    c = [sum(a[i * n + k] * b[k * n + j] for k in range(n)) & MASK32
+         for i in range(n) for j in range(n)]
+    return _kernel("matmul", f"{n}x{n} integer matrix multiply using MUL", source,
+                   lambda sym: _words(sym["mat_c"], c), max_cycles=40000)
+
+
+def sort_kernel(count: int = 16) -> Kernel:
+    values = _values(5, count, -1000, 1000)
+    source = f"""
+    la   a0, array
+    li   a1, {count}
+    li   t3, 1              # i
+outer:
+    slli t0, t3, 2
+    add  t0, t0, a0         # &a[i]
+    lw   t1, 0(t0)          # key
+inner:
+    beq  t0, a0, insert
+    lw   t2, -4(t0)
+    bge  t1, t2, insert     # signed compare
+    sw   t2, 0(t0)
+    addi t0, t0, -4
+    j    inner
+insert:
+    sw   t1, 0(t0)
+    addi t3, t3, 1
+    bne  t3, a1, outer
+halt:
+    j    .
+
+    .data
+array:
+{_word_lines(values)}
+"""
+    return _kernel("sort", f"Insertion sort of {count} signed words", source,
+                   lambda sym: _words(sym["array"], sorted(values)))
+
+
+def linked_list_kernel(nodes: int = 32) -> Kernel:
+    rng = random.Random(6)
+    values = _values(7, nodes)
+    # Nodes are two words (next, value) placed in shuffled slots, so every
+    # step is a dependent load from a non-sequential address
+    slots = list(range(nodes))
+    rng.shuffle(slots)
+    position = {slot: i for i, slot in enumerate(slots)}
+    lines = []
+    for slot in range(nodes):
+        i = position[slot]
+        nxt = f"node{i + 1}" if i + 1 < nodes else "0"
+        lines.append(f"node{i}: .word {nxt}, {values[i]}")
+    node_lines = "\n".join(lines)
+    source = f"""
+    la   a0, node0
+    li   s0, 0
+    li   s1, 0
+walk:
+    lw   t0, 4(a0)
+    lw   a0, 0(a0)
+    add  s0, s0, t0
+    addi s1, s1, 1
+    bnez a0, walk
+    la   t1, result
+    sw   s0, 0(t1)
+    sw   s1, 4(t1)
+halt:
+    j    .
+
+    .data
+{node_lines}
+result:
+    .word 0, 0
+"""
+    return _kernel("linked_list", f"Pointer-chasing sum over {nodes} shuffled nodes", source,
+                   lambda sym: _words(sym["result"], [sum(values) & MASK32, nodes]))
+
+
+def dhrystone_kernel(iterations: int = 20) -> Kernel:
+    """Call/return, record copy, string compare, arithmetic with MUL/DIV"""
+    record = _values(8, 4)
+    string = _values(9, 6, 1, 0x7F7F7F7F)
+    other = string[:5] + [string[5] ^ 1]
+    source = f"""
+    li   s0, {iterations}
+    li   s1, 0              # int_glob
+    li   a4, 3              # int_1
+    li   a5, 0              # bool_glob
+main:
+    li   t0, 5              # int_2 = int_1 * 5 - 3
+    mul  t1, a4, t0
+    addi t1, t1, -3
+    div  t2, t1, a4         # int_1 = int_2 / int_1 + iterations left
+    add  a4, t2, s0
+    call proc_copy
+    call proc_strcmp
+    add  a5, a5, a0
+    add  s1, s1, a4
+    xori s1, s1, 0x55
+    addi s0, s0, -1
+    bnez s0, main
+    la   t0, result
+    sw   s1, 0(t0)
+    sw   a5, 4(t0)
+    sw   a4, 8(t0)
+halt:
+    j    .
+
+# Copy record A to record B, bumping the discriminant field
+proc_copy:
+    la   t0, rec_a
+    la   t1, rec_b
+    lw   t2, 0(t0)
+    lw   t3, 4(t0)
+    lw   t4, 8(t0)
+    lw   t5, 12(t0)
+    addi t2, t2, 1
+    sw   t2, 0(t1)
+    sw   t3, 4(t1)
+    sw   t4, 8(t1)
+    sw   t5, 12(t1)
+    sw   t2, 0(t0)
+    ret
+
+# a0 = 1 if the two 6-word strings differ, comparing word by word
+proc_strcmp:
+    la   t0, str_1
+    la   t1, str_2
+    li   t2, 6
+cmp:
+    lw   t3, 0(t0)
+    lw   t4, 0(t1)
+    bne  t3, t4, differ
+    addi t0, t0, 4
+    addi t1, t1, 4
+    addi t2, t2, -1
+    bnez t2, cmp
+    li   a0, 0
+    ret
+differ:
+    li   a0, 1
+    ret
+
+    .data
+rec_a:
+{_word_lines(record)}
+rec_b:
+    .space 16
+str_1:
+{_word_lines(string)}
+str_2:
+{_word_lines(other)}
+result:
+    .word 0, 0, 0
+"""
+    int_glob, bool_glob, int_1 = 0, 0, 3
+    for i in range(iterations, 0, -1):
+        int_2 = _wrap(int_1 * 5 - 3)
+        int_1 = _wrap(int(int_2 / int_1) + i)
+        bool_glob += 1
+        int_glob = _wrap(int_glob + int_1) ^ 0x55
+    final_record = [(record[0] + iterations) & MASK32] + record[1:]
+
+    def expected(sym):
+        words = _words(sym["result"], [int_glob, bool_glob, int_1])
+        words.update(_words(sym["rec_a"], final_record))
+        words.update(_words(sym["rec_b"], final_record))
+        return words
+
+    return _kernel("dhrystone", f"Dhrystone-like mix, {iterations} iterations", source,
+                   expected, max_cycles=40000)
+
+
+def _wrap(value: int) -> int:
+    value &= MASK32
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def amo_counter_kernel(iterations: int = 32) -> Kernel:
+    source = f"""
+    la   a0, counters
+    addi a1, a0, 4
+    li   a2, {iterations}
+    li   t1, 1
+loop:
+    amoadd.w zero, t1, (a0)
+retry:                      # LR/SC increment
+    lr.w t0, (a1)
+    addi t0, t0, 1
+    sc.w t2, t0, (a1)
+    bnez t2, retry
+    addi a2, a2, -1
+    bnez a2, loop
+halt:
+    j    .
+
+    .data
+counters:
+    .word 0, 0
+"""
+    return _kernel("amo_counter", f"AMOADD and LR/SC counters, {iterations} iterations", source,
+                   lambda sym: _words(sym["counters"], [iterations, iterations]))
+
+
+KERNELS: Dict[str, Callable[[], Kernel]] = {
+    "memcpy": memcpy_kernel,
+    "checksum": checksum_kernel,
+    "matmul": matmul_kernel,
+    "sort": sort_kernel,
+    "linked_list": linked_list_kernel,
+    "dhrystone": dhrystone_kernel,
+    "amo_counter": amo_counter_kernel,
+}
+
+
+def build_kernels(names: Optional[List[str]] = None) -> List[Kernel]:
+    """Build the named kernels, or all of them"""
+    names = names or list(KERNELS)
+    unknown = [n for n in names if n not in KERNELS]
+    if unknown:
+        raise ValueError(f"Unknown kernel(s) {', '.join(unknown)}; choose from {', '.join(KERNELS)}")
+    return [KERNELS[n]() for n in names]
+
+
+def load_baselines(path: str = BASELINE_FILE) -> Dict:
+    if not os.path.exists(path):
+        return {"tolerance": DEFAULT_TOLERANCE, "model_tolerance": DEFAULT_MODEL_TOLERANCE,
+                "latency": DEFAULT_LATENCY, "kernels": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(baselines: Dict, path: str = BASELINE_FILE):
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(name: str, measured: Dict, baselines: Dict, tolerance: Optional[float] = None) -> Optional[str]:
+    """Return a message if measured cycles exceed the baseline by more than the tolerance"""
+    base = baselines.get("kernels", {}).get(name)
+    if not base:
+        return None
+    if tolerance is None and base["source"] == "model":
+        tolerance = baselines.get("model_tolerance", DEFAULT_MODEL_TOLERANCE)
+    elif tolerance is None:
+        tolerance = baselines.get("tolerance", DEFAULT_TOLERANCE)
+    limit = base["cycles"] * (1 + tolerance)
+    if measured["cycles"] > limit:
+        return (f"{name}: {measured['cycles']} cycles (CPI {measured['cpi']:.3f}) vs "
+                f"{base['source']} baseline {base['cycles']} (CPI {base['cpi']:.3f}), "
+                f"+{(measured['cycles'] / base['cycles'] - 1) * 100:.1f}% > {tolerance * 100:.1f}%")
+    return None
+
+
+def model_baseline(kernel: Kernel) -> Dict:
+    """Pipeline model prediction in baseline form"""
+    from pipeline_model import PipelineModel
+
+    result = PipelineModel().run_program(kernel.program, kernel.base, kernel.data)
+    return {
+        "cycles": result.span_cycles,
+        "retired": result.retired,
+        "cpi": round(result.span_cycles / result.retired, 4),
+        "source": "model",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="cpu_top benchmark kernels")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="show kernels and their baselines")
+    seed = sub.add_parser("seed", help="fill missing baselines from the pipeline model")
+    seed.add_argument("--force", action="store_true", help="also replace existing model baselines")
+    args = parser.parse_args(argv)
+
+    baselines = load_baselines()
+    if args.command == "list":
+        for kernel in build_kernels():
+            base = baselines["kernels"].get(kernel.name)
+            info = f"{base['cycles']:>7} cycles  CPI {base['cpi']:.3f}  ({base['source']})" if base else "no baseline"
+            print(f"{kernel.name:<12} {len(kernel.program):>4} insns  {info}  {kernel.description}")
+        return 0
+
+    for kernel in build_kernels():
+        current = baselines["kernels"].get(kernel.name)
+        if current and (current["source"] == "rtl" or not args.force):
+            continue
+        baselines["kernels"][kernel.name] = model_baseline(kernel)
+        print(f"{kernel.name}: seeded {baselines['kernels'][kernel.name]['cycles']} cycles from the model")
+    save_baselines(baselines)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+Kanata pipeline trace export for cpu_top
+
+Follows every fetched instruction through IF/ID/EX/MEM/WB using the stage
+valid and stall signals and writes a Kanata 0004 log that opens in the
+Konata pipeline visualiser. Stalls are drawn on lane 1 with their cause,
+and instructions that leave the pipeline without retiring (dropped
+fetches, squashed EX slots, branch flushes) are marked as flushed.
+
+Only the five in-flight instructions are kept in memory; everything else
+is streamed to disk through a buffered writer.
+"""
+
+import argparse
+from typing import List, Optional, TextIO
+
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly
+
+STAGES = ("IF", "ID", "EX", "MEM", "WB")
+
+
+class _Inflight:
+    __slots__ = ("kid", "stage", "stalled")
+
+    def __init__(self, kid: int, stage: str):
+        self.kid = kid
+        self.stage = stage
+        self.stalled = False
+
+
+class KanataWriter:
+    """Low-level Kanata 0004 command writer"""
+
+    def __init__(self, stream: TextIO, start_cycle: int = 0, buffer_lines: int = 4096):
+        self.stream = stream
+        self.buffer_lines = buffer_lines
+        self._lines: List[str] = ["Kanata\t0004", f"C=\t{start_cycle}"]
+        self._pending_cycles = 0
+        self._next_id = 0
+        self._next_retire = 0
+
+    def _emit(self, line: str):
+        if self._pending_cycles:
+            self._lines.append(f"C\t{self._pending_cycles}")
+            self._pending_cycles = 0
+        self._lines.append(line)
+        if len(self._lines) >= self.buffer_lines:
+            self.flush()
+
+    def cycle(self, count: int = 1):
+        self._pending_cycles += count
+
+    def insn(self, label: str, detail: Optional[str] = None) -> int:
+        kid = self._next_id
+        self._next_id += 1
+        self._emit(f"I\t{kid}\t{kid}\t0")
+        self._emit(f"L\t{kid}\t0\t{label}")
+        if detail:
+            self._emit(f"L\t{kid}\t1\t{detail}")
+        return kid
+
+    def label(self, kid: int, text: str, hover: bool = True):
+        self._emit(f"L\t{kid}\t{1 if hover else 0}\t{text}")
+
+    def start(self, kid: int, stage: str, lane: int = 0):
+        self._emit(f"S\t{kid}\t{lane}\t{stage}")
+
+    def end(self, kid: int, stage: str, lane: int = 0):
+        self._emit(f"E\t{kid}\t{lane}\t{stage}")
+
+    def retire(self, kid: int, flushed: bool = False):
+        rid = self._next_retire if not flushed else 0
+        if not flushed:
+            self._next_retire += 1
+        self._emit(f"R\t{kid}\t{rid}\t{1 if flushed else 0}")
+
+    def flush(self):
+        if self._lines:
+            self.stream.write("\n".join(self._lines))
+            self.stream.write("\n")
+            self._lines.clear()
+
+    def close(self):
+        if self._pending_cycles:
+            self._lines.append(f"C\t{self._pending_cycles}")
+            self._pending_cycles = 0
+        self.flush()
+        self.stream.flush()
+
+
+class KonataTracer:
+    """Samples cpu_top each cycle and streams a Kanata pipeline trace"""
+
+    def __init__(self, dut, path: str, max_cycles: Optional[int] = None):
+        self.dut = dut
+        self.path = path
+        self.max_cycles = max_cycles
+        self.cycles = 0
+        self.retired = 0
+        self.flushed = 0
+        self._file = None
+        self._writer: Optional[KanataWriter] = None
+        self._task = None
+        self._slots: List[Optional[_Inflight]] = [None] * len(STAGES)
+
+    def start(self):
+        if self._task is None:
+            self._file = open(self.path, "w")
+            self._writer = KanataWriter(self._file)
+            self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+        self._close()
+
+    def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._file.close()
+            self._writer = None
+            self._file = None
+
+    def _stall_cause(self) -> str:
+        dut = self.dut
+        if dut.cp_stall_external.value:
+            return "coprocessor"
+        if dut.mem_stall.value:
+            return "memory wait"
+        if dut.m_stall.value:
+            return "mul/div"
+        return "stall"
+
+    def _move(self, occ: Optional[_Inflight], stage: str):
+        if occ is None:
+            return
+        self._writer.end(occ.kid, occ.stage)
+        occ.stage = stage
+        self._writer.start(occ.kid, stage)
+
+    def _leave(self, occ: Optional[_Inflight], flushed: bool, reason: str = ""):
+        if occ is None:
+            return
+        w = self._writer
+        if occ.stalled:
+            w.end(occ.kid, "stall", lane=1)
+        w.end(occ.kid, occ.stage)
+        if flushed:
+            w.label(occ.kid, f"flushed in {occ.stage}: {reason}")
+            self.flushed += 1
+        else:
+            self.retired += 1
+        w.retire(occ.kid, flushed)
+
+    async def _run(self):
+        dut = self.dut
+        w = self._writer
+        prev_stall = False
+        prev_backend = False
+        prev_hazard = False
+        prev_retire = False
+        prev_flush = False
+
+        try:
+            while self.max_cycles is None or self.cycles < self.max_cycles:
+                # Sample settled pre-edge state, after the memory responses
+                await FallingEdge(dut.clk)
+                await ReadOnly()
+                w.cycle()
+                self.cycles += 1
+                if not dut.rst_n.value:
+                    for occ in self._slots:
+                        self._leave(occ, True, "reset")
+                    self._slots = [None] * len(STAGES)
+                    prev_stall = prev_backend = prev_hazard = prev_retire = prev_flush = False
+                    continue
+
+                if_, id_, ex, mem, wb = self._slots
+
+                # Apply what the last rising edge did. The back end moves
+                # unless backend_stall; load-use and M/A hazards only hold
+                # IF/ID and send a bubble into EX.
+                if not prev_backend:
+                    self._leave(wb, not prev_retire, "not retired")
+                    wb, mem = mem, ex
+                    self._move(wb, "WB")
+                    self._move(mem, "MEM")
+                    if prev_hazard:
+                        ex = None
+                    else:
+                        ex = id_
+                        self._move(ex, "EX")
+                if not prev_stall:
+                    if dut.id_valid.value:
+                        id_ = if_
+                        self._move(id_, "ID")
+                    else:
+                        self._leave(if_, True, "branch flush" if prev_flush else "fetch not ready")
+                        id_ = None
+                    if_ = None
+                    if dut.if_valid.value:
+                        pc = int(dut.if_pc.value)
+                        inst = int(dut.if_inst.value)
+                        if_ = _Inflight(w.insn(f"{pc:08x}: {inst:08x}"), "IF")
+                        w.start(if_.kid, "IF")
+
+                self._slots = [if_, id_, ex, mem, wb]
+
+                # Mark stalls on lane 1 while a stage is frozen
+                stall = bool(dut.pipeline_stall.value)
+                backend = bool(dut.backend_stall.value)
+                if backend:
+                    cause = self._stall_cause()
+                elif dut.load_use_hazard.value:
+                    cause = "load-use"
+                else:
+                    cause = "data hazard"
+                for occ in self._slots:
+                    if occ is None:
+                        continue
+                    held = backend or (stall and occ.stage in ("IF", "ID"))
+                    if held and not occ.stalled:
+                        w.start(occ.kid, "stall", lane=1)
+                        w.label(occ.kid, f"stalled in {occ.stage}: {cause}")
+                        occ.stalled = True
+                    elif not held and occ.stalled:
+                        w.end(occ.kid, "stall", lane=1)
+                        occ.stalled = False
+
+                prev_stall = stall
+                prev_backend = backend
+                prev_hazard = bool(dut.load_use_hazard.value or dut.data_hazard.value)
+                prev_retire = bool(dut.wb_valid.value) and not backend
+                prev_flush = bool(dut.pipeline_flush.value)
+        finally:
+            self._close()
+
+
+def main(argv=None):
+    """Check that a Kanata file is well formed and print a short summary"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("trace")
+    args = parser.parse_args(argv)
+
+    cycles = insns = retired = flushed = 0
+    with open(args.trace) as f:
+        header = f.readline().split("\t")
+        if header[0] != "Kanata":
+            raise SystemExit(f"{args.trace}: not a Kanata trace")
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "C":
+                cycles += int(fields[1])
+            elif fields[0] == "I":
+                insns += 1
+            elif fields[0] == "R":
+                if fields[3] == "1":
+                    flushed += 1
+                else:
+                    retired += 1
+    print(f"{cycles} cycles, {insns} instructions, {retired} retired, {flushed} flushed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Memory responder for cpu_top's instruction and data ports
+
+Serves imem/dmem requests each cycle from Python memory models, and can
+record the exact per-cycle response stream to a compact binary trace.
+A recorded trace can then be replayed from a preloaded NumPy array with no
+model lookups at all, which makes regressions of known-good programs and
+bisection of RTL changes much cheaper.
+
+Trace files start with an 8-byte header (magic, version, record size)
+followed by one TRACE_DTYPE record per clock cycle.
+
+Wait states can be injected with a LatencyProfile to see how the pipeline
+copes with BRAM or AXI latencies instead of same-cycle ready.
+"""
+
+import logging
+import os
+import random
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import cocotb
+from cocotb.triggers import FallingEdge
+
+logger = logging.getLogger(__name__)
+
+NOP = 0x00000013
+
+TRACE_MAGIC = b"RVMR"
+TRACE_VERSION = 1
+_HEADER = struct.Struct("<4sHH")
+
+# Per-cycle flag bits
+IMEM_READ = 1 << 0
+IMEM_READY = 1 << 1
+DMEM_READ = 1 << 2
+DMEM_WRITE = 1 << 3
+DMEM_READY = 1 << 4
+
+# Requests are stored alongside the responses so a replay can report the
+# first cycle where the DUT asked for something different
+TRACE_DTYPE = np.dtype([
+    ("imem_addr", "<u4"),
+    ("imem_read_data", "<u4"),
+    ("dmem_addr", "<u4"),
+    ("dmem_read_data", "<u4"),
+    ("flags", "u1"),
+])
+
+MODES = ("model", "record", "replay")
+PORTS = ("imem", "dmem")
+
+# Wait states for accesses that leave the BRAM windows (see docs/memory_map.md)
+AXI_LATENCY = 8
+# (base, size, wait states) for the CPU address space in docs/memory_map.md
+DEFAULT_REGIONS = [
+    (0x00000000, 0x8000, 0),  # Instruction / data BRAM
+]
+
+
+class LatencyProfile:
+    """Wait-state model; the base class adds no wait states"""
+
+    name = "zero"
+
+    def __init__(self, ports: Sequence[str] = PORTS):
+        self.ports = tuple(ports)
+
+    def latency(self, port: str, addr: int, cycle: int, write: bool = False) -> int:
+        """Wait states before a new request on port is accepted"""
+        return 0
+
+    def blocked(self, port: str, cycle: int) -> bool:
+        """Whether port applies back-pressure this cycle regardless of requests"""
+        return False
+
+
+class FixedLatency(LatencyProfile):
+    """Every access takes the same number of wait states"""
+
+    def __init__(self, cycles: int, ports: Sequence[str] = PORTS):
+        super().__init__(ports)
+        self.cycles = cycles
+        self.name = f"fixed:{cycles}"
+
+    def latency(self, port: str, addr: int, cycle: int, write: bool = False) -> int:
+        return self.cycles if port in self.ports else 0
+
+
+class RandomLatency(LatencyProfile):
+    """Wait states drawn from a uniform range or a weighted distribution"""
+
+    def __init__(self, low: int = 0, high: int = 3, weights: Optional[Dict[int, float]] = None,
+                 seed: int = 0, ports: Sequence[str] = PORTS):
+        super().__init__(ports)
+        self.rng = random.Random(seed)
+        if weights is None:
+            weights = {n: 1.0 for n in range(low, high + 1)}
+        self.values = list(weights)
+        self.weights = list(weights.values())
+        self.name = f"random:{min(self.values)}-{max(self.values)}"
+
+    def latency(self, port: str, addr: int, cycle: int, write: bool = False) -> int:
+        if port not in self.ports:
+            return 0
+        return self.rng.choices(self.values, self.weights)[0]
+
+
+class RegionLatency(LatencyProfile):
+    """Wait states looked up by address region"""
+
+    def __init__(self, regions: List[Tuple[int, int, int]] = DEFAULT_REGIONS,
+                 default: int = AXI_LATENCY, ports: Sequence[str] = PORTS):
+        super().__init__(ports)
+        self.regions = regions
+        self.default = default
+        self.name = "region"
+
+    def latency(self, port: str, addr: int, cycle: int, write: bool = False) -> int:
+        if port not in self.ports:
+            return 0
+        for base, size, wait in self.regions:
+            if base <= addr < base + size:
+                return wait
+        return self.default
+
+
+class BurstyLatency(LatencyProfile):
+    """Periodic back-pressure: ready is held low for busy of every period cycles"""
+
+    def __init__(self, period: int = 16, busy: int = 4, cycles: int = 0,
+                 ports: Sequence[str] = PORTS):
+        super().__init__(ports)
+        self.period = period
+        self.busy = busy
+        self.cycles = cycles
+        self.name = f"bursty:{period}/{busy}"
+
+    def latency(self, port: str, addr: int, cycle: int, write: bool = False) -> int:
+        return self.cycles if port in self.ports else 0
+
+    def blocked(self, port: str, cycle: int) -> bool:
+        return port in self.ports and cycle % self.period < self.busy
+
+
+class BramLatency(LatencyProfile):
+    """The wait states memory_system's BRAM ports give the core
+
+    The instruction port reads ahead, so repeating or following on from
+    the last fetch is free and any other fetch waits a cycle. Data reads
+    are registered and wait a cycle; writes complete at once.
+    """
+
+    def __init__(self, ports: Sequence[str] = PORTS):
+        super().__init__(ports)
+        self.last_fetch: Optional[int] = None
+        self.name = "bram"
+
+    def latency(self, port: str, addr: int, cycle: int, write: bool = False) -> int:
+        if port not in self.ports:
+            return 0
+        if port == "dmem":
+            return 0 if write else 1
+        last, self.last_fetch = self.last_fetch, addr
+        return 0 if last is not None and addr in (last, last + 4) else 1
+
+
+def parse_latency_profile(spec: Optional[str]) -> Optional[LatencyProfile]:
+    """Build a profile from e.g. "fixed:2", "random:0-3", "region", "bursty:16/4", "bram"
+
+    An "@imem" or "@dmem" suffix restricts the profile to one port.
+    """
+    if not spec or spec in ("0", "none", "zero"):
+        return None
+    spec, _, port = spec.partition("@")
+    ports = (port,) if port else PORTS
+    kind, _, arg = spec.partition(":")
+    if kind == "fixed":
+        return FixedLatency(int(arg or 1), ports=ports)
+    if kind == "random":
+        low, _, high = (arg or "0-3").partition("-")
+        return RandomLatency(int(low), int(high or low), ports=ports)
+    if kind == "region":
+        return RegionLatency(default=int(arg) if arg else AXI_LATENCY, ports=ports)
+    if kind == "bursty":
+        period, _, busy = (arg or "16/4").partition("/")
+        return BurstyLatency(int(period), int(busy or 1), ports=ports)
+    if kind == "bram":
+        return BramLatency(ports=ports)
+    raise ValueError(f"Unknown latency profile '{spec}'")
+
+
+class DictMemory:
+    """Adapts an address -> word dict to the read/write model interface"""
+
+    def __init__(self, memory: Dict[int, int], default: int = 0):
+        self.memory = memory
+        self.default = default
+
+    def read(self, addr: int) -> int:
+        return self.memory.get(addr, self.default)
+
+    def write(self, addr: int, data: int):
+        self.memory[addr] = data
+
+
+def load_trace(path: str) -> np.ndarray:
+    """Load a recorded response trace"""
+    with open(path, "rb") as f:
+        magic, version, record_size = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != TRACE_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a version {TRACE_VERSION} memory response trace")
+        return np.fromfile(f, dtype=TRACE_DTYPE)
+
+
+class MemoryResponder:
+    """Drives imem/dmem responses from models, recording or replaying them
+
+    imem and dmem are any objects with read(addr) and write(addr, data),
+    e.g. cpu_top_tb.MemoryModel or DictMemory. They are not needed in
+    replay mode.
+    """
+
+    def __init__(self, dut, imem=None, dmem=None, mode: str = "model",
+                 trace_path: Optional[str] = None, verify: bool = True,
+                 chunk_cycles: int = 65536, latency: Optional[LatencyProfile] = None):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        if mode != "model" and trace_path is None:
+            raise ValueError(f"{mode} mode needs a trace_path")
+        self.dut = dut
+        self.imem = imem
+        self.dmem = dmem
+        self.mode = mode
+        self.trace_path = trace_path
+        self.verify = verify
+        self.cycle = 0
+        self.divergence_cycle: Optional[int] = None
+        self.latency = latency
+        # Cycles each port held ready low while a request was waiting
+        self.wait_cycles = {port: 0 for port in PORTS}
+        self._pending_wait: Dict[str, Optional[list]] = {port: None for port in PORTS}
+        self._file = None
+
+        if mode == "record":
+            os.makedirs(os.path.dirname(trace_path) or ".", exist_ok=True)
+            self._file = open(trace_path, "wb")
+            self._file.write(_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, TRACE_DTYPE.itemsize))
+            self._chunk = np.zeros(chunk_cycles, dtype=TRACE_DTYPE)
+            self._pending = 0
+        elif mode == "replay":
+            trace = load_trace(trace_path)
+            # Plain int lists are much cheaper to index and assign per cycle
+            self._imem_data = trace["imem_read_data"].tolist()
+            self._dmem_data = trace["dmem_read_data"].tolist()
+            self._flags = trace["flags"].tolist()
+            self._imem_addr = trace["imem_addr"].tolist()
+            self._dmem_addr = trace["dmem_addr"].tolist()
+            logger.info(f"Replaying {len(self._flags)} cycles from {trace_path}")
+
+    @classmethod
+    def from_env(cls, dut, imem=None, dmem=None, name: str = "trace",
+                 latency: Optional[LatencyProfile] = None):
+        """Build a responder configured by MEM_TRACE_MODE, MEM_TRACE_DIR and MEM_LATENCY"""
+        mode = os.environ.get("MEM_TRACE_MODE", "model")
+        trace_dir = os.environ.get("MEM_TRACE_DIR", "mem_traces")
+        path = os.path.join(trace_dir, f"{name}.rvmr") if mode != "model" else None
+        if latency is None:
+            latency = parse_latency_profile(os.environ.get("MEM_LATENCY"))
+        return cls(dut, imem, dmem, mode=mode, trace_path=path, latency=latency)
+
+    def start(self, cycles: Optional[int] = None):
+        return cocotb.start_soon(self.run(cycles))
+
+    async def run(self, cycles: Optional[int] = None):
+        """Respond every cycle, forever or for a fixed number of cycles
+
+        Requests are sampled on the falling edge, once the DUT's outputs have
+        settled, so a zero wait state response is seen at the next rising edge.
+        """
+        try:
+            while cycles is None or self.cycle < cycles:
+                await FallingEdge(self.dut.clk)
+                self.respond()
+        finally:
+            self.close()
+
+    def respond(self):
+        """Drive this cycle's responses"""
+        if self.mode == "replay":
+            self._replay()
+        else:
+            self._serve()
+        self.cycle += 1
+
+    def _serve(self):
+        dut = self.dut
+        flags = 0
+        imem_addr = imem_data = dmem_addr = dmem_data = 0
+
+        if dut.imem_read.value:
+            imem_addr = int(dut.imem_addr.value)
+            flags |= IMEM_READ
+            if self._accept("imem", imem_addr, imem_addr):
+                imem_data = self.imem.read(imem_addr)
+                dut.imem_read_data.value = imem_data
+                dut.imem_ready.value = 1
+                flags |= IMEM_READY
+            else:
+                dut.imem_ready.value = 0
+        else:
+            self._pending_wait["imem"] = None
+            dut.imem_ready.value = 0
+
+        if dut.dmem_read.value or dut.dmem_write.value:
+            dmem_addr = int(dut.dmem_addr.value)
+            write = not dut.dmem_read.value
+            flags |= DMEM_WRITE if write else DMEM_READ
+            if not self._accept("dmem", (dmem_addr, write), dmem_addr):
+                dut.dmem_ready.value = 0
+            elif write:
+                self.dmem.write(dmem_addr, int(dut.dmem_write_data.value))
+                dut.dmem_ready.value = 1
+                flags |= DMEM_READY
+            else:
+                dmem_data = self.dmem.read(dmem_addr)
+                dut.dmem_read_data.value = dmem_data
+                dut.dmem_ready.value = 1
+                flags |= DMEM_READY
+        else:
+            self._pending_wait["dmem"] = None
+            dut.dmem_ready.value = 0
+
+        if self._file is not None:
+            self._chunk[self._pending] = (imem_addr, imem_data, dmem_addr, dmem_data, flags)
+            self._pending += 1
+            if self._pending == len(self._chunk):
+                self._flush()
+
+    def _accept(self, port: str, key, addr: int) -> bool:
+        """Count down the wait states for the request identified by key"""
+        if self.latency is None:
+            return True
+        if self.latency.blocked(port, self.cycle):
+            self.wait_cycles[port] += 1
+            return False
+        pending = self._pending_wait[port]
+        if pending is None or pending[0] != key:
+            # A new request, or the DUT moved on before the last one completed
+            write = port == "dmem" and key[1]
+            pending = self._pending_wait[port] = [key, self.latency.latency(port, addr, self.cycle, write)]
+        if pending[1] > 0:
+            pending[1] -= 1
+            self.wait_cycles[port] += 1
+            return False
+        self._pending_wait[port] = None
+        return True
+
+    def _replay(self):
+        dut = self.dut
+        cycle = self.cycle
+        if cycle >= len(self._flags):
+            if cycle == len(self._flags):
+                logger.warning(f"Memory trace exhausted after {cycle} cycles")
+            dut.imem_ready.value = 0
+            dut.dmem_ready.value = 0
+            return
+
+        flags = self._flags[cycle]
+        if self.verify and self.divergence_cycle is None:
+            self._check_requests(cycle, flags)
+        if flags & IMEM_READY:
+            dut.imem_read_data.value = self._imem_data[cycle]
+        dut.imem_ready.value = 1 if flags & IMEM_READY else 0
+        if flags & DMEM_READ:
+            dut.dmem_read_data.value = self._dmem_data[cycle]
+        dut.dmem_ready.value = 1 if flags & DMEM_READY else 0
+
+    def _check_requests(self, cycle: int, flags: int):
+        dut = self.dut
+        expected = (flags & (IMEM_READ | DMEM_READ | DMEM_WRITE),
+                    self._imem_addr[cycle] if flags & IMEM_READ else None,
+                    self._dmem_addr[cycle] if flags & (DMEM_READ | DMEM_WRITE) else None)
+        actual_flags = ((IMEM_READ if dut.imem_read.value else 0)
+                        | (DMEM_READ if dut.dmem_read.value else 0)
+                        | (DMEM_WRITE if dut.dmem_write.value and not dut.dmem_read.value else 0))
+        actual = (actual_flags,
+                  int(dut.imem_addr.value) if actual_flags & IMEM_READ else None,
+                  int(dut.dmem_addr.value) if actual_flags & (DMEM_READ | DMEM_WRITE) else None)
+        if actual != expected:
+            self.divergence_cycle = cycle
+            logger.error(f"Memory requests diverge from trace at cycle {cycle}: "
+                         f"expected {_describe(expected)}, got {_describe(actual)}")
+
+    def _flush(self):
+        self._file.write(self._chunk[:self._pending].tobytes())
+        self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self._flush()
+            self._file.close()
+            self._file = None
+            logger.info(f"Recorded {self.cycle} cycles to {self.trace_path}")
+
+
+def _describe(requests) -> str:
+    flags, imem_addr, dmem_addr = requests
+    parts = []
+    if flags & IMEM_READ:
+        parts.append(f"imem 0x{imem_addr:08x}")
+    if flags & DMEM_READ:
+        parts.append(f"dmem read 0x{dmem_addr:08x}")
+    if flags & DMEM_WRITE:
+        parts.append(f"dmem write 0x{dmem_addr:08x}")
+    return ", ".join(parts) or "idle"
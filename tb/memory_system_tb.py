@@ -1,6 +1,6 @@
 import cocotb
 from cocotb.clock import Clock
-from cocotb.triggers import RisingEdge, ClockCycles
+from cocotb.triggers import RisingEdge, FallingEdge, ReadOnly, ClockCycles
 
 
 async def reset_dut(dut):
@@ -13,8 +13,10 @@ async def reset_dut(dut):
     dut.dmem_read.value = 0
     dut.dmem_write.value = 0
     dut.dmem_byte_enable.value = 0
-    dut.cache_flush.value = 0
-    dut.cache_invalidate.value = 0
+    # The cache control ports are gone from the direct-BRAM memory_system
+    if hasattr(dut, "cache_flush"):
+        dut.cache_flush.value = 0
+        dut.cache_invalidate.value = 0
 
     await ClockCycles(dut.clk, 2)
     dut.rst_n.value = 1
@@ -28,16 +30,19 @@ async def imem_fetch(dut, addr):
     """Fetch instruction from memory"""
     dut.imem_addr.value = addr
     dut.imem_read.value = 1
-    await RisingEdge(dut.clk)
 
-    # Wait for ready signal
+    # Wait for ready, sampled once the outputs have settled after the edge
     cycles = 0
-    while dut.imem_ready.value.integer != 1:
+    while True:
         await RisingEdge(dut.clk)
+        await ReadOnly()
+        if dut.imem_ready.value.integer == 1:
+            break
         cycles += 1
         assert cycles < 10, f"Timeout waiting for imem_ready at addr {hex(addr)}"
 
     data = dut.imem_read_data.value.integer
+    await FallingEdge(dut.clk)
     dut.imem_read.value = 0
     await RisingEdge(dut.clk)
     return data
@@ -67,16 +72,19 @@ async def dmem_read(dut, addr):
     """Read data from memory"""
     dut.dmem_addr.value = addr
     dut.dmem_read.value = 1
-    await RisingEdge(dut.clk)
 
-    # Wait for ready signal
+    # Wait for ready, sampled once the outputs have settled after the edge
     cycles = 0
-    while dut.dmem_ready.value.integer != 1:
+    while True:
         await RisingEdge(dut.clk)
+        await ReadOnly()
+        if dut.dmem_ready.value.integer == 1:
+            break
         cycles += 1
         assert cycles < 10, f"Timeout waiting for dmem_ready at addr {hex(addr)}"
 
     data = dut.dmem_read_data.value.integer
+    await FallingEdge(dut.clk)
     dut.dmem_read.value = 0
     await RisingEdge(dut.clk)
     return data
@@ -305,3 +313,155 @@ async def test_out_of_range_access(dut):
     cocotb.log.info(
         "Test passed: Out-of-range and misaligned accesses handled correctly"
     )
+
+
+@cocotb.test()
+async def test_distinct_addresses(dut):
+    """Each address reaches its own BRAM word on both ports"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    await reset_dut(dut)
+
+    # inst_mem's initial block loads a NOP and two ADDIs
+    for addr, expected in [(0x0, 0x00000013), (0x4, 0x00100093), (0x8, 0x00200113)]:
+        data = await imem_fetch(dut, addr)
+        assert data == expected, f"imem[0x{addr:x}]: expected 0x{expected:08x}, got 0x{data:08x}"
+
+    words = {0x10: 0x11111111, 0x14: 0x22222222, 0x400: 0x33333333, 0x1FFC: 0x44444444}
+    for addr, value in words.items():
+        await dmem_write(dut, addr, value, 0xF)
+    data = await dmem_read(dut, 0)
+    assert data == 0x89ABCDEF, f"dmem[0x0] overwritten: 0x{data:08x}"
+    for addr, value in words.items():
+        data = await dmem_read(dut, addr)
+        assert data == value, f"dmem[0x{addr:x}]: expected 0x{value:08x}, got 0x{data:08x}"
+
+
+async def fetch_stream(dut, addrs):
+    """Fetch addrs like cpu_top: move to the next address only after an edge
+    where imem_ready was high. Returns (cycles taken, words fetched)."""
+    dut.imem_read.value = 1
+    dut.imem_addr.value = addrs[0]
+    cycles = 0
+    words = []
+    index = 0
+    while index < len(addrs):
+        # Ready and data as the edge sees them
+        await ReadOnly()
+        ready = dut.imem_ready.value.integer == 1
+        if ready:
+            words.append(dut.imem_read_data.value.integer)
+        await RisingEdge(dut.clk)
+        cycles += 1
+        assert cycles < 4 * len(addrs), "Fetch stream stopped making progress"
+        if ready:
+            index += 1
+            if index < len(addrs):
+                dut.imem_addr.value = addrs[index]
+    dut.imem_read.value = 0
+    return cycles, words
+
+
+@cocotb.test()
+async def test_fetch_throughput(dut):
+    """Sequential and held fetches are ready every cycle; a redirect waits one"""
+    from backdoor import BackdoorLoader
+
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    await reset_dut(dut)
+    loader = BackdoorLoader(dut)
+    image = [0x1000 + i for i in range(0x200 // 4)]
+    loader.write_words("imem", 0, image)
+
+    # Straight-line code from the reset vector, a three-cycle stall holding
+    # 0x58, then a branch to 0x100
+    sequential = list(range(0x4C, 0x80, 4))
+    stalled = sequential[:4] + [sequential[3]] * 3 + sequential[4:]
+    branch = list(range(0x100, 0x120, 4))
+    addrs = stalled + branch
+    cycles, words = await fetch_stream(dut, addrs)
+
+    expected = [image[addr // 4] for addr in addrs]
+    assert words == expected, f"Fetched {[hex(w) for w in words]}, expected {[hex(w) for w in expected]}"
+    # One wait state for the first fetch after reset and one for the branch
+    assert cycles == len(addrs) + 2, f"{len(addrs)} fetches took {cycles} cycles"
+
+
+@cocotb.test()
+async def test_data_read_wait_state(dut):
+    """Writes complete at the edge; reads wait one cycle for the BRAM"""
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    await reset_dut(dut)
+
+    dut.dmem_addr.value = 0x20
+    dut.dmem_write_data.value = 0xCAFEF00D
+    dut.dmem_byte_enable.value = 0xF
+    dut.dmem_write.value = 1
+    await ReadOnly()
+    assert dut.dmem_ready.value.integer == 1, "Write not ready in its first cycle"
+    await RisingEdge(dut.clk)
+    dut.dmem_write.value = 0
+
+    dut.dmem_read.value = 1
+    await ReadOnly()
+    assert dut.dmem_ready.value.integer == 0, "Read ready before the BRAM was read"
+    await RisingEdge(dut.clk)
+    await ReadOnly()
+    assert dut.dmem_ready.value.integer == 1, "Read not ready after one wait state"
+    assert dut.dmem_read_data.value.integer == 0xCAFEF00D
+    await RisingEdge(dut.clk)
+    dut.dmem_read.value = 0
+
+
+@cocotb.test()
+async def test_backdoor_preload(dut):
+    """Load a full 32 KB image into both BRAMs through the hierarchy in zero time"""
+    import random
+    from cocotb.triggers import ReadWrite
+    from cocotb.utils import get_sim_time
+    from backdoor import BackdoorLoader
+
+    clock = Clock(dut.clk, 10, units="ns")
+    cocotb.start_soon(clock.start())
+
+    # Hold reset while the arrays are written
+    dut.rst_n.value = 0
+    dut.imem_read.value = 0
+    dut.dmem_read.value = 0
+    dut.dmem_write.value = 0
+    # Let the init block run before overwriting the arrays
+    await RisingEdge(dut.clk)
+
+    rng = random.Random(37)
+    loader = BackdoorLoader(dut)
+    imem_words = [rng.getrandbits(32) for _ in range(loader.sizes["imem"])]
+    dmem_words = [rng.getrandbits(32) for _ in range(loader.sizes["dmem"])]
+
+    start = get_sim_time("ns")
+    loader.write_words("imem", 0, imem_words)
+    loader.write_words("dmem", 0, dmem_words)
+    await ReadWrite()
+    assert get_sim_time("ns") == start, "Backdoor load consumed simulated time"
+    cocotb.log.info(f"Backdoor loaded {loader.words_written * 4} bytes at t={start} ns")
+
+    await ClockCycles(dut.clk, 2)
+    dut.rst_n.value = 1
+    await RisingEdge(dut.clk)
+
+    # Spot-check through the normal ports
+    for index in [0, 1, 0x4C // 4, len(imem_words) // 2, len(imem_words) - 1]:
+        data = await imem_fetch(dut, index * 4)
+        assert data == imem_words[index], (
+            f"imem[0x{index * 4:x}]: expected 0x{imem_words[index]:08x}, got 0x{data:08x}"
+        )
+    for index in [0, len(dmem_words) // 3, len(dmem_words) - 1]:
+        data = await dmem_read(dut, index * 4)
+        assert data == dmem_words[index], (
+            f"dmem[0x{index * 4:x}]: expected 0x{dmem_words[index]:08x}, got 0x{data:08x}"
+        )
+    assert loader.read_words("dmem", 0, 4) == dmem_words[:4]
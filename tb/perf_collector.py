@@ -0,0 +1,234 @@
+"""
+Retirement-based performance collector for cpu_top
+
+Counts retired instructions from writeback valid and attributes every
+cycle that does not retire to a single cause, so the breakdown always adds
+up to the cycle count:
+
+* cycles where the back end is stalled are charged to the stall source
+  that is active (coprocessor, data memory wait, multiply/divide, atomic,
+  offload stall_reason, or the generic debug_stall),
+* other cycles with an empty writeback stage are charged to whatever
+  created that bubble, which is tracked through shadow ID/EX/MEM/WB slots
+  (pipeline fill, fetch wait, branch flush or a load-use bubble).
+
+Per-instruction-class latency histograms (cycles from entering ID to
+retirement) are kept alongside, and everything can be written as JSON.
+"""
+
+import json
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+import cocotb
+from cocotb.triggers import FallingEdge, ReadOnly
+
+# stall_reason encoding from offload_stall_handler in offload_logic.sv
+STALL_REASONS = {
+    1: "cp_busy",
+    2: "data_hazard",
+    3: "structural_hazard",
+    4: "cp_exception",
+    5: "mem_conflict",
+    6: "cp_timeout",
+    7: "resource_conflict",
+}
+
+_CLASSES = {
+    0x33: "alu",
+    0x13: "alu_imm",
+    0x03: "load",
+    0x23: "store",
+    0x63: "branch",
+    0x6F: "jal",
+    0x67: "jalr",
+    0x37: "lui",
+    0x17: "auipc",
+    0x0F: "fence",
+    0x73: "system",
+    0x2F: "atomic",
+}
+
+
+def instruction_class(insn: int) -> str:
+    """Coarse instruction class used for latency histograms"""
+    opcode = insn & 0x7F
+    if opcode == 0x33 and (insn >> 25) == 0x01:
+        return "muldiv"
+    return _CLASSES.get(opcode, "other")
+
+
+class PerfCollector:
+    """Samples cpu_top once per cycle and accumulates CPI and stall statistics"""
+
+    def __init__(self, dut, stop_pc: Optional[int] = None):
+        self.dut = dut
+        # Collection stops once the instruction at stop_pc retires
+        self.stop_pc = stop_pc
+        self.done = False
+        self.cycles = 0
+        self.retired = 0
+        self.first_retire_cycle: Optional[int] = None
+        self.last_retire_cycle: Optional[int] = None
+        self.stall_cycles: Counter = Counter()
+        self.bubble_cycles: Counter = Counter()
+        self.class_counts: Counter = Counter()
+        self.latency: Dict[str, Counter] = defaultdict(Counter)
+        self._task = None
+        self._has_stall_reason = hasattr(dut, "stall_reason")
+        self._has_a_stall = hasattr(dut, "a_stall_req")
+
+    def start(self):
+        if self._task is None:
+            self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    def reset(self):
+        self.done = False
+        self.cycles = 0
+        self.retired = 0
+        self.first_retire_cycle = None
+        self.last_retire_cycle = None
+        self.stall_cycles.clear()
+        self.bubble_cycles.clear()
+        self.class_counts.clear()
+        self.latency.clear()
+
+    def _stall_cause(self) -> str:
+        dut = self.dut
+        if dut.cp_stall_external.value:
+            return "cp_stall_external"
+        if dut.mem_stall.value:
+            return "memory_wait"
+        if dut.m_stall.value:
+            return "muldiv"
+        if self._has_a_stall and dut.a_stall_req.value:
+            return "atomic"
+        if self._has_stall_reason:
+            reason = int(dut.stall_reason.value)
+            if reason:
+                return "offload_" + STALL_REASONS.get(reason, str(reason))
+        return "debug_stall"
+
+    async def _run(self):
+        dut = self.dut
+        # Slots hold (pc, inst, cycle entered ID) for an instruction, or the
+        # reason string for a bubble
+        id_slot = ex_slot = mem_slot = wb_slot = "pipeline_fill"
+        next_id = if_empty = "pipeline_fill"
+        prev_stall = False
+
+        while True:
+            # Sample settled pre-edge state, after the memory responses
+            await FallingEdge(dut.clk)
+            await ReadOnly()
+            if self.done:
+                continue
+            if not dut.rst_n.value:
+                id_slot = ex_slot = mem_slot = wb_slot = next_id = if_empty = "pipeline_fill"
+                prev_stall = False
+                continue
+
+            stall = bool(dut.pipeline_stall.value)
+            backend = bool(dut.backend_stall.value)
+            if not prev_stall:
+                # ID was loaded at the last edge from the fetch sampled then
+                id_slot = (int(dut.id_pc.value), int(dut.id_inst.value), self.cycles) \
+                    if dut.id_valid.value else next_id
+
+            self.cycles += 1
+            if backend:
+                self.stall_cycles[self._stall_cause()] += 1
+            elif dut.wb_valid.value and isinstance(wb_slot, tuple):
+                self._retire(wb_slot)
+            elif dut.wb_valid.value:
+                # Retired something the shadow pipeline missed
+                self.retired += 1
+            else:
+                self.bubble_cycles[wb_slot if isinstance(wb_slot, str) else "other"] += 1
+
+            # Why ID would be empty after the next edge, and why IF would be
+            if dut.pipeline_flush.value:
+                next_id = "branch_flush"
+            elif not dut.if_valid.value:
+                next_id = if_empty
+            else:
+                next_id = "other"
+            if not stall:
+                if int(dut.reset_counter.value) < 10:
+                    if_empty = "pipeline_fill"
+                elif dut.pipeline_flush.value:
+                    if_empty = "branch_flush"
+                elif not dut.imem_ready.value:
+                    if_empty = "fetch_wait"
+                else:
+                    if_empty = "other"
+
+            # Load-use and M/A hazards hold IF/ID and send a bubble into EX
+            # while the back end keeps moving
+            if not backend:
+                wb_slot = mem_slot
+                mem_slot = ex_slot
+                if dut.load_use_hazard.value:
+                    ex_slot = "load_use"
+                elif dut.data_hazard.value:
+                    ex_slot = "data_hazard"
+                else:
+                    ex_slot = id_slot
+            prev_stall = stall
+
+    def _retire(self, slot):
+        pc, inst, entered = slot
+        cls = instruction_class(inst)
+        self.retired += 1
+        if self.first_retire_cycle is None:
+            self.first_retire_cycle = self.cycles
+        self.last_retire_cycle = self.cycles
+        if pc == self.stop_pc:
+            self.done = True
+        self.class_counts[cls] += 1
+        self.latency[cls][self.cycles - entered] += 1
+
+    @property
+    def cpi(self) -> Optional[float]:
+        return self.cycles / self.retired if self.retired else None
+
+    def report(self) -> Dict:
+        """Summary as a JSON-serialisable dict"""
+        lost = dict(self.stall_cycles)
+        for cause, count in self.bubble_cycles.items():
+            lost[cause] = lost.get(cause, 0) + count
+        return {
+            "cycles": self.cycles,
+            "retired": self.retired,
+            "cpi": self.cpi,
+            # Cycles from first to last retirement, excluding reset and fill
+            "span_cycles": (self.last_retire_cycle - self.first_retire_cycle + 1
+                            if self.first_retire_cycle is not None else 0),
+            "ipc": self.retired / self.cycles if self.cycles else None,
+            "stall_cycles": dict(self.stall_cycles),
+            "bubble_cycles": dict(self.bubble_cycles),
+            "lost_cycles": lost,
+            "instruction_classes": dict(self.class_counts),
+            "latency_histograms": {
+                cls: {str(k): v for k, v in sorted(hist.items())}
+                for cls, hist in self.latency.items()
+            },
+        }
+
+    def write_report(self, path: str) -> Dict:
+        report = self.report()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    def summary(self) -> str:
+        cpi = f"{self.cpi:.2f}" if self.retired else "inf"
+        lost = ", ".join(f"{cause}={count}" for cause, count in
+                         sorted(self.report()["lost_cycles"].items(), key=lambda kv: -kv[1]))
+        return f"CPI={cpi} retired={self.retired} cycles={self.cycles}" + (f" ({lost})" if lost else "")
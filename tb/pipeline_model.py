@@ -0,0 +1,307 @@
+"""
+Cycle-approximate timing model of the cpu_top pipeline
+
+Replays the dynamic instruction stream from the reference ISS through a
+scoreboard model of the 5-stage pipeline and predicts cycle counts and
+stall causes, typically a few hundred times faster than Verilator. The
+timing rules mirror cpu_top.sv and are all parameters of PipelineConfig,
+so design-space questions (branch penalty, forwarding, load-use bubbles,
+mul/div and atomic latencies, offload stalls) become a config change.
+
+Calibration mode replays programs whose RTL results were recorded with
+PerfCollector (see test_pipeline_model_calibration in cpu_top_tb.py) and
+reports the prediction error per program:
+
+    python pipeline_model.py calibrate pipeline_calibration.json
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from perf_collector import instruction_class
+from riscv_iss import RV32ISS, IllegalInstruction, SparseMemory
+
+RESET_PC = 0x4C
+JAL_SELF = 0x0000006F  # j .
+
+
+@dataclass
+class PipelineConfig:
+    """Timing parameters, defaults matching cpu_top.sv"""
+    # Fetch slots squashed after a taken branch or jump: the redirect
+    # happens in ID, by which time two younger words have been fetched
+    branch_penalty: int = 2
+    # Bubble inserted when an instruction in ID uses a load result in EX
+    load_use_penalty: int = 1
+    # Without forwarding, operands wait until the producer has written back
+    forwarding: bool = True
+    # Cycles an M op holds EX: rv32m_muldiv MUL_LAT / DIV_LAT plus the
+    # cycle its result is valid
+    mul_latency: int = 3
+    div_latency: int = 33
+    # Cycles a_stall_req holds the pipeline for LR/SC and AMOs
+    # with single-cycle memory: LR loads, SC checks then stores, an AMO
+    # loads, computes and stores
+    lr_latency: int = 1
+    sc_latency: int = 2
+    amo_latency: int = 3
+    # Extra cycles per instruction fetch, e.g. BRAM or AXI wait states
+    fetch_wait: int = 0
+    # Coprocessor (custom-0..3) instructions stall for this long, capped at
+    # the offload stall timeout
+    offload_latency: int = 0
+    offload_timeout: int = 1024
+    # Cycles from reset release until the first instruction retires
+    fill_cycles: int = 15
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> "PipelineConfig":
+        return cls(**{k: v for k, v in values.items() if k in cls.__dataclass_fields__})
+
+
+_CUSTOM_OPCODES = {0x0B, 0x2B, 0x5B, 0x7B}
+
+
+def _sources(insn: int) -> Tuple[int, ...]:
+    """Architectural source registers read by insn"""
+    opcode = insn & 0x7F
+    rs1 = (insn >> 15) & 0x1F
+    rs2 = (insn >> 20) & 0x1F
+    if opcode in (0x33, 0x23, 0x63, 0x2F):
+        return (rs1, rs2)
+    if opcode in (0x13, 0x03, 0x67):
+        return (rs1,)
+    return ()
+
+
+@dataclass
+class ModelResult:
+    """Prediction for one program, shaped like PerfCollector.report()"""
+    cycles: int = 0
+    retired: int = 0
+    span_cycles: int = 0
+    lost_cycles: Counter = field(default_factory=Counter)
+    instruction_classes: Counter = field(default_factory=Counter)
+
+    def report(self) -> Dict:
+        return {
+            "cycles": self.cycles,
+            "retired": self.retired,
+            "span_cycles": self.span_cycles,
+            "cpi": self.cycles / self.retired if self.retired else None,
+            "ipc": self.retired / self.cycles if self.cycles else None,
+            "lost_cycles": dict(self.lost_cycles),
+            "instruction_classes": dict(self.instruction_classes),
+        }
+
+
+class PipelineModel:
+    """In-order scoreboard model of IF/ID/EX/MEM/WB"""
+
+    def __init__(self, config: Optional[PipelineConfig] = None):
+        self.config = config or PipelineConfig()
+
+    def run_stream(self, stream: Iterable[Tuple[int, int, bool]]) -> ModelResult:
+        """Time a stream of (pc, insn, redirected) tuples
+
+        redirected is True when the instruction changed control flow.
+        """
+        cfg = self.config
+        result = ModelResult()
+        # Cycle each architectural register's value can be forwarded from
+        ready_at = [0] * 32
+        # What a consumer of each register would be waiting on
+        tags: List[Optional[str]] = [None] * 32
+        prev_ex = -1  # EX cycle of the previous instruction
+        earliest = 0  # Earliest EX cycle for the next instruction, and why
+        earliest_cause = None
+        # Earliest EX cycle for the next op on the M or A unit, which only
+        # accepts one once it is idle again
+        unit_free = {"muldiv": 0, "atomic": 0}
+        first_ex = None
+        # (EX cycle, cycles held in EX) of the first instructions, whose
+        # back-end stalls also delay the first retirement
+        head: List[Tuple[int, int]] = []
+
+        for pc, insn, redirected in stream:
+            opcode = insn & 0x7F
+            cls = instruction_class(insn)
+            ex = prev_ex + 1 + cfg.fetch_wait
+            cause = "fetch_wait" if cfg.fetch_wait else None
+            if earliest > ex:
+                ex, cause = earliest, earliest_cause
+            if unit_free.get(cls, 0) > ex:
+                ex, cause = unit_free[cls], "data_hazard"
+            for rs in _sources(insn):
+                if rs and ready_at[rs] > ex:
+                    ex = ready_at[rs]
+                    cause = tags[rs] or "data_hazard"
+            if first_ex is None:
+                first_ex = ex
+            elif ex - prev_ex - 1 > 0:
+                result.lost_cycles[cause or "other"] += ex - prev_ex - 1
+
+            # When this instruction's result can be consumed
+            rd = (insn >> 7) & 0x1F
+            earliest, earliest_cause = ex + 1, None
+            if cls == "muldiv":
+                # The op holds EX until its result is valid. M/A results
+                # are forwarded from MEM, so consumers wait one cycle more.
+                latency = cfg.div_latency if (insn >> 12) & 4 else cfg.mul_latency
+                earliest, earliest_cause = ex + latency, "muldiv"
+                ready, tag = ex + latency + 1, "data_hazard"
+                unit_free[cls] = ready
+            elif cls == "load":
+                ready, tag = ex + 1 + cfg.load_use_penalty, "load_use"
+            elif cls == "atomic":
+                funct5 = insn >> 27
+                stall = {0x02: cfg.lr_latency, 0x03: cfg.sc_latency}.get(funct5, cfg.amo_latency)
+                earliest, earliest_cause = ex + 1 + stall, "atomic"
+                ready, tag = ex + 2 + stall, "data_hazard"
+                unit_free[cls] = ready
+            elif opcode in _CUSTOM_OPCODES and cfg.offload_latency:
+                stall = min(cfg.offload_latency, cfg.offload_timeout)
+                earliest, earliest_cause = ex + 1 + stall, "cp_stall_external"
+                ready, tag = ex + 1, None
+            else:
+                ready, tag = ex + 1, None
+            if not cfg.forwarding:
+                # Register file is written in WB, read in ID
+                ready, tag = max(ready, ex + 3), tag or "data_hazard"
+            if rd and opcode not in (0x23, 0x63):
+                ready_at[rd] = ready
+                tags[rd] = tag
+            # Anything beyond the next cycle so far is a back-end stall
+            hold = earliest - ex
+            if len(head) < 3:
+                head.append((ex, hold))
+            if redirected and cfg.branch_penalty and ex + 1 + cfg.branch_penalty > earliest:
+                earliest, earliest_cause = ex + 1 + cfg.branch_penalty, "branch_flush"
+
+            prev_ex = ex
+            result.retired += 1
+            result.instruction_classes[cls] += 1
+
+        if first_ex is not None:
+            # Like PerfCollector, span from the first to the last retirement
+            result.span_cycles = prev_ex + hold + 1 - _first_retire(head) + 1
+            result.cycles = result.span_cycles + cfg.fill_cycles
+            result.lost_cycles["pipeline_fill"] += cfg.fill_cycles
+        return result
+
+    def run_program(self, words: List[int], base: int = RESET_PC,
+                    data: Optional[Dict[int, int]] = None,
+                    max_instructions: int = 1_000_000) -> ModelResult:
+        """Execute a program on the ISS and time its instruction stream
+
+        The run ends at ECALL/EBREAK or at a `j .` self-loop, which is
+        counted once as the final instruction.
+        """
+        # cpu_top has separate instruction and data memories
+        iss = RV32ISS(pc=base, imem=SparseMemory())
+        iss.imem.load_words(base, words)
+        for addr, value in (data or {}).items():
+            iss.memory.store(addr, 4, value)
+        return self.run_stream(_iss_stream(iss, max_instructions))
+
+
+def _first_retire(head: List[Tuple[int, int]]) -> int:
+    """Cycle the first instruction leaves WB
+
+    It needs two cycles after EX in which the back end is not frozen by a
+    younger instruction holding EX.
+    """
+    ex, hold = head[0]
+    frozen = {c for ex_j, hold_j in head[1:] for c in range(ex_j, ex_j + hold_j - 1)}
+    cycle = ex + hold - 1
+    moves = 0
+    while moves < 2:
+        cycle += 1
+        if cycle not in frozen:
+            moves += 1
+    return cycle
+
+
+def _iss_stream(iss: RV32ISS, max_instructions: int):
+    for _ in range(max_instructions):
+        if iss.halted:
+            return
+        pc = iss.pc
+        try:
+            record = iss.step()
+        except IllegalInstruction:
+            return
+        yield pc, record.insn, iss.pc != pc + 4
+        if iss.pc == pc and record.insn == JAL_SELF:
+            return
+
+
+def calibrate(runs: Dict[str, Dict], config: Optional[PipelineConfig] = None) -> Dict[str, Dict]:
+    """Compare model predictions with recorded RTL runs
+
+    runs maps a program name to {"program": [...], "base": int,
+    "data": {addr: value}, "rtl": PerfCollector report}. The error is
+    computed on span_cycles, which excludes reset and pipeline fill.
+    """
+    model = PipelineModel(config)
+    results = {}
+    for name, run in runs.items():
+        data = {int(k): v for k, v in run.get("data", {}).items()}
+        predicted = model.run_program(run["program"], run.get("base", RESET_PC), data).report()
+        rtl = run["rtl"]
+        rtl_span = rtl.get("span_cycles") or rtl["cycles"]
+        error = (predicted["span_cycles"] - rtl_span) / rtl_span * 100 if rtl_span else None
+        results[name] = {
+            "model_cycles": predicted["span_cycles"],
+            "rtl_cycles": rtl_span,
+            "model_retired": predicted["retired"],
+            "rtl_retired": rtl["retired"],
+            "error_pct": error,
+            "model_lost_cycles": predicted["lost_cycles"],
+            "rtl_lost_cycles": rtl.get("lost_cycles", {}),
+        }
+    return results
+
+
+def format_calibration(results: Dict[str, Dict]) -> str:
+    lines = [f"{'program':<24} {'model':>8} {'rtl':>8} {'error':>8}"]
+    errors = []
+    for name, r in results.items():
+        err = "n/a" if r["error_pct"] is None else f"{r['error_pct']:+.1f}%"
+        if r["error_pct"] is not None:
+            errors.append(abs(r["error_pct"]))
+        lines.append(f"{name:<24} {r['model_cycles']:>8} {r['rtl_cycles']:>8} {err:>8}")
+    if errors:
+        lines.append(f"mean absolute error {sum(errors) / len(errors):.1f}%")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="cpu_top pipeline timing model")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cal = sub.add_parser("calibrate", help="compare against recorded RTL runs")
+    cal.add_argument("runs", help="JSON written by test_pipeline_model_calibration")
+    cal.add_argument("--config", help="JSON file of PipelineConfig overrides")
+    cal.add_argument("--json", help="write per-program results here")
+    args = parser.parse_args(argv)
+
+    config = PipelineConfig()
+    if args.config:
+        with open(args.config) as f:
+            config = PipelineConfig.from_dict(json.load(f))
+    with open(args.runs) as f:
+        runs = json.load(f)
+    results = calibrate(runs, config)
+    print(format_calibration(results))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": asdict(config), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+Out-of-process scoreboard for cpu_top
+
+Reference model work done inside cocotb coroutines stalls the simulator,
+since everything shares one Python thread in the simulator process. The
+RemoteScoreboard instead packs each monitored transaction (fetches, data
+memory operations and retired instructions with their register writes)
+into a shared-memory ring and a separate checker process replays them
+against the RV32IMA ISS. The simulator only pays for one struct.pack_into
+per transaction; mismatches come back asynchronously through a queue.
+"""
+
+import multiprocessing
+import os
+import shutil
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Set
+
+from commit_log import CommitRecord
+from riscv_iss import MASK32, IllegalInstruction, RV32ISS
+
+# Ring header: head, tail, capacity, closed
+_CTRL = struct.Struct("<QQII")
+_CTRL_SIZE = 64
+# kind, rd, flags, addr, data, value, mem_addr, mem_value
+_TXN = struct.Struct("<BBHIIIII")
+TXN_SIZE = _TXN.size
+
+# Transaction kinds
+TXN_FETCH = 1
+TXN_MEM = 2
+TXN_COMMIT = 3
+
+# TXN_MEM flags
+MEM_READ = 1 << 0
+MEM_WRITE = 1 << 1
+# TXN_COMMIT flags
+COMMIT_RD = 1 << 0
+COMMIT_MEM_ADDR = 1 << 1
+COMMIT_MEM_VALUE = 1 << 2
+
+
+class TransactionRing:
+    """Single-producer, single-consumer ring of fixed-size records in shared memory"""
+
+    def __init__(self, capacity: int = 1 << 16, name: Optional[str] = None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_CTRL_SIZE + capacity * TXN_SIZE)
+            _CTRL.pack_into(self.shm.buf, 0, 0, 0, capacity, 0)
+            self.owner = True
+        else:
+            self.shm = _attach(name)
+            self.owner = False
+        self.buf = self.shm.buf
+        self.capacity = _CTRL.unpack_from(self.buf, 0)[2]
+        self.name = self.shm.name
+        self.full_waits = 0
+        # Optional liveness check so a dead consumer cannot hang the producer
+        self.consumer_alive = None
+        # Producer and consumer each cache their own index
+        self._head = _CTRL.unpack_from(self.buf, 0)[0]
+        self._tail = _CTRL.unpack_from(self.buf, 0)[1]
+
+    def put(self, kind: int, rd: int = 0, flags: int = 0, addr: int = 0, data: int = 0,
+            value: int = 0, mem_addr: int = 0, mem_value: int = 0):
+        """Append one record, waiting for the consumer if the ring is full"""
+        head = self._head
+        if head - struct.unpack_from("<Q", self.buf, 8)[0] >= self.capacity:
+            self.full_waits += 1
+            while head - struct.unpack_from("<Q", self.buf, 8)[0] >= self.capacity:
+                if self.consumer_alive is not None and not self.consumer_alive():
+                    raise RuntimeError("Checker process exited with the transaction ring full")
+                time.sleep(0.0001)
+        offset = _CTRL_SIZE + (head % self.capacity) * TXN_SIZE
+        _TXN.pack_into(self.buf, offset, kind, rd, flags, addr & MASK32, data & MASK32,
+                       value & MASK32, mem_addr & MASK32, mem_value & MASK32)
+        self._head = head + 1
+        struct.pack_into("<Q", self.buf, 0, self._head)
+
+    def drain(self, limit: int = 4096) -> List[tuple]:
+        """Pop up to limit records"""
+        head = struct.unpack_from("<Q", self.buf, 0)[0]
+        count = min(head - self._tail, limit)
+        records = []
+        for i in range(count):
+            offset = _CTRL_SIZE + ((self._tail + i) % self.capacity) * TXN_SIZE
+            records.append(_TXN.unpack_from(self.buf, offset))
+        self._tail += count
+        struct.pack_into("<Q", self.buf, 8, self._tail)
+        return records
+
+    @property
+    def closed(self) -> bool:
+        return bool(_CTRL.unpack_from(self.buf, 0)[3])
+
+    def mark_closed(self):
+        struct.pack_into("<I", self.buf, 20, 1)
+
+    def release(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment; only the creating side unlinks it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 the spawned child shares the parent's resource
+        # tracker, which already owns this segment
+        return shared_memory.SharedMemory(name=name)
+
+
+class ReferenceChecker:
+    """Replays the transaction stream against the ISS and collects mismatches"""
+
+    def __init__(self, max_reports: int = 100):
+        self.iss = RV32ISS()
+        self.fetched: Dict[int, int] = {}
+        self.known_words: Set[int] = set()
+        self.synced = False
+        self.checked = 0
+        self.mismatch_count = 0
+        self.max_reports = max_reports
+        self.reports: List[Dict[str, Any]] = []
+
+    def process(self, txn: tuple):
+        kind, rd, flags, addr, data, value, mem_addr, mem_value = txn
+        if kind == TXN_FETCH:
+            self.fetched[addr] = data
+        elif kind == TXN_MEM:
+            # Seed the model with data memory contents the first time they are read
+            word = addr & ~3
+            if flags & MEM_READ and word not in self.known_words:
+                self.iss.memory.store(word, 4, mem_value)
+                self.known_words.add(word)
+        elif kind == TXN_COMMIT:
+            self._commit(CommitRecord(
+                pc=addr, insn=data,
+                rd=rd if flags & COMMIT_RD else None, rd_value=value,
+                mem_addr=mem_addr if flags & COMMIT_MEM_ADDR else None,
+                mem_value=mem_value if flags & COMMIT_MEM_VALUE else None,
+            ).normalized())
+
+    def _commit(self, actual: CommitRecord):
+        if not self.synced:
+            self.iss.pc = actual.pc
+            self.synced = True
+        self.checked += 1
+
+        if actual.pc != self.iss.pc:
+            self._report(actual, "pc", self.iss.pc, actual.pc)
+            self.iss.pc = actual.pc
+        fetched = self.fetched.get(actual.pc)
+        if fetched is not None and fetched != actual.insn:
+            self._report(actual, "instruction", fetched, actual.insn)
+
+        try:
+            expected = self.iss.step(actual.insn).normalized()
+        except IllegalInstruction:
+            self._report(actual, "illegal instruction", None, actual.insn)
+            self.iss.pc = (actual.pc + 4) & MASK32
+            return
+
+        if expected.rd != actual.rd or (expected.rd is not None and expected.rd_value != actual.rd_value):
+            self._report(actual, "register write",
+                         None if expected.rd is None else (expected.rd, expected.rd_value),
+                         None if actual.rd is None else (actual.rd, actual.rd_value))
+            if actual.rd is not None:
+                # Follow the DUT so one bad result does not cascade
+                self.iss.regs[actual.rd] = actual.rd_value
+        if expected.mem_write and (expected.mem_addr, expected.mem_value) != (actual.mem_addr, actual.mem_value):
+            self._report(actual, "store", (expected.mem_addr, expected.mem_value),
+                         (actual.mem_addr, actual.mem_value))
+        if expected.mem_write:
+            self.known_words.add(expected.mem_addr & ~3)
+
+    def _report(self, record: CommitRecord, field: str, expected: Any, actual: Any):
+        self.mismatch_count += 1
+        if len(self.reports) < self.max_reports:
+            self.reports.append({
+                "commit": self.checked - 1,
+                "pc": record.pc,
+                "insn": record.insn,
+                "field": field,
+                "expected": expected,
+                "actual": actual,
+            })
+
+
+def _checker_main(ring_name: str, results, max_reports: int):
+    """Checker process entry point"""
+    ring = TransactionRing(name=ring_name)
+    checker = ReferenceChecker(max_reports)
+    sent = 0
+    try:
+        while True:
+            closed = ring.closed
+            batch = ring.drain()
+            for txn in batch:
+                checker.process(txn)
+            while sent < len(checker.reports):
+                results.put(("mismatch", checker.reports[sent]))
+                sent += 1
+            if not batch:
+                if closed:
+                    break
+                time.sleep(0.001)
+    finally:
+        results.put(("summary", {"checked": checker.checked, "mismatches": checker.mismatch_count}))
+        ring.release()
+
+
+class RemoteScoreboard:
+    """Simulator-side handle for the out-of-process checker"""
+
+    def __init__(self, capacity: int = 1 << 16, max_reports: int = 100):
+        self.capacity = capacity
+        self.max_reports = max_reports
+        self.ring: Optional[TransactionRing] = None
+        self.process = None
+        self.results = None
+        self.mismatches: List[Dict[str, Any]] = []
+        self.summary: Optional[Dict[str, int]] = None
+
+    def start(self):
+        # Fork is unsafe inside a simulator process, and sys.executable may
+        # be the simulator itself, so spawn a plain Python interpreter
+        ctx = multiprocessing.get_context("spawn")
+        python = os.environ.get("PYTHON_BIN") or shutil.which("python3") or sys.executable
+        ctx.set_executable(python)
+        self.ring = TransactionRing(self.capacity)
+        self.results = ctx.Queue()
+        self.process = ctx.Process(target=_checker_main,
+                                   args=(self.ring.name, self.results, self.max_reports),
+                                   daemon=True)
+        self.process.start()
+        self.ring.consumer_alive = self.process.is_alive
+
+    def send_fetch(self, pc: int, insn: int):
+        self.ring.put(TXN_FETCH, addr=pc, data=insn)
+
+    def send_memory(self, addr: int, write_data: int, read_data: int, read: bool, write: bool):
+        flags = (MEM_READ if read else 0) | (MEM_WRITE if write else 0)
+        self.ring.put(TXN_MEM, flags=flags, addr=addr, value=write_data, mem_value=read_data)
+
+    def send_commit(self, record: CommitRecord):
+        flags = 0
+        if record.rd is not None:
+            flags |= COMMIT_RD
+        if record.mem_addr is not None:
+            flags |= COMMIT_MEM_ADDR
+        if record.mem_value is not None:
+            flags |= COMMIT_MEM_VALUE
+        self.ring.put(TXN_COMMIT, rd=record.rd or 0, flags=flags, addr=record.pc, data=record.insn,
+                      value=record.rd_value, mem_addr=record.mem_addr or 0, mem_value=record.mem_value or 0)
+
+    def poll(self) -> List[Dict[str, Any]]:
+        """Collect any mismatches reported since the last poll without blocking"""
+        new = []
+        while self.results is not None and not self.results.empty():
+            try:
+                kind, payload = self.results.get_nowait()
+            except Exception:
+                break
+            if kind == "mismatch":
+                new.append(payload)
+            else:
+                self.summary = payload
+        self.mismatches.extend(new)
+        return new
+
+    def close(self, timeout: float = 60.0) -> Optional[Dict[str, int]]:
+        """Let the checker drain the ring, then return its summary"""
+        if self.process is None:
+            return self.summary
+        self.ring.mark_closed()
+        deadline = time.monotonic() + timeout
+        while self.summary is None and time.monotonic() < deadline:
+            self.poll()
+            time.sleep(0.01)
+        self.process.join(max(0.0, deadline - time.monotonic()))
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.release()
+        self.process = None
+        return self.summary
+
+
+def format_mismatch(report: Dict[str, Any]) -> str:
+    def fmt(value):
+        if isinstance(value, tuple):
+            return "(" + ", ".join("None" if v is None else f"0x{v:08x}" for v in value) + ")"
+        return "None" if value is None else f"0x{value:08x}"
+    return (f"commit #{report['commit']} PC 0x{report['pc']:08x} (0x{report['insn']:08x}): "
+            f"{report['field']} expected {fmt(report['expected'])}, got {fmt(report['actual'])}")
@@ -0,0 +1,644 @@
+"""
+Two-pass RV32IMA assembler for test programs
+
+Turns assembly text with labels into instruction and data images so
+testbenches no longer have to hand-encode instructions and branch offsets:
+
+    program = assemble('''
+        la   a0, buf
+        li   t0, 0x12345678
+        sw   t0, 0(a0)
+    loop:
+        j    loop
+        .data
+    buf: .word 0
+    ''')
+    imem.load_program(program.text, program.text_base)
+
+Supported input:
+
+* all RV32I, M and A instructions (`amo*.w` may carry .aq/.rl/.aqrl suffixes),
+  with memory operands written as `offset(reg)`;
+* pseudo-instructions nop, li, la, mv, not, neg, seqz, snez, beqz, bnez,
+  blez, bgez, bltz, bgtz, bgt, ble, bgtu, bleu, j, jr, ret, call, tail;
+* directives .text, .data, .org, .align/.balign, .word, .half, .byte,
+  .space/.zero, .ascii, .asciz/.string, .equ/.set, .globl (ignored);
+* Python-style integer expressions over symbols and `.` (the current
+  address), with %hi() and %lo().
+
+`call` and `tail` are a single JAL, which reaches the whole of cpu_top's
+instruction memory. Pass one lays out every section and collects symbols;
+pass two encodes. Finished images are cached by a hash of the source and
+layout, in memory and, if ASM_CACHE_DIR is set, on disk.
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_TEXT_BASE = 0x4C
+DEFAULT_DATA_BASE = 0x800
+MASK32 = 0xFFFFFFFF
+NOP = 0x00000013
+
+_ABI = ["zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2", "s0", "s1"] \
+    + [f"a{i}" for i in range(8)] + [f"s{i}" for i in range(2, 12)] + ["t3", "t4", "t5", "t6"]
+REGISTERS: Dict[str, int] = {name: i for i, name in enumerate(_ABI)}
+REGISTERS.update({f"x{i}": i for i in range(32)})
+REGISTERS["fp"] = 8
+
+CSRS = {
+    "mstatus": 0x300, "misa": 0x301, "mie": 0x304, "mtvec": 0x305, "mscratch": 0x340,
+    "mepc": 0x341, "mcause": 0x342, "mtval": 0x343, "mip": 0x344,
+    "cycle": 0xC00, "time": 0xC01, "instret": 0xC02, "cycleh": 0xC80, "instreth": 0xC82,
+    "mcycle": 0xB00, "minstret": 0xB02, "mhartid": 0xF14,
+}
+
+# R-type: (funct3, funct7)
+_R = {
+    "add": (0, 0x00), "sub": (0, 0x20), "sll": (1, 0x00), "slt": (2, 0x00),
+    "sltu": (3, 0x00), "xor": (4, 0x00), "srl": (5, 0x00), "sra": (5, 0x20),
+    "or": (6, 0x00), "and": (7, 0x00),
+    "mul": (0, 0x01), "mulh": (1, 0x01), "mulhsu": (2, 0x01), "mulhu": (3, 0x01),
+    "div": (4, 0x01), "divu": (5, 0x01), "rem": (6, 0x01), "remu": (7, 0x01),
+}
+_I = {"addi": 0, "slti": 2, "sltiu": 3, "xori": 4, "ori": 6, "andi": 7}
+_SHIFT = {"slli": (1, 0x00), "srli": (5, 0x00), "srai": (5, 0x20)}
+_LOAD = {"lb": 0, "lh": 1, "lw": 2, "lbu": 4, "lhu": 5}
+_STORE = {"sb": 0, "sh": 1, "sw": 2}
+_BRANCH = {"beq": 0, "bne": 1, "blt": 4, "bge": 5, "bltu": 6, "bgeu": 7}
+_CSR = {"csrrw": 1, "csrrs": 2, "csrrc": 3, "csrrwi": 5, "csrrsi": 6, "csrrci": 7}
+_AMO = {
+    "lr.w": 0x02, "sc.w": 0x03, "amoswap.w": 0x01, "amoadd.w": 0x00, "amoxor.w": 0x04,
+    "amoand.w": 0x0C, "amoor.w": 0x08, "amomin.w": 0x10, "amomax.w": 0x14,
+    "amominu.w": 0x18, "amomaxu.w": 0x1C,
+}
+# Ordering suffix of an A instruction -> aq/rl bits
+_AQRL = {"": 0, ".aq": 2, ".rl": 1, ".aqrl": 3}
+# Branches against zero: (real mnemonic, whether x0 is rs1 rather than rs2)
+_BRANCH_PSEUDO = {
+    "beqz": ("beq", False), "bnez": ("bne", False),
+    "blez": ("bge", True), "bgez": ("bge", False),
+    "bltz": ("blt", False), "bgtz": ("blt", True),
+}
+_BRANCH_SWAP = {"bgt": "blt", "ble": "bge", "bgtu": "bltu", "bleu": "bgeu"}
+
+_MEM_OPERAND = re.compile(r"^(.*)\(\s*([A-Za-z0-9]+)\s*\)$")
+_LABEL = re.compile(r"^\s*([A-Za-z_]\w*)\s*:")
+_DOT = re.compile(r"(?<![\w.])\.(?![\w.])")
+_RELOC = re.compile(r"%(hi|lo)\(")
+_NUMBER = re.compile(r"^-?(0[xX][0-9a-fA-F]+|0[bB][01]+|0[oO][0-7]+|[1-9][0-9]*|0)$")
+
+
+class AssemblerError(Exception):
+    """Raised for malformed source, with the offending line attached"""
+
+    def __init__(self, message: str, lineno: Optional[int] = None, line: str = ""):
+        where = f"line {lineno}: " if lineno else ""
+        super().__init__(f"{where}{message}" + (f"\n    {line.strip()}" if line else ""))
+        self.lineno = lineno
+
+
+@dataclass
+class Program:
+    """Assembled images; data is word-addressed to match the memory models"""
+    text: List[int]
+    text_base: int
+    data: Dict[int, int] = field(default_factory=dict)
+    symbols: Dict[str, int] = field(default_factory=dict)
+
+    def address(self, symbol: str) -> int:
+        return self.symbols[symbol]
+
+    def to_dict(self) -> Dict:
+        return {
+            "text": self.text,
+            "text_base": self.text_base,
+            "data": {str(k): v for k, v in self.data.items()},
+            "symbols": self.symbols,
+        }
+
+    @classmethod
+    def from_dict(cls, values: Dict) -> "Program":
+        return cls(values["text"], values["text_base"],
+                   {int(k): v for k, v in values["data"].items()}, values["symbols"])
+
+
+@dataclass
+class _Statement:
+    section: str
+    addr: int
+    size: int
+    mnemonic: str
+    operands: List[str]
+    lineno: int
+    line: str
+
+
+class _Section:
+    def __init__(self, base: int, end: int):
+        self.base = base
+        self.image = bytearray(max(end - base, 0))
+
+    def put(self, addr: int, payload: bytes):
+        offset = addr - self.base
+        if offset < 0:
+            raise ValueError(f"address 0x{addr:x} is below the section base 0x{self.base:x}")
+        self.image[offset:offset + len(payload)] = payload
+
+
+def _split_operands(text: str) -> List[str]:
+    """Split on commas outside parentheses and quotes"""
+    if "(" not in text and '"' not in text and "'" not in text:
+        return [part.strip() for part in text.split(",") if part.strip()]
+    parts, depth, quote, current = [], 0, None, ""
+    for ch in text:
+        if quote:
+            current += ch
+            if ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+            current += ch
+        elif ch == "(":
+            depth += 1
+            current += ch
+        elif ch == ")":
+            depth -= 1
+            current += ch
+        elif ch == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _strip_comment(line: str) -> str:
+    if '"' not in line and "'" not in line:
+        end = line.find("#")
+        slashes = line.find("//")
+        if slashes >= 0 and (end < 0 or slashes < end):
+            end = slashes
+        return line if end < 0 else line[:end]
+    quote = None
+    for i, ch in enumerate(line):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch == "#" or line.startswith("//", i):
+            return line[:i]
+    return line
+
+
+def _hi(value: int) -> int:
+    return ((value + 0x800) >> 12) & 0xFFFFF
+
+
+def _lo(value: int) -> int:
+    low = value & 0xFFF
+    return low - 0x1000 if low & 0x800 else low
+
+
+class _Evaluator:
+    _BINOPS = {
+        ast.Add: lambda a, b: a + b, ast.Sub: lambda a, b: a - b,
+        ast.Mult: lambda a, b: a * b, ast.FloorDiv: lambda a, b: a // b,
+        ast.Mod: lambda a, b: a % b, ast.LShift: lambda a, b: a << b,
+        ast.RShift: lambda a, b: a >> b, ast.BitOr: lambda a, b: a | b,
+        ast.BitAnd: lambda a, b: a & b, ast.BitXor: lambda a, b: a ^ b,
+    }
+
+    def __init__(self, symbols: Dict[str, int]):
+        self.symbols = symbols
+        self.dot = 0  # Address of the statement being assembled
+        self._trees: Dict[str, ast.AST] = {}
+
+    def __call__(self, text: str) -> int:
+        text = text.strip()
+        # Fast paths for the common cases: plain numbers and symbols
+        if _NUMBER.match(text):
+            return int(text, 0)
+        if text in self.symbols:
+            return self.symbols[text]
+        tree = self._trees.get(text)
+        if tree is None:
+            source = _RELOC.sub(lambda m: f"__{m.group(1)}__(", text)
+            source = _DOT.sub("__dot__", source)
+            try:
+                tree = self._trees[text] = ast.parse(source, mode="eval").body
+            except SyntaxError:
+                raise ValueError(f"bad expression '{text}'")
+        return self._eval(tree)
+
+    def _eval(self, node) -> int:
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, int):
+                return node.value
+            if isinstance(node.value, str) and len(node.value) == 1:
+                return ord(node.value)
+        elif isinstance(node, ast.Name):
+            if node.id == "__dot__":
+                return self.dot
+            if node.id in self.symbols:
+                return self.symbols[node.id]
+            raise KeyError(node.id)
+        elif isinstance(node, ast.BinOp) and type(node.op) in self._BINOPS:
+            return self._BINOPS[type(node.op)](self._eval(node.left), self._eval(node.right))
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd, ast.Invert)):
+            value = self._eval(node.operand)
+            return -value if isinstance(node.op, ast.USub) else ~value if isinstance(node.op, ast.Invert) else value
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and len(node.args) == 1:
+            if node.func.id == "__hi__":
+                return _hi(self._eval(node.args[0]))
+            if node.func.id == "__lo__":
+                return _lo(self._eval(node.args[0]))
+        raise ValueError(f"unsupported expression '{ast.unparse(node)}'")
+
+
+class Assembler:
+    """Assembles one source text; use assemble() for the cached entry point"""
+
+    def __init__(self, text_base: int = DEFAULT_TEXT_BASE, data_base: int = DEFAULT_DATA_BASE):
+        self.text_base = text_base
+        self.data_base = data_base
+        self.symbols: Dict[str, int] = {}
+        self._eval = _Evaluator(self.symbols)
+        self._statements: List[_Statement] = []
+
+    def assemble(self, source: str) -> Program:
+        self._layout(source)
+        ends = {"text": self.text_base, "data": self.data_base}
+        for st in self._statements:
+            ends[st.section] = max(ends[st.section], st.addr + st.size)
+        sections = {"text": _Section(self.text_base, ends["text"]),
+                    "data": _Section(self.data_base, ends["data"])}
+        for st in self._statements:
+            self._eval.dot = st.addr
+            try:
+                payload = self._encode(st)
+                sections[st.section].put(st.addr, payload)
+            except AssemblerError:
+                raise
+            except KeyError as e:
+                raise AssemblerError(f"undefined symbol {e}", st.lineno, st.line)
+            except ValueError as e:
+                raise AssemblerError(str(e), st.lineno, st.line)
+            except IndexError:
+                raise AssemblerError("missing operand", st.lineno, st.line)
+
+        text = sections["text"].image
+        if len(text) % 4:
+            text.extend(bytes(4 - len(text) % 4))
+        words = [int.from_bytes(text[i:i + 4], "little") for i in range(0, len(text), 4)]
+        data_image = sections["data"].image
+        data = {}
+        for i in range(0, len(data_image), 4):
+            chunk = data_image[i:i + 4]
+            data[self.data_base + i] = int.from_bytes(chunk.ljust(4, b"\0"), "little")
+        return Program(words, self.text_base, data, dict(self.symbols))
+
+    # Pass one: sizes, addresses and symbols
+
+    def _layout(self, source: str):
+        locs = {"text": self.text_base, "data": self.data_base}
+        section = "text"
+        for lineno, raw in enumerate(source.splitlines(), 1):
+            line = _strip_comment(raw).strip()
+            while True:
+                match = _LABEL.match(line)
+                if not match:
+                    break
+                name = match.group(1)
+                if name in self.symbols:
+                    raise AssemblerError(f"duplicate symbol '{name}'", lineno, raw)
+                self.symbols[name] = locs[section]
+                line = line[match.end():].strip()
+            if not line:
+                continue
+            parts = line.split(None, 1)
+            mnemonic = parts[0].lower()
+            operands = _split_operands(parts[1]) if len(parts) > 1 else []
+            self._eval.dot = locs[section]
+            try:
+                if mnemonic in (".text", ".data"):
+                    section = mnemonic[1:]
+                    continue
+                if mnemonic == ".section":
+                    section = "data" if operands and (".data" in operands[0] or ".bss" in operands[0]) else "text"
+                    continue
+                if mnemonic in (".globl", ".global", ".type", ".size", ".option", ".file"):
+                    continue
+                if mnemonic in (".equ", ".set"):
+                    self.symbols[operands[0]] = self._eval(operands[1])
+                    continue
+                if mnemonic == ".org":
+                    locs[section] = self._eval(operands[0])
+                    continue
+                size = self._size(mnemonic, operands, locs[section])
+            except AssemblerError:
+                raise
+            except KeyError as e:
+                raise AssemblerError(f"symbol {e} must be defined before use here", lineno, raw)
+            except ValueError as e:
+                raise AssemblerError(str(e), lineno, raw)
+            except IndexError:
+                raise AssemblerError("missing operand", lineno, raw)
+            if section == "text" and not mnemonic.startswith(".") and locs[section] % 4:
+                raise AssemblerError("instruction is not word aligned", lineno, raw)
+            self._statements.append(_Statement(section, locs[section], size, mnemonic, operands, lineno, raw))
+            locs[section] += size
+
+    def _size(self, mnemonic: str, operands: List[str], loc: int) -> int:
+        if mnemonic in (".align", ".p2align", ".balign"):
+            align = self._eval(operands[0])
+            align = align if mnemonic == ".balign" else 1 << align
+            return -loc % align
+        if mnemonic == ".word":
+            return 4 * len(operands)
+        if mnemonic in (".half", ".short"):
+            return 2 * len(operands)
+        if mnemonic == ".byte":
+            return len(operands)
+        if mnemonic in (".space", ".zero", ".skip"):
+            return self._eval(operands[0])
+        if mnemonic in (".ascii", ".asciz", ".string"):
+            return sum(len(self._string(op)) + (mnemonic != ".ascii") for op in operands)
+        if mnemonic.startswith("."):
+            raise ValueError(f"unknown directive '{mnemonic}'")
+        if mnemonic == "la":
+            return 8
+        if mnemonic == "li":
+            # Constants are sized now; forward references get the long form
+            try:
+                value = self._eval(operands[1])
+            except KeyError:
+                return 8
+            return 4 if -2048 <= _signed(value) < 2048 or _lo(value) == 0 else 8
+        return 4
+
+    @staticmethod
+    def _string(operand: str) -> bytes:
+        value = ast.literal_eval(operand)
+        if not isinstance(value, str):
+            raise ValueError(f"expected a string, got {operand}")
+        return value.encode("latin-1")
+
+    # Pass two: encoding
+
+    def _reg(self, name: str) -> int:
+        try:
+            return REGISTERS[name.strip().lower()]
+        except KeyError:
+            raise ValueError(f"unknown register '{name}'")
+
+    def _imm(self, text: str, bits: int, signed: bool = True) -> int:
+        value = self._eval(text)
+        low, high = (-(1 << (bits - 1)), 1 << (bits - 1)) if signed else (0, 1 << bits)
+        if not low <= value < high:
+            raise ValueError(f"immediate {value} does not fit in {bits} bits")
+        return value & ((1 << bits) - 1)
+
+    def _mem(self, operand: str) -> Tuple[str, int]:
+        match = _MEM_OPERAND.match(operand.strip())
+        if not match or match.group(2).lower() not in REGISTERS:
+            raise ValueError(f"expected offset(reg), got '{operand}'")
+        return match.group(1).strip() or "0", self._reg(match.group(2))
+
+    def _offset(self, target: str, pc: int, bits: int) -> int:
+        offset = self._eval(target) - pc
+        if offset % 2:
+            raise ValueError(f"branch target {target} is not 2-byte aligned")
+        if not -(1 << (bits - 1)) <= offset < (1 << (bits - 1)):
+            raise ValueError(f"branch target {target} is out of range ({offset:+d} bytes)")
+        return offset
+
+    def _encode(self, st: _Statement) -> bytes:
+        m, ops = st.mnemonic, st.operands
+        if m.startswith("."):
+            return self._directive(st)
+        words = self._instruction(m, ops, st.addr, st.size)
+        if 4 * len(words) != st.size:
+            raise AssemblerError("instruction size changed between passes", st.lineno, st.line)
+        return b"".join((w & MASK32).to_bytes(4, "little") for w in words)
+
+    def _directive(self, st: _Statement) -> bytes:
+        m, ops = st.mnemonic, st.operands
+        if m in (".align", ".p2align", ".balign"):
+            if st.section == "text" and st.size % 4 == 0:
+                return NOP.to_bytes(4, "little") * (st.size // 4)
+            return bytes(st.size)
+        if m in (".word", ".half", ".short", ".byte"):
+            width = {".word": 4, ".half": 2, ".short": 2, ".byte": 1}[m]
+            mask = (1 << (8 * width)) - 1
+            return b"".join((self._eval(op) & mask).to_bytes(width, "little") for op in ops)
+        if m in (".space", ".zero", ".skip"):
+            fill = self._eval(ops[1]) & 0xFF if len(ops) > 1 else 0
+            return bytes([fill]) * st.size
+        return b"".join(self._string(op) + (b"\0" if m != ".ascii" else b"") for op in ops)
+
+    def _instruction(self, m: str, ops: List[str], pc: int, size: int) -> List[int]:
+        r = self._reg
+        if m in _R:
+            funct3, funct7 = _R[m]
+            return [_r_type(0x33, r(ops[0]), funct3, r(ops[1]), r(ops[2]), funct7)]
+        if m in _I:
+            return [_i_type(0x13, r(ops[0]), _I[m], r(ops[1]), self._imm(ops[2], 12))]
+        if m in _SHIFT:
+            funct3, funct7 = _SHIFT[m]
+            return [_r_type(0x13, r(ops[0]), funct3, r(ops[1]), self._imm(ops[2], 5, False), funct7)]
+        if m in _LOAD:
+            offset, base = self._mem(ops[1])
+            return [_i_type(0x03, r(ops[0]), _LOAD[m], base, self._imm(offset, 12))]
+        if m in _STORE:
+            offset, base = self._mem(ops[1])
+            return [_s_type(_STORE[m], base, r(ops[0]), self._imm(offset, 12))]
+        if m in _BRANCH:
+            return [_b_type(_BRANCH[m], r(ops[0]), r(ops[1]), self._offset(ops[2], pc, 13))]
+        if m in _BRANCH_SWAP:
+            return [_b_type(_BRANCH[_BRANCH_SWAP[m]], r(ops[1]), r(ops[0]), self._offset(ops[2], pc, 13))]
+        if m in _BRANCH_PSEUDO:
+            real, swap = _BRANCH_PSEUDO[m]
+            rs1, rs2 = (0, r(ops[0])) if swap else (r(ops[0]), 0)
+            return [_b_type(_BRANCH[real], rs1, rs2, self._offset(ops[1], pc, 13))]
+        if m == "lui":
+            return [(self._imm(ops[1], 20, False) << 12) | (r(ops[0]) << 7) | 0x37]
+        if m == "auipc":
+            return [(self._imm(ops[1], 20, False) << 12) | (r(ops[0]) << 7) | 0x17]
+        if m == "jal":
+            rd, target = (r(ops[0]), ops[1]) if len(ops) == 2 else (1, ops[0])
+            return [_j_type(rd, self._offset(target, pc, 21))]
+        if m == "jalr":
+            if len(ops) == 1:
+                return [_i_type(0x67, 1, 0, r(ops[0]), 0)]
+            if len(ops) == 2:
+                offset, base = self._mem(ops[1])
+                return [_i_type(0x67, r(ops[0]), 0, base, self._imm(offset, 12))]
+            return [_i_type(0x67, r(ops[0]), 0, r(ops[1]), self._imm(ops[2], 12))]
+        if m in _CSR:
+            csr = CSRS.get(ops[1].lower())
+            csr = csr if csr is not None else self._imm(ops[1], 12, False)
+            src = self._imm(ops[2], 5, False) if m.endswith("i") else r(ops[2])
+            return [_i_type(0x73, r(ops[0]), _CSR[m], src, csr)]
+        split = m.find(".w") + 2
+        base, suffix = m[:split], m[split:]
+        if base in _AMO and suffix in _AQRL:
+            funct5, aqrl = _AMO[base], _AQRL[suffix]
+            if base == "lr.w":
+                rs1, rs2 = self._mem(ops[1])[1], 0
+            else:
+                rs1, rs2 = self._mem(ops[2])[1], r(ops[1])
+            return [_r_type(0x2F, r(ops[0]), 0b010, rs1, rs2, (funct5 << 2) | aqrl)]
+        return self._pseudo(m, ops, pc, size)
+
+    def _pseudo(self, m: str, ops: List[str], pc: int, size: int) -> List[int]:
+        r = self._reg
+        if m == "nop":
+            return [NOP]
+        if m == "li":
+            rd, value = r(ops[0]), self._eval(ops[1]) & MASK32
+            if size == 4 and -2048 <= _signed(value) < 2048:
+                return [_i_type(0x13, rd, 0, 0, value & 0xFFF)]
+            if size == 4:
+                return [(value & 0xFFFFF000) | (rd << 7) | 0x37]
+            return [(_hi(value) << 12) | (rd << 7) | 0x37, _i_type(0x13, rd, 0, rd, _lo(value) & 0xFFF)]
+        if m == "la":
+            rd, offset = r(ops[0]), (self._eval(ops[1]) - pc) & MASK32
+            return [(_hi(offset) << 12) | (rd << 7) | 0x17, _i_type(0x13, rd, 0, rd, _lo(offset) & 0xFFF)]
+        if m == "mv":
+            return [_i_type(0x13, r(ops[0]), 0, r(ops[1]), 0)]
+        if m == "not":
+            return [_i_type(0x13, r(ops[0]), 4, r(ops[1]), 0xFFF)]
+        if m == "neg":
+            return [_r_type(0x33, r(ops[0]), 0, 0, r(ops[1]), 0x20)]
+        if m == "seqz":
+            return [_i_type(0x13, r(ops[0]), 3, r(ops[1]), 1)]
+        if m == "snez":
+            return [_r_type(0x33, r(ops[0]), 3, 0, r(ops[1]), 0)]
+        if m == "j":
+            return [_j_type(0, self._offset(ops[0], pc, 21))]
+        if m == "call":
+            return [_j_type(1, self._offset(ops[0], pc, 21))]
+        if m == "tail":
+            return [_j_type(0, self._offset(ops[0], pc, 21))]
+        if m == "jr":
+            return [_i_type(0x67, 0, 0, r(ops[0]), 0)]
+        if m == "ret":
+            return [_i_type(0x67, 0, 0, 1, 0)]
+        if m == "fence":
+            return [0x0FF0000F]
+        if m == "ecall":
+            return [0x00000073]
+        if m == "ebreak":
+            return [0x00100073]
+        raise ValueError(f"unknown instruction '{m}'")
+
+
+def _signed(value: int) -> int:
+    value &= MASK32
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def _r_type(opcode, rd, funct3, rs1, rs2, funct7):
+    return (funct7 << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+
+def _i_type(opcode, rd, funct3, rs1, imm):
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+
+def _s_type(funct3, rs1, rs2, imm):
+    return (((imm >> 5) & 0x7F) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) \
+        | ((imm & 0x1F) << 7) | 0x23
+
+
+def _b_type(funct3, rs1, rs2, offset):
+    return ((((offset >> 12) & 1) << 31) | (((offset >> 5) & 0x3F) << 25) | (rs2 << 20) | (rs1 << 15)
+            | (funct3 << 12) | (((offset >> 1) & 0xF) << 8) | (((offset >> 11) & 1) << 7) | 0x63)
+
+
+def _j_type(rd, offset):
+    return ((((offset >> 20) & 1) << 31) | (((offset >> 1) & 0x3FF) << 21)
+            | (((offset >> 11) & 1) << 20) | (((offset >> 12) & 0xFF) << 12) | (rd << 7) | 0x6F)
+
+
+_CACHE: Dict[str, Program] = {}
+
+
+def source_hash(source: str, text_base: int = DEFAULT_TEXT_BASE, data_base: int = DEFAULT_DATA_BASE) -> str:
+    digest = hashlib.sha256(f"{text_base:x}:{data_base:x}\n".encode())
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+
+def assemble(source: str, text_base: int = DEFAULT_TEXT_BASE, data_base: int = DEFAULT_DATA_BASE,
+             cache: bool = True) -> Program:
+    """Assemble source, reusing a cached image when the same source was seen before
+
+    Cached Program objects are shared, so callers should not modify them.
+    """
+    key = source_hash(source, text_base, data_base)
+    if cache and key in _CACHE:
+        return _CACHE[key]
+
+    cache_dir = os.environ.get("ASM_CACHE_DIR") if cache else None
+    path = os.path.join(cache_dir, key + ".json") if cache_dir else None
+    if path and os.path.exists(path):
+        with open(path) as f:
+            program = Program.from_dict(json.load(f))
+    else:
+        program = Assembler(text_base, data_base).assemble(source)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(program.to_dict(), f)
+            os.replace(path + ".tmp", path)
+    if cache:
+        _CACHE[key] = program
+    return program
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assemble RV32IMA test programs")
+    parser.add_argument("source")
+    parser.add_argument("-o", "--output", help="text image, one hex word per line ($readmemh format)")
+    parser.add_argument("--data", help="data image, one hex word per line")
+    parser.add_argument("--text-base", type=lambda v: int(v, 0), default=DEFAULT_TEXT_BASE)
+    parser.add_argument("--data-base", type=lambda v: int(v, 0), default=DEFAULT_DATA_BASE)
+    parser.add_argument("--symbols", action="store_true", help="print the symbol table")
+    args = parser.parse_args(argv)
+
+    with open(args.source) as f:
+        try:
+            program = assemble(f.read(), args.text_base, args.data_base)
+        except AssemblerError as e:
+            print(f"{args.source}: {e}", file=sys.stderr)
+            return 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(f"@{args.text_base // 4:08x}\n")
+            f.writelines(f"{w:08x}\n" for w in program.text)
+    if args.data:
+        with open(args.data, "w") as f:
+            f.write(f"@{args.data_base // 4:08x}\n")
+            f.writelines(f"{program.data[a]:08x}\n" for a in sorted(program.data))
+    if args.symbols or not (args.output or args.data):
+        for name, addr in sorted(program.symbols.items(), key=lambda kv: kv[1]):
+            print(f"{addr:08x} {name}")
+        print(f"{len(program.text)} text words, {len(program.data)} data words")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
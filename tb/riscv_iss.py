@@ -0,0 +1,283 @@
+"""
+RV32IMA instruction set simulator used as a reference model
+
+Executes one instruction per step() call and reports what it did as a
+CommitRecord, so results can be compared directly against the commit
+stream produced by the RTL retirement monitor.
+"""
+
+from typing import Dict, Iterable, Optional
+
+from commit_log import CommitRecord
+
+MASK32 = 0xFFFFFFFF
+PAGE_SIZE = 4096
+
+
+class IllegalInstruction(Exception):
+    """Raised when the ISS cannot decode an instruction"""
+
+    def __init__(self, pc: int, insn: int):
+        super().__init__(f"Illegal instruction 0x{insn:08x} at PC 0x{pc:08x}")
+        self.pc = pc
+        self.insn = insn
+
+
+def _signed(value: int) -> int:
+    value &= MASK32
+    return value - (1 << 32) if value & 0x80000000 else value
+
+
+def _sext(value: int, bits: int) -> int:
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+
+class SparseMemory:
+    """Byte-addressable little-endian memory backed by 4 KB pages"""
+
+    def __init__(self):
+        self.pages: Dict[int, bytearray] = {}
+
+    def _page(self, addr: int) -> bytearray:
+        page = self.pages.get(addr // PAGE_SIZE)
+        if page is None:
+            page = self.pages[addr // PAGE_SIZE] = bytearray(PAGE_SIZE)
+        return page
+
+    def contains(self, addr: int) -> bool:
+        return (addr & MASK32) // PAGE_SIZE in self.pages
+
+    def load(self, addr: int, size: int) -> int:
+        addr &= MASK32
+        offset = addr % PAGE_SIZE
+        if offset + size <= PAGE_SIZE:
+            return int.from_bytes(self._page(addr)[offset:offset + size], "little")
+        return sum(self.load(addr + i, 1) << (8 * i) for i in range(size))
+
+    def store(self, addr: int, size: int, value: int):
+        addr &= MASK32
+        offset = addr % PAGE_SIZE
+        if offset + size <= PAGE_SIZE:
+            self._page(addr)[offset:offset + size] = (value & ((1 << (8 * size)) - 1)).to_bytes(size, "little")
+        else:
+            for i in range(size):
+                self.store(addr + i, 1, value >> (8 * i))
+
+    def load_words(self, base: int, words: Iterable[int]):
+        for i, word in enumerate(words):
+            self.store(base + 4 * i, 4, word)
+
+
+class RV32ISS:
+    """Functional RV32IMA model
+
+    Only machine mode is modelled; CSR accesses read as zero and ECALL/EBREAK
+    set the halted flag instead of trapping. Pass a separate imem to model
+    cpu_top's split instruction and data memories.
+    """
+
+    def __init__(self, memory: Optional[SparseMemory] = None, pc: int = 0,
+                 imem: Optional[SparseMemory] = None):
+        self.memory = memory if memory is not None else SparseMemory()
+        self.imem = imem if imem is not None else self.memory
+        self.regs = [0] * 32
+        self.pc = pc
+        self.halted = False
+        self.instret = 0
+        self._reservation: Optional[int] = None
+
+    def reset(self, pc: int = 0):
+        self.regs = [0] * 32
+        self.pc = pc
+        self.halted = False
+        self.instret = 0
+        self._reservation = None
+
+    def step(self, insn: Optional[int] = None) -> CommitRecord:
+        """Execute one instruction, fetched from memory unless insn is given"""
+        pc = self.pc
+        if insn is None:
+            insn = self.imem.load(pc, 4)
+        record = CommitRecord(pc=pc, insn=insn)
+        next_pc = (pc + 4) & MASK32
+
+        opcode = insn & 0x7F
+        rd = (insn >> 7) & 0x1F
+        funct3 = (insn >> 12) & 0x7
+        rs1 = (insn >> 15) & 0x1F
+        rs2 = (insn >> 20) & 0x1F
+        funct7 = insn >> 25
+        a = self.regs[rs1]
+        b = self.regs[rs2]
+        result: Optional[int] = None
+
+        if opcode == 0x37:  # LUI
+            result = insn & 0xFFFFF000
+        elif opcode == 0x17:  # AUIPC
+            result = pc + (insn & 0xFFFFF000)
+        elif opcode == 0x6F:  # JAL
+            imm = (((insn >> 31) & 1) << 20) | (((insn >> 12) & 0xFF) << 12) \
+                | (((insn >> 20) & 1) << 11) | (((insn >> 21) & 0x3FF) << 1)
+            result = next_pc
+            next_pc = (pc + _sext(imm, 21)) & MASK32
+        elif opcode == 0x67:  # JALR
+            result = next_pc
+            next_pc = (a + _sext(insn >> 20, 12)) & ~1 & MASK32
+        elif opcode == 0x63:  # Branches
+            imm = (((insn >> 31) & 1) << 12) | (((insn >> 7) & 1) << 11) \
+                | (((insn >> 25) & 0x3F) << 5) | (((insn >> 8) & 0xF) << 1)
+            taken = {
+                0: a == b,
+                1: a != b,
+                4: _signed(a) < _signed(b),
+                5: _signed(a) >= _signed(b),
+                6: a < b,
+                7: a >= b,
+            }.get(funct3)
+            if taken is None:
+                raise IllegalInstruction(pc, insn)
+            if taken:
+                next_pc = (pc + _sext(imm, 13)) & MASK32
+        elif opcode == 0x03:  # Loads
+            addr = (a + _sext(insn >> 20, 12)) & MASK32
+            size = 1 << (funct3 & 3)
+            if funct3 in (3, 6, 7):
+                raise IllegalInstruction(pc, insn)
+            value = self.memory.load(addr, size)
+            result = value if funct3 & 4 or size == 4 else _sext(value, 8 * size) & MASK32
+            record.mem_addr = addr
+            record.mem_size = size
+        elif opcode == 0x23:  # Stores
+            imm = ((insn >> 25) << 5) | ((insn >> 7) & 0x1F)
+            addr = (a + _sext(imm, 12)) & MASK32
+            if funct3 > 2:
+                raise IllegalInstruction(pc, insn)
+            size = 1 << funct3
+            self.memory.store(addr, size, b)
+            record.mem_addr = addr
+            record.mem_value = b & ((1 << (8 * size)) - 1)
+            record.mem_size = size
+        elif opcode == 0x13:  # OP-IMM
+            imm = _sext(insn >> 20, 12)
+            if funct3 == 1:
+                result = a << (rs2)
+            elif funct3 == 5:
+                result = (_signed(a) >> rs2) if funct7 & 0x20 else (a >> rs2)
+            else:
+                result = self._alu(funct3, a, imm & MASK32, False)
+        elif opcode == 0x33:  # OP
+            if funct7 == 0x01:
+                result = self._muldiv(funct3, a, b)
+            elif funct7 in (0x00, 0x20):
+                result = self._alu(funct3, a, b, funct7 == 0x20)
+            else:
+                raise IllegalInstruction(pc, insn)
+        elif opcode == 0x0F:  # FENCE
+            pass
+        elif opcode == 0x73:  # SYSTEM
+            if funct3 == 0:
+                self.halted = True
+            else:
+                result = 0
+        elif opcode == 0x2F and funct3 == 2:  # AMO
+            result = self._atomic(record, funct7 >> 2, a, b)
+        else:
+            raise IllegalInstruction(pc, insn)
+
+        if result is not None:
+            record.rd = rd
+            record.rd_value = result & MASK32 if rd else 0
+            if rd:
+                self.regs[rd] = result & MASK32
+
+        self.pc = next_pc
+        self.instret += 1
+        return record
+
+    def run(self, max_instructions: int) -> int:
+        """Run until halted or max_instructions retire; returns the count"""
+        for count in range(max_instructions):
+            if self.halted:
+                return count
+            self.step()
+        return max_instructions
+
+    @staticmethod
+    def _alu(funct3: int, a: int, b: int, alt: bool) -> int:
+        if funct3 == 0:
+            return a - b if alt else a + b
+        if funct3 == 1:
+            return a << (b & 0x1F)
+        if funct3 == 2:
+            return int(_signed(a) < _signed(b))
+        if funct3 == 3:
+            return int(a < b)
+        if funct3 == 4:
+            return a ^ b
+        if funct3 == 5:
+            return _signed(a) >> (b & 0x1F) if alt else a >> (b & 0x1F)
+        if funct3 == 6:
+            return a | b
+        return a & b
+
+    @staticmethod
+    def _muldiv(funct3: int, a: int, b: int) -> int:
+        sa, sb = _signed(a), _signed(b)
+        if funct3 == 0:
+            return a * b
+        if funct3 == 1:
+            return (sa * sb) >> 32
+        if funct3 == 2:
+            return (sa * b) >> 32
+        if funct3 == 3:
+            return (a * b) >> 32
+        if funct3 == 4:  # DIV
+            if b == 0:
+                return MASK32
+            if sa == -(1 << 31) and sb == -1:
+                return a
+            return int(sa / sb)
+        if funct3 == 5:  # DIVU
+            return a // b if b else MASK32
+        if funct3 == 6:  # REM
+            if b == 0:
+                return a
+            if sa == -(1 << 31) and sb == -1:
+                return 0
+            return sa - sb * int(sa / sb)
+        return a % b if b else a  # REMU
+
+    def _atomic(self, record: CommitRecord, funct5: int, addr: int, b: int) -> int:
+        record.mem_addr = addr
+        if funct5 == 0x02:  # LR.W
+            self._reservation = addr
+            return self.memory.load(addr, 4)
+        if funct5 == 0x03:  # SC.W
+            if self._reservation != addr:
+                self._reservation = None
+                record.mem_addr = None
+                return 1
+            self._reservation = None
+            self.memory.store(addr, 4, b)
+            record.mem_value = b
+            return 0
+
+        old = self.memory.load(addr, 4)
+        ops = {
+            0x00: lambda x, y: x + y,
+            0x01: lambda x, y: y,
+            0x04: lambda x, y: x ^ y,
+            0x08: lambda x, y: x | y,
+            0x0C: lambda x, y: x & y,
+            0x10: lambda x, y: x if _signed(x) < _signed(y) else y,
+            0x14: lambda x, y: x if _signed(x) > _signed(y) else y,
+            0x18: lambda x, y: min(x, y),
+            0x1C: lambda x, y: max(x, y),
+        }
+        if funct5 not in ops:
+            raise IllegalInstruction(record.pc, record.insn)
+        new = ops[funct5](old, b) & MASK32
+        self.memory.store(addr, 4, new)
+        record.mem_value = new
+        return old
@@ -0,0 +1,374 @@
+"""
+Simulation backend for the host controller
+
+SimBackend lets CPUController, AsyncCPUController and the GDB server in
+sw/host_interface drive a cocotb red_pitaya_cpu_wrapper as if it were the
+board. Control and status go over AXI4-Lite, memory and registers through
+the BRAM backdoor. The Makefile puts sw/host_interface on PYTHONPATH.
+
+    cpu = CPUController(SimBackend(dut))
+    await cocotb.external(script)(cpu)
+"""
+
+import logging
+import queue
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import cocotb
+from cocotb.triggers import FallingEdge, RisingEdge
+
+from axi4lite_master import AXI4LiteMaster
+from backdoor import BackdoorLoader
+from controller import (
+    CPU_CTRL_ENABLE,
+    CPU_CTRL_MODE,
+    CPU_CTRL_PC,
+    CPU_CTRL_RESET,
+    CPU_CTRL_STEP,
+    CPU_DEBUG_BP_ADDR,
+    CPU_DEBUG_BP_CTRL,
+    CPU_DEBUG_MEM_ADDR,
+    CPU_DEBUG_MEM_DATA,
+    CPU_DEBUG_REG_SEL,
+    CPU_DEBUG_REG_VAL,
+    CPU_ENABLE_BIT,
+    CPU_MODE_RUN,
+    CPU_MODE_STEP,
+    CPU_REG_COUNT,
+    CPU_RESET_BIT,
+    CPU_STATE_DEBUG,
+    CPU_STATE_HALTED,
+    CPU_STATE_RUNNING,
+    CPU_STATUS_CYCLES,
+    CPU_STATUS_INSTRET,
+    CPU_STATUS_PC,
+    CPU_STATUS_STATE,
+    CTRL_OFFSET,
+    DEBUG_OFFSET,
+    DMEM_OFFSET,
+    DMEM_SIZE,
+    EBREAK,
+    STATUS_OFFSET,
+    Backend,
+    ControllerError,
+)
+from disassembler import decode
+
+logger = logging.getLogger(__name__)
+
+# cpu_regs.h CTRL/STATUS offsets -> red_pitaya_cpu_wrapper AXI registers
+_SIM_ENABLE = 0x000
+_SIM_DEBUG_PC = 0x014
+_SIM_CTRL = {
+    CPU_CTRL_ENABLE: 0x000,
+    CPU_CTRL_RESET: 0x004,
+    CPU_CTRL_STEP: 0x008,
+    CPU_CTRL_PC: 0x00C,
+}
+_SIM_STATUS = {
+    CPU_STATUS_PC: _SIM_DEBUG_PC,
+    CPU_STATUS_CYCLES: 0x018,
+    CPU_STATUS_INSTRET: 0x01C,
+}
+
+
+# Parks the core on a SimBackend trap: jal x0, 0
+SIM_PARK = 0x0000006F
+# Unstalled cycles the fetch PC must stay on a trap to count as halted
+SIM_PARK_CYCLES = 16
+SIM_STEP_TIMEOUT = 1000
+
+
+class SimBackend(Backend):
+    """Backend for a cocotb red_pitaya_cpu_wrapper
+
+    Methods block and must be called from a thread started with
+    cocotb.external; each call hands the access to the scheduler. While
+    serve() runs they are called from plain threads instead, such as the
+    executor of an AsyncCPUController. Control
+    and status offsets the wrapper implements go over AXI4-Lite, IMEM/DMEM
+    and the debug register/memory ports go through the hierarchy in zero
+    time. Anything else reads as zero.
+
+    The wrapper has no halt: its reset is gated by the enable bit, so
+    stop() resets the core, its registers and the cycle/instret counters.
+    Read what you need before stopping. CPU_CTRL_PC lands in cpu_start_pc,
+    which nothing uses, so set_pc() has no effect and the core always
+    starts from its reset vector.
+
+    Breakpoints and single step are emulated with traps: a SIM_PARK jump
+    to itself replaces the instruction at the CPU_DEBUG_BP_ADDR breakpoint,
+    at EBREAKs written to IMEM and at the next PCs of a step. Reads of IMEM
+    return the original words. The core counts as halted (at its PC) once
+    it spins on a trap, with everything before it retired, and enable
+    stays set. In CPU_MODE_STEP, setting enable runs one instruction and
+    clearing it does nothing, which is what CPUController.step() does.
+    """
+
+    poll_interval = 0
+    blocking = True
+
+    def __init__(self, dut, axi=None):
+        self.dut = dut
+        self.axi = axi or AXI4LiteMaster(dut, dut.s_axi_aclk)
+        self.backdoor = BackdoorLoader(dut)
+        self.regs = dut.cpu_core.reg_file.regfile.int_regs
+        self._debug: Dict[int, int] = {}
+        self._mode = CPU_MODE_RUN
+        # Original words under the traps, by IMEM address
+        self._shadow: Dict[int, int] = {}
+        # Traps holding a halted or stepping core
+        self._parks: List[int] = []
+        # Excluded from trapping while a step executes it
+        self._released: Optional[int] = None
+        self._halted_at: Optional[int] = None
+        self._call = cocotb.function(self._access)
+        self._requests: "queue.Queue[Tuple[tuple, Future]]" = queue.Queue()
+        self._serving = False
+
+    async def serve(self):
+        """Run accesses queued by plain threads; start with cocotb.start_soon
+
+        The simulation runs on between requests, as a board would.
+        """
+        self._serving = True
+        try:
+            while True:
+                try:
+                    args, future = self._requests.get_nowait()
+                except queue.Empty:
+                    await RisingEdge(self.dut.s_axi_aclk)
+                    continue
+                try:
+                    future.set_result(await self._access(*args))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            self._serving = False
+
+    def _request(self, *args) -> int:
+        if not self._serving:
+            return self._call(*args)
+        future: Future = Future()
+        self._requests.put((args, future))
+        return future.result()
+
+    async def _access(self, write: bool, offset: int, value: int = 0) -> int:
+        if offset < DMEM_OFFSET:
+            if write:
+                self._write_imem(offset, value)
+                return 0
+            return self._read_imem(offset)
+        if offset < DMEM_OFFSET + DMEM_SIZE:
+            if write:
+                self.backdoor.write_words("dmem", offset - DMEM_OFFSET, [value])
+                return 0
+            return self.backdoor.read_words("dmem", offset - DMEM_OFFSET, 1)[0]
+
+        block, reg = offset & ~0xFFF, offset & 0xFFF
+        if block == CTRL_OFFSET and reg == CPU_CTRL_MODE:
+            if write:
+                self._mode = value
+            return 0 if write else self._mode
+        if block == CTRL_OFFSET and reg == CPU_CTRL_ENABLE and write:
+            await self._set_enable(bool(value & CPU_ENABLE_BIT))
+            return 0
+        if block == CTRL_OFFSET and reg in _SIM_CTRL:
+            if write:
+                if reg == CPU_CTRL_RESET and value & CPU_RESET_BIT:
+                    self._release()
+                await self.axi.write(_SIM_CTRL[reg], value)
+                return 0
+            return (await self.axi.read(_SIM_CTRL[reg]))[0]
+        if block == STATUS_OFFSET and not write:
+            if reg == CPU_STATUS_PC:
+                pc = await self._parked()
+                return pc if pc is not None else (await self.axi.read(_SIM_DEBUG_PC))[0]
+            if reg in _SIM_STATUS:
+                return (await self.axi.read(_SIM_STATUS[reg]))[0]
+            if reg == CPU_STATUS_STATE:
+                if not await self._enabled():
+                    return CPU_STATE_HALTED
+                if await self._parked() is not None:
+                    return CPU_STATE_HALTED | CPU_STATE_DEBUG
+                return CPU_STATE_RUNNING
+            return 0
+        if block == DEBUG_OFFSET:
+            return self._debug_access(write, reg, value)
+        return 0
+
+    def _debug_access(self, write: bool, reg: int, value: int) -> int:
+        if reg == CPU_DEBUG_REG_VAL:
+            index = self._debug.get(CPU_DEBUG_REG_SEL, 0) % CPU_REG_COUNT
+            if write:
+                if index:
+                    self.regs[index].value = value
+                return 0
+            return 0 if index == 0 else int(self.regs[index].value)
+        if reg == CPU_DEBUG_MEM_DATA:
+            addr = self._debug.get(CPU_DEBUG_MEM_ADDR, 0)
+            if addr < DMEM_OFFSET:
+                if write:
+                    self._write_imem(addr, value)
+                    return 0
+                return self._read_imem(addr)
+            if write:
+                self.backdoor.write_words("dmem", addr - DMEM_OFFSET, [value])
+                return 0
+            return self.backdoor.read_words("dmem", addr - DMEM_OFFSET, 1)[0]
+        if write:
+            old = self._breakpoint()
+            self._debug[reg] = value
+            if reg in (CPU_DEBUG_BP_ADDR, CPU_DEBUG_BP_CTRL):
+                for addr in {old, self._breakpoint()} - {None}:
+                    self._sync(addr)
+            return 0
+        return self._debug.get(reg, 0)
+
+    # Trap emulation
+
+    def _breakpoint(self) -> Optional[int]:
+        if not self._debug.get(CPU_DEBUG_BP_CTRL, 0) & 1:
+            return None
+        return self._debug.get(CPU_DEBUG_BP_ADDR, 0) & ~3
+
+    def _read_imem(self, addr: int) -> int:
+        if addr in self._shadow:
+            return self._shadow[addr]
+        return self.backdoor.read_words("imem", addr, 1)[0]
+
+    def _write_imem(self, addr: int, value: int):
+        if addr in self._shadow:
+            self._shadow[addr] = value
+        else:
+            self.backdoor.write_words("imem", addr, [value])
+        self._sync(addr)
+
+    def _sync(self, addr: int):
+        """Plant or lift the trap at addr to match breakpoints and parks"""
+        trapped = addr != self._released and (
+            addr == self._breakpoint() or addr in self._parks or self._read_imem(addr) == EBREAK)
+        if trapped and addr not in self._shadow:
+            self._shadow[addr] = self.backdoor.read_words("imem", addr, 1)[0]
+            self.backdoor.write_words("imem", addr, [SIM_PARK])
+        elif not trapped and addr in self._shadow:
+            self.backdoor.write_words("imem", addr, [self._shadow.pop(addr)])
+
+    def _release(self):
+        """Lift the traps holding the core so it can run on"""
+        parks, self._parks, self._halted_at = self._parks, [], None
+        for addr in parks:
+            self._sync(addr)
+
+    async def _enabled(self) -> bool:
+        return bool((await self.axi.read(_SIM_ENABLE))[0] & CPU_ENABLE_BIT)
+
+    async def _parked(self) -> Optional[int]:
+        """The trap the core spins on, or None while it runs
+
+        Spinning on a trap at pc fetches pc and the squashed pc + 4 and
+        pc + 8 fetched before the jump resolves in ID.
+        Stalled cycles are not counted, so a multi-cycle M/A op before the
+        trap finishes first.
+        """
+        if self._halted_at is not None:
+            return self._halted_at
+        if not self._shadow or not await self._enabled():
+            return None
+        pcs = set()
+        seen = 0
+        for _ in range(SIM_PARK_CYCLES * 4):
+            await FallingEdge(self.dut.s_axi_aclk)
+            if int(self.dut.debug_stall.value):
+                continue
+            pcs.add(int(self.dut.debug_pc.value))
+            seen += 1
+            if seen == SIM_PARK_CYCLES:
+                break
+        pc = min(pcs, default=None)
+        if seen < SIM_PARK_CYCLES or pc not in self._shadow or not pcs <= {pc, pc + 4, pc + 8}:
+            return None
+        # Hold the core here even if the breakpoint is cleared
+        if pc not in self._parks:
+            self._parks.append(pc)
+        self._halted_at = pc
+        return pc
+
+    def _next_pcs(self, pc: int) -> List[int]:
+        insn = self._read_imem(pc)
+        opcode = insn & 0x7F
+        _, _, offset = decode(insn)
+        if opcode == 0x6F:
+            return [(pc + offset) & 0xFFFFFFFF]
+        if opcode == 0x63:
+            return [pc + 4, (pc + offset) & 0xFFFFFFFF]
+        if opcode == 0x67:
+            rs1 = (insn >> 15) & 0x1F
+            base = int(self.regs[rs1].value) if rs1 else 0
+            imm = (insn >> 20) - (1 << 12) if insn >> 31 else insn >> 20
+            return [(base + imm) & 0xFFFFFFFE]
+        return [pc + 4]
+
+    async def _set_enable(self, enable: bool):
+        if self._mode == CPU_MODE_STEP:
+            if enable:
+                await self._step()
+            return
+        self._release()
+        await self.axi.write(_SIM_ENABLE, int(enable))
+
+    async def _wait_parked(self) -> int:
+        for _ in range(SIM_STEP_TIMEOUT // SIM_PARK_CYCLES):
+            pc = await self._parked()
+            if pc is not None:
+                return pc
+        raise ControllerError("Timeout waiting for the simulated CPU to reach a trap")
+
+    async def _step(self):
+        pc = await self._parked()
+        if pc is None:
+            if await self._enabled():
+                raise ControllerError("CPU must be stopped for single step")
+            # Out of reset: park on the reset vector first
+            pc = (await self.axi.read(_SIM_DEBUG_PC))[0]
+            self._parks = [pc]
+            self._sync(pc)
+            await self.axi.write(_SIM_ENABLE, 1)
+            pc = await self._wait_parked()
+
+        targets = [addr for addr in self._next_pcs(pc) if addr != pc]
+        if not targets:
+            return  # Jumps to itself: one step ends where it started
+        self._parks, self._halted_at = targets, None
+        for addr in targets:
+            self._sync(addr)
+        self._released = pc
+        self._sync(pc)
+        try:
+            await self._wait_parked()
+        finally:
+            self._released = None
+            self._sync(pc)
+
+    def read32(self, offset: int) -> int:
+        return self._request(False, offset)
+
+    def write32(self, offset: int, value: int):
+        self._request(True, offset, value & 0xFFFFFFFF)
+
+    def read(self, offset: int, size: int) -> bytes:
+        first, last = offset & ~3, (offset + size + 3) & ~3
+        words = [self.read32(addr) for addr in range(first, last, 4)]
+        data = b"".join(w.to_bytes(4, "little") for w in words)
+        return data[offset - first:offset - first + size]
+
+    def write(self, offset: int, data):
+        data = bytes(data)
+        if offset % 4 or len(data) % 4:
+            first, last = offset & ~3, (offset + len(data) + 3) & ~3
+            merged = bytearray(self.read(first, last - first))
+            merged[offset - first:offset - first + len(data)] = data
+            offset, data = first, bytes(merged)
+        for pos in range(0, len(data), 4):
+            self.write32(offset + pos, int.from_bytes(data[pos:pos + 4], "little"))
@@ -4,16 +4,22 @@ UVM-style architecture for RV32IMA CPU testing
 """
 
 import cocotb
-from cocotb.triggers import RisingEdge, ClockCycles, Timer
+from cocotb.triggers import RisingEdge, FallingEdge, ReadOnly, ClockCycles, Timer
 from cocotb.clock import Clock
 from cocotb.queue import Queue
 from cocotb.result import TestFailure, TestSuccess
+import os
 import random
 import logging
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Any
 from enum import Enum, auto
 
+from commit_log import CommitLogWriter, CommitRecord
+from konata_tracer import KonataTracer
+from memory_responder import DictMemory, MemoryResponder
+from remote_scoreboard import RemoteScoreboard, format_mismatch
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -344,6 +350,9 @@ class CPUMonitor:
         self.dut = dut
         self.instruction_items = Queue()
         self.memory_items = Queue()
+        self.retired_count = 0
+        self.commit_log: Optional[CommitLogWriter] = None
+        self.remote: Optional[RemoteScoreboard] = None
         
     async def monitor_instructions(self):
         """Monitor instruction interface"""
@@ -357,6 +366,8 @@ class CPUMonitor:
                 )
                 item.decode()
                 await self.instruction_items.put(item)
+                if self.remote is not None:
+                    self.remote.send_fetch(item.pc, item.instruction)
                 logger.debug(f"Monitored instruction: 0x{item.instruction:08x}")
     
     async def monitor_memory(self):
@@ -373,8 +384,66 @@ class CPUMonitor:
                     read_data=int(self.dut.dmem_read_data.value) if self.dut.dmem_read.value else 0
                 )
                 await self.memory_items.put(item)
+                if self.remote is not None:
+                    self.remote.send_memory(item.address, item.data, item.read_data, item.read, item.write)
                 logger.debug(f"Monitored memory: {'READ' if item.read else 'WRITE'} @ 0x{item.address:08x}")
 
+    async def monitor_retirement(self):
+        """Monitor instruction retirement and stream it to the commit log
+
+        cpu_top has no PC or instruction past EX, so both are tracked through
+        shadow EX/MEM/WB slots that follow the RTL's stall and bubble rules.
+        Signals are sampled after the falling edge, once the memory responses
+        have settled, so they reflect the state the next rising edge will act on.
+        """
+        # Each slot is [pc, inst, mem_addr, mem_value] or None for a bubble
+        ex_slot = mem_slot = wb_slot = None
+        try:
+            while True:
+                await FallingEdge(self.dut.clk)
+                await ReadOnly()
+                if not self.dut.rst_n.value:
+                    ex_slot = mem_slot = wb_slot = None
+                    continue
+
+                backend_stall = bool(self.dut.backend_stall.value)
+
+                # Loads and stores drive the data port while in EX
+                if ex_slot is not None and self.dut.ex_valid.value:
+                    if self.dut.dmem_write.value:
+                        ex_slot[2] = int(self.dut.dmem_addr.value)
+                        ex_slot[3] = int(self.dut.dmem_write_data.value)
+                    elif self.dut.dmem_read.value:
+                        ex_slot[2] = int(self.dut.dmem_addr.value)
+
+                if self.dut.wb_valid.value and not backend_stall and wb_slot is not None:
+                    pc, inst, mem_addr, mem_value = wb_slot
+                    record = CommitRecord(pc=pc, insn=inst, mem_addr=mem_addr, mem_value=mem_value)
+                    if self.dut.wb_reg_write.value:
+                        record.rd = int(self.dut.wb_rd.value)
+                        record.rd_value = int(self.dut.wb_result.value)
+                    record = record.normalized()
+                    self.retired_count += 1
+                    if self.commit_log is not None:
+                        self.commit_log.write(record)
+                    if self.remote is not None:
+                        self.remote.send_commit(record)
+                    logger.debug(f"Retired: {record.to_spike()}")
+
+                # Load-use and M/A hazards hold IF/ID and bubble EX; the back end
+                # only stops for backend_stall
+                if not backend_stall:
+                    wb_slot = mem_slot
+                    mem_slot = ex_slot
+                    if (self.dut.load_use_hazard.value or self.dut.data_hazard.value
+                            or not self.dut.id_valid.value):
+                        ex_slot = None
+                    else:
+                        ex_slot = [int(self.dut.id_pc.value), int(self.dut.id_inst.value), None, None]
+        finally:
+            if self.commit_log is not None:
+                self.commit_log.close()
+
 class CPUScoreboard:
     """Scoreboard for checking CPU behavior"""
     
@@ -433,16 +502,28 @@ class CPUScoreboard:
 class CPUEnvironment:
     """Top-level environment for CPU testing"""
     
-    def __init__(self, dut):
+    def __init__(self, dut, commit_log: Optional[str] = None, remote_checker: Optional[bool] = None):
         self.dut = dut
         self.driver = CPUDriver(dut)
         self.monitor = CPUMonitor(dut)
         self.scoreboard = CPUScoreboard()
         self.generator = InstructionGenerator()
         self.memory_model = {}
+        self.responder: Optional[MemoryResponder] = None
+        # Commit log path, e.g. make sanity COMMIT_LOG=sanity.log
+        self.commit_log = commit_log or os.environ.get("COMMIT_LOG")
+        # Check against the ISS in a separate process, e.g. make sanity REMOTE_CHECKER=1
+        if remote_checker is None:
+            remote_checker = os.environ.get("REMOTE_CHECKER", "0") not in ("", "0")
+        self.remote = RemoteScoreboard() if remote_checker else None
+        # Konata pipeline trace, e.g. make sanity KONATA_TRACE=sanity.kanata
+        self.tracer = KonataTracer(dut, os.environ["KONATA_TRACE"]) if os.environ.get("KONATA_TRACE") else None
         
-    async def start(self):
-        """Start the environment - initialize clock and reset CPU"""
+    async def start(self, name: str = "cpu_comprehensive"):
+        """Start the environment - initialize clock and reset CPU
+
+        name labels the memory trace when MEM_TRACE_MODE is set.
+        """
         # Start the clock
         clock = Clock(self.dut.clk, 10, units="ns")  # 100MHz
         cocotb.start_soon(clock.start())
@@ -450,6 +531,10 @@ class CPUEnvironment:
         # Initialize signals
         self.dut.interr.value = 0
         self.dut.cp_stall_external.value = 0
+
+        # The core only advances its PC on imem_ready, so it needs memory
+        # attached before it comes out of reset
+        self.setup_memory_interface(name=name)
         
         # Reset and get starting PC
         cpu_start_pc = await self.driver.reset()
@@ -459,6 +544,21 @@ class CPUEnvironment:
         cocotb.start_soon(self.driver.drive_memory())
         cocotb.start_soon(self.monitor.monitor_instructions())
         cocotb.start_soon(self.monitor.monitor_memory())
+
+        if self.commit_log:
+            fmt = os.environ.get("COMMIT_LOG_FORMAT",
+                                 "binary" if self.commit_log.endswith(".bin") else "text")
+            self.monitor.commit_log = CommitLogWriter(self.commit_log, fmt=fmt)
+            logger.info(f"Writing {fmt} commit log to {self.commit_log}")
+        if self.remote is not None and self.remote.process is None:
+            self.remote.start()
+            self.monitor.remote = self.remote
+            cocotb.start_soon(self._remote_checker_poll())
+        # Records go straight to their sinks; nothing is queued in memory
+        if self.monitor.commit_log is not None or self.monitor.remote is not None:
+            cocotb.start_soon(self.monitor.monitor_retirement())
+        if self.tracer is not None:
+            self.tracer.start()
         
         # Start detailed cycle monitor
         cocotb.start_soon(self._cycle_monitor())
@@ -577,6 +677,43 @@ class CPUEnvironment:
                 logger.info(f"Cycle monitor stopping after {cycle_count} cycles")
                 break
         
+    async def _remote_checker_poll(self, interval: int = 256):
+        """Pick up mismatches from the checker process as they arrive
+
+        cocotb kills this coroutine when the test ends, so the finally block
+        is the environment's teardown: tests that never call finish() still
+        stop the checker process and release its shared memory.
+        """
+        try:
+            while self.remote is not None and self.remote.process is not None:
+                await ClockCycles(self.dut.clk, interval)
+                self._record_remote_mismatches(self.remote.poll())
+        finally:
+            self.finish()
+
+    def _record_remote_mismatches(self, mismatches: List[Dict[str, Any]]):
+        for report in mismatches:
+            message = format_mismatch(report)
+            self.scoreboard.errors.append(message)
+            logger.error(f"Reference model mismatch: {message}")
+
+    def finish(self):
+        """Wait for the checker process to catch up and collect its results
+
+        Safe to call more than once; later calls do nothing.
+        """
+        if self.remote is None or self.remote.process is None:
+            return
+        self.monitor.remote = None
+        pending = len(self.remote.mismatches)
+        summary = self.remote.close()
+        self._record_remote_mismatches(self.remote.mismatches[pending:])
+        if summary is not None:
+            logger.info(f"Reference model checked {summary['checked']} instructions, "
+                        f"{summary['mismatches']} mismatches")
+        else:
+            self.scoreboard.errors.append("Reference model checker did not report a summary")
+
     async def load_program_at_pc(self, instructions: List[int]):
         """Load program at CPU's actual starting PC"""
         start_pc = await self.driver.reset()
@@ -609,41 +746,18 @@ class CPUEnvironment:
         logger.info(f"Test completed - CPU executed for {num_instructions * 2} cycles")
         return TestSuccess("Test completed successfully")
     
-    def setup_memory_interface(self):
-        """Set up memory interface to serve our program"""
-        async def memory_handler():
-            while True:
-                await RisingEdge(self.dut.clk)
-                
-                # Handle instruction memory
-                if self.dut.imem_read.value:
-                    addr = int(self.dut.imem_addr.value)
-                    if addr in self.memory_model:
-                        self.dut.imem_read_data.value = self.memory_model[addr]
-                        logger.debug(f"IMEM: Read 0x{self.memory_model[addr]:08x} from 0x{addr:08x}")
-                    else:
-                        self.dut.imem_read_data.value = 0x00000013  # NOP
-                    self.dut.imem_ready.value = 1
-                else:
-                    self.dut.imem_ready.value = 0
-                
-                # Handle data memory  
-                if self.dut.dmem_write.value:
-                    addr = int(self.dut.dmem_addr.value)
-                    data = int(self.dut.dmem_write_data.value)
-                    self.memory_model[addr] = data
-                    logger.info(f"DMEM: Write 0x{data:08x} to 0x{addr:08x}")
-                    self.dut.dmem_ready.value = 1
-                elif self.dut.dmem_read.value:
-                    addr = int(self.dut.dmem_addr.value)
-                    data = self.memory_model.get(addr, 0)
-                    self.dut.dmem_read_data.value = data
-                    logger.info(f"DMEM: Read 0x{data:08x} from 0x{addr:08x}")
-                    self.dut.dmem_ready.value = 1
-                else:
-                    self.dut.dmem_ready.value = 0
-        
-        cocotb.start_soon(memory_handler())
+    def setup_memory_interface(self, name: str = "cpu_comprehensive"):
+        """Set up memory interface to serve our program
+
+        MEM_TRACE_MODE=record|replay records or replays the response stream.
+        """
+        self.responder = MemoryResponder.from_env(
+            self.dut,
+            imem=DictMemory(self.memory_model, default=0x00000013),  # NOP
+            dmem=DictMemory(self.memory_model),
+            name=name,
+        )
+        self.responder.start()
     
     async def verify_results(self):
         """Verify test results"""
@@ -676,6 +790,7 @@ async def test_cpu_comprehensive_fixed(dut):
     # Run test
     result = await env.run_test(num_instructions=50, 
                                categories=[InstructionCategory.ALU, InstructionCategory.STORE])
+    env.finish()
     
     # Check for any scoreboard errors
     if env.scoreboard.errors:
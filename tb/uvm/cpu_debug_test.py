@@ -5,6 +5,8 @@ from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge, ClockCycles
 import logging
 
+from disassembler import disassemble
+
 # Configure logging for very detailed output
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -59,24 +61,7 @@ async def cpu_detailed_debug_test(dut):
             if isinstance(inst, int) and inst != 0:
                 log_msg += f"INST=0x{inst:08x} "
                 
-                # Decode instruction type
-                opcode = inst & 0x7F
-                if opcode == 0x33:
-                    log_msg += "[R-type] "
-                elif opcode == 0x13:
-                    log_msg += "[I-type] "
-                elif opcode == 0x03:
-                    log_msg += "[LOAD] "
-                elif opcode == 0x23:
-                    log_msg += "[STORE] "
-                elif opcode == 0x63:
-                    log_msg += "[BRANCH] "
-                elif opcode == 0x6F:
-                    log_msg += "[JAL] "
-                elif opcode == 0x67:
-                    log_msg += "[JALR] "
-                else:
-                    log_msg += f"[OP:0x{opcode:02x}] "
+                log_msg += f"[{disassemble(inst, pc if isinstance(pc, int) else None)}] "
                 log_this_cycle = True
             elif isinstance(inst, int):
                 log_msg += "[NOP] "
@@ -132,27 +117,7 @@ async def cpu_step_by_step_test(dut):
                        f"Pipeline[{if_valid}{id_valid}{ex_valid}{mem_valid}{wb_valid}] "
                        f"Stall={stall}")
             
-            # Decode instruction if it's not NOP
-            if inst != 0x00000013:  # Not a NOP
-                opcode = inst & 0x7F
-                if opcode == 0x33:
-                    logger.info(f"         → R-type ALU operation")
-                elif opcode == 0x13:
-                    logger.info(f"         → I-type ALU operation")
-                elif opcode == 0x03:
-                    logger.info(f"         → Load operation")
-                elif opcode == 0x23:
-                    logger.info(f"         → Store operation")
-                elif opcode == 0x63:
-                    logger.info(f"         → Branch operation")
-                elif opcode == 0x6F:
-                    logger.info(f"         → JAL jump")
-                elif opcode == 0x67:
-                    logger.info(f"         → JALR jump")
-                else:
-                    logger.info(f"         → Unknown opcode: 0x{opcode:02x}")
-            else:
-                logger.info(f"         → NOP instruction")
+            logger.info(f"         → {disassemble(inst, pc)}")
                 
         except Exception as e:
             logger.info(f"Cycle {cycle+1:2d}: Error reading signals: {e}")
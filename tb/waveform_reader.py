@@ -0,0 +1,380 @@
+"""
+Streaming VCD/FST reader for offline analysis of cpu_top waveform dumps
+
+The VCD file is memory-mapped and scanned line by line; only value changes
+for the selected signals are kept, so multi-GB dumps can be post-processed
+without loading them into memory. FST files are streamed through GTKWave's
+``fst2vcd`` converter.
+
+Example:
+    reader = open_waveform("sim_build/dump.vcd")
+    traces = reader.read(["clk", "debug_pc", "wb_valid", "debug_stall"])
+    samples = reader.sample_at_edges("clk", ["debug_pc", "wb_valid"])
+"""
+
+import argparse
+import mmap
+import os
+import shutil
+import subprocess
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+# Byte values used by the change-line fast path
+_HASH = ord("#")
+_DOLLAR = ord("$")
+_VECTOR = (ord("b"), ord("B"))
+_SCALAR = tuple(ord(c) for c in "01xXzZ")
+
+# x/z bits read back as 0; the change is flagged in SignalTrace.unknown
+_XZ_TO_ZERO = bytes.maketrans(b"xXzZ", b"0000")
+
+_TIMESCALE_UNITS = {
+    "s": 1.0,
+    "ms": 1e-3,
+    "us": 1e-6,
+    "ns": 1e-9,
+    "ps": 1e-12,
+    "fs": 1e-15,
+}
+
+
+class WaveformError(Exception):
+    """Raised for malformed dumps or unknown signal names"""
+
+
+@dataclass
+class VarInfo:
+    """A variable declared in the VCD header"""
+    name: str  # Full hierarchical name, scopes joined with '.'
+    ident: bytes
+    width: int
+    var_type: str
+
+
+@dataclass
+class SignalTrace:
+    """Value changes of one signal as NumPy arrays"""
+    name: str
+    width: int
+    times: np.ndarray  # uint64, in timescale units
+    values: np.ndarray  # uint64 (object for signals wider than 64 bits)
+    unknown: np.ndarray  # bool, True where the change contained x/z bits
+
+    def __len__(self):
+        return len(self.times)
+
+    def value_at(self, time: int) -> int:
+        """Return the value held at the given time (0 before the first change)"""
+        idx = int(np.searchsorted(self.times, time, side="right")) - 1
+        return int(self.values[idx]) if idx >= 0 else 0
+
+
+class VCDReader:
+    """Memory-mapped, streaming reader for VCD files"""
+
+    def __init__(self, path: str, lines: Optional[Iterable[bytes]] = None):
+        self.path = path
+        self.timescale = "1ns"
+        self.timescale_seconds = 1e-9
+        self.vars: Dict[str, VarInfo] = {}
+        self._by_ident: Dict[bytes, List[VarInfo]] = {}
+
+        self._file = None
+        self._mmap = None
+        if lines is None:
+            self._file = open(path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            lines = iter(self._mmap.readline, b"")
+        self._lines = iter(lines)
+        self._parse_header()
+        self._body_offset = self._mmap.tell() if self._mmap is not None else None
+        self._consumed = False
+
+    # Context manager support ------------------------------------------------
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Release the memory map and file handle"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Header parsing ----------------------------------------------------------
+
+    def _header_tokens(self) -> Iterator[str]:
+        for line in self._lines:
+            for token in line.split():
+                yield token.decode("ascii", "replace")
+
+    def _parse_header(self):
+        scopes: List[str] = []
+        tokens = self._header_tokens()
+
+        def until_end() -> List[str]:
+            body = []
+            for tok in tokens:
+                if tok == "$end":
+                    return body
+                body.append(tok)
+            raise WaveformError(f"{self.path}: unterminated header section")
+
+        for tok in tokens:
+            if tok == "$scope":
+                body = until_end()
+                scopes.append(body[1] if len(body) > 1 else body[0])
+            elif tok == "$upscope":
+                until_end()
+                if scopes:
+                    scopes.pop()
+            elif tok == "$var":
+                body = until_end()
+                if len(body) < 4:
+                    raise WaveformError(f"{self.path}: malformed $var {body}")
+                var_type, width, ident, ref = body[0], int(body[1]), body[2], body[3]
+                name = ".".join(scopes + [ref])
+                info = VarInfo(name=name, ident=ident.encode("ascii"), width=width, var_type=var_type)
+                self.vars[name] = info
+                self._by_ident.setdefault(info.ident, []).append(info)
+            elif tok == "$timescale":
+                self._set_timescale("".join(until_end()))
+            elif tok == "$enddefinitions":
+                return
+            elif tok.startswith("$"):
+                until_end()
+        raise WaveformError(f"{self.path}: no $enddefinitions found")
+
+    def _set_timescale(self, text: str):
+        self.timescale = text
+        digits = "".join(c for c in text if c.isdigit()) or "1"
+        unit = text[len(digits):].strip() if text.startswith(digits) else text.lstrip("0123456789")
+        self.timescale_seconds = int(digits) * _TIMESCALE_UNITS.get(unit, 1e-9)
+
+    # Signal lookup -----------------------------------------------------------
+
+    def resolve(self, name: str) -> VarInfo:
+        """Find a variable by full hierarchical name or unique trailing path"""
+        if name in self.vars:
+            return self.vars[name]
+        suffix = "." + name
+        matches = [v for full, v in self.vars.items() if full.endswith(suffix)]
+        if not matches:
+            raise WaveformError(f"Signal '{name}' not found in {self.path}")
+        # Prefer the shallowest match, e.g. cpu_top.pc over cpu_top.u_x.pc
+        matches.sort(key=lambda v: v.name.count("."))
+        if len(matches) > 1 and matches[0].name.count(".") == matches[1].name.count("."):
+            names = ", ".join(v.name for v in matches)
+            raise WaveformError(f"Signal '{name}' is ambiguous: {names}")
+        return matches[0]
+
+    # Body streaming ----------------------------------------------------------
+
+    def _body_lines(self) -> Iterator[bytes]:
+        if self._mmap is not None:
+            self._mmap.seek(self._body_offset)
+            return iter(self._mmap.readline, b"")
+        if self._consumed:
+            raise WaveformError("Piped waveform streams can only be read once")
+        self._consumed = True
+        return self._lines
+
+    def iter_changes(self, names: Optional[List[str]] = None) -> Iterator[Tuple[int, str, int, bool]]:
+        """Yield (time, name, value, unknown) for every change of the selected signals
+
+        Changes are produced in file order without buffering, so callers can
+        reconstruct state on the fly for arbitrarily long dumps.
+        """
+        infos = [self.resolve(n) for n in names] if names else list(self.vars.values())
+        wanted: Dict[bytes, List[str]] = {}
+        for info in infos:
+            wanted.setdefault(info.ident, []).append(info.name)
+
+        time = 0
+        skipping_comment = False
+        for line in self._body_lines():
+            if skipping_comment:
+                skipping_comment = b"$end" not in line
+                continue
+            if len(line) < 2:
+                continue
+            c = line[0]
+            if c == _HASH:
+                time = int(line[1:])
+                continue
+            if c in _SCALAR:
+                ident = line[1:].strip()
+                names_for = wanted.get(ident)
+                if names_for is None:
+                    continue
+                unknown = c not in (48, 49)
+                value = 1 if c == 49 else 0
+            elif c in _VECTOR:
+                bits, ident = line[1:].split()
+                names_for = wanted.get(ident)
+                if names_for is None:
+                    continue
+                clean = bits.translate(_XZ_TO_ZERO)
+                unknown = clean != bits
+                value = int(clean, 2)
+            elif c == _DOLLAR:
+                skipping_comment = line.startswith(b"$comment") and b"$end" not in line
+                continue
+            else:
+                # Real-valued and malformed lines are not used by the RTL dumps
+                continue
+            for name in names_for:
+                yield time, name, value, unknown
+
+    def read(self, names: List[str]) -> Dict[str, SignalTrace]:
+        """Collect all changes of the given signals into NumPy arrays
+
+        Only the selected signals are materialised; the rest of the file is
+        scanned and discarded. Keys of the result are the requested names.
+        """
+        infos = {name: self.resolve(name) for name in names}
+        full_to_req: Dict[str, List[str]] = {}
+        for req, info in infos.items():
+            full_to_req.setdefault(info.name, []).append(req)
+
+        times = {full: array("Q") for full in full_to_req}
+        unknown = {full: array("B") for full in full_to_req}
+        values = {}
+        for full in full_to_req:
+            # Signals wider than 64 bits fall back to Python ints
+            values[full] = array("Q") if self.vars[full].width <= 64 else []
+
+        for time, full, value, xz in self.iter_changes(list({i.name for i in infos.values()})):
+            times[full].append(time)
+            values[full].append(value)
+            unknown[full].append(xz)
+
+        result = {}
+        for full, reqs in full_to_req.items():
+            vals = values[full]
+            trace = SignalTrace(
+                name=full,
+                width=self.vars[full].width,
+                times=np.frombuffer(times[full], dtype=np.uint64) if times[full] else np.zeros(0, np.uint64),
+                values=(np.frombuffer(vals, dtype=np.uint64) if len(vals) else np.zeros(0, np.uint64))
+                if isinstance(vals, array) else np.array(vals, dtype=object),
+                unknown=np.frombuffer(unknown[full], dtype=np.uint8).astype(bool)
+                if unknown[full] else np.zeros(0, bool),
+            )
+            for req in reqs:
+                result[req] = trace
+        return result
+
+    def sample_at_edges(self, clock: str, names: List[str], edge: str = "rising",
+                        when: str = "before") -> Dict[str, np.ndarray]:
+        """Resample signals once per clock edge
+
+        With when="before" each sample is the value the flops see at the edge
+        (changes stamped at the edge time are excluded); with when="after" the
+        post-edge value is returned. The result includes a "time" array with
+        the edge timestamps.
+        """
+        if when not in ("before", "after"):
+            raise ValueError("when must be 'before' or 'after'")
+        traces = self.read([clock] + [n for n in names if n != clock])
+        edge_times = clock_edges(traces[clock], edge)
+        side = "left" if when == "before" else "right"
+        samples = {"time": edge_times}
+        for name in names:
+            samples[name] = resample(traces[name], edge_times, side=side)
+        return samples
+
+
+def clock_edges(clk: SignalTrace, edge: str = "rising") -> np.ndarray:
+    """Return the timestamps of clock edges in a clock trace"""
+    vals = clk.values.astype(np.uint8) & 1
+    prev = np.concatenate(([0], vals[:-1])) if len(vals) else vals
+    if edge == "rising":
+        mask = (prev == 0) & (vals == 1)
+    elif edge == "falling":
+        mask = (prev == 1) & (vals == 0)
+    elif edge == "both":
+        mask = prev != vals
+    else:
+        raise ValueError("edge must be 'rising', 'falling' or 'both'")
+    if len(mask):
+        # The first entry is the initial value dump, not an edge
+        mask[0] = False
+    return clk.times[mask]
+
+
+def resample(trace: SignalTrace, sample_times: np.ndarray, side: str = "left") -> np.ndarray:
+    """Sample a trace at the given times (vectorised step interpolation)"""
+    idx = np.searchsorted(trace.times, sample_times, side=side) - 1
+    if len(trace.values) == 0:
+        return np.zeros(len(sample_times), dtype=np.uint64)
+    out = trace.values[np.clip(idx, 0, None)]
+    if trace.values.dtype == object:
+        out = out.copy()
+        out[idx < 0] = 0
+        return out
+    return np.where(idx < 0, 0, out).astype(trace.values.dtype)
+
+
+class FSTReader(VCDReader):
+    """FST reader that streams the dump through GTKWave's fst2vcd
+
+    The converter output is consumed as a pipe, so the same single-pass
+    filtering applies; a piped stream can only be read once per reader.
+    """
+
+    def __init__(self, path: str, fst2vcd: str = "fst2vcd"):
+        exe = shutil.which(fst2vcd)
+        if exe is None:
+            raise WaveformError(f"'{fst2vcd}' not found; install GTKWave to read FST dumps")
+        self._proc = subprocess.Popen([exe, path], stdout=subprocess.PIPE, bufsize=1 << 20)
+        super().__init__(path, lines=self._proc.stdout)
+
+    def close(self):
+        super().close()
+        if self._proc is not None:
+            self._proc.stdout.close()
+            self._proc.terminate()
+            self._proc.wait()
+            self._proc = None
+
+
+def open_waveform(path: str) -> VCDReader:
+    """Open a .vcd or .fst dump with the matching reader"""
+    if os.path.splitext(path)[1].lower() == ".fst":
+        return FSTReader(path)
+    return VCDReader(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resample a cpu_top dump at every clock edge")
+    parser.add_argument("dump", help="VCD or FST file")
+    parser.add_argument("-c", "--clock", default="clk", help="Clock signal name")
+    parser.add_argument("-s", "--signals", nargs="+", required=True, help="Signals to sample")
+    parser.add_argument("-o", "--output", help="Write the samples to this .npz file")
+    args = parser.parse_args()
+
+    with open_waveform(args.dump) as reader:
+        samples = reader.sample_at_edges(args.clock, args.signals)
+
+    print(f"{len(samples['time'])} {args.clock} edges")
+    for name in args.signals:
+        print(f"  {name}: {len(np.unique(samples[name]))} distinct values")
+    if args.output:
+        np.savez_compressed(args.output, **samples)
+        print(f"Samples written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
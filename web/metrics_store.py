@@ -0,0 +1,229 @@
+"""
+Multi-resolution metrics store for the dashboard
+
+A soak test produces far more counter samples than a browser chart can
+draw. MetricsStore turns each (cycles, instret, stall) sample into IPC,
+MIPS and stall ratio and keeps them at three resolutions: raw samples,
+1 s buckets and 1 min buckets. Each resolution is a fixed-size ring of
+NumPy rows, so memory is bounded however long the test runs.
+
+series() answers a (start, end, points) query from the finest tier that
+still covers start and has at most MAX_FACTOR * points rows in the
+window. It then downsamples those rows with Largest-Triangle-Three-Buckets
+(LTTB), which keeps peaks and dips that plain decimation loses. The cost
+depends on points, not on how much history is stored.
+
+Feed a store from one source, either the dashboard's telemetry bridge or
+a PerfSampler:
+
+    bridge.add_listener(store.add)
+    sampler.add_listener(store.add)
+    t, ipc, tier = store.series("ipc", time.time() - 3600, time.time(), 500)
+"""
+
+import math
+import threading
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+METRICS = ("ipc", "mips", "stall")
+
+ROW_DTYPE = np.dtype([("time", "<f8")] + [(name, "<f4") for name in METRICS])
+
+# (tier name, bucket seconds or None for raw samples, default capacity)
+TIERS = [
+    ("raw", None, 1 << 18),
+    ("1s", 1.0, 86400),  # One day
+    ("1min", 60.0, 10080),  # One week
+]
+
+MAX_FACTOR = 4  # Rows per requested point that LTTB may have to scan
+
+
+class Ring:
+    """Fixed-size ring of ROW_DTYPE rows in time order"""
+
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity, dtype=ROW_DTYPE)
+        self.capacity = capacity
+        self.count = 0  # Rows ever appended
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, row: Tuple):
+        self.data[self.count % self.capacity] = row
+        self.count += 1
+
+    def _segments(self) -> List[np.ndarray]:
+        """The rows oldest first, as at most two views"""
+        if self.count <= self.capacity:
+            return [self.data[:self.count]]
+        split = self.count % self.capacity
+        return [self.data[split:], self.data[:split]]
+
+    @property
+    def oldest(self) -> float:
+        return float(self._segments()[0]["time"][0]) if self.count else math.inf
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        """Rows with start <= time <= end (a copy)"""
+        parts = []
+        for segment in self._segments():
+            times = segment["time"]
+            lo, hi = np.searchsorted(times, start, "left"), np.searchsorted(times, end, "right")
+            if hi > lo:
+                parts.append(segment[lo:hi])
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=ROW_DTYPE)
+
+    def count_between(self, start: float, end: float) -> int:
+        total = 0
+        for segment in self._segments():
+            times = segment["time"]
+            total += int(np.searchsorted(times, end, "right") - np.searchsorted(times, start, "left"))
+        return total
+
+
+class _Rollup:
+    """Accumulates samples into fixed-period buckets"""
+
+    def __init__(self, period: float, capacity: int):
+        self.period = period
+        self.ring = Ring(capacity)
+        self.bucket: Optional[int] = None
+        self._clear()
+
+    def _clear(self):
+        self.cycles = self.instret = 0
+        self.seconds = 0.0
+        self.samples = self.stalled = 0
+
+    def add(self, timestamp: float, cycles: int, instret: int, seconds: float, stalled: bool):
+        bucket = int(timestamp // self.period)
+        if self.bucket is not None and bucket != self.bucket:
+            self.flush()
+        self.bucket = bucket
+        self.cycles += cycles
+        self.instret += instret
+        self.seconds += seconds
+        self.samples += 1
+        self.stalled += stalled
+
+    def flush(self):
+        if self.samples:
+            self.ring.append(_row((self.bucket + 0.5) * self.period, self.cycles, self.instret,
+                                  self.seconds, self.stalled / self.samples))
+        self._clear()
+
+
+def _row(timestamp: float, cycles: int, instret: int, seconds: float, stall: float) -> Tuple:
+    ipc = instret / cycles if cycles else math.nan
+    mips = instret / seconds / 1e6 if seconds > 0 else math.nan
+    return timestamp, ipc, mips, stall
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets downsampling of (x, y) to points points"""
+    n = len(x)
+    if points >= n or points < 3:
+        return x, y
+    # NaN gaps (e.g. a halted CPU has no IPC) would poison the areas
+    y_fill = np.nan_to_num(y)
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y_fill[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y_fill[lo:hi] - y_fill[a])
+                      - (x[a] - x[lo:hi]) * (avg_y - y_fill[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+class MetricsStore:
+    """Raw, 1 s and 1 min rings of IPC, MIPS and stall ratio"""
+
+    def __init__(self, capacities: Optional[Mapping[str, int]] = None):
+        capacities = capacities or {}
+        self.raw = Ring(capacities.get("raw", TIERS[0][2]))
+        self.rollups: Dict[str, _Rollup] = {
+            name: _Rollup(period, capacities.get(name, capacity)) for name, period, capacity in TIERS[1:]
+        }
+        self._last: Optional[Tuple[float, int, int]] = None
+        self._lock = threading.Lock()
+        self.samples = 0
+        self.discontinuities = 0  # Counter resets and out-of-order samples
+
+    def tiers(self) -> Dict[str, Ring]:
+        return {"raw": self.raw, **{name: rollup.ring for name, rollup in self.rollups.items()}}
+
+    def add(self, timestamp: float, values: Mapping[str, int]):
+        """Add one sample with 64-bit cycles and instret and the stall status"""
+        cycles, instret = int(values["cycles"]), int(values["instret"])
+        stalled = bool(values.get("stall", 0))
+        with self._lock:
+            last, self._last = self._last, (timestamp, cycles, instret)
+            if last is None:
+                return
+            seconds, d_cycles, d_instret = timestamp - last[0], cycles - last[1], instret - last[2]
+            if seconds <= 0 or d_cycles < 0 or d_instret < 0:
+                # CPU reset or a stale frame; start again from this sample
+                self.discontinuities += 1
+                return
+            self.raw.append(_row(timestamp, d_cycles, d_instret, seconds, float(stalled)))
+            for rollup in self.rollups.values():
+                rollup.add(timestamp, d_cycles, d_instret, seconds, stalled)
+            self.samples += 1
+
+    def flush(self):
+        """Close the open buckets, e.g. at the end of a test"""
+        with self._lock:
+            for rollup in self.rollups.values():
+                rollup.flush()
+
+    def _reach(self, name: str, ring: Ring) -> float:
+        """Earliest time a tier covers: rollup rows are stamped mid-bucket"""
+        period = self.rollups[name].period if name in self.rollups else 0.0
+        return ring.oldest - period / 2
+
+    def _pick(self, start: float, end: float, points: int) -> Tuple[str, Ring]:
+        tiers = list(self.tiers().items())
+        for name, ring in tiers:
+            if self._reach(name, ring) <= start and ring.count_between(start, end) <= MAX_FACTOR * points:
+                return name, ring
+        # Nothing covers start; of the tiers small enough, use the one that
+        # reaches furthest back, the finer one on a tie
+        best = None
+        for name, ring in tiers:
+            if ring.count_between(start, end) > MAX_FACTOR * points:
+                continue
+            if best is None or self._reach(name, ring) < self._reach(*best):
+                best = name, ring
+        return best or tiers[-1]
+
+    def series(self, metric: str, start: float, end: float, points: int = 500
+               ) -> Tuple[np.ndarray, np.ndarray, str]:
+        """(times, values, tier name) of metric over [start, end], at most points long"""
+        if metric not in METRICS:
+            raise KeyError(f"Unknown metric '{metric}'")
+        with self._lock:
+            name, ring = self._pick(start, end, points)
+            rows = ring.window(start, end)
+        times, values = lttb(rows["time"], rows[metric].astype(np.float64), points)
+        return times, values, name
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "samples": self.samples,
+                "discontinuities": self.discontinuities,
+                "tiers": {name: {"rows": len(ring), "capacity": ring.capacity,
+                                 "oldest": None if ring.oldest == math.inf else ring.oldest}
+                          for name, ring in self.tiers().items()},
+            }
@@ -0,0 +1,416 @@
+"""
+Dashboard server for the Red Pitaya RISC-V CPU
+
+A small asyncio HTTP server for the pages in templates/ and static/.
+The REST endpoints never touch the hardware per request. They answer from
+a Snapshot that one task refreshes at a fixed rate, so any number of open
+dashboards cost the same MMIO traffic as one. Memory pages are only read
+while a dashboard has asked for them recently. Control actions go through
+one command queue and run strictly one at a time, in arrival order.
+
+    GET  /                       dashboard
+    GET  /controls               run control and program upload
+    GET  /api/state              status block, registers and snapshot age
+    GET  /api/registers
+    GET  /api/memory?addr=&size= bytes (hex) from cached pages
+    GET  /api/disasm?addr=&count=
+    GET  /api/metrics?metric=ipc&start=&end=&points=
+                                 downsampled history from the MetricsStore
+    POST /api/control            {"action": "start" | "stop" | "step" | "reset"}
+    POST /api/load?type=elf      program file as the request body
+    GET  /ws                     telemetry WebSocket (websocket_bridge)
+
+    PYTHONPATH=sw/host_interface python web/server.py --backend devmem --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import mimetypes
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from async_controller import AsyncCPUController
+from controller import REGISTER_NAMES, STATUS_OFFSET, CPUController, ControllerError, open_backend
+from disassembler import format_line
+from loader import DMEM_OFFSET, FILE_TYPES, LoaderError, load_program
+from snapshot import STATUS_BLOCK_SIZE, STATUS_FIELDS
+
+from metrics_store import METRICS, MetricsStore
+from websocket_bridge import TelemetryBridge, WebSocketError, is_websocket, parse_request
+
+logger = logging.getLogger(__name__)
+
+WEB_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(WEB_DIR, "templates")
+STATIC_DIR = os.path.join(WEB_DIR, "static")
+
+PAGE = 256  # Granularity of cached memory
+PAGE_TTL = 5.0  # Seconds a page stays in the refresh set after its last request
+MAX_MEMORY_READ = 4096
+MAX_DISASM = 256
+MAX_POINTS = 2000
+MAX_BODY = 1024 * 1024  # Same limit as the loader
+
+PAGES = {"/": ("index.html", "Dashboard"), "/controls": ("controls.html", "Controls")}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 426: "Upgrade Required", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or REASONS.get(status, ""))
+        self.status = status
+
+
+class Snapshot:
+    """Controller state as of the last refresh"""
+
+    def __init__(self):
+        self.status: Dict[str, int] = {}
+        self.registers: List[int] = []
+        self.pages: Dict[int, bytes] = {}
+        self.taken = 0.0
+        self.seq = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "seq": self.seq,
+            "age": round(time.time() - self.taken, 3) if self.taken else None,
+            "status": self.status,
+            "registers": {name: value for name, value in zip(REGISTER_NAMES, self.registers)},
+        }
+
+
+class DashboardServer:
+    """HTTP front end over one AsyncCPUController"""
+
+    def __init__(self, cpu: AsyncCPUController, refresh: float = 10.0, telemetry_rate: float = 30.0):
+        self.cpu = cpu
+        self.interval = 1.0 / refresh
+        self.snapshot = Snapshot()
+        self.bridge = TelemetryBridge(cpu, telemetry_rate)
+        # The bridge polls continuously once it has a listener, so history
+        # accumulates whether or not a dashboard is open
+        self.metrics = MetricsStore()
+        self.bridge.add_listener(self.metrics.add)
+        self.commands: "asyncio.Queue[Tuple[str, Dict, asyncio.Future]]" = asyncio.Queue()
+        self._watched: Dict[int, float] = {}  # page address -> last requested
+        self._templates: Dict[str, str] = {}
+
+    # Snapshot
+
+    async def refresh(self):
+        """Read the status block, registers and watched pages once"""
+        block = await self.cpu.read_block(STATUS_OFFSET, STATUS_BLOCK_SIZE)
+        words = struct.unpack(f"<{STATUS_BLOCK_SIZE // 4}I", block)
+        snap = Snapshot()
+        snap.status = {name: words[offset // 4] for name, offset in STATUS_FIELDS}
+        snap.registers = await self.cpu.read_registers()
+        now = time.monotonic()
+        for page, last in list(self._watched.items()):
+            if now - last > PAGE_TTL:
+                del self._watched[page]
+        for start, size in _runs(sorted(self._watched)):
+            data = await self.cpu.read_memory(start, size)
+            for offset in range(0, size, PAGE):
+                snap.pages[start + offset] = data[offset:offset + PAGE]
+        snap.taken = time.time()
+        snap.seq = self.snapshot.seq + 1
+        self.snapshot = snap
+
+    async def _refresher(self):
+        while True:
+            try:
+                await self.refresh()
+            except ControllerError as e:
+                logger.warning(f"Snapshot refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _pages(self, addr: int, size: int) -> bytes:
+        """Bytes from cached pages; unseen pages join the refresh set first"""
+        CPUController.check_range(addr, size)
+        pages = range(addr - addr % PAGE, addr + size, PAGE)
+        now = time.monotonic()
+        for page in pages:
+            self._watched[page] = now
+        # A refresh may swap the snapshot while we wait on a read
+        cached = self.snapshot.pages
+        chunks = {page: cached[page] for page in pages if page in cached}
+        missing = [page for page in pages if page not in chunks]
+        if missing:
+            # Read them now rather than waiting for the next refresh
+            for start, length in _runs(missing):
+                data = await self.cpu.read_memory(start, length)
+                for offset in range(0, length, PAGE):
+                    chunks[start + offset] = data[offset:offset + PAGE]
+                    self.snapshot.pages.setdefault(start + offset, chunks[start + offset])
+        data = b"".join(chunks[page] for page in pages)
+        first = pages[0]
+        return data[addr - first:addr - first + size]
+
+    # Commands
+
+    async def command(self, action: str, **args):
+        """Queue a control action and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self.commands.put((action, args, future))
+        return await future
+
+    async def _worker(self):
+        while True:
+            action, args, future = await self.commands.get()
+            try:
+                result = await self._run_command(action, args)
+                # Make the effect visible to the next poll
+                self.snapshot.pages.clear()
+                await self.refresh()
+                future.set_result(result)
+            except (ControllerError, LoaderError) as e:
+                future.set_exception(e)
+            except Exception as e:
+                logger.exception(f"Command {action} failed")
+                future.set_exception(e)
+
+    async def _run_command(self, action: str, args: Dict):
+        if action == "start":
+            await self.cpu.start()
+        elif action == "stop":
+            await self.cpu.stop()
+        elif action == "step":
+            await self.cpu.step()
+        elif action == "reset":
+            await self.cpu.reset(hard=bool(args.get("hard")))
+        elif action == "load":
+            return await self._load(args["data"], args.get("file_type"))
+        else:
+            raise HTTPError(400, f"Unknown action '{action}'")
+        return None
+
+    async def _load(self, data: bytes, file_type: Optional[str]) -> Dict:
+        with tempfile.NamedTemporaryFile(suffix=".prog") as f:
+            f.write(data)
+            f.flush()
+            with load_program(f.name, file_type=file_type) as image:
+                stats = await self.cpu.load(image)
+        return {"blocks": stats.blocks, "written": stats.written, "bytes": stats.bytes_written}
+
+    # HTTP
+
+    def _template(self, name: str) -> str:
+        if name not in self._templates:
+            with open(os.path.join(TEMPLATE_DIR, name)) as f:
+                self._templates[name] = f.read()
+        return self._templates[name]
+
+    def render(self, name: str, title: str) -> bytes:
+        page = self._template("layout.html")
+        page = page.replace("{{ title }}", title).replace("{{ content }}", self._template(name))
+        return page.encode()
+
+    async def route(self, method: str, target: str, body: bytes) -> Tuple[int, str, bytes]:
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path
+
+        if path in PAGES:
+            _require(method, "GET")
+            return 200, "text/html; charset=utf-8", self.render(*PAGES[path])
+        if path.startswith("/static/"):
+            _require(method, "GET")
+            return self._static(path[len("/static/"):])
+        if path == "/api/state":
+            _require(method, "GET")
+            return _json(self.snapshot.as_dict())
+        if path == "/api/registers":
+            _require(method, "GET")
+            return _json(self.snapshot.as_dict()["registers"])
+        if path == "/api/memory":
+            _require(method, "GET")
+            addr, size = _int(query, "addr"), _int(query, "size", 256)
+            if not 0 < size <= MAX_MEMORY_READ:
+                raise HTTPError(400, f"size must be 1..{MAX_MEMORY_READ}")
+            data = await self._pages(addr, size)
+            return _json({"addr": addr, "size": size, "seq": self.snapshot.seq, "data": data.hex()})
+        if path == "/api/disasm":
+            _require(method, "GET")
+            addr = _int(query, "addr", self.snapshot.status.get("pc", 0)) & ~3
+            count = min(_int(query, "count", 32), MAX_DISASM)
+            data = await self._pages(addr, 4 * count)
+            lines = [format_line(addr + i, int.from_bytes(data[i:i + 4], "little"))
+                     for i in range(0, len(data), 4)]
+            return _json({"addr": addr, "pc": self.snapshot.status.get("pc"), "lines": lines})
+        if path == "/api/metrics":
+            _require(method, "GET")
+            metric = query.get("metric", "ipc")
+            if metric not in METRICS:
+                raise HTTPError(400, f"metric must be one of {', '.join(METRICS)}")
+            end = _float(query, "end", time.time())
+            start = _float(query, "start", end - 300)
+            points = min(_int(query, "points", 500), MAX_POINTS)
+            times, values, tier = self.metrics.series(metric, start, end, points)
+            return _json({"metric": metric, "tier": tier, "t": times.round(3).tolist(),
+                          "v": [None if v != v else round(float(v), 4) for v in values]})
+        if path == "/api/control":
+            _require(method, "POST")
+            try:
+                request = json.loads(body or b"{}")
+            except ValueError:
+                raise HTTPError(400, "Body must be JSON")
+            if not isinstance(request, dict):
+                raise HTTPError(400, "Body must be a JSON object")
+            action = request.pop("action", None)
+            if action not in ("start", "stop", "step", "reset"):
+                raise HTTPError(400, "action must be start, stop, step or reset")
+            await self.command(action, **request)
+            return _json({"ok": True, "state": self.snapshot.as_dict()})
+        if path == "/api/load":
+            _require(method, "POST")
+            file_type = query.get("type")
+            if file_type is not None and file_type not in FILE_TYPES:
+                raise HTTPError(400, f"type must be one of {', '.join(FILE_TYPES)}")
+            if not body:
+                raise HTTPError(400, "Empty program")
+            stats = await self.command("load", data=body, file_type=file_type)
+            return _json({"ok": True, "load": stats})
+        raise HTTPError(404)
+
+    def _static(self, name: str) -> Tuple[int, str, bytes]:
+        path = os.path.normpath(os.path.join(STATIC_DIR, name))
+        if not path.startswith(STATIC_DIR + os.sep) or not os.path.isfile(path):
+            raise HTTPError(404)
+        with open(path, "rb") as f:
+            data = f.read()
+        return 200, mimetypes.guess_type(path)[0] or "application/octet-stream", data
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                method, target, headers = parse_request(head)
+                if urlsplit(target).path == "/ws":
+                    if not is_websocket(headers):
+                        await _respond(writer, 426, "text/plain", b"WebSocket upgrade required", False)
+                        break
+                    await self.bridge.accept(reader, writer, target, headers)
+                    return
+                length = int(headers.get("content-length", 0))
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if length > MAX_BODY:
+                    await _respond(writer, 413, "text/plain", b"Request body too large", False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, content_type, payload = await self.route(method, target, body)
+                except HTTPError as e:
+                    status, content_type, payload = _error(e.status, str(e))
+                except (ControllerError, LoaderError) as e:
+                    status, content_type, payload = _error(400, str(e))
+                except Exception as e:
+                    logger.exception(f"{method} {target} failed")
+                    status, content_type, payload = _error(500, str(e))
+                await _respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.LimitOverrunError, ConnectionError, WebSocketError, ValueError) as e:
+            logger.info(f"Dropped connection: {e!r}")
+        writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Dashboard on http://{host}:{port}/")
+        tasks = [self._refresher(), self._worker(), self.bridge.run()]
+        async with server:
+            await asyncio.gather(server.serve_forever(), *tasks)
+
+
+def _runs(pages: List[int]) -> List[Tuple[int, int]]:
+    """Merge sorted page addresses into (start, size) reads, split at the IMEM/DMEM boundary"""
+    runs: List[Tuple[int, int]] = []
+    for page in pages:
+        if runs and runs[-1][0] + runs[-1][1] == page != DMEM_OFFSET:
+            runs[-1] = (runs[-1][0], runs[-1][1] + PAGE)
+        else:
+            runs.append((page, PAGE))
+    return runs
+
+
+def _require(method: str, expected: str):
+    if method != expected:
+        raise HTTPError(405, f"Use {expected}")
+
+
+def _int(query: Dict[str, str], name: str, default: Optional[int] = None) -> int:
+    if name not in query:
+        if default is None:
+            raise HTTPError(400, f"Missing parameter '{name}'")
+        return default
+    try:
+        return int(query[name], 0)
+    except ValueError:
+        raise HTTPError(400, f"Parameter '{name}' must be an integer")
+
+
+def _float(query: Dict[str, str], name: str, default: float) -> float:
+    try:
+        return float(query.get(name, default))
+    except ValueError:
+        raise HTTPError(400, f"Parameter '{name}' must be a number")
+
+
+def _json(value) -> Tuple[int, str, bytes]:
+    return 200, "application/json", json.dumps(value, separators=(",", ":")).encode()
+
+
+def _error(status: int, message: str) -> Tuple[int, str, bytes]:
+    return status, "application/json", json.dumps({"error": message}).encode()
+
+
+async def _respond(writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes,
+                   keep_alive: bool):
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Cache-Control: no-store\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode() + body)
+    await writer.drain()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Web dashboard for the Red Pitaya CPU")
+    parser.add_argument("--backend", default="devmem", help="devmem[:base] or file:<path>")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--refresh", type=float, default=10.0, help="snapshot refreshes per second")
+    parser.add_argument("--telemetry-rate", type=float, default=30.0, help="WebSocket frames per second")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    async def run():
+        cpu = AsyncCPUController(CPUController(open_backend(args.backend)))
+        await DashboardServer(cpu, args.refresh, args.telemetry_rate).serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except ControllerError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
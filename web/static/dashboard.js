@@ -0,0 +1,189 @@
+// Live view: telemetry over the /ws WebSocket, registers, disassembly and
+// memory from the server's cached snapshot
+
+const POLL_MS = 250;
+const RECONNECT_MS = 1000;
+const DISASM_LINES = 24;
+const MEMORY_BYTES = 256;
+const CHART_MS = 1000;
+
+const telemetry = {};
+let previous = null;  // {cycles, instret} for the IPC estimate
+
+function setLink(up) {
+  const link = document.getElementById("link");
+  link.textContent = up ? "live" : "offline";
+  link.className = "link " + (up ? "up" : "down");
+}
+
+function applyTelemetry(fields) {
+  Object.assign(telemetry, fields);
+  for (const el of document.querySelectorAll("[data-field]")) {
+    const value = telemetry[el.dataset.field];
+    if (value !== undefined) {
+      el.textContent = formatField(value, el.dataset.format);
+    }
+  }
+  const ipc = document.getElementById("ipc");
+  if (ipc && ("cycles" in fields || "instret" in fields)) {
+    if (previous && telemetry.cycles > previous.cycles) {
+      ipc.textContent = ((telemetry.instret - previous.instret) /
+                         (telemetry.cycles - previous.cycles)).toFixed(3);
+    }
+    previous = {cycles: telemetry.cycles, instret: telemetry.instret};
+  }
+}
+
+function connect() {
+  const scheme = location.protocol === "https:" ? "wss:" : "ws:";
+  const ws = new WebSocket(`${scheme}//${location.host}/ws`, "rp-cpu.json");
+  ws.onopen = () => setLink(true);
+  ws.onmessage = (event) => applyTelemetry(JSON.parse(event.data).fields);
+  ws.onclose = () => {
+    setLink(false);
+    setTimeout(connect, RECONNECT_MS);
+  };
+}
+
+async function pollRegisters(table) {
+  const registers = await fetchJSON("/api/registers");
+  const rows = Object.entries(registers).map(([name, value], i) =>
+    `<tr><td>x${i}</td><td>${name}</td><td>${hex(value)}</td><td>${value | 0}</td></tr>`);
+  table.innerHTML = rows.join("");
+}
+
+async function pollDisassembly(pre) {
+  const input = document.getElementById("disasm-addr");
+  const follow = !input.value.trim();
+  const pc = telemetry.pc || 0;
+  const start = follow ? Math.max(pc - 8 * 4, 0) : parseAddress(input.value, pc);
+  const result = await fetchJSON(`/api/disasm?addr=${start}&count=${DISASM_LINES}`);
+  pre.textContent = result.lines
+    .map((line, i) => (start + 4 * i === pc ? "=> " : "   ") + line)
+    .join("\n");
+}
+
+async function pollMemory(pre) {
+  const addr = parseAddress(document.getElementById("mem-addr").value, 0x10000);
+  const result = await fetchJSON(`/api/memory?addr=${addr}&size=${MEMORY_BYTES}`);
+  pre.textContent = hexDump(result.addr, result.data);
+}
+
+function startPolling() {
+  const panels = [
+    ["registers", pollRegisters],
+    ["disasm", pollDisassembly],
+    ["memory", pollMemory],
+  ].map(([id, poll]) => [document.getElementById(id), poll]).filter(([el]) => el);
+  if (!panels.length) {
+    return;
+  }
+  const tick = async () => {
+    // Skip work while the tab is hidden; the server cache makes each poll cheap
+    if (!document.hidden) {
+      for (const [el, poll] of panels) {
+        try {
+          await poll(el);
+        } catch (e) {
+          el.textContent = `error: ${e.message}`;
+        }
+      }
+    }
+    setTimeout(tick, POLL_MS);
+  };
+  tick();
+}
+
+function drawChart(canvas, series) {
+  const ctx = canvas.getContext("2d");
+  const {width, height} = canvas;
+  ctx.clearRect(0, 0, width, height);
+  const points = series.t.map((t, i) => [t, series.v[i]]).filter(([, v]) => v !== null);
+  if (points.length < 2) {
+    return;
+  }
+  const t0 = points[0][0];
+  const t1 = points[points.length - 1][0];
+  const max = Math.max(...points.map(([, v]) => v)) || 1;
+  ctx.strokeStyle = "#3557c8";
+  ctx.beginPath();
+  points.forEach(([t, v], i) => {
+    const x = ((t - t0) / (t1 - t0 || 1)) * width;
+    const y = height - (v / max) * (height - 10) - 5;
+    i ? ctx.lineTo(x, y) : ctx.moveTo(x, y);
+  });
+  ctx.stroke();
+  ctx.fillStyle = "#5a6275";
+  ctx.fillText(max.toFixed(3), 4, 12);
+}
+
+function startChart() {
+  const canvas = document.getElementById("chart");
+  if (!canvas) {
+    return;
+  }
+  const tick = async () => {
+    if (!document.hidden) {
+      const metric = document.getElementById("chart-metric").value;
+      const span = Number(document.getElementById("chart-span").value);
+      const end = Date.now() / 1000;
+      try {
+        const series = await fetchJSON(
+          `/api/metrics?metric=${metric}&start=${end - span}&end=${end}&points=${canvas.width / 2}`);
+        document.getElementById("chart-tier").textContent = `${series.t.length} points (${series.tier})`;
+        drawChart(canvas, series);
+      } catch (e) {
+        document.getElementById("chart-tier").textContent = `error: ${e.message}`;
+      }
+    }
+    setTimeout(tick, CHART_MS);
+  };
+  tick();
+}
+
+function log(message) {
+  const el = document.getElementById("log");
+  if (el) {
+    el.textContent = `${new Date().toLocaleTimeString()}  ${message}\n` + el.textContent;
+  }
+}
+
+function setupControls() {
+  for (const button of document.querySelectorAll("button[data-action]")) {
+    button.addEventListener("click", async () => {
+      button.disabled = true;
+      try {
+        const result = await postJSON("/api/control", {action: button.dataset.action});
+        log(`${button.dataset.action}: pc ${hex(result.state.status.pc)}`);
+      } catch (e) {
+        log(`${button.dataset.action} failed: ${e.message}`);
+      } finally {
+        button.disabled = false;
+      }
+    });
+  }
+
+  const form = document.getElementById("load-form");
+  if (!form) {
+    return;
+  }
+  form.addEventListener("submit", async (event) => {
+    event.preventDefault();
+    const file = document.getElementById("program").files[0];
+    const type = document.getElementById("program-type").value;
+    try {
+      const result = await fetchJSON("/api/load" + (type ? `?type=${type}` : ""), {
+        method: "POST",
+        body: await file.arrayBuffer(),
+      });
+      log(`loaded ${file.name}: ${result.load.written}/${result.load.blocks} blocks written`);
+    } catch (e) {
+      log(`load failed: ${e.message}`);
+    }
+  });
+}
+
+connect();
+startPolling();
+startChart();
+setupControls();
@@ -0,0 +1,63 @@
+// Formatting and request helpers shared by the dashboard pages
+
+// CPU_STATE_* bits from cpu_regs.h
+const STATE_BITS = [
+  [1 << 0, "running"],
+  [1 << 1, "halted"],
+  [1 << 2, "exception"],
+  [1 << 3, "interrupt"],
+  [1 << 4, "debug"],
+  [1 << 5, "reset"],
+];
+
+// CPU_STALL_* codes
+const STALL_NAMES = ["none", "hazard", "memory", "coproc", "debug"];
+
+function hex(value, digits = 8) {
+  return "0x" + (value >>> 0).toString(16).padStart(digits, "0");
+}
+
+function formatState(state) {
+  const names = STATE_BITS.filter(([bit]) => state & bit).map(([, name]) => name);
+  return names.length ? names.join(", ") : "idle";
+}
+
+function formatField(value, format) {
+  switch (format) {
+    case "hex": return hex(value);
+    case "state": return formatState(value);
+    case "stall": return STALL_NAMES[value] || hex(value, 1);
+    default: return value.toLocaleString();
+  }
+}
+
+function parseAddress(text, fallback) {
+  const value = Number(text.trim());
+  return text.trim() && Number.isInteger(value) ? value : fallback;
+}
+
+async function fetchJSON(url, options = {}) {
+  const response = await fetch(url, options);
+  const body = await response.json();
+  if (!response.ok) {
+    throw new Error(body.error || response.statusText);
+  }
+  return body;
+}
+
+function postJSON(url, value) {
+  return fetchJSON(url, {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify(value),
+  });
+}
+
+function hexDump(addr, hexData) {
+  const lines = [];
+  for (let i = 0; i < hexData.length; i += 32) {
+    const words = hexData.slice(i, i + 32).match(/.{8}/g) || [];
+    lines.push(hex(addr + i / 2, 5) + ":  " + words.join(" "));
+  }
+  return lines.join("\n");
+}
@@ -0,0 +1,98 @@
+"""MetricsStore tier choice and LTTB downsampling"""
+
+import math
+
+import numpy as np
+
+from metrics_store import MetricsStore, lttb
+
+T0 = 1_700_000_040.0  # A whole minute, so buckets line up with T0
+
+
+def feed(store: MetricsStore, seconds: float, rate: float = 10.0, ipc: float = 0.5):
+    """Samples at rate per second from T0 to T0 + seconds at a steady IPC"""
+    for i in range(int(seconds * rate) + 1):
+        cycles = i * 1000
+        store.add(T0 + i / rate, {"cycles": cycles, "instret": int(cycles * ipc), "stall": i % 2})
+
+
+def test_raw_for_short_windows():
+    store = MetricsStore()
+    feed(store, 60)
+    times, values, tier = store.series("ipc", T0 + 30, T0 + 40, 100)
+    assert tier == "raw"
+    assert len(times) == 100
+    assert np.allclose(values, 0.5)
+
+
+def test_rollup_for_long_windows():
+    """Too many raw rows in the window moves to 1 s buckets"""
+    store = MetricsStore()
+    feed(store, 600)
+    times, values, tier = store.series("ipc", T0, T0 + 600, 200)
+    assert tier == "1s"
+    assert len(times) == 200
+    assert np.allclose(values, 0.5)
+    assert abs(store.series("stall", T0, T0 + 600, 200)[1].mean() - 0.5) < 0.01
+
+
+def test_rollup_covers_from_bucket_start():
+    """A tier whose oldest bucket starts at the window start covers it
+
+    The oldest 1 s row is stamped T0 + 900.5 but holds samples from
+    T0 + 900; the 1 min tier would give a single point.
+    """
+    store = MetricsStore({"raw": 1000, "1s": 100, "1min": 100})
+    feed(store, 1000)
+    assert store.tiers()["1s"].oldest == T0 + 900.5
+    times, values, tier = store.series("ipc", T0 + 900, T0 + 1000, 50)
+    assert tier == "1s"
+    assert len(times) == 50
+
+
+def test_fallback_reaches_furthest_back():
+    """With nothing covering start, the tier reaching furthest back wins"""
+    store = MetricsStore({"raw": 1000, "1s": 100, "1min": 100})
+    feed(store, 1000)
+    store.flush()
+    assert store.series("ipc", T0 - 3600, T0 + 1000, 50)[2] == "1min"
+    # The 1 s and 1 min buckets both start at T0 here; the finer one is used
+    store = MetricsStore({"raw": 10, "1s": 1, "1min": 1})
+    feed(store, 0.9)
+    store.flush()
+    assert store.series("ipc", T0 - 1, T0 + 1, 50)[2] == "1s"
+
+
+def test_lttb_passthrough():
+    x = np.arange(10.0)
+    y = x ** 2
+    assert lttb(x, y, 10)[0] is x
+    assert lttb(x, y, 2)[1] is y
+
+
+def test_lttb_keeps_extremes():
+    """Ends are kept, times stay in order and a one-sample spike survives"""
+    x = np.arange(10_000.0)
+    y = np.sin(x / 500)
+    y[4321] = 10.0
+    y[7777] = -10.0
+    xs, ys = lttb(x, y, 100)
+    assert len(xs) == len(ys) == 100
+    assert (xs[0], xs[-1]) == (0.0, 9999.0)
+    assert np.all(np.diff(xs) > 0)
+    assert 4321.0 in xs and 7777.0 in xs
+    assert np.array_equal(ys, y[xs.astype(int)])
+    # Decimation to the same number of points misses both
+    assert 10.0 not in y[::100] and -10.0 not in y[::100]
+
+
+def test_lttb_nan_gaps():
+    """NaN values (a halted CPU) do not stop the spike from being found"""
+    x = np.arange(1000.0)
+    y = np.ones(1000)
+    y[100:200] = math.nan
+    y[500] = 5.0
+    xs, ys = lttb(x, y, 20)
+    assert len(xs) == 20
+    assert 500.0 in xs
+    assert np.isnan(ys).sum() < 20
@@ -0,0 +1,135 @@
+"""DashboardServer REST endpoints and command queue against a FileBackend"""
+
+import asyncio
+import json
+from typing import Dict, Tuple
+
+import pytest
+
+from async_controller import AsyncCPUController
+from controller import CPU_CTRL_ENABLE, CPU_ENABLE_BIT, CTRL_OFFSET, CPUController, FileBackend
+from server import DashboardServer
+
+PROGRAM = bytes.fromhex("93005000" "13014000")  # li ra, 5; li sp, 4
+
+
+def serve(test):
+    """Run test(server, request) with the server listening on a free port"""
+    async def main():
+        cpu = CPUController(FileBackend())
+        cpu.write_memory(0, PROGRAM)
+        server = DashboardServer(AsyncCPUController(cpu), refresh=100.0)
+        await server.refresh()
+        listener = await asyncio.start_server(server.handle_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        tasks = [asyncio.ensure_future(server._worker()), asyncio.ensure_future(server._refresher())]
+
+        async def request(method: str, target: str, body: bytes = b"") -> Tuple[int, Dict, bytes]:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            head = await reader.readuntil(b"\r\n\r\n")
+            payload = await reader.read()
+            writer.close()
+            lines = head.decode().split("\r\n")
+            headers = dict(line.split(": ", 1) for line in lines[1:] if line)
+            return int(lines[0].split()[1]), headers, payload
+
+        try:
+            await test(server, request)
+        finally:
+            for task in tasks:
+                task.cancel()
+            listener.close()
+            await listener.wait_closed()
+
+    asyncio.run(main())
+
+
+def test_pages_and_static():
+    async def test(server, request):
+        status, headers, body = await request("GET", "/")
+        assert status == 200 and headers["Content-Type"].startswith("text/html")
+        assert b"{{" not in body
+        status, headers, _ = await request("GET", "/static/dashboard.js")
+        assert status == 200 and "javascript" in headers["Content-Type"]
+        assert (await request("GET", "/static/../server.py"))[0] == 404
+        assert (await request("GET", "/nowhere"))[0] == 404
+        assert (await request("POST", "/api/state"))[0] == 405
+    serve(test)
+
+
+def test_state_memory_and_disasm():
+    async def test(server, request):
+        status, _, body = await request("GET", "/api/state")
+        state = json.loads(body)
+        assert status == 200 and state["seq"] >= 1
+        assert set(state["registers"]) == set(json.loads((await request("GET", "/api/registers"))[2]))
+
+        status, _, body = await request("GET", "/api/memory?addr=0&size=8")
+        assert json.loads(body)["data"] == PROGRAM.hex()
+        # Pages read for a request stay in the snapshot until they go unused
+        assert 0 in server.snapshot.pages and 0 in server._watched
+        assert (await request("GET", "/api/memory?addr=0&size=0"))[0] == 400
+        assert (await request("GET", "/api/memory?size=4"))[0] == 400
+        assert (await request("GET", "/api/memory?addr=0x40000&size=4"))[0] == 400
+
+        lines = json.loads((await request("GET", "/api/disasm?addr=0&count=2"))[2])["lines"]
+        assert [line.split("  ")[-1] for line in lines] == ["li ra, 5", "li sp, 4"]
+
+        status, _, body = await request("GET", "/api/metrics?metric=ipc&points=10")
+        assert status == 200 and json.loads(body)["tier"] == "raw"
+        assert (await request("GET", "/api/metrics?metric=nope"))[0] == 400
+    serve(test)
+
+
+def test_control_and_load():
+    async def test(server, request):
+        backend = server.cpu.controller.backend
+        status, _, body = await request("POST", "/api/control", b'{"action": "start"}')
+        assert status == 200 and json.loads(body)["ok"]
+        assert backend.read32(CTRL_OFFSET + CPU_CTRL_ENABLE) & CPU_ENABLE_BIT
+        await request("POST", "/api/control", b'{"action": "stop"}')
+        assert not backend.read32(CTRL_OFFSET + CPU_CTRL_ENABLE) & CPU_ENABLE_BIT
+        assert (await request("POST", "/api/control", b'{"action": "fly"}'))[0] == 400
+        assert (await request("POST", "/api/control", b"[1]"))[0] == 400
+        assert (await request("GET", "/api/control"))[0] == 405
+
+        # The memory page is cached; a load must not leave the old bytes there
+        await request("GET", "/api/memory?addr=0&size=8")
+        status, _, body = await request("POST", "/api/load?type=bin", PROGRAM[::-1])
+        assert status == 200 and json.loads(body)["load"]["written"] >= 1
+        body = (await request("GET", "/api/memory?addr=0&size=8"))[2]
+        assert json.loads(body)["data"] == PROGRAM[::-1].hex()
+        assert (await request("POST", "/api/load?type=exe", PROGRAM))[0] == 400
+        assert (await request("POST", "/api/load"))[0] == 400
+    serve(test)
+
+
+def test_commands_run_one_at_a_time():
+    """Concurrent commands run in arrival order, each after the last finished"""
+    async def test(server, request):
+        events = []
+
+        async def run_command(action, args):
+            events.append(("begin", action))
+            await asyncio.sleep(0.01)
+            events.append(("end", action))
+            return action
+
+        server._run_command = run_command
+        actions = ["start", "step", "stop", "reset"]
+        results = await asyncio.gather(*(server.command(action) for action in actions))
+        assert results == actions
+        assert events == [(edge, action) for action in actions for edge in ("begin", "end")]
+
+        # A failing command fails only its caller
+        async def failing(action, args):
+            raise ValueError(action)
+
+        server._run_command = failing
+        with pytest.raises(ValueError, match="start"):
+            await server.command("start")
+        server._run_command = run_command
+        assert await server.command("stop") == "stop"
+    serve(test)
@@ -0,0 +1,275 @@
+"""RFC 6455 framing and handshake, frame encodings and per-client fan-out"""
+
+import asyncio
+import json
+import os
+import struct
+
+import pytest
+
+from async_controller import AsyncCPUController
+from controller import CPU_STATUS_PC, STATUS_OFFSET, CPUController, FileBackend
+from websocket_bridge import (
+    OP_BINARY,
+    OP_CLOSE,
+    OP_CONT,
+    OP_PING,
+    OP_PONG,
+    OP_TEXT,
+    TELEMETRY_FIELDS,
+    TelemetryBridge,
+    WebSocket,
+    WebSocketError,
+    decode_binary,
+    encode_binary,
+    handshake,
+)
+
+FIELDS = [name for name, _ in TELEMETRY_FIELDS]
+
+
+def client_frame(opcode: int, payload: bytes, fin: bool = True, masked: bool = True) -> bytes:
+    """A frame as a browser sends it: masked, with the shortest length form"""
+    size = len(payload)
+    if size < 126:
+        length = struct.pack("!B", size)
+    elif size < 1 << 16:
+        length = struct.pack("!BH", 126, size)
+    else:
+        length = struct.pack("!BQ", 127, size)
+    head = struct.pack("!B", (0x80 if fin else 0) | opcode) + length
+    if not masked:
+        return head + payload
+    mask = os.urandom(4)
+    return (bytes([head[0], head[1] | 0x80]) + head[2:] + mask
+            + bytes(b ^ mask[i & 3] for i, b in enumerate(payload)))
+
+
+async def read_server_frame(reader: asyncio.StreamReader):
+    b0, b1 = await reader.readexactly(2)
+    assert not b1 & 0x80  # Server frames are never masked
+    size = b1 & 0x7F
+    if size == 126:
+        size, = struct.unpack("!H", await reader.readexactly(2))
+    elif size == 127:
+        size, = struct.unpack("!Q", await reader.readexactly(8))
+    return bool(b0 & 0x80), b0 & 0x0F, await reader.readexactly(size)
+
+
+class Writer:
+    """Enough of a StreamWriter for WebSocket"""
+
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+
+    def write(self, data: bytes):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSocket:
+    """A WebSocket whose sends can be held up, as for a slow client"""
+
+    def __init__(self):
+        self.sent = []
+        self.inbox: "asyncio.Queue" = asyncio.Queue()
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.closed = False
+
+    async def send(self, message):
+        await self.gate.wait()
+        self.sent.append(message)
+
+    async def recv(self):
+        return await self.inbox.get()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_binary_round_trip():
+    values = {name: i + 1 for i, name in enumerate(FIELDS)}
+    values["cycles"] = (1 << 40) + 7  # Counters travel as 64 bits
+    frame = encode_binary(42, 1234.5, values)
+    assert decode_binary(frame) == (42, 1234.5, values)
+
+    frame = encode_binary(43, 1.0, {"pc": 0x40, "instret": 1 << 33})
+    mask, = struct.unpack_from("<H", frame, 13)
+    assert mask == 1 << FIELDS.index("pc") | 1 << FIELDS.index("instret")
+    assert len(frame) == 15 + 4 + 8
+    assert decode_binary(frame) == (43, 1.0, {"pc": 0x40, "instret": 1 << 33})
+
+    with pytest.raises(ValueError):
+        decode_binary(b"\x02" + frame[1:])
+
+
+def test_handshake():
+    """The RFC 6455 section 1.3 example key, and subprotocol choice"""
+    headers = {"sec-websocket-key": "dGhlIHNhbXBsZSBub25jZQ==", "sec-websocket-version": "13",
+               "sec-websocket-protocol": "chat, rp-cpu.bin"}
+    response, protocol = handshake(headers, ("rp-cpu.bin", "rp-cpu.json"))
+    lines = response.decode().split("\r\n")
+    assert lines[0] == "HTTP/1.1 101 Switching Protocols"
+    assert "Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=" in lines
+    assert protocol == "rp-cpu.bin" and "Sec-WebSocket-Protocol: rp-cpu.bin" in lines
+    assert response.endswith(b"\r\n\r\n")
+
+    del headers["sec-websocket-protocol"]
+    response, protocol = handshake(headers, ("rp-cpu.bin",))
+    assert protocol is None and b"Sec-WebSocket-Protocol" not in response
+    with pytest.raises(WebSocketError):
+        handshake({**headers, "sec-websocket-version": "8"})
+    with pytest.raises(WebSocketError):
+        handshake({"sec-websocket-version": "13"})
+
+
+def test_server_frame_lengths():
+    ws = WebSocket(None, None)
+    for size, head in ((125, 2), (126, 4), (65535, 4), (65536, 10)):
+        frame = ws._frame(OP_BINARY, bytes(size))
+        assert len(frame) == head + size
+        assert frame[0] == 0x80 | OP_BINARY
+
+
+def test_read_frames():
+    """Unmasking, fragments with a ping between them, close, and bad frames"""
+    async def main():
+        reader = asyncio.StreamReader()
+        writer = Writer()
+        ws = WebSocket(reader, writer)
+        reader.feed_data(client_frame(OP_TEXT, b'{"resync":', fin=False)
+                         + client_frame(OP_PING, b"hi")
+                         + client_frame(OP_CONT, b" true}")
+                         + client_frame(OP_BINARY, bytes(range(256)) * 2))
+        assert await ws.recv() == '{"resync": true}'
+        assert writer.data == ws._frame(OP_PONG, b"hi")
+        assert await ws.recv() == bytes(range(256)) * 2
+
+        writer.data = b""
+        reader.feed_data(client_frame(OP_CLOSE, struct.pack("!H", 1000)))
+        assert await ws.recv() is None
+        assert writer.data == ws._frame(OP_CLOSE, struct.pack("!H", 1000)) and writer.closed
+
+        for frame in (client_frame(OP_TEXT, b"x", masked=False), client_frame(OP_BINARY, bytes(1 << 17))):
+            reader = asyncio.StreamReader()
+            reader.feed_data(frame)
+            with pytest.raises(WebSocketError):
+                await WebSocket(reader, Writer()).recv()
+
+        reader = asyncio.StreamReader()
+        reader.feed_data(client_frame(OP_TEXT, b"cut")[:4])
+        reader.feed_eof()
+        assert await WebSocket(reader, Writer()).recv() is None
+
+    asyncio.run(main())
+
+
+def bridge() -> TelemetryBridge:
+    return TelemetryBridge(AsyncCPUController(CPUController(FileBackend())))
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_changed_fields():
+    """The first frame has every field, later ones only what changed"""
+    async def main():
+        telemetry = bridge()
+        backend = telemetry.cpu.controller.backend
+        ws = FakeSocket()
+        task = asyncio.ensure_future(telemetry.serve_client(ws, binary=True))
+        telemetry.publish(1.0, await telemetry.sample())
+        await settle()
+        assert decode_binary(ws.sent[0])[2] == {name: 0 for name in FIELDS}
+
+        backend.write32(STATUS_OFFSET + CPU_STATUS_PC, 0x40)
+        telemetry.publish(2.0, await telemetry.sample())
+        await settle()
+        assert struct.unpack_from("<H", ws.sent[1], 13)[0] == 1 << FIELDS.index("pc")
+        assert decode_binary(ws.sent[1]) == (2, 2.0, {"pc": 0x40})
+
+        telemetry.publish(3.0, await telemetry.sample())  # Nothing changed
+        await settle()
+        assert len(ws.sent) == 2
+
+        await ws.inbox.put('{"resync": true}')
+        await settle()
+        assert decode_binary(ws.sent[2])[2] == {**{name: 0 for name in FIELDS}, "pc": 0x40}
+
+        await ws.inbox.put(None)
+        await task
+        assert ws.closed and not telemetry.clients
+
+    asyncio.run(main())
+
+
+def test_slow_client_drops_frames():
+    """A client still sending gets only the newest state when it catches up"""
+    async def main():
+        telemetry = bridge()
+        slow, fast = FakeSocket(), FakeSocket()
+        tasks = [asyncio.ensure_future(telemetry.serve_client(ws, binary=False)) for ws in (slow, fast)]
+        await settle()
+        slow.gate.clear()
+        for pc in range(1, 6):
+            telemetry.publish(float(pc), {"pc": pc})
+            await settle()
+
+        assert [json.loads(m)["fields"]["pc"] for m in fast.sent] == [1, 2, 3, 4, 5]
+        assert slow.sent == []  # Stuck sending pc 1
+        slow.gate.set()
+        await settle()
+        assert [json.loads(m)["fields"]["pc"] for m in slow.sent] == [1, 5]
+        assert [json.loads(m)["seq"] for m in slow.sent] == [1, 5]
+        clients = {client.ws: client for client in telemetry.clients}
+        assert clients[slow].dropped == 3 and clients[fast].dropped == 0
+
+        for ws in (slow, fast):
+            await ws.inbox.put(None)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+
+def test_connection():
+    """Upgrade over a real socket, a JSON frame, and a plain HTTP request refused"""
+    async def main():
+        telemetry = bridge()
+        server = await asyncio.start_server(telemetry.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        poller = asyncio.ensure_future(telemetry.run())
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /?format=json HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\n"
+                     b"Connection: Upgrade\r\nSec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                     b"Sec-WebSocket-Version: 13\r\n\r\n")
+        head = await reader.readuntil(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.1 101 ")
+        fin, opcode, payload = await asyncio.wait_for(read_server_frame(reader), 5)
+        assert (fin, opcode) == (True, OP_TEXT)
+        assert set(json.loads(payload)["fields"]) == set(FIELDS)
+        writer.write(client_frame(OP_CLOSE, struct.pack("!H", 1000)))
+        while opcode != OP_CLOSE:
+            _, opcode, payload = await asyncio.wait_for(read_server_frame(reader), 5)
+        assert payload == struct.pack("!H", 1000)
+        writer.close()
+
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        assert (await reader.read()).startswith(b"HTTP/1.1 426 ")
+        writer.close()
+
+        poller.cancel()
+        server.close()
+        await server.wait_closed()
+
+    asyncio.run(main())
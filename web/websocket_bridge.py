@@ -0,0 +1,392 @@
+"""
+WebSocket telemetry bridge for the dashboard
+
+One asyncio service polls the CPU status block (CPU_STATUS_STATE through
+CPU_STATUS_PIPELINE) once per frame and fans the result out to any number
+of browser clients. Each client only gets the fields that changed since
+the last frame it was sent. A client that is still busy sending gets the
+newest state when it catches up, and the frames in between are dropped
+rather than queued. Counters are extended to 64 bits on the way through.
+
+Frames are JSON text by default. Clients that ask for the rp-cpu.bin
+subprotocol (or ?format=binary) get a compact binary frame instead:
+
+    <B type=1> <I seq> <d time> <H changed mask> then, for each set bit
+    in TELEMETRY_FIELDS order, the value as <I (or <Q for the counters)
+
+The WebSocket protocol (RFC 6455) is implemented on asyncio streams, so
+the bridge needs nothing outside the standard library and the host tools,
+and it listens on localhost only unless told otherwise:
+
+    PYTHONPATH=sw/host_interface python web/websocket_bridge.py --backend devmem --port 8765 --rate 30
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import struct
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+from async_controller import AsyncCPUController
+from controller import STATUS_OFFSET, CPUController, ControllerError, open_backend
+from perf_sampler import WrapCounter
+from snapshot import STATUS_BLOCK_SIZE, STATUS_FIELDS
+
+logger = logging.getLogger(__name__)
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+SUBPROTOCOL_JSON = "rp-cpu.json"
+SUBPROTOCOL_BINARY = "rp-cpu.bin"
+MAX_MESSAGE = 1 << 16
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Field name and binary format, in status block order
+TELEMETRY_FIELDS: List[Tuple[str, str]] = [
+    (name, "Q" if name in ("cycles", "instret") else "I") for name, _ in STATUS_FIELDS
+]
+FRAME_TELEMETRY = 1
+_FRAME_HEADER = struct.Struct("<BIdH")
+
+Values = Dict[str, int]
+
+
+class WebSocketError(Exception):
+    """Protocol violation by the peer"""
+
+
+def parse_request(head: bytes) -> Tuple[str, str, Dict[str, str]]:
+    """(method, target, {lower-case header: value}) of an HTTP request head"""
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise WebSocketError(f"Bad request line {lines[0]!r}")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+def is_websocket(headers: Dict[str, str]) -> bool:
+    return ("websocket" in headers.get("upgrade", "").lower()
+            and "upgrade" in headers.get("connection", "").lower())
+
+
+def handshake(headers: Dict[str, str], protocols: Tuple[str, ...] = ()) -> Tuple[bytes, Optional[str]]:
+    """101 response for a WebSocket upgrade request, and the chosen subprotocol"""
+    key = headers.get("sec-websocket-key")
+    if not key or headers.get("sec-websocket-version") != "13":
+        raise WebSocketError("Missing Sec-WebSocket-Key or unsupported version")
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+    offered = [p.strip() for p in headers.get("sec-websocket-protocol", "").split(",") if p.strip()]
+    chosen = next((p for p in offered if p in protocols), None)
+    lines = [
+        "HTTP/1.1 101 Switching Protocols",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Accept: {accept}",
+    ]
+    if chosen:
+        lines.append(f"Sec-WebSocket-Protocol: {chosen}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode(), chosen
+
+
+class WebSocket:
+    """Server side of an upgraded connection"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+
+    def _frame(self, opcode: int, payload: bytes) -> bytes:
+        size = len(payload)
+        if size < 126:
+            header = struct.pack("!BB", 0x80 | opcode, size)
+        elif size < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, size)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, size)
+        return header + payload
+
+    async def send(self, message: Union[str, bytes]):
+        if self.closed:
+            raise ConnectionResetError("WebSocket closed")
+        if isinstance(message, str):
+            self.writer.write(self._frame(OP_TEXT, message.encode()))
+        else:
+            self.writer.write(self._frame(OP_BINARY, message))
+        await self.writer.drain()
+
+    async def _read_frame(self) -> Tuple[bool, int, bytes]:
+        b0, b1 = await self.reader.readexactly(2)
+        if not b1 & 0x80:
+            raise WebSocketError("Client frames must be masked")
+        size = b1 & 0x7F
+        if size == 126:
+            size, = struct.unpack("!H", await self.reader.readexactly(2))
+        elif size == 127:
+            size, = struct.unpack("!Q", await self.reader.readexactly(8))
+        if size > MAX_MESSAGE:
+            raise WebSocketError(f"Frame of {size} bytes is too large")
+        mask = await self.reader.readexactly(4)
+        data = bytearray(await self.reader.readexactly(size))
+        for i in range(size):
+            data[i] ^= mask[i & 3]
+        return bool(b0 & 0x80), b0 & 0x0F, bytes(data)
+
+    async def recv(self) -> Optional[Union[str, bytes]]:
+        """Next data message, or None once the connection is closed"""
+        message = b""
+        kind = None
+        try:
+            while True:
+                fin, opcode, data = await self._read_frame()
+                if opcode == OP_CLOSE:
+                    await self.close()
+                    return None
+                if opcode == OP_PING:
+                    self.writer.write(self._frame(OP_PONG, data))
+                    continue
+                if opcode == OP_PONG:
+                    continue
+                if opcode != OP_CONT:
+                    kind = opcode
+                message += data
+                if len(message) > MAX_MESSAGE:
+                    raise WebSocketError("Message too large")
+                if fin:
+                    return message.decode() if kind == OP_TEXT else message
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self.closed = True
+            return None
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.writer.write(self._frame(OP_CLOSE, struct.pack("!H", code)))
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+        self.writer.close()
+
+
+def encode_json(seq: int, timestamp: float, changed: Values) -> str:
+    return json.dumps({"seq": seq, "t": round(timestamp, 6), "fields": changed}, separators=(",", ":"))
+
+
+def encode_binary(seq: int, timestamp: float, changed: Values) -> bytes:
+    mask = 0
+    values = []
+    formats = ""
+    for bit, (name, fmt) in enumerate(TELEMETRY_FIELDS):
+        if name in changed:
+            mask |= 1 << bit
+            values.append(changed[name])
+            formats += fmt
+    return _FRAME_HEADER.pack(FRAME_TELEMETRY, seq, timestamp, mask) + struct.pack("<" + formats, *values)
+
+
+def decode_binary(frame: bytes) -> Tuple[int, float, Values]:
+    """Inverse of encode_binary(), for tools and tests"""
+    kind, seq, timestamp, mask = _FRAME_HEADER.unpack_from(frame)
+    if kind != FRAME_TELEMETRY:
+        raise ValueError(f"Unknown frame type {kind}")
+    names = [(name, fmt) for bit, (name, fmt) in enumerate(TELEMETRY_FIELDS) if mask >> bit & 1]
+    values = struct.unpack_from("<" + "".join(fmt for _, fmt in names), frame, _FRAME_HEADER.size)
+    return seq, timestamp, dict(zip((name for name, _ in names), values))
+
+
+class Client:
+    """One browser connection and what it has been sent"""
+
+    def __init__(self, ws: WebSocket, binary: bool, peer: str):
+        self.ws = ws
+        self.binary = binary
+        self.peer = peer
+        self.sent: Values = {}
+        self.dirty = asyncio.Event()
+        self.frames = 0
+        self.dropped = 0  # Frames superseded before this client could take them
+
+
+class TelemetryBridge:
+    """Polls the status block once per frame and fans changes out to clients"""
+
+    def __init__(self, cpu: AsyncCPUController, rate: float = 30.0, send_timeout: float = 5.0):
+        self.cpu = cpu
+        self.interval = 1.0 / rate
+        self.send_timeout = send_timeout
+        self.clients: Set[Client] = set()
+        self.listeners: List[Callable[[float, Values], None]] = []
+        self.latest: Values = {}
+        self.timestamp = 0.0
+        self.seq = 0
+        self.polls = 0
+        self._counters = {"cycles": WrapCounter(), "instret": WrapCounter()}
+        self._primed = False
+
+    def add_listener(self, listener: Callable[[float, Values], None]):
+        """Call listener(timestamp, values) with every polled frame"""
+        self.listeners.append(listener)
+
+    async def sample(self) -> Values:
+        block = await self.cpu.read_block(STATUS_OFFSET, STATUS_BLOCK_SIZE)
+        words = struct.unpack(f"<{STATUS_BLOCK_SIZE // 4}I", block)
+        values = {name: words[offset // 4] for name, offset in STATUS_FIELDS}
+        for name, counter in self._counters.items():
+            if not self._primed:
+                counter.last = values[name]
+            values[name] = counter.update(values[name], time.monotonic())
+        self._primed = True
+        self.polls += 1
+        return values
+
+    def publish(self, timestamp: float, values: Values):
+        self.seq += 1
+        self.timestamp = timestamp
+        self.latest = values
+        for listener in self.listeners:
+            listener(timestamp, values)
+        for client in self.clients:
+            if client.dirty.is_set():
+                client.dropped += 1
+            client.dirty.set()
+
+    async def run(self):
+        """Poll loop; only touches the hardware while someone is listening"""
+        loop = asyncio.get_running_loop()
+        next_frame = loop.time()
+        while True:
+            if self.clients or self.listeners:
+                try:
+                    self.publish(time.time(), await self.sample())
+                except ControllerError as e:
+                    logger.warning(f"Telemetry poll failed: {e}")
+            next_frame += self.interval
+            delay = next_frame - loop.time()
+            if delay < 0:
+                next_frame = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def _sender(self, client: Client):
+        while True:
+            await client.dirty.wait()
+            client.dirty.clear()
+            changed = {k: v for k, v in self.latest.items() if client.sent.get(k) != v}
+            if not changed:
+                continue
+            if client.binary:
+                message = encode_binary(self.seq, self.timestamp, changed)
+            else:
+                message = encode_json(self.seq, self.timestamp, changed)
+            await asyncio.wait_for(client.ws.send(message), self.send_timeout)
+            client.sent.update(changed)
+            client.frames += 1
+
+    async def serve_client(self, ws: WebSocket, binary: bool, peer: str = "?"):
+        """Stream telemetry to an upgraded connection until it closes
+
+        A client may send {"resync": true} to get every field again.
+        """
+        client = Client(ws, binary, peer)
+        self.clients.add(client)
+        if self.latest:
+            client.dirty.set()
+        sender = asyncio.ensure_future(self._sender(client))
+        logger.info(f"Telemetry client {peer} connected ({'binary' if binary else 'json'})")
+        try:
+            while True:
+                receive = asyncio.ensure_future(ws.recv())
+                done, _ = await asyncio.wait({receive, sender}, return_when=asyncio.FIRST_COMPLETED)
+                if sender in done:
+                    receive.cancel()
+                    sender.result()  # Raises the send failure
+                message = receive.result()
+                if message is None:
+                    break
+                if isinstance(message, str) and json.loads(message or "{}").get("resync"):
+                    client.sent.clear()
+                    client.dirty.set()
+        except (asyncio.TimeoutError, ConnectionError, WebSocketError, ValueError) as e:
+            logger.info(f"Telemetry client {peer} dropped: {e!r}")
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            await ws.close()
+            logger.info(f"Telemetry client {peer} left after {client.frames} frames, "
+                        f"{client.dropped} dropped")
+
+    async def accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     target: str, headers: Dict[str, str]):
+        """Complete the upgrade of a parsed request and serve it"""
+        response, protocol = handshake(headers, (SUBPROTOCOL_BINARY, SUBPROTOCOL_JSON))
+        writer.write(response)
+        await writer.drain()
+        query = parse_qs(urlsplit(target).query)
+        binary = protocol == SUBPROTOCOL_BINARY or query.get("format") == ["binary"]
+        peer = writer.get_extra_info("peername")
+        await self.serve_client(WebSocket(reader, writer), binary, f"{peer[0]}:{peer[1]}" if peer else "?")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            _, target, headers = parse_request(head)
+            if not is_websocket(headers):
+                writer.write(b"HTTP/1.1 426 Upgrade Required\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+                writer.close()
+                return
+            await self.accept(reader, writer, target, headers)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, WebSocketError) as e:
+            logger.info(f"Rejected connection: {e!r}")
+            writer.close()
+
+
+async def serve(cpu: AsyncCPUController, host: str = "127.0.0.1", port: int = 8765, rate: float = 30.0):
+    bridge = TelemetryBridge(cpu, rate)
+    server = await asyncio.start_server(bridge.handle_connection, host, port)
+    logger.info(f"Telemetry on ws://{host}:{port}/ at {rate:g} frames/s")
+    async with server:
+        await asyncio.gather(server.serve_forever(), bridge.run())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WebSocket telemetry bridge for the CPU dashboard")
+    parser.add_argument("--backend", default="devmem", help="devmem[:base] or file:<path>")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=30.0, help="frames per second")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    try:
+        cpu = AsyncCPUController(CPUController(open_backend(args.backend)))
+        asyncio.run(serve(cpu, args.host, args.port, args.rate))
+    except ControllerError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())